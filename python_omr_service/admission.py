@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Admissão e prioridade das requisições de OMR
+============================================
+
+Um lote de 200 imagens de uma escola disputava a CPU de igual para igual com
+o professor que lê uma folha pelo celular, e não havia limite para o
+trabalho enfileirado. Aqui, por worker:
+
+- Vagas de CPU (OMR_ADMISSION_SLOTS, padrão: CPUs do worker): triagem, QR e
+  OMR só rodam com uma vaga. Quem espera é atendido por prioridade:
+  folhas interativas (process-sheet, process-image) primeiro; itens de lote
+  em rodízio entre chaves (school_id ou o lote), para uma escola com 200
+  folhas não passar na frente das outras
+- Fila interativa limitada (OMR_ADMISSION_QUEUE) e espera máxima
+  (OMR_ADMISSION_WAIT_S): passou disso, 429 com Retry-After
+- Lotes simultâneos limitados (OMR_ADMISSION_BATCHES, padrão threads - 1):
+  sempre sobra uma thread do worker para as folhas interativas; lote além
+  do limite recebe 429 na hora, antes de ler o upload
+
+Itens de lote nunca recebem 429 no meio: esperam a vez (a espera segura o
+upload, como o orçamento de memória).
+"""
+
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, Hashable, Optional
+
+from runtime_limits import runtime
+
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+
+ADMISSION_SLOTS = int(os.getenv('OMR_ADMISSION_SLOTS', runtime['omr_slots']))
+# Folhas interativas esperando vaga além das que estão rodando
+ADMISSION_QUEUE = int(os.getenv('OMR_ADMISSION_QUEUE', 8))
+# Espera máxima de uma folha interativa por vaga (s)
+ADMISSION_WAIT_SECONDS = float(os.getenv('OMR_ADMISSION_WAIT_S', 10))
+ADMISSION_BATCHES = int(os.getenv('OMR_ADMISSION_BATCHES', max(1, runtime['threads'] - 1)))
+
+# Média móvel do tempo de uma vaga e de um lote (estimativa do Retry-After)
+_EWMA = 0.2
+
+
+class AdmissionRejected(Exception):
+    """Worker saturado: responder 429 com Retry-After (s)."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Slot:
+    """Vaga de CPU concedida; release() é idempotente."""
+
+    def __init__(self, admission: 'Admission', priority: str):
+        self._admission = admission
+        self.priority = priority
+        self.started = time.time()
+        self.wait_ms = 0.0
+        self._held = True
+
+    def release(self):
+        if self._held:
+            self._held = False
+            self._admission._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class Admission:
+    """Vagas de CPU do worker, fila interativa limitada e rodízio entre lotes."""
+
+    def __init__(self, slots: int = ADMISSION_SLOTS, max_waiting: int = ADMISSION_QUEUE,
+                 max_batches: int = ADMISSION_BATCHES):
+        self.slots = max(1, slots)
+        self.max_waiting = max_waiting
+        self.max_batches = max(1, max_batches)
+        self._cond = threading.Condition()
+        self._busy = 0
+        self._interactive = deque()
+        # chave -> fila de itens; a chave atendida vai para o fim (rodízio)
+        self._bulk: 'OrderedDict[Hashable, deque]' = OrderedDict()
+        self._batches: Dict[object, float] = {}
+        self._slot_s = 0.1
+        self._batch_s = 30.0
+        self._counts = {'granted_interactive': 0, 'granted_bulk': 0,
+                        'rejected_interactive': 0, 'rejected_batches': 0}
+
+    # ------------------------------------------------------------------
+    # Vagas de CPU
+    # ------------------------------------------------------------------
+
+    def _next(self):
+        if self._interactive:
+            return self._interactive[0]
+        if self._bulk:
+            return next(iter(self._bulk.values()))[0]
+        return None
+
+    def _retry_after(self, waiting: int) -> int:
+        return max(1, math.ceil(self._slot_s * (waiting + self._busy) / self.slots))
+
+    def acquire(self, priority: str = INTERACTIVE, key: Hashable = None,
+                timeout: Optional[float] = None) -> Slot:
+        """
+        Espera uma vaga de CPU.
+
+        Args:
+            priority: INTERACTIVE (na frente) ou BULK (rodízio por key)
+            key: school_id ou lote, para itens BULK
+            timeout: espera máxima (padrão ADMISSION_WAIT_SECONDS para
+                interativas; itens de lote esperam sem limite)
+
+        Raises:
+            AdmissionRejected: fila interativa cheia ou espera esgotada
+        """
+        ticket = object()
+        t0 = time.time()
+        with self._cond:
+            if priority == INTERACTIVE:
+                if len(self._interactive) >= self.max_waiting:
+                    self._counts['rejected_interactive'] += 1
+                    raise AdmissionRejected(
+                        f"{len(self._interactive)} folhas na fila do worker",
+                        self._retry_after(len(self._interactive)))
+                if timeout is None:
+                    timeout = ADMISSION_WAIT_SECONDS
+                queue = self._interactive
+            else:
+                queue = self._bulk.setdefault(key, deque())
+            queue.append(ticket)
+
+            granted = False
+            try:
+                granted = self._cond.wait_for(
+                    lambda: self._busy < self.slots and self._next() is ticket, timeout=timeout)
+            finally:
+                queue.remove(ticket)
+                if priority == BULK:
+                    if not queue:
+                        del self._bulk[key]
+                    elif granted:
+                        self._bulk.move_to_end(key)
+                if granted:
+                    self._busy += 1
+                    self._counts[f'granted_{priority}'] += 1
+                # A cabeça da fila mudou: quem é o próximo confere de novo
+                self._cond.notify_all()
+
+            if not granted:
+                self._counts['rejected_interactive'] += 1
+                raise AdmissionRejected(f"Sem vaga de CPU em {timeout:.0f}s",
+                                        self._retry_after(len(self._interactive)))
+
+        slot = Slot(self, priority)
+        slot.wait_ms = round((slot.started - t0) * 1000, 2)
+        return slot
+
+    def _release(self, slot: Slot):
+        with self._cond:
+            self._busy -= 1
+            self._slot_s += _EWMA * ((time.time() - slot.started) - self._slot_s)
+            self._cond.notify_all()
+
+    # ------------------------------------------------------------------
+    # Lotes (batch-process, process-pdf)
+    # ------------------------------------------------------------------
+
+    def begin_batch(self) -> object:
+        """
+        Registra um lote; AdmissionRejected se o worker já tem max_batches.
+
+        Returns:
+            token para end_batch()
+        """
+        now = time.time()
+        with self._cond:
+            if len(self._batches) >= self.max_batches:
+                self._counts['rejected_batches'] += 1
+                # Até o lote mais antigo terminar, pela duração média
+                remaining = min(self._batch_s - (now - started) for started in self._batches.values())
+                raise AdmissionRejected(f"{len(self._batches)} lotes em andamento no worker",
+                                        max(1, math.ceil(remaining)))
+            token = object()
+            self._batches[token] = now
+            return token
+
+    def end_batch(self, token: object):
+        with self._cond:
+            started = self._batches.pop(token, None)
+            if started is not None:
+                self._batch_s += _EWMA * ((time.time() - started) - self._batch_s)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Estado e contagens deste worker (/api/metrics)."""
+        with self._cond:
+            return {
+                'slots': self.slots,
+                'busy': self._busy,
+                'waiting_interactive': len(self._interactive),
+                'waiting_bulk': sum(len(q) for q in self._bulk.values()),
+                'bulk_keys': len(self._bulk),
+                'batches': len(self._batches),
+                'max_batches': self.max_batches,
+                'avg_slot_ms': round(self._slot_s * 1000, 2),
+                **self._counts,
+            }
+
+
+admission = Admission()
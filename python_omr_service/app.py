@@ -9,7 +9,7 @@ Porta: 5002
 Autor: GabaritAI / X-TRI
 """
 
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response, stream_with_context
 from flask_cors import CORS
 import cv2
 import numpy as np
@@ -20,13 +20,34 @@ import os
 import re
 import time
 from app_log import logger
+from omr_decision import (
+    LEGACY_RULES, LOW_CONFIDENCE_MARGIN, DARK_LEVELS, CODE_BLANK, CODE_DOUBLE, merge_rules, decide, decision_margin,
+    confidence_from_margin, code_to_answer, stored_precision
+)
 import csv
+import hashlib
+import json
+import tempfile
+import uuid
 from datetime import datetime
 from supabase_client import *
+from qr_locator import read_qr_located
+from pdf_raster import PDF_DPI, iter_pages, page_count, page_bytes, clamp_dpi
+from image_input import is_body_image, decode_body_image, ImageInputError
+from sheet_io import sheet_io, SAVE_SAVED, SAVE_NOT_SAVED
+from admission import admission, AdmissionRejected, INTERACTIVE, BULK
+from runtime_limits import runtime, apply_opencv_threads
+from stage_pipeline import StagePipeline
+from upload_stream import iter_multipart, memory_budget, decoded_bytes, MemoryBudgetExceeded
+from sheet_triage import triage, rotate_page, oriented_markers, STATUS_BLANK, STATUS_NOT_SHEET, STATUS_LOW_QUALITY, STATUS_CANDIDATE
+from darkness_store import (
+    DarknessStore, READERS, READER_HOUGH, READER_LEGACY, make_record, latest_per_key,
+    split_overrides, regrade, summarize, answers_from_codes
+)
 
 # Importar módulo QR (usa funções do qr_reader_module.py se disponível)
 try:
-    from qr_reader_module import read_qr_with_fallback, validate_sheet_code as validate_qr
+    from qr_reader_module import read_qr_with_fallback, qr_engine, validate_sheet_code as validate_qr
     USE_QR_MODULE = True
 except ImportError:
     USE_QR_MODULE = False
@@ -34,6 +55,8 @@ except ImportError:
 # Importar novo leitor OMR com detecção Hough (100% precisão)
 try:
     from xtri_gabarito_reader import process_answer_sheet as hough_process_omr
+    from xtri_gabarito_reader import DECISION_RULES as HOUGH_DECISION_RULES
+    from xtri_gabarito_reader import DARK_PIXEL_VALUE as HOUGH_DARK_PIXEL_VALUE
     USE_HOUGH_OMR = True
 except ImportError:
     USE_HOUGH_OMR = False
@@ -41,6 +64,10 @@ except ImportError:
 app = Flask(__name__)
 CORS(app)
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB
+# Pool interno do OpenCV dimensionado pelas CPUs do contêiner (gunicorn.conf.py repete após o fork)
+apply_opencv_threads()
+# /api/batch-process lê o multipart em streaming (upload_stream); OMR_STREAM_UPLOADS=false volta ao parser do Flask
+STREAM_UPLOADS = os.getenv('OMR_STREAM_UPLOADS', 'true').lower() != 'false'
 
 # ============================================================
 # CONFIGURACAO DO TEMPLATE X-TRI (90 questoes, 6 colunas x 15 linhas)
@@ -86,6 +113,47 @@ RELATIVE_DIFF = 5.0          # Diferença minima entre 1a e 2a para ser marcaç
 DOUBLE_MARK_DIFF = 5.0       # Se diff < 5% entre 1a e 2a (ambas altas), dupla marcação
 DARK_PIXEL_THRESHOLD = 185   # Valor de pixel para considerar escuro (inclui cinzas mais claros)
 
+# Regras de read_question (omr_decision) com os thresholds acima
+LEGACY_DECISION_RULES = merge_rules(LEGACY_RULES, {
+    'blank_threshold': BLANK_THRESHOLD,
+    'marked_threshold': MARKED_THRESHOLD,
+    'double_mark_diff': DOUBLE_MARK_DIFF,
+    'clear_diff': RELATIVE_DIFF,
+})
+
+# Releitura (questões com margem < LOW_CONFIDENCE_MARGIN): as 5 bolhas são
+# deslocadas juntas (passo de 2px, +/- 6px na horizontal e +/- 15px na vertical)
+# e fica o deslocamento em que a bolha mais escura está mais preenchida.
+# Deslocar a linha inteira mantém o espaçamento entre as opções: a busca
+# por bolha invadiria a bolha vizinha e criaria duplas falsas.
+REREAD_STEP = 2
+REREAD_SEARCH_X = 6
+
+# Matrizes de escuridão de cada folha (re-correção offline: /api/regrade)
+# OMR_DARKNESS_STORE=false desliga a gravação
+SAVE_DARKNESS = os.getenv('OMR_DARKNESS_STORE', 'true').lower() != 'false'
+darkness_store = DarknessStore()
+
+# process-sheet: busca do aluno em paralelo com o OMR e salvamento na thread de I/O (sheet_io);
+# OMR_CONCURRENT_SHEET=false volta à execução em sequência
+CONCURRENT_SHEET = os.getenv('OMR_CONCURRENT_SHEET', 'true').lower() != 'false'
+
+# batch-process / process-pdf: estágios sobrepostos entre páginas (stage_pipeline);
+# OMR_BATCH_PIPELINE=false processa página a página
+BATCH_PIPELINE = os.getenv('OMR_BATCH_PIPELINE', 'true').lower() != 'false'
+BATCH_IO_THREADS = int(os.getenv('OMR_BATCH_IO_THREADS', 2))
+
+# Triagem por miniatura antes do QR/OMR (sheet_triage); OMR_TRIAGE=false desliga
+TRIAGE_ENABLED = os.getenv('OMR_TRIAGE', 'true').lower() != 'false'
+# Só a página em branco é recusada; not_sheet / low_quality seguem para os
+# leitores (que corrigem inclinação), a menos que OMR_TRIAGE_REJECT=true
+TRIAGE_REJECT = os.getenv('OMR_TRIAGE_REJECT', 'false').lower() == 'true'
+TRIAGE_ERRORS = {
+    STATUS_BLANK: ('BLANK_PAGE', 'Página em branco'),
+    STATUS_NOT_SHEET: ('NOT_A_SHEET', 'A página não é um cartão-resposta'),
+    STATUS_LOW_QUALITY: ('LOW_QUALITY', 'Imagem sem qualidade para leitura'),
+}
+
 
 # ============================================================
 # FUNCOES DE PROCESSAMENTO
@@ -324,53 +392,44 @@ def analyze_bubble(gray, x, y, scale_x, scale_y):
     return darkness
 
 
-def analyze_bubble_with_search(gray, x, y, scale_x, scale_y):
+def analyze_bubble_with_search(gray, x, y, scale_x, scale_y, step=5, search_x=0):
     """Analisa uma bolha com busca local para compensar desalinhamentos."""
     h, w = gray.shape
     r = int(BUBBLE_RADIUS * scale_x * 1.3)
     search_range = int(15 * scale_y)  # Buscar +/- 15 pixels na vertical
+    search_range_x = int(search_x * scale_x)
 
     best_darkness = 0.0
 
     # Buscar na posição original e posições próximas
-    for dy in range(-search_range, search_range + 1, 5):
+    for dy in range(-search_range, search_range + 1, step):
         test_y = y + dy
         if test_y - r < 0 or test_y + r >= h:
             continue
 
-        x1 = max(0, x - r)
-        x2 = min(w, x + r)
-        y1 = max(0, test_y - r)
-        y2 = min(h, test_y + r)
+        for dx in range(-search_range_x, search_range_x + 1, step):
+            test_x = x + dx
+            x1 = max(0, test_x - r)
+            x2 = min(w, test_x + r)
+            y1 = max(0, test_y - r)
+            y2 = min(h, test_y + r)
 
-        roi = gray[y1:y2, x1:x2]
-        if roi.size == 0:
-            continue
+            roi = gray[y1:y2, x1:x2]
+            if roi.size == 0:
+                continue
 
-        dark_pixels = np.sum(roi < DARK_PIXEL_THRESHOLD)
-        darkness = (dark_pixels / roi.size) * 100.0
+            dark_pixels = np.sum(roi < DARK_PIXEL_THRESHOLD)
+            darkness = (dark_pixels / roi.size) * 100.0
 
-        if darkness > best_darkness:
-            best_darkness = darkness
+            if darkness > best_darkness:
+                best_darkness = darkness
 
     return best_darkness
 
 
-def read_question(gray, q_num, col_x, row_y, scale_x, scale_y, aligned=False):
-    """
-    Lê uma questão e retorna a resposta.
-
-    Lógica simplificada em 4 passos hierárquicos:
-    1. Blank: nenhuma bolha significativamente escura
-    2. Clear mark: melhor bolha escura E significativamente mais escura que a segunda
-    3. Double mark: duas bolhas escuras com diferença pequena
-    4. Light mark: diferença relativa grande mesmo com valores baixos
-
-    Returns:
-        str: 'A'-'E' para resposta, 'X' para dupla marcação, None para em branco
-    """
-    options = []
-
+def measure_question(gray, col_x, row_y, scale_x, scale_y, aligned=False, step=5, search_x=0):
+    """Escuridão (%) das 5 bolhas de uma questão, na ordem A-E."""
+    darkness = []
     for opt_idx in range(5):
         if aligned:
             x = int((col_x + opt_idx * OPTION_SPACING) * scale_x)
@@ -378,50 +437,95 @@ def read_question(gray, q_num, col_x, row_y, scale_x, scale_y, aligned=False):
         else:
             x = int((MARKER_TL[0] + col_x + opt_idx * OPTION_SPACING) * scale_x)
             y = int((MARKER_TL[1] + row_y) * scale_y)
+        darkness.append(analyze_bubble_with_search(gray, x, y, scale_x, scale_y, step, search_x))
+    return darkness
 
-        darkness = analyze_bubble_with_search(gray, x, y, scale_x, scale_y)
-        options.append({
-            'label': chr(65 + opt_idx),
-            'darkness': darkness
-        })
-
-    # Ordenar por escuridão (maior primeiro)
-    sorted_opts = sorted(options, key=lambda x: x['darkness'], reverse=True)
-    best = sorted_opts[0]
-    second = sorted_opts[1]
-    diff = best['darkness'] - second['darkness']
-
-    # ============================================================
-    # LÓGICA MELHORADA - Suporta marcações leves/cinzas
-    # ============================================================
-
-    # Calcular diferença relativa (importante para marcas leves)
-    relative_diff = (diff / best['darkness'] * 100) if best['darkness'] > 0 else 0
 
-    # 1. BLANK: nenhuma bolha significativamente escura
-    if best['darkness'] < BLANK_THRESHOLD:
-        return None
+def measure_levels(gray, positions, scale_x, scale_y, aligned=False):
+    """
+    Escuridão de todas as bolhas em cada limiar de DARK_LEVELS: (len(DARK_LEVELS), questões, 5).
 
-    # 2. DOUBLE MARK: duas bolhas escuras com diferença pequena (ambas acima do threshold)
-    if best['darkness'] >= MARKED_THRESHOLD and second['darkness'] >= MARKED_THRESHOLD:
-        if diff < DOUBLE_MARK_DIFF:
-            return 'X'
+    Mesma janela e busca vertical de analyze_bubble_with_search (maior valor
+    por limiar), com uma imagem integral por limiar: guardada com a folha para
+    testar outro DARK_PIXEL_THRESHOLD sem a imagem.
+    """
+    h, w = gray.shape
+    r = int(BUBBLE_RADIUS * scale_x * 1.3)
+    search_range = int(15 * scale_y)
+    offsets = np.arange(-search_range, search_range + 1, 5)
+
+    cols = np.array([col_x for col_x, _ in positions], dtype=np.float64)[:, None] + \
+        np.arange(5) * OPTION_SPACING
+    rows = np.array([row_y for _, row_y in positions], dtype=np.float64)
+    if not aligned:
+        cols, rows = cols + MARKER_TL[0], rows + MARKER_TL[1]
+    xs = (cols * scale_x).astype(int)                        # (q, 5)
+    ys = (rows * scale_y).astype(int)[:, None] + offsets     # (q, dy)
+    valid = (ys - r >= 0) & (ys + r < h)
+
+    x1, x2 = np.clip(xs - r, 0, w), np.clip(xs + r, 0, w)
+    y1, y2 = np.clip(ys - r, 0, h), np.clip(ys + r, 0, h)
+    x1, x2 = x1[:, :, None], x2[:, :, None]                  # (q, 5, 1)
+    y1, y2 = y1[:, None, :], y2[:, None, :]                  # (q, 1, dy)
+    area = np.maximum((x2 - x1) * (y2 - y1), 1)
+
+    out = np.zeros((len(DARK_LEVELS), len(positions), 5), dtype=np.float64)
+    for k, level in enumerate(DARK_LEVELS):
+        ii = cv2.integral((gray < level).astype(np.uint8))
+        dark = ii[y2, x2] - ii[y1, x2] - ii[y2, x1] + ii[y1, x1]
+        values = np.where(valid[:, None, :], dark / area * 100.0, 0.0)
+        out[k] = values.max(axis=2)
+    return out
+
+
+def measure_question_shifted(gray, col_x, row_y, scale_x, scale_y, aligned=False,
+                             step=REREAD_STEP, search_x=REREAD_SEARCH_X):
+    """
+    Releitura de uma questão: desloca as 5 bolhas juntas e devolve a escuridão
+    (A-E) no deslocamento em que a bolha mais escura está mais preenchida.
+    """
+    h, w = gray.shape
+    r = int(BUBBLE_RADIUS * scale_x * 1.3)
+    if aligned:
+        xs = [int((col_x + opt_idx * OPTION_SPACING) * scale_x) for opt_idx in range(5)]
+        y = int(row_y * scale_y)
+    else:
+        xs = [int((MARKER_TL[0] + col_x + opt_idx * OPTION_SPACING) * scale_x) for opt_idx in range(5)]
+        y = int((MARKER_TL[1] + row_y) * scale_y)
+    search_range = int(15 * scale_y)
+    search_range_x = int(search_x * scale_x)
+
+    dark = gray < DARK_PIXEL_THRESHOLD
+    best = [0.0] * 5
+    for dy in range(-search_range, search_range + 1, step):
+        y1, y2 = max(0, y + dy - r), min(h, y + dy + r)
+        if y + dy - r < 0 or y + dy + r >= h:
+            continue
+        for dx in range(-search_range_x, search_range_x + 1, step):
+            darkness = []
+            for x in xs:
+                roi = dark[y1:y2, max(0, x + dx - r):min(w, x + dx + r)]
+                darkness.append(roi.mean() * 100.0 if roi.size else 0.0)
+            if max(darkness) > max(best):
+                best = darkness
+    return best
 
-    # 3. CLEAR MARK: melhor bolha tem diferença absoluta ou relativa significativa
-    if best['darkness'] >= MARKED_THRESHOLD:
-        if diff >= RELATIVE_DIFF or relative_diff >= 15:  # diff >= 5% OU relativa >= 15%
-            return best['label']
 
-    # 4. LIGHT MARK: marcação leve mas distinguível (diferença relativa grande)
-    if best['darkness'] >= BLANK_THRESHOLD and relative_diff >= 20:
-        return best['label']
+def read_question(gray, q_num, col_x, row_y, scale_x, scale_y, aligned=False):
+    """
+    Lê uma questão e retorna a resposta.
 
-    # 5. FALLBACK: se melhor está bem acima do threshold, aceitar
-    if best['darkness'] >= MARKED_THRESHOLD + 8:
-        return best['label']
+    Lógica simplificada em 4 passos hierárquicos (LEGACY_DECISION_RULES):
+    1. Blank: nenhuma bolha significativamente escura
+    2. Clear mark: melhor bolha escura E significativamente mais escura que a segunda
+    3. Double mark: duas bolhas escuras com diferença pequena
+    4. Light mark: diferença relativa grande mesmo com valores baixos
 
-    # Incerto = em branco
-    return None
+    Returns:
+        str: 'A'-'E' para resposta, 'X' para dupla marcação, None para em branco
+    """
+    darkness = measure_question(gray, col_x, row_y, scale_x, scale_y, aligned)
+    return code_to_answer(int(decide(np.array(darkness), LEGACY_DECISION_RULES)))
 
 
 def process_omr(img):
@@ -451,8 +555,11 @@ def process_omr(img):
                     ans = result['answers'].get(str(i))
                     answers_list.append(ans)
 
+                confidence_list = [result['confidence'].get(str(i)) for i in range(start_question, end_question + 1)]
+
                 day = 1 if start_question == 1 else 2
-                logger.info(f"Hough OMR (DIA {day}): {result['stats']['answered']}/90 respondidas ({elapsed*1000:.1f}ms)")
+                logger.info(f"Hough OMR (DIA {day}): {result['stats']['answered']}/90 respondidas, "
+                            f"{result['stats']['escalated']} relidas ({elapsed*1000:.1f}ms)")
 
                 return {
                     'answers': answers_list,
@@ -461,6 +568,12 @@ def process_omr(img):
                     'answered': result['stats']['answered'],
                     'blank': result['stats']['blank'],
                     'double_marked': result['stats']['double_marked'],
+                    'confidence': confidence_list,
+                    'escalated': result['stats']['escalated'],
+                    'low_confidence': result['low_confidence'],
+                    'codes': np.array(result['codes'], dtype=np.uint8),
+                    'darkness': np.array(result['darkness'], dtype=np.float64),
+                    'darkness_levels': np.array(result['darkness_levels'], dtype=np.float64),
                     'elapsed_ms': round(elapsed * 1000, 2),
                     'method': 'hough'
                 }
@@ -474,6 +587,218 @@ def process_omr(img):
     return process_omr_legacy(img, start_time)
 
 
+def triage_page(img):
+    """Triagem da página (sheet_triage); None com a triagem desligada."""
+    if not TRIAGE_ENABLED:
+        return None
+    page = triage(img)
+    if page['status'] != STATUS_CANDIDATE:
+        logger.info(f"Triagem: {page['status']} ({page['reason']}, {page['elapsed_ms']}ms)")
+    if page['rotation']:
+        logger.info(f"Triagem: página fora de orientação, girando {page['rotation']}° ({page['elapsed_ms']}ms)")
+    return page
+
+
+def triage_rejects(page):
+    """A triagem encerra a página: em branco sempre; not_sheet / low_quality só com OMR_TRIAGE_REJECT."""
+    if not page or page['status'] == STATUS_CANDIDATE:
+        return False
+    return page['status'] == STATUS_BLANK or TRIAGE_REJECT
+
+
+def save_darkness(key, result):
+    """Grava a matriz de escuridão da folha; falha só gera aviso (não afeta a leitura)."""
+    if not SAVE_DARKNESS or result.get('darkness') is None:
+        return False
+    try:
+        dark_value = DARK_PIXEL_THRESHOLD if result['method'] == 'legacy' else HOUGH_DARK_PIXEL_VALUE
+        record = make_record(key, READERS[result['method']], result['codes'], result['darkness'],
+                             result['darkness_levels'], dark_value, result.get('start_question', 1))
+        darkness_store.append(record)
+        return True
+    except Exception as e:
+        logger.warning(f"Falha ao gravar matriz de escuridão de {key}: {e}")
+        return False
+
+
+# ============================================================
+# ESTÁGIOS DE UMA PÁGINA DE LOTE (StagePipeline)
+# ============================================================
+# job: dict com 'file' (FileStorage) ou 'img', e 'qr_context'. Cada estágio
+# completa o job; job['outcome'] encerra o item antes do fim.
+
+def release_page(job):
+    """Descarta a imagem do job e devolve a memória reservada (idempotente)."""
+    job.pop('img', None)
+    reserved = job.pop('reserved', 0)
+    if reserved:
+        memory_budget.release(reserved)
+
+
+def stage_decode(job):
+    """Arquivo enviado → array BGR, dentro do orçamento de memória do worker."""
+    if 'img' in job:
+        return
+    img_file = job.pop('file')
+    try:
+        img_file.stream.seek(0, io.SEEK_END)
+        if img_file.stream.tell() == 0:
+            job['outcome'] = {"status": "erro", "code": "EMPTY_FILE"}
+            return
+        img_file.stream.seek(0)
+
+        # Abrir imagem (só o cabeçalho; decodificação dentro do orçamento de memória)
+        pil_img = Image.open(img_file.stream)
+        nbytes = decoded_bytes(pil_img)
+        try:
+            memory_budget.acquire(nbytes)
+        except MemoryBudgetExceeded as e:
+            job['outcome'] = {"status": "erro", "code": "MEMORY_BUDGET", "message": str(e)}
+            return
+        job['reserved'] = nbytes
+        if pil_img.mode != 'RGB':
+            pil_img = pil_img.convert('RGB')
+        job['img'] = np.array(pil_img)[:, :, ::-1].copy()
+    finally:
+        # Parte em disco (SpooledTemporaryFile) é apagada aqui, não no fim do lote
+        img_file.close()
+
+
+def stage_qr(job):
+    """Triagem (versos em branco ignorados), giro e QR."""
+    img_array = job['img']
+    page = triage_page(img_array)
+    if triage_rejects(page):
+        code, message = TRIAGE_ERRORS[page['status']]
+        job['outcome'] = {
+            "status": "ignorado" if page['status'] == STATUS_BLANK else "erro",
+            "code": code,
+            "message": f"{message}: {page['reason']}",
+            "triage": page
+        }
+        release_page(job)
+        return
+    markers = oriented_markers(page, img_array.shape)
+    if page and page['rotation']:
+        img_array = job['img'] = rotate_page(img_array, page['rotation'])
+
+    # Ler QR Code
+    if USE_QR_MODULE:
+        qr_result = read_qr_with_fallback(img_array, markers=markers, context=job.get('qr_context'))
+        sheet_code = qr_result['sheet_code'] if qr_result['success'] else None
+        start_question = 1  # TODO: adicionar suporte a dia no módulo QR
+    else:
+        sheet_code, start_question = read_qr_code(img_array)
+
+    if not sheet_code:
+        job['outcome'] = {"status": "erro", "code": "QR_NOT_FOUND"}
+        if page and page['status'] != STATUS_CANDIDATE:
+            job['outcome']['triage'] = page
+        release_page(job)
+        return
+    job['sheet_code'] = sheet_code
+
+
+def stage_omr(job):
+    """OMR; a imagem é liberada logo depois (só a matriz de respostas segue)."""
+    try:
+        job['omr'] = process_omr(job['img'])
+    finally:
+        release_page(job)
+    save_darkness(job['sheet_code'], job['omr'])
+
+
+def stage_lookup(job):
+    job['student'] = lookup_student_by_sheet_code(job['sheet_code'])
+
+
+def stage_save(job):
+    """Salva no Supabase e monta o resultado da página."""
+    omr_result = job['omr']
+    student = job['student']
+    stats = {
+        "answered": omr_result['answered'],
+        "blank": omr_result['blank'],
+        "double_marked": omr_result['double_marked']
+    }
+    saved = save_omr_result(job['sheet_code'], omr_result['answers'], stats)
+
+    job['outcome'] = {
+        "status": "sucesso",
+        "sheet_code": job['sheet_code'],
+        "student_name": student.get('student_name') if student else None,
+        "enrollment": student.get('enrollment') if student else None,
+        "class_name": student.get('class_name') if student else None,
+        "school_id": student.get('school_id') if student else None,
+        "answered": omr_result['answered'],
+        "blank": omr_result['blank'],
+        "double_marked": omr_result['double_marked'],
+        "low_confidence": omr_result['low_confidence'],
+        "saved": saved
+    }
+
+
+def bulk_slot(stage):
+    """
+    Estágio de CPU de lote: roda com uma vaga da admissão (depois das folhas
+    interativas, em rodízio entre escolas/lotes por job['admission_key']).
+
+    A decodificação fica de fora: ela espera o orçamento de memória, que só
+    o OMR libera, e segurar uma vaga ali travaria o OMR dos outros lotes.
+    """
+    def run(job):
+        with admission.acquire(BULK, job.get('admission_key')):
+            stage(job)
+    return run
+
+
+# CPU (decodificar, QR, OMR) com uma thread cada; I/O do Supabase com BATCH_IO_THREADS
+SHEET_STAGES = [
+    ('decode', stage_decode, 1),
+    ('qr', bulk_slot(stage_qr), 1),
+    ('omr', bulk_slot(stage_omr), 1),
+    ('lookup', stage_lookup, BATCH_IO_THREADS),
+    ('save', stage_save, BATCH_IO_THREADS),
+]
+
+
+def page_outcome(job):
+    """Resultado final do job (erro de estágio vira PROCESSING_ERROR)."""
+    release_page(job)
+    if 'error' in job:
+        logger.error(f"Erro no processamento da página: {job['error']}")
+        return {"status": "erro", "code": "PROCESSING_ERROR", "message": str(job['error'])}
+    return job['outcome']
+
+
+def process_sheet_pages(jobs):
+    """
+    Pipeline das páginas de um lote: decodificar → QR → OMR → aluno → salvar.
+
+    Com BATCH_PIPELINE os estágios se sobrepõem entre páginas consecutivas
+    (StagePipeline); sem ele, página a página.
+
+    Yields:
+        (índice, job, resultado) na ordem de entrada; resultado tem status
+        "sucesso", "ignorado" (verso em branco) ou "erro" (com code)
+    """
+    if BATCH_PIPELINE:
+        # Cliente desconectado: as páginas ainda nos estágios devolvem a memória
+        for index, job in StagePipeline(SHEET_STAGES, cleanup=release_page).run(jobs):
+            yield index, job, page_outcome(job)
+        return
+
+    for index, job in enumerate(jobs):
+        for _, stage, _ in SHEET_STAGES:
+            if 'outcome' in job or 'error' in job:
+                break
+            try:
+                stage(job)
+            except Exception as e:
+                job['error'] = e
+        yield index, job, page_outcome(job)
+
+
 def process_omr_legacy(img, start_time=None):
     """Processa uma imagem usando o método legado (coordenadas fixas)."""
     if start_time is None:
@@ -505,8 +830,6 @@ def process_omr_legacy(img, start_time=None):
     # 3. Pre-processar (CLAHE + gamma)
     processed = preprocess_image(gray)
 
-    # Ler todas as questoes
-    answers = []
     # Log das coordenadas da Q01 para debug
     q1_col_x = COLUMNS_X[0]
     q1_row_y = Y_POSITIONS[0]
@@ -518,11 +841,36 @@ def process_omr_legacy(img, start_time=None):
         q1_y = int((MARKER_TL[1] + q1_row_y) * scale_y)
     logger.info(f"Q01 coords: col_x={q1_col_x}, row_y={q1_row_y} -> pixel x={q1_x}, y={q1_y}")
 
-    for col_idx, col_x in enumerate(COLUMNS_X):
-        for row_idx, row_y in enumerate(Y_POSITIONS):
-            q_num = col_idx * 15 + row_idx + 1
-            answer = read_question(processed, q_num, col_x, row_y, scale_x, scale_y, aligned)
-            answers.append(answer)
+    # Ler todas as questoes (caminho barato) -> matriz 90 x 5
+    positions = [(col_x, row_y) for col_x in COLUMNS_X for row_y in Y_POSITIONS]
+    darkness = stored_precision([
+        measure_question(processed, col_x, row_y, scale_x, scale_y, aligned)
+        for col_x, row_y in positions
+    ])
+    codes = decide(darkness, LEGACY_DECISION_RULES)
+    margins = decision_margin(darkness, LEGACY_DECISION_RULES)
+
+    # Reler só as questões com margem baixa (linha deslocada em bloco); fica a
+    # leitura mais estável, sem transformar marcação única em dupla
+    escalated = np.flatnonzero(margins < LOW_CONFIDENCE_MARGIN)
+    for i in escalated.tolist():
+        col_x, row_y = positions[i]
+        reread = stored_precision(measure_question_shifted(processed, col_x, row_y, scale_x, scale_y, aligned))
+        reread_code = int(decide(reread, LEGACY_DECISION_RULES))
+        reread_margin = float(decision_margin(reread, LEGACY_DECISION_RULES))
+        if reread_code == CODE_DOUBLE and codes[i] < CODE_BLANK:
+            continue
+        if reread_margin > margins[i]:
+            darkness[i] = reread
+            codes[i] = reread_code
+            margins[i] = reread_margin
+
+    answers = [code_to_answer(int(code)) for code in codes]
+    confidence = [round(float(c), 2) for c in confidence_from_margin(margins)]
+    low_confidence = [i + 1 for i in np.flatnonzero(margins < LOW_CONFIDENCE_MARGIN).tolist()]
+
+    # Escuridão por limiar de pixel (re-correção offline, darkness_store)
+    levels = measure_levels(processed, positions, scale_x, scale_y, aligned)
 
     # Estatisticas
     answered = sum(1 for a in answers if a and a != 'X')
@@ -536,6 +884,12 @@ def process_omr_legacy(img, start_time=None):
         'answered': answered,
         'blank': blank,
         'double_marked': double_marked,
+        'confidence': confidence,
+        'escalated': int(len(escalated)),
+        'low_confidence': low_confidence,
+        'codes': codes,
+        'darkness': darkness,
+        'darkness_levels': levels,
         'elapsed_ms': round(elapsed * 1000, 2),
         'method': 'legacy'
     }
@@ -565,18 +919,20 @@ def read_qr_code(img):
     else:
         gray = img.copy()
 
-    qr_data = None
+    # Recorte previsto pelo template (posição do QR na página)
+    qr_data = read_qr_located(gray)
 
-    # Decodificar QR codes
-    decoded_objects = pyzbar.decode(gray)
+    # Decodificar QR codes na imagem inteira
+    if qr_data is None:
+        decoded_objects = pyzbar.decode(gray)
 
-    for obj in decoded_objects:
-        if obj.type == 'QRCODE':
-            try:
-                qr_data = obj.data.decode('utf-8')
-                break
-            except:
-                continue
+        for obj in decoded_objects:
+            if obj.type == 'QRCODE':
+                try:
+                    qr_data = obj.data.decode('utf-8')
+                    break
+                except:
+                    continue
 
     # Se não encontrou, tentar com diferentes pré-processamentos
     if qr_data is None:
@@ -636,6 +992,19 @@ def validate_sheet_code(code):
 # ENDPOINTS DA API
 # ============================================================
 
+def overloaded_response(e, body=None):
+    """429 com Retry-After para uma requisição recusada pela admissão."""
+    logger.warning(f"Admissão recusou {request.path}: {e} (Retry-After {e.retry_after}s)")
+    response = jsonify(body or {
+        "status": "erro",
+        "code": "OVERLOADED",
+        "message": f"Serviço ocupado: {e}"
+    })
+    response.status_code = 429
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+
 @app.route('/health', methods=['GET'])
 def health():
     """Health check."""
@@ -643,7 +1012,20 @@ def health():
         "status": "ok",
         "service": "omr-service",
         "version": "1.0",
-        "questions": 90
+        "questions": 90,
+        # Limites detectados e configuração escolhida (runtime_limits)
+        "runtime": {**runtime, "opencv_threads_active": cv2.getNumThreads()}
+    })
+
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Métricas do processo: métodos de QR (acerto, tempo médio) e salvamentos assíncronos."""
+    return jsonify({
+        "status": "ok",
+        "qr": qr_engine.metrics() if USE_QR_MODULE else None,
+        "saves": sheet_io.metrics(),
+        "admission": admission.snapshot()
     })
 
 
@@ -651,32 +1033,49 @@ def health():
 def process_image():
     """Processa uma imagem de gabarito."""
     try:
-        # Verificar se tem arquivo
-        if 'image' not in request.files:
-            logger.error("Campo 'image' nao encontrado nos arquivos")
-            return jsonify({"status": "erro", "mensagem": "Arquivo 'image' nao fornecido"}), 400
+        if is_body_image(request.mimetype):
+            # Página no corpo (cinza cru ou PNG/JPEG de um canal): sem multipart nem conversão de cor
+            img_bytes = request.get_data(cache=False)
+            try:
+                img_array, _ = decode_body_image(request.mimetype, request.headers, img_bytes)
+            except ImageInputError as e:
+                logger.error(f"Imagem inválida no corpo: {e.message}")
+                return jsonify({"status": "erro", "mensagem": e.message}), 400
+        else:
+            # Verificar se tem arquivo
+            if 'image' not in request.files:
+                logger.error("Campo 'image' nao encontrado nos arquivos")
+                return jsonify({"status": "erro", "mensagem": "Arquivo 'image' nao fornecido"}), 400
 
-        img_file = request.files['image']
-        img_bytes = img_file.read()
+            img_file = request.files['image']
+            img_bytes = img_file.read()
 
-        if len(img_bytes) == 0:
-            logger.error("Arquivo vazio recebido")
-            return jsonify({"status": "erro", "mensagem": "Arquivo vazio"}), 400
+            if len(img_bytes) == 0:
+                logger.error("Arquivo vazio recebido")
+                return jsonify({"status": "erro", "mensagem": "Arquivo vazio"}), 400
 
-        # Abrir imagem
-        pil_img = Image.open(io.BytesIO(img_bytes))
+            # Abrir imagem
+            pil_img = Image.open(io.BytesIO(img_bytes))
 
-        if pil_img.mode != 'RGB':
-            pil_img = pil_img.convert('RGB')
+            if pil_img.mode != 'RGB':
+                pil_img = pil_img.convert('RGB')
 
-        # Converter para OpenCV (BGR)
-        img_array = np.array(pil_img)[:, :, ::-1].copy()
+            # Converter para OpenCV (BGR)
+            img_array = np.array(pil_img)[:, :, ::-1].copy()
 
-        # Processar OMR
-        result = process_omr(img_array)
+        # Vaga de CPU (admission): folha interativa passa na frente dos lotes
+        with admission.acquire(INTERACTIVE):
+            # Página de cabeça para baixo / deitada: girar antes do OMR
+            page = triage_page(img_array)
+            if page and page['rotation']:
+                img_array = rotate_page(img_array, page['rotation'])
+
+            # Processar OMR
+            result = process_omr(img_array)
+        save_darkness(f"img-{hashlib.sha1(img_bytes).hexdigest()[:24]}", result)
 
         # Numero da pagina
-        page_num = int(request.form.get('page', 1))
+        page_num = int(request.form.get('page') or request.args.get('page', 1))
 
         logger.info(f"Pagina {page_num}: {result['answered']}/90 respondidas | {result['blank']} branco | {result['double_marked']} dupla | {result['elapsed_ms']}ms")
 
@@ -684,11 +1083,13 @@ def process_image():
         questoes = []
         for i, ans in enumerate(result['answers'], 1):
             if ans is None:
-                questoes.append({'numero': i, 'resposta': ''})
+                questao = {'numero': i, 'resposta': ''}
             elif ans == 'X':
-                questoes.append({'numero': i, 'resposta': 'X', 'invalida': True, 'motivo': 'Dupla marcacao'})
+                questao = {'numero': i, 'resposta': 'X', 'invalida': True, 'motivo': 'Dupla marcacao'}
             else:
-                questoes.append({'numero': i, 'resposta': ans})
+                questao = {'numero': i, 'resposta': ans}
+            questao['confianca'] = result['confidence'][i - 1]
+            questoes.append(questao)
 
         return jsonify({
             "status": "sucesso",
@@ -698,12 +1099,17 @@ def process_image():
                     "questoes": questoes,
                     "respondidas": result['answered'],
                     "em_branco": result['blank'],
-                    "dupla_marcacao": result['double_marked']
+                    "dupla_marcacao": result['double_marked'],
+                    "relidas": result['escalated'],
+                    "baixa_confianca": result['low_confidence']
                 },
                 "elapsed_ms": result['elapsed_ms']
             }
         })
 
+    except AdmissionRejected as e:
+        return overloaded_response(e, {"status": "erro", "mensagem": f"Serviço ocupado: {e}"})
+
     except Exception as e:
         logger.error(f"Erro no processamento: {e}", exc_info=True)
         return jsonify({"status": "erro", "mensagem": str(e)}), 500
@@ -714,50 +1120,96 @@ def process_sheet():
     """
     Processa gabarito com QR Code: lê identificação + respostas.
 
-    Pipeline: Image → pyzbar (QR ~10ms) → Supabase lookup (~20ms) → OpenCV OMR (~50ms)
+    Pipeline: Image → triagem (~5ms) → QR (~10ms) → OpenCV OMR (~50ms) com a busca do aluno
+    no Supabase (~20ms) em paralelo → salvamento (sheet_io, espera até OMR_SAVE_WAIT_MS)
 
-    Input: image (multipart/form-data)
+    Input: image (multipart/form-data) ou a página no corpo (image_input):
+           application/octet-stream cinza cru com X-Image-Width / X-Image-Height,
+           ou PNG/JPEG/PGM decodificado direto em cinza
     Output: {
         status: "sucesso",
         sheet_code: "XTRI-A7B3C9",
         student: { student_name, enrollment, class_name },
         answers: ["A", "B", null, "C", ...],
         stats: { answered, blank, double_marked },
-        timings: { qr_ms, supabase_ms, omr_ms, total_ms }
+        timings: { qr_ms, qr_budget_exhausted, supabase_ms, omr_ms, total_ms }
     }
     """
     timings = {}
     total_start = time.time()
+    slot = None
 
     try:
-        # Verificar se tem arquivo
-        if 'image' not in request.files:
-            logger.error("Campo 'image' nao encontrado nos arquivos")
-            return jsonify({
-                "status": "erro",
-                "code": "NO_IMAGE",
-                "message": "Arquivo 'image' não fornecido"
-            }), 400
+        t0 = time.time()
+        if is_body_image(request.mimetype):
+            # Página no corpo (cinza cru ou PNG/JPEG de um canal): sem multipart nem conversão de cor
+            try:
+                img_array, image_info = decode_body_image(request.mimetype, request.headers,
+                                                          request.get_data(cache=False))
+            except ImageInputError as e:
+                logger.error(f"Imagem inválida no corpo: {e.message}")
+                return jsonify({
+                    "status": "erro",
+                    "code": e.code,
+                    "message": e.message
+                }), 400
+            timings['input_format'] = image_info['format']
+        else:
+            # Verificar se tem arquivo
+            if 'image' not in request.files:
+                logger.error("Campo 'image' nao encontrado nos arquivos")
+                return jsonify({
+                    "status": "erro",
+                    "code": "NO_IMAGE",
+                    "message": "Arquivo 'image' não fornecido"
+                }), 400
 
-        img_file = request.files['image']
-        img_bytes = img_file.read()
+            img_file = request.files['image']
+            img_bytes = img_file.read()
 
-        if len(img_bytes) == 0:
-            logger.error("Arquivo vazio recebido")
-            return jsonify({
-                "status": "erro",
-                "code": "EMPTY_FILE",
-                "message": "Arquivo vazio"
-            }), 400
+            if len(img_bytes) == 0:
+                logger.error("Arquivo vazio recebido")
+                return jsonify({
+                    "status": "erro",
+                    "code": "EMPTY_FILE",
+                    "message": "Arquivo vazio"
+                }), 400
 
-        # Abrir imagem
-        pil_img = Image.open(io.BytesIO(img_bytes))
+            # Abrir imagem
+            pil_img = Image.open(io.BytesIO(img_bytes))
 
-        if pil_img.mode != 'RGB':
-            pil_img = pil_img.convert('RGB')
+            if pil_img.mode != 'RGB':
+                pil_img = pil_img.convert('RGB')
 
-        # Converter para OpenCV (BGR)
-        img_array = np.array(pil_img)[:, :, ::-1].copy()
+            # Converter para OpenCV (BGR)
+            img_array = np.array(pil_img)[:, :, ::-1].copy()
+            timings['input_format'] = 'multipart'
+        timings['decode_ms'] = round((time.time() - t0) * 1000, 2)
+
+        # Vaga de CPU para triagem, QR e OMR (admission): folha interativa passa na frente dos lotes
+        slot = admission.acquire(INTERACTIVE)
+        timings['admission_wait_ms'] = slot.wait_ms
+
+        # ============================================================
+        # STEP 0: TRIAGEM (~5ms) - verso em branco, capa, foto borrada
+        # ============================================================
+        t0 = time.time()
+        page = triage_page(img_array)
+        rotation = page['rotation'] if page else 0
+        markers = oriented_markers(page, img_array.shape)
+        if rotation:
+            img_array = rotate_page(img_array, rotation)
+        timings['triage_ms'] = round((time.time() - t0) * 1000, 2)
+
+        if triage_rejects(page):
+            code, message = TRIAGE_ERRORS[page['status']]
+            return jsonify({
+                "status": "erro",
+                "code": code,
+                "message": f"{message}: {page['reason']}",
+                "triage": page,
+                "timings": timings
+            }), 400
 
         # ============================================================
         # STEP 1: LER QR CODE (~10ms)
@@ -765,11 +1217,14 @@ def process_sheet():
         t0 = time.time()
 
         if USE_QR_MODULE:
-            # Usar módulo QR com fallback (mais robusto)
-            qr_result = read_qr_with_fallback(img_array)
+            # Usar módulo QR com fallback (mais robusto); ordem adaptativa por scanner
+            qr_result = read_qr_with_fallback(img_array, markers=markers,
+                                              context=request.form.get('scanner') or request.args.get('scanner'))
             sheet_code = qr_result['sheet_code'] if qr_result['success'] else None
             start_question = 1  # TODO: adicionar suporte a dia no módulo QR se necessário
             timings['qr_method'] = qr_result.get('method')
+            timings['qr_attempts'] = len(qr_result['attempts'])
+            timings['qr_budget_exhausted'] = qr_result['budget_exhausted']
         else:
             # Fallback para função interna (retorna tuple: sheet_code, start_question)
             sheet_code, start_question = read_qr_code(img_array)
@@ -782,7 +1237,10 @@ def process_sheet():
             return jsonify({
                 "status": "erro",
                 "code": "QR_NOT_FOUND",
-                "message": "QR Code não detectado na imagem"
+                "message": "QR Code não detectado na imagem",
+                "budget_exhausted": timings.get('qr_budget_exhausted', False),
+                "triage": page if page and page['status'] != STATUS_CANDIDATE else None,
+                "timings": timings
             }), 400
 
         # Validar formato do código
@@ -798,23 +1256,22 @@ def process_sheet():
         logger.info(f"QR Code lido: {sheet_code} via {timings.get('qr_method')} ({timings['qr_ms']}ms)")
 
         # ============================================================
-        # STEP 2: SUPABASE LOOKUP (~20ms)
+        # STEP 2: SUPABASE LOOKUP (~20ms) - em paralelo com o OMR
         # ============================================================
         t0 = time.time()
-        student = lookup_student_by_sheet_code(sheet_code)
-        timings['supabase_ms'] = round((time.time() - t0) * 1000, 2)
-
-        if student:
-            logger.info(f"Student: {student.get('student_name')} ({timings['supabase_ms']}ms)")
+        if CONCURRENT_SHEET:
+            wait_student = sheet_io.lookup(lookup_student_by_sheet_code, sheet_code)
         else:
-            logger.warning(f"Student not found for {sheet_code} ({timings['supabase_ms']}ms)")
+            student = lookup_student_by_sheet_code(sheet_code)
+            timings['supabase_ms'] = round((time.time() - t0) * 1000, 2)
 
         # ============================================================
-        # STEP 3: PROCESSAR OMR (~50ms)
+        # STEP 3: PROCESSAR OMR (~50ms) - OpenCV solta o GIL, a busca segue na thread de I/O
         # ============================================================
         t0 = time.time()
         result = process_omr(img_array)
         timings['omr_ms'] = round((time.time() - t0) * 1000, 2)
+        slot.release()
 
         stats = {
             "answered": result['answered'],
@@ -822,17 +1279,29 @@ def process_sheet():
             "double_marked": result['double_marked']
         }
 
-        logger.info(f"OMR: {result['answered']}/90 ({timings['omr_ms']}ms)")
+        logger.info(f"OMR: {result['answered']}/90, {result['escalated']} relidas ({timings['omr_ms']}ms)")
 
         # ============================================================
-        # STEP 4: SALVAR RESULTADO NO SUPABASE
+        # STEP 4: SALVAR RESULTADO NO SUPABASE (thread de I/O no modo concorrente)
         # ============================================================
         t0 = time.time()
-        saved = save_omr_result(sheet_code, result['answers'], stats)
-        timings['save_ms'] = round((time.time() - t0) * 1000, 2)
+        if CONCURRENT_SHEET:
+            save = sheet_io.save(save_omr_result, sheet_code, result['answers'], stats)
+            student, timings['supabase_ms'], timings['lookup_wait_ms'] = wait_student()
+        else:
+            saved = save_omr_result(sheet_code, result['answers'], stats)
+            save = {'status': SAVE_SAVED if saved else SAVE_NOT_SAVED, 'saved': saved,
+                    'save_ms': round((time.time() - t0) * 1000, 2)}
+        saved = save['saved']
+        timings['save_ms'] = save['save_ms']
 
+        if student:
+            logger.info(f"Student: {student.get('student_name')} ({timings['supabase_ms']}ms)")
+        else:
+            logger.warning(f"Student not found for {sheet_code} ({timings['supabase_ms']}ms)")
         if saved:
             logger.info(f"Result saved ({timings['save_ms']}ms)")
+        save_darkness(sheet_code, result)
 
         # Calcular tempo total
         timings['total_ms'] = round((time.time() - total_start) * 1000, 2)
@@ -851,6 +1320,7 @@ def process_sheet():
             "sheet_code": sheet_code,
             "day": day,  # 1 para DIA 1 (questões 1-90), 2 para DIA 2 (questões 91-180)
             "start_question": omr_start_question,  # 1 ou 91
+            "rotation": rotation,  # Giro aplicado (graus, horário) a página fora de orientação
             "student": {
                 "student_name": student.get('student_name') if student else None,
                 "enrollment": student.get('enrollment') if student else None,
@@ -859,11 +1329,18 @@ def process_sheet():
             } if student else None,
             "answers": result['answers'],  # Lista posicional (índice 0 = primeira questão do dia)
             "answers_numbered": result.get('answers_dict', {}),  # Dict com números corretos
+            "confidence": result['confidence'],  # 0-1 por questão (mesma ordem de answers)
+            "low_confidence": result['low_confidence'],  # Questões para revisão manual
+            "escalated": result['escalated'],  # Questões relidas pelo caminho caro
             "stats": stats,
             "timings": timings,
-            "saved": saved
+            "saved": saved,  # None se o salvamento não terminou a tempo (OMR_SAVE_WAIT_MS / OMR_SAVE_ASYNC)
+            "save_status": save['status']  # saved / not_saved / pending
         })
 
+    except AdmissionRejected as e:
+        return overloaded_response(e)
+
     except Exception as e:
         logger.error(f"Erro no processamento: {e}", exc_info=True)
         return jsonify({
@@ -872,6 +1349,10 @@ def process_sheet():
             "message": str(e)
         }), 500
 
+    finally:
+        if slot is not None:
+            slot.release()
+
 
 @app.route('/api/upload-csv', methods=['POST'])
 def upload_csv():
@@ -1012,15 +1493,13 @@ def batch_status(batch_id):
 def download_pdf(batch_id):
     """
     Gera e retorna PDF com gabaritos do lote.
-    Cada página contém um gabarito com QR Code único.
+    Cada página contém um gabarito com QR Code único (vetorial); o resto da
+    folha é um form XObject compartilhado por todas as páginas.
     """
     try:
         # Verificar se reportlab está disponível
         try:
-            from reportlab.lib.pagesizes import A4
-            from reportlab.pdfgen import canvas
-            from reportlab.lib.units import mm
-            import qrcode
+            from sheet_pdf import render_batch_pdf
         except ImportError:
             return jsonify({
                 "status": "erro",
@@ -1038,83 +1517,8 @@ def download_pdf(batch_id):
                 "message": f"Nenhum aluno encontrado para o lote {batch_id}"
             }), 404
 
-        # Gerar PDF em memória
-        pdf_buffer = io.BytesIO()
-        c = canvas.Canvas(pdf_buffer, pagesize=A4)
-        width, height = A4
-
-        for student in students:
-            # Cabeçalho
-            c.setFont("Helvetica-Bold", 16)
-            c.drawString(20*mm, height - 20*mm, "GABARITO - PROVA")
-
-            # Dados do aluno
-            c.setFont("Helvetica", 12)
-            c.drawString(20*mm, height - 35*mm, f"Nome: {student['student_name']}")
-            c.drawString(20*mm, height - 42*mm, f"Matrícula: {student.get('enrollment_code', '-')}")
-            c.drawString(20*mm, height - 49*mm, f"Turma: {student.get('class_name', '-')}")
-            c.drawString(20*mm, height - 56*mm, f"Código: {student['sheet_code']}")
-
-            # QR Code (canto superior direito)
-            qr = qrcode.QRCode(version=1, box_size=3, border=2)
-            qr.add_data(student['sheet_code'])
-            qr.make(fit=True)
-            qr_img = qr.make_image(fill_color="black", back_color="white")
-
-            # Salvar QR como imagem temporária
-            qr_buffer = io.BytesIO()
-            qr_img.save(qr_buffer, format='PNG')
-            qr_buffer.seek(0)
-
-            from reportlab.lib.utils import ImageReader
-            qr_reader = ImageReader(qr_buffer)
-            c.drawImage(qr_reader, width - 45*mm, height - 45*mm, 35*mm, 35*mm)
-
-            # Marcadores de canto (quadrados pretos para alinhamento)
-            marker_size = 5*mm
-            # Top-left
-            c.rect(15*mm, height - 130*mm, marker_size, marker_size, fill=1)
-            # Top-right
-            c.rect(width - 20*mm, height - 130*mm, marker_size, marker_size, fill=1)
-            # Bottom-left
-            c.rect(15*mm, 40*mm, marker_size, marker_size, fill=1)
-            # Bottom-right
-            c.rect(width - 20*mm, 40*mm, marker_size, marker_size, fill=1)
-
-            # Grid de respostas (6 colunas x 15 linhas = 90 questões)
-            start_y = height - 140*mm
-            col_width = 28*mm
-            row_height = 8*mm
-            bubble_radius = 2.5*mm
-
-            c.setFont("Helvetica", 8)
-
-            for col in range(6):
-                col_x = 20*mm + col * col_width
-
-                # Cabeçalho da coluna
-                c.setFont("Helvetica-Bold", 8)
-                header_text = "A  B  C  D  E"
-                c.drawString(col_x + 8*mm, start_y + 5*mm, header_text)
-                c.setFont("Helvetica", 8)
-
-                for row in range(15):
-                    q_num = col * 15 + row + 1
-                    row_y = start_y - row * row_height
-
-                    # Número da questão
-                    c.drawString(col_x, row_y, f"{q_num:02d}")
-
-                    # Bolhas A-E
-                    for opt in range(5):
-                        bubble_x = col_x + 10*mm + opt * 5*mm
-                        c.circle(bubble_x, row_y + 1.5*mm, bubble_radius)
-
-            # Nova página
-            c.showPage()
-
-        c.save()
-        pdf_buffer.seek(0)
+        # Gerar PDF em memória (parte fixa da folha desenhada uma vez, ver sheet_pdf)
+        pdf_buffer = render_batch_pdf(students)
 
         # Buscar nome do lote para o filename
         batch_status = get_batch_status(batch_id)
@@ -1144,125 +1548,106 @@ def batch_process():
     """
     Processa múltiplas imagens de gabarito de uma vez.
 
-    Input: images[] (multipart/form-data) - array de imagens
+    O multipart é lido em streaming (upload_stream): cada imagem entra no
+    pipeline em estágios (process_sheet_pages) assim que chega, dentro do
+    orçamento de memória do worker.
+
+    Input: images[] (multipart/form-data) - array de imagens; scanner / school_id (opcionais, antes das imagens)
 
     Output: {
         status: "sucesso",
         processed: 10,
-        success: 8,
+        success: 7,
         failed: 2,
+        skipped: 1,
         results: [...]
     }
     """
+    # Lotes simultâneos limitados por worker: recusar antes de ler o upload
     try:
-        if 'images' not in request.files:
-            return jsonify({
-                "status": "erro",
-                "code": "NO_IMAGES",
-                "message": "Nenhuma imagem fornecida"
-            }), 400
+        batch_token = admission.begin_batch()
+    except AdmissionRejected as e:
+        return overloaded_response(e)
+
+    try:
+        # Streaming: cada folha é processada assim que a parte chega (sem ler o lote inteiro)
+        streaming = STREAM_UPLOADS and request.mimetype == 'multipart/form-data'
+        fields = {}
+        if streaming:
+            images = iter_multipart(request, fields)
+        else:
+            if 'images' not in request.files:
+                return jsonify({
+                    "status": "erro",
+                    "code": "NO_IMAGES",
+                    "message": "Nenhuma imagem fornecida"
+                }), 400
 
-        images = request.files.getlist('images')
+            images = request.files.getlist('images')
 
-        if not images:
-            return jsonify({
-                "status": "erro",
-                "code": "EMPTY_IMAGES",
-                "message": "Lista de imagens vazia"
-            }), 400
+            if not images:
+                return jsonify({
+                    "status": "erro",
+                    "code": "EMPTY_IMAGES",
+                    "message": "Lista de imagens vazia"
+                }), 400
+            fields = request.form
 
         results = []
         success_count = 0
         failed_count = 0
+        skipped_count = 0
+        batch_id = f"batch-{uuid.uuid4().hex[:8]}"
 
-        for idx, img_file in enumerate(images):
-            try:
-                img_bytes = img_file.read()
-                if len(img_bytes) == 0:
-                    results.append({
-                        "index": idx,
-                        "filename": img_file.filename,
-                        "status": "erro",
-                        "code": "EMPTY_FILE"
-                    })
-                    failed_count += 1
+        def jobs():
+            for img_file in images:
+                if img_file.name != 'images':
+                    img_file.close()
                     continue
-
-                # Abrir imagem
-                pil_img = Image.open(io.BytesIO(img_bytes))
-                if pil_img.mode != 'RGB':
-                    pil_img = pil_img.convert('RGB')
-
-                img_array = np.array(pil_img)[:, :, ::-1].copy()
-
-                # Ler QR Code
-                if USE_QR_MODULE:
-                    qr_result = read_qr_with_fallback(img_array)
-                    sheet_code = qr_result['sheet_code'] if qr_result['success'] else None
-                    start_question = 1  # TODO: adicionar suporte a dia no módulo QR
-                else:
-                    sheet_code, start_question = read_qr_code(img_array)
-
-                if not sheet_code:
-                    results.append({
-                        "index": idx,
-                        "filename": img_file.filename,
-                        "status": "erro",
-                        "code": "QR_NOT_FOUND"
-                    })
-                    failed_count += 1
-                    continue
-
-                # Processar OMR
-                omr_result = process_omr(img_array)
-
-                # Buscar aluno
-                student = lookup_student_by_sheet_code(sheet_code)
-
-                # Salvar resultado
-                stats = {
-                    "answered": omr_result['answered'],
-                    "blank": omr_result['blank'],
-                    "double_marked": omr_result['double_marked']
-                }
-                saved = save_omr_result(sheet_code, omr_result['answers'], stats)
-
-                results.append({
-                    "index": idx,
-                    "filename": img_file.filename,
-                    "status": "sucesso",
-                    "sheet_code": sheet_code,
-                    "student_name": student.get('student_name') if student else None,
-                    "enrollment": student.get('enrollment') if student else None,
-                    "class_name": student.get('class_name') if student else None,
-                    "school_id": student.get('school_id') if student else None,
-                    "answered": omr_result['answered'],
-                    "blank": omr_result['blank'],
-                    "double_marked": omr_result['double_marked'],
-                    "saved": saved
-                })
+                # Estatística do QR por scanner (ou só deste lote): a ordem dos métodos se adapta
+                qr_context = fields.get('scanner') or request.args.get('scanner') or batch_id
+                # Rodízio da CPU entre escolas (ou lotes sem escola)
+                admission_key = fields.get('school_id') or request.args.get('school_id') or batch_id
+                yield {"file": img_file, "filename": img_file.filename,
+                       "qr_context": qr_context, "admission_key": admission_key}
+
+        for idx, job, outcome in process_sheet_pages(jobs()):
+            results.append({"index": idx, "filename": job['filename'], **outcome})
+            if outcome['status'] == 'sucesso':
                 success_count += 1
-
-            except Exception as e:
-                results.append({
-                    "index": idx,
-                    "filename": img_file.filename,
-                    "status": "erro",
-                    "code": "PROCESSING_ERROR",
-                    "message": str(e)
-                })
+            elif outcome['status'] == 'ignorado':
+                skipped_count += 1
+            else:
                 failed_count += 1
 
-        logger.info(f"Batch process: {success_count}/{len(images)} success, {failed_count} failed")
+        if not results:
+            return jsonify({
+                "status": "erro",
+                "code": "NO_IMAGES",
+                "message": "Nenhuma imagem fornecida"
+            }), 400
+
+        logger.info(f"Batch process: {success_count}/{len(results)} success, {failed_count} failed, "
+                    f"{skipped_count} em branco{' (streaming)' if streaming else ''}")
 
         return jsonify({
             "status": "sucesso",
-            "processed": len(images),
+            "processed": len(results),
             "success": success_count,
             "failed": failed_count,
+            "skipped": skipped_count,  # Páginas em branco (verso do scanner duplex)
             "results": results
         })
 
+    except ValueError as e:
+        # Multipart malformado ou incompleto (modo streaming)
+        logger.warning(f"Batch process: upload inválido: {e}")
+        return jsonify({
+            "status": "erro",
+            "code": "INVALID_UPLOAD",
+            "message": str(e)
+        }), 400
+
     except Exception as e:
         logger.error(f"Batch process error: {e}", exc_info=True)
         return jsonify({
@@ -1271,6 +1656,205 @@ def batch_process():
             "message": str(e)
         }), 500
 
+    finally:
+        admission.end_batch(batch_token)
+
+
+@app.route('/api/process-pdf', methods=['POST'])
+def process_pdf():
+    """
+    Processa um PDF escaneado inteiro (várias folhas) em uma requisição.
+
+    As páginas são rasterizadas em cinza na resolução do template por um pool
+    de threads (pdf_raster) e entram direto no pipeline em estágios, sem JPEG
+    nem uma requisição por página. Os resultados saem em streaming, uma linha
+    JSON por página (mesmos campos de /api/batch-process) e um resumo no fim.
+
+    Input: pdf (multipart/form-data), first_page / last_page / dpi / scanner / school_id (opcionais);
+           dpi é ajustado a [PDF_DPI_MIN, PDF_DPI_MAX] (100-300)
+
+    Output (application/x-ndjson):
+        {"page": 1, "status": "sucesso", "sheet_code": "XTRI-A7B3C9", ...}
+        {"page": 2, "status": "ignorado", "code": "BLANK_PAGE", ...}
+        {"status": "sucesso", "done": true, "processed": 2, "success": 1, "failed": 0, "skipped": 1, ...}
+    """
+    # Lotes simultâneos limitados por worker: recusar antes de ler o upload
+    try:
+        batch_token = admission.begin_batch()
+    except AdmissionRejected as e:
+        return overloaded_response(e)
+
+    if 'pdf' not in request.files:
+        admission.end_batch(batch_token)
+        return jsonify({
+            "status": "erro",
+            "code": "NO_PDF",
+            "message": "Arquivo 'pdf' não fornecido"
+        }), 400
+
+    pdf_file = request.files['pdf']
+    tmp = tempfile.NamedTemporaryFile(suffix='.pdf', delete=False)
+    try:
+        pdf_file.save(tmp)
+        tmp.close()
+        if os.path.getsize(tmp.name) == 0:
+            os.unlink(tmp.name)
+            admission.end_batch(batch_token)
+            return jsonify({
+                "status": "erro",
+                "code": "EMPTY_FILE",
+                "message": "Arquivo vazio"
+            }), 400
+
+        total_pages = page_count(tmp.name)
+        first_page = max(1, int(request.form.get('first_page', 1)))
+        last_page = min(total_pages, int(request.form.get('last_page', total_pages)))
+        requested_dpi = int(request.form.get('dpi', PDF_DPI))
+        dpi = clamp_dpi(requested_dpi)
+        if dpi != requested_dpi:
+            logger.warning(f"PDF: dpi {requested_dpi} fora do intervalo aceito, usando {dpi}")
+        # Cada página rasterizada reserva isso no orçamento de memória do worker
+        nbytes = page_bytes(tmp.name, dpi)
+    except ValueError as e:
+        os.unlink(tmp.name)
+        admission.end_batch(batch_token)
+        return jsonify({
+            "status": "erro",
+            "code": "INVALID_PDF",
+            "message": str(e)
+        }), 400
+    except Exception:
+        os.unlink(tmp.name)
+        admission.end_batch(batch_token)
+        raise
+
+    pdf_id = f"pdf-{uuid.uuid4().hex[:8]}"
+    qr_context = request.form.get('scanner') or pdf_id
+    # Rodízio da CPU entre escolas (ou PDFs sem escola)
+    admission_key = request.form.get('school_id') or request.args.get('school_id') or pdf_id
+    logger.info(f"PDF {pdf_file.filename}: páginas {first_page}-{last_page} de {total_pages} ({dpi} DPI)")
+
+    def cleanup():
+        """Apaga o PDF temporário e encerra o lote (idempotente)."""
+        try:
+            os.unlink(tmp.name)
+        except FileNotFoundError:
+            pass
+        admission.end_batch(batch_token)
+
+    def generate():
+        start = time.time()
+        counts = {'sucesso': 0, 'ignorado': 0, 'erro': 0}
+        try:
+            def jobs():
+                for page_number, img_array, error in iter_pages(tmp.name, first_page, last_page, dpi,
+                                                                budget=memory_budget, nbytes=nbytes):
+                    job = {"page": page_number, "qr_context": qr_context,
+                           "admission_key": admission_key, "fed_at": time.time()}
+                    if isinstance(error, MemoryBudgetExceeded):
+                        job['outcome'] = {"status": "erro", "code": "MEMORY_BUDGET", "message": str(error)}
+                    elif error is not None:
+                        job['outcome'] = {"status": "erro", "code": "RASTER_ERROR", "message": str(error)}
+                    else:
+                        # A reserva da página volta em release_page (depois do OMR)
+                        job['img'] = img_array
+                        job['reserved'] = nbytes
+                    yield job
+
+            for _, job, outcome in process_sheet_pages(jobs()):
+                counts[outcome['status']] += 1
+                outcome['elapsed_ms'] = round((time.time() - job['fed_at']) * 1000, 2)
+                yield json.dumps({"page": job['page'], **outcome}, ensure_ascii=False) + "\n"
+
+            processed = sum(counts.values())
+            logger.info(f"PDF process: {counts['sucesso']}/{processed} success, {counts['erro']} failed, "
+                        f"{counts['ignorado']} em branco ({(time.time() - start) * 1000:.0f}ms)")
+            yield json.dumps({
+                "status": "sucesso",
+                "done": True,
+                "processed": processed,
+                "success": counts['sucesso'],
+                "failed": counts['erro'],
+                "skipped": counts['ignorado'],
+                "total_pages": total_pages,
+                "elapsed_ms": round((time.time() - start) * 1000, 2)
+            }) + "\n"
+        finally:
+            cleanup()
+
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    # Também quando a resposta fecha sem o gerador ter começado
+    response.call_on_close(cleanup)
+    return response
+
+
+@app.route('/api/regrade', methods=['POST'])
+def regrade_sheets():
+    """
+    Re-corrige as folhas já processadas com novas regras, sem reler imagens.
+
+    Input (JSON): {
+        constants: { FILL_THRESHOLD: 20, DARK_PIXEL_VALUE: 175, DOUBLE_MARK_DIFF: 4, ... },
+        rules: { double_mark_diff: 4, ... },   # nomes de omr_decision, nos dois leitores
+        since: "2026-10-01", until: "2026-10-19",
+        sheet_codes: ["XTRI-A7B3C9", ...],      # opcional
+        include_answers: false                  # respostas novas por folha alterada
+    }
+
+    Output: {
+        status: "sucesso",
+        sheets, changed_sheets, changed_answers,
+        changes_by_question: { "12": 3, ... },
+        transitions: { "A->X": 2, "-->B": 5, ... },
+        timings: { load_ms, regrade_ms }
+    }
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        t0 = time.time()
+        records, levels = darkness_store.load(data.get('since'), data.get('until'))
+        if not data.get('all_records'):
+            records = latest_per_key(records)
+        if data.get('sheet_codes'):
+            wanted = np.array([str(code).encode('utf-8') for code in data['sheet_codes']])
+            records = records[np.isin(records['key'], wanted)]
+        load_ms = round((time.time() - t0) * 1000, 2)
+
+        t0 = time.time()
+        overrides = split_overrides(data.get('rules'), data.get('constants'))
+        hough_rules = HOUGH_DECISION_RULES if USE_HOUGH_OMR else LEGACY_DECISION_RULES
+        new_codes = regrade(records, levels, {READER_HOUGH: hough_rules, READER_LEGACY: LEGACY_DECISION_RULES},
+                            overrides)
+        summary = summarize(records, new_codes)
+        regrade_ms = round((time.time() - t0) * 1000, 2)
+    except (ValueError, TypeError) as e:
+        return jsonify({
+            "status": "erro",
+            "code": "INVALID_RULES",
+            "message": str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Regrade error: {e}", exc_info=True)
+        return jsonify({
+            "status": "erro",
+            "code": "REGRADE_ERROR",
+            "message": str(e)
+        }), 500
+
+    logger.info(f"Regrade: {summary['changed_answers']} respostas alteradas em "
+                f"{summary['changed_sheets']}/{summary['sheets']} folhas ({load_ms}+{regrade_ms}ms)")
+
+    response = {"status": "sucesso", **summary, "timings": {"load_ms": load_ms, "regrade_ms": regrade_ms}}
+    if data.get('include_answers'):
+        changed = np.flatnonzero((records['codes'] != new_codes).any(axis=1))
+        response['changed'] = [{
+            "sheet_code": records['key'][i].decode('utf-8'),
+            "start_question": int(records['start_question'][i]),
+            "answers": answers_from_codes(new_codes[i]),
+            "previous": answers_from_codes(records['codes'][i]),
+        } for i in changed.tolist()]
+    return jsonify(response)
+
 
 # ============================================================
 # MAIN
@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+Matrizes de escuridão persistidas e re-correção offline
+=======================================================
+
+Cada folha processada grava um registro binário de tamanho fixo com:
+- codes: decisão original (90, 0-4 = A-E, 5 = branco, 6 = dupla)
+- darkness: escuridão 90 x 5 usada na decisão (%, float32)
+- levels: escuridão 90 x 5 em cada limiar de DARK_LEVELS (meios pontos, uint8)
+- dark_pixel_value: limiar de pixel escuro usado na leitura
+
+Os registros vão em arquivos diários (darkness-AAAAMMDD.v2.omrd) em
+OMR_DARKNESS_DIR. Re-corrigir = ler os arquivos com np.fromfile e aplicar
+omr_decision.decide com as novas regras: nenhuma imagem é decodificada.
+
+Os arquivos têm códigos de folha e respostas: os com mais de
+OMR_DARKNESS_RETENTION_DAYS dias são apagados por quem abre o arquivo de um
+dia novo. O diretório é local da máquina; com várias réplicas, só um volume
+compartilhado em OMR_DARKNESS_DIR dá a re-correção de todas as folhas.
+
+Mudar DARK_PIXEL_VALUE / DARK_PIXEL_THRESHOLD soma a darkness a variação da
+escuridão em levels (interpolada) entre o limiar da leitura e o novo; com o
+limiar original a re-correção reproduz exatamente a decisão gravada, inclusive
+nas questões relidas: os leitores decidem sobre a escuridão já na precisão
+gravada (omr_decision.stored_precision).
+
+Uso:
+    python darkness_store.py info
+    python darkness_store.py regrade --set FILL_THRESHOLD=20 --set DARK_PIXEL_VALUE=175
+    python darkness_store.py regrade --rule double_mark_diff=4 --since 2026-10-01 --json
+"""
+
+import os
+import sys
+import glob
+import time
+import fcntl
+import tempfile
+import numpy as np
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from app_log import logger
+from omr_decision import DARK_LEVELS, OPTIONS, CODE_BLANK, merge_rules, decide, code_to_answer
+
+# v1 (darkness-AAAAMMDD.omrd) gravava darkness em décimos de % (uint16) e é ignorado
+MAGIC = b'OMRDARK2'
+HEADER_SIZE = 64
+NUM_QUESTIONS = 90
+KEY_SIZE = 32
+FILE_SUFFIX = '.v2.omrd'
+FILE_PATTERN = 'darkness-*' + FILE_SUFFIX
+# Dias de arquivos mantidos (0 = sem limite)
+RETENTION_DAYS = int(os.getenv('OMR_DARKNESS_RETENTION_DAYS', 90))
+# Folhas por bloco na re-correção
+BLOCK_SHEETS = 8192
+
+READER_HOUGH = 0
+READER_LEGACY = 1
+READERS = {'hough': READER_HOUGH, 'legacy': READER_LEGACY}
+
+# Constantes dos leitores -> (leitor, campos de omr_decision)
+# DARK_PIXEL_* não é regra de decisão: escolhe o limiar interpolado em levels
+CONSTANTS = {
+    'FILL_THRESHOLD': (READER_HOUGH, ('blank_threshold', 'marked_threshold')),
+    'DARK_PIXEL_VALUE': (READER_HOUGH, ('dark_pixel_value',)),
+    'BLANK_THRESHOLD': (READER_LEGACY, ('blank_threshold',)),
+    'MARKED_THRESHOLD': (READER_LEGACY, ('marked_threshold',)),
+    'DOUBLE_MARK_DIFF': (READER_LEGACY, ('double_mark_diff',)),
+    'RELATIVE_DIFF': (READER_LEGACY, ('clear_diff',)),
+    'DARK_PIXEL_THRESHOLD': (READER_LEGACY, ('dark_pixel_value',)),
+}
+
+
+def record_dtype(n_levels: int = len(DARK_LEVELS)) -> np.dtype:
+    """Registro de uma folha (~4.1 KB com 5 limiares)."""
+    return np.dtype([
+        ('key', f'S{KEY_SIZE}'),
+        ('created', '<f8'),
+        ('reader', 'u1'),
+        ('start_question', 'u1'),
+        ('dark_pixel_value', 'u1'),
+        ('codes', 'u1', (NUM_QUESTIONS,)),
+        ('darkness', '<f4', (NUM_QUESTIONS, len(OPTIONS))),
+        ('levels', 'u1', (n_levels, NUM_QUESTIONS, len(OPTIONS))),
+    ])
+
+
+def _header(levels) -> bytes:
+    header = MAGIC + np.array([len(levels)], dtype='<u2').tobytes() + bytes(levels)
+    return header.ljust(HEADER_SIZE, b'\0')
+
+
+def _parse_header(raw: bytes) -> Tuple[int, ...]:
+    if len(raw) < HEADER_SIZE or not raw.startswith(MAGIC):
+        raise ValueError('Arquivo de escuridão inválido (cabeçalho)')
+    n_levels = int(np.frombuffer(raw[len(MAGIC):len(MAGIC) + 2], dtype='<u2')[0])
+    start = len(MAGIC) + 2
+    return tuple(raw[start:start + n_levels])
+
+
+def make_record(key: str, reader: int, codes, darkness, levels, dark_pixel_value: int,
+                start_question: int = 1, created: Optional[float] = None) -> np.ndarray:
+    """Monta o registro de uma folha a partir do resultado de process_omr."""
+    rec = np.zeros(1, dtype=record_dtype(len(DARK_LEVELS)))
+    rec['key'] = key.encode('utf-8')[:KEY_SIZE]
+    rec['created'] = time.time() if created is None else created
+    rec['reader'] = reader
+    rec['start_question'] = start_question
+    rec['dark_pixel_value'] = dark_pixel_value
+    rec['codes'] = np.asarray(codes, dtype=np.uint8).reshape(NUM_QUESTIONS)
+    rec['darkness'] = np.clip(np.asarray(darkness, dtype=np.float64), 0, 100)
+    rec['levels'] = np.round(np.clip(np.asarray(levels, dtype=np.float64), 0, 100) * 2)
+    return rec
+
+
+class DarknessStore:
+    """Arquivos diários append-only de registros de escuridão, com retenção em dias."""
+
+    def __init__(self, directory: Optional[str] = None, retention_days: Optional[int] = None):
+        self.directory = directory or os.getenv(
+            'OMR_DARKNESS_DIR', os.path.join(tempfile.gettempdir(), 'omr_darkness')
+        )
+        os.makedirs(self.directory, exist_ok=True)
+        self.retention_days = RETENTION_DAYS if retention_days is None else retention_days
+
+    def path_for(self, when: Optional[float] = None) -> str:
+        day = datetime.fromtimestamp(time.time() if when is None else when, tz=timezone.utc)
+        return os.path.join(self.directory, f'darkness-{day:%Y%m%d}{FILE_SUFFIX}')
+
+    def append(self, record: np.ndarray) -> str:
+        """
+        Acrescenta um registro ao arquivo do dia.
+
+        flock serializa os workers do gunicorn; o cabeçalho é escrito por quem
+        encontra o arquivo vazio.
+        """
+        path = self.path_for(float(record['created'][0]))
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            new_file = os.fstat(fd).st_size == 0
+            if new_file:
+                os.write(fd, _header(DARK_LEVELS))
+            os.write(fd, record.tobytes())
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+        if new_file:
+            # Primeiro registro do dia: uma limpeza por dia, contada a partir dele
+            self.prune(float(record['created'][0]))
+        return path
+
+    def prune(self, now: Optional[float] = None) -> int:
+        """
+        Apaga os arquivos diários (v1 e v2) mais antigos que retention_days.
+
+        Returns:
+            Arquivos apagados
+        """
+        if self.retention_days <= 0:
+            return 0
+        oldest = os.path.basename(self.path_for((time.time() if now is None else now)
+                                                - self.retention_days * 86400))[:len('darkness-AAAAMMDD')]
+        removed = 0
+        for path in glob.glob(os.path.join(self.directory, 'darkness-*.omrd')):
+            if os.path.basename(path)[:len(oldest)] < oldest:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        if removed:
+            logger.info(f"Escuridão: {removed} arquivo(s) com mais de {self.retention_days} dias apagado(s)")
+        return removed
+
+    def files(self, since: Optional[str] = None, until: Optional[str] = None) -> List[str]:
+        """Arquivos em ordem de data; since/until = 'AAAA-MM-DD' (inclusivos)."""
+        paths = sorted(glob.glob(os.path.join(self.directory, FILE_PATTERN)))
+        lo = since.replace('-', '') if since else None
+        hi = until.replace('-', '') if until else None
+        selected = []
+        for path in paths:
+            day = os.path.basename(path)[len('darkness-'):-len(FILE_SUFFIX)]
+            if (lo and day < lo) or (hi and day > hi):
+                continue
+            selected.append(path)
+        return selected
+
+    def load(self, since: Optional[str] = None, until: Optional[str] = None) -> Tuple[np.ndarray, Tuple[int, ...]]:
+        """
+        Todos os registros do período, concatenados.
+
+        Um registro incompleto no fim do arquivo (escrita interrompida) é ignorado.
+        """
+        chunks = []
+        levels = tuple(DARK_LEVELS)
+        for path in self.files(since, until):
+            with open(path, 'rb') as f:
+                file_levels = _parse_header(f.read(HEADER_SIZE))
+            if file_levels != levels:
+                raise ValueError(f'{os.path.basename(path)}: limiares {file_levels} != {levels}')
+            dtype = record_dtype(len(levels))
+            count = (os.path.getsize(path) - HEADER_SIZE) // dtype.itemsize
+            if count > 0:
+                chunks.append(np.fromfile(path, dtype=dtype, count=count, offset=HEADER_SIZE))
+        if not chunks:
+            return np.zeros(0, dtype=record_dtype(len(levels))), levels
+        return np.concatenate(chunks), levels
+
+
+# ============================================================
+# RE-CORREÇÃO
+# ============================================================
+
+def latest_per_key(records: np.ndarray) -> np.ndarray:
+    """Só o registro mais recente de cada folha (reprocessamentos substituem)."""
+    if len(records) == 0:
+        return records
+    order = np.argsort(records['created'], kind='stable')[::-1]
+    _, first = np.unique(records['key'][order], return_index=True)
+    return records[np.sort(order[first])]
+
+
+def _levels_at(records: np.ndarray, levels: Tuple[int, ...], value) -> np.ndarray:
+    """Escuridão (N, 90, 5) no limiar value (escalar ou um por registro), interpolada em levels."""
+    lv = np.asarray(levels, dtype=np.float64)
+    value = np.broadcast_to(np.asarray(value, dtype=np.float64), (len(records),))
+    j = np.clip(np.searchsorted(lv, value, side='right') - 1, 0, len(lv) - 2)
+    weight = ((value - lv[j]) / (lv[j + 1] - lv[j]))[:, None, None]
+    rows = np.arange(len(records))
+    lower = records['levels'][rows, j].astype(np.float64)
+    upper = records['levels'][rows, j + 1].astype(np.float64)
+    return (lower * (1.0 - weight) + upper * weight) / 2.0
+
+
+def darkness_matrix(records: np.ndarray, levels: Tuple[int, ...],
+                    dark_pixel_value: Optional[float] = None) -> np.ndarray:
+    """
+    Escuridão (N, 90, 5) em %.
+
+    Sem dark_pixel_value (ou igual ao da leitura): a matriz usada na decisão
+    original. Com outro limiar: darkness + (levels no novo limiar - levels no
+    limiar da leitura), com interpolação linear entre os limiares vizinhos.
+    """
+    darkness = records['darkness'].astype(np.float64)
+    if dark_pixel_value is None:
+        return darkness
+    if not levels[0] <= dark_pixel_value <= levels[-1]:
+        raise ValueError(f'dark_pixel_value fora de [{levels[0]}, {levels[-1]}]: {dark_pixel_value}')
+    shift = _levels_at(records, levels, dark_pixel_value) - _levels_at(records, levels, records['dark_pixel_value'])
+    return np.clip(darkness + shift, 0.0, 100.0)
+
+
+def split_overrides(rules: Optional[Dict] = None, constants: Optional[Dict] = None) -> Dict[int, Dict]:
+    """
+    Alterações por leitor: {leitor: {regra: valor, 'dark_pixel_value': v}}.
+
+    rules usa os nomes de omr_decision e vale para os dois leitores;
+    constants usa os nomes das constantes (FILL_THRESHOLD, DOUBLE_MARK_DIFF, ...).
+    """
+    per_reader = {reader: dict(rules or {}) for reader in READERS.values()}
+    for name, value in (constants or {}).items():
+        if name not in CONSTANTS:
+            raise ValueError(f'Constante desconhecida: {name}. Válidas: {sorted(CONSTANTS)}')
+        reader, fields = CONSTANTS[name]
+        for field in fields:
+            per_reader[reader][field] = value
+    return per_reader
+
+
+def regrade(records: np.ndarray, levels: Tuple[int, ...], base_rules: Dict[int, Dict],
+            overrides: Optional[Dict[int, Dict]] = None) -> np.ndarray:
+    """
+    Novos códigos (N, 90) com as regras de cada leitor alteradas por overrides.
+
+    Args:
+        records: registros de DarknessStore.load
+        base_rules: {READER_HOUGH: regras, READER_LEGACY: regras} atuais
+        overrides: saída de split_overrides
+    """
+    codes = np.full((len(records), NUM_QUESTIONS), CODE_BLANK, dtype=np.uint8)
+    for reader, base in base_rules.items():
+        changes = dict((overrides or {}).get(reader, {}))
+        dark_value = changes.pop('dark_pixel_value', None)
+        dark_value = None if dark_value is None else float(dark_value)
+        rules = merge_rules(base, changes)
+        selected = np.flatnonzero(records['reader'] == reader)
+        # Em blocos de folhas: a matriz em float64 de 100k folhas não precisa existir inteira
+        for start in range(0, len(selected), BLOCK_SHEETS):
+            rows = selected[start:start + BLOCK_SHEETS]
+            codes[rows] = decide(darkness_matrix(records[rows], levels, dark_value), rules)
+    return codes
+
+
+def summarize(records: np.ndarray, new_codes: np.ndarray) -> Dict:
+    """Quantas respostas mudaram, por questão e por transição (ex.: 'A->X')."""
+    old_codes = records['codes']
+    changed = old_codes != new_codes
+    labels = [code_to_answer(c) or '-' for c in range(CODE_BLANK + 2)]
+    transitions = {}
+    if changed.any():
+        pairs = old_codes[changed].astype(np.int32) * 8 + new_codes[changed]
+        values, counts = np.unique(pairs, return_counts=True)
+        transitions = {f'{labels[v // 8]}->{labels[v % 8]}': int(c) for v, c in zip(values, counts)}
+    per_question = changed.sum(axis=0)
+    return {
+        'sheets': int(len(records)),
+        'changed_sheets': int(changed.any(axis=1).sum()),
+        'changed_answers': int(changed.sum()),
+        'changes_by_question': {str(q + 1): int(n) for q, n in enumerate(per_question) if n},
+        'transitions': transitions,
+    }
+
+
+def answers_from_codes(codes: np.ndarray) -> List[Optional[str]]:
+    """Códigos de uma folha → lista como process_omr ('A'-'E', 'X', None)."""
+    return [code_to_answer(int(c)) for c in codes]
+
+
+# ============================================================
+# CLI
+# ============================================================
+
+def _parse_assignments(items: List[str]) -> Dict[str, float]:
+    values = {}
+    for item in items or []:
+        name, sep, value = item.partition('=')
+        if not sep:
+            raise ValueError(f'Use NOME=valor: {item}')
+        values[name.strip()] = float(value)
+    return values
+
+
+def main(argv=None) -> int:
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description='Re-correção offline das matrizes de escuridão')
+    parser.add_argument('command', choices=['info', 'regrade'])
+    parser.add_argument('--dir', default=None, help='Diretório (padrão: OMR_DARKNESS_DIR)')
+    parser.add_argument('--since', default=None, help='AAAA-MM-DD')
+    parser.add_argument('--until', default=None, help='AAAA-MM-DD')
+    parser.add_argument('--set', action='append', dest='constants', metavar='CONSTANTE=valor',
+                        help=f'Constante de um leitor ({", ".join(sorted(CONSTANTS))})')
+    parser.add_argument('--rule', action='append', dest='rules', metavar='regra=valor',
+                        help='Regra de omr_decision nos dois leitores (ex.: double_mark_diff=4)')
+    parser.add_argument('--all-records', action='store_true', help='Não descartar reprocessamentos')
+    parser.add_argument('--json', action='store_true')
+    args = parser.parse_args(argv)
+
+    store = DarknessStore(args.dir)
+    t0 = time.time()
+    records, levels = store.load(args.since, args.until)
+    if not args.all_records:
+        records = latest_per_key(records)
+    load_s = time.time() - t0
+
+    if args.command == 'info':
+        info = {
+            'directory': store.directory,
+            'files': len(store.files(args.since, args.until)),
+            'sheets': int(len(records)),
+            'hough': int((records['reader'] == READER_HOUGH).sum()),
+            'legacy': int((records['reader'] == READER_LEGACY).sum()),
+            'levels': list(levels),
+            'load_s': round(load_s, 3),
+        }
+        print(json.dumps(info, indent=2) if args.json else '\n'.join(f'{k}: {v}' for k, v in info.items()))
+        return 0
+
+    # Regras atuais dos leitores (importadas só aqui: app carrega Flask/Supabase)
+    from xtri_gabarito_reader import DECISION_RULES
+    from app import LEGACY_DECISION_RULES
+
+    overrides = split_overrides(_parse_assignments(args.rules), _parse_assignments(args.constants))
+    t0 = time.time()
+    new_codes = regrade(records, levels, {READER_HOUGH: DECISION_RULES, READER_LEGACY: LEGACY_DECISION_RULES},
+                        overrides)
+    summary = summarize(records, new_codes)
+    summary['load_s'] = round(load_s, 3)
+    summary['regrade_s'] = round(time.time() - t0, 3)
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print(f"Folhas: {summary['sheets']} ({summary['load_s']}s leitura, {summary['regrade_s']}s decisão)")
+        print(f"Folhas alteradas: {summary['changed_sheets']} | respostas alteradas: {summary['changed_answers']}")
+        for transition, count in sorted(summary['transitions'].items(), key=lambda kv: -kv[1]):
+            print(f"  {transition}: {count}")
+    return 0
+
+
+if __name__ == '__main__':
+    try:
+        sys.exit(main())
+    except ValueError as e:
+        logger.error(str(e))
+        sys.exit(2)
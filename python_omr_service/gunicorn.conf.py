@@ -0,0 +1,34 @@
+# =============================================================================
+# GabaritAI OMR Service - gunicorn
+# =============================================================================
+# Workers, threads e OpenCV vêm dos limites do contêiner (runtime_limits.py):
+# a mesma configuração serve para 1 vCPU e para 16. Para fixar valores:
+# OMR_WORKERS, OMR_THREADS, OMR_OPENCV_THREADS.
+# =============================================================================
+
+import os
+
+from runtime_limits import runtime, apply_opencv_threads
+
+bind = f"0.0.0.0:{os.getenv('PORT', 5002)}"
+workers = runtime['workers']
+threads = runtime['threads']
+worker_class = 'gthread'
+timeout = 120
+
+# App carregado uma vez no master: templates, OpenCV e módulos ficam em
+# páginas compartilhadas (copy-on-write) entre os workers
+preload_app = True
+
+
+def post_fork(server, worker):
+    # O pool de threads do OpenCV não sobrevive ao fork; recriar no worker
+    apply_opencv_threads()
+
+
+def when_ready(server):
+    server.log.info(
+        "OMR: %d CPU (%s), %s MB (%s) -> %d workers x %d threads, OpenCV %d, PDF %d, orçamento %d MB",
+        runtime['cpus'], runtime['cpu_source'], runtime['memory_mb'], runtime['memory_source'],
+        runtime['workers'], runtime['threads'], runtime['opencv_threads'],
+        runtime['pdf_workers'], runtime['memory_budget_mb'])
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Formatos de entrada da imagem
+=============================
+
+Além do multipart com PNG/JPEG colorido, as rotas de folha aceitam a página
+no corpo da requisição, para quem já tem a página rasterizada em cinza (o
+servidor Node):
+
+- application/octet-stream com X-Image-Width e X-Image-Height: cinza 8 bits
+  cru, linha a linha. Vira array sem cópia (np.frombuffer) e pula a
+  decodificação e a conversão de cor inteiras
+- application/octet-stream sem dimensões, image/png, image/jpeg, image/tiff,
+  image/webp, image/x-portable-graymap: decodificado direto em um canal
+  (cv2.IMREAD_GRAYSCALE), sem passar por RGB/BGR
+
+X-Image-DPI (opcional) informa a resolução da página.
+"""
+
+from typing import Any, Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+RAW_MIMETYPE = 'application/octet-stream'
+ENCODED_MIMETYPES = {
+    'image/png', 'image/jpeg', 'image/tiff', 'image/webp',
+    'image/x-portable-graymap', 'image/x-portable-anymap',
+}
+
+# Limites de sanidade da página (pixels por lado e DPI)
+MIN_SIDE = 200
+MAX_SIDE = 10000
+DPI_RANGE = (50, 1200)
+
+
+class ImageInputError(ValueError):
+    """Corpo da requisição que não é uma imagem válida no formato declarado."""
+
+    def __init__(self, code: str, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+def is_body_image(mimetype: str) -> bool:
+    """A requisição traz a imagem no corpo (e não em multipart)?"""
+    return mimetype == RAW_MIMETYPE or mimetype in ENCODED_MIMETYPES
+
+
+def _int_header(headers, name: str) -> Optional[int]:
+    value = headers.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ImageInputError('INVALID_HEADER', f"{name} deve ser inteiro: {value!r}")
+
+
+def decode_body_image(mimetype: str, headers, body: bytes) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """
+    Página em cinza a partir do corpo da requisição.
+
+    Args:
+        mimetype: Content-Type sem parâmetros
+        headers: cabeçalhos (X-Image-Width / X-Image-Height / X-Image-DPI)
+        body: corpo da requisição
+
+    Returns:
+        (imagem cinza uint8 (h, w), {'format': 'raw' ou 'encoded', 'dpi': int ou None})
+
+    Raises:
+        ImageInputError: corpo vazio, dimensões que não batem com o tamanho,
+        DPI fora da faixa ou imagem que não decodifica
+    """
+    if not body:
+        raise ImageInputError('EMPTY_FILE', "Arquivo vazio")
+
+    width = _int_header(headers, 'X-Image-Width')
+    height = _int_header(headers, 'X-Image-Height')
+    dpi = _int_header(headers, 'X-Image-DPI')
+    if dpi is not None and not DPI_RANGE[0] <= dpi <= DPI_RANGE[1]:
+        raise ImageInputError('INVALID_HEADER', f"X-Image-DPI fora da faixa {DPI_RANGE}: {dpi}")
+
+    if mimetype == RAW_MIMETYPE and (width is not None or height is not None):
+        if width is None or height is None:
+            raise ImageInputError('INVALID_HEADER', "Imagem crua precisa de X-Image-Width e X-Image-Height")
+        if not (MIN_SIDE <= width <= MAX_SIDE and MIN_SIDE <= height <= MAX_SIDE):
+            raise ImageInputError('INVALID_HEADER', f"Dimensões fora da faixa: {width}x{height}")
+        if len(body) != width * height:
+            raise ImageInputError(
+                'INVALID_DIMENSIONS',
+                f"Tamanho do corpo ({len(body)} bytes) não bate com {width}x{height} em cinza 8 bits")
+        # Visão somente leitura sobre o corpo: nenhum passo do pipeline escreve na página
+        return np.frombuffer(body, dtype=np.uint8).reshape(height, width), {'format': 'raw', 'dpi': dpi}
+
+    gray = cv2.imdecode(np.frombuffer(body, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        raise ImageInputError('INVALID_IMAGE', f"Não foi possível decodificar a imagem ({mimetype})")
+    return gray, {'format': 'encoded', 'dpi': dpi}
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Rasterização de PDFs escaneados
+===============================
+
+Converte as páginas de um PDF em imagens em escala de cinza (uint8) na
+resolução do template, em um pool de threads produtoras (cada página é um
+pdftoppm separado, que roda fora do GIL), entregando as páginas em ordem
+para o pipeline da folha sem arquivos temporários por página nem
+codificação JPEG no meio.
+
+No máximo RASTER_WORKERS + RASTER_PREFETCH páginas ficam prontas à frente do
+consumidor, e cada uma reserva a sua memória no orçamento do worker
+(upload_stream.memory_budget) antes de ser rasterizada: a memória não cresce
+com o tamanho do PDF nem com o DPI pedido.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+from runtime_limits import runtime
+from upload_stream import MemoryBudget, MemoryBudgetExceeded
+
+# O template X-TRI é calibrado em 150 DPI (A4 = 1240 x 1754)
+PDF_DPI = int(os.getenv('OMR_PDF_DPI', 150))
+# DPI aceito do cliente (fora disso é ajustado ao limite mais próximo)
+PDF_DPI_MIN = 100
+PDF_DPI_MAX = 300
+# Pico por pixel de uma página: imagem PIL + array cinza + cópia de trabalho (giro/recorte)
+RASTER_BYTES_PER_PIXEL = 3
+# Tamanho assumido quando o pdfinfo não informa (A4, em pontos)
+A4_POINTS = (595.276, 841.89)
+# Threads de rasterização: CPUs do worker (runtime_limits), no máximo 4
+RASTER_WORKERS = runtime['pdf_workers']
+# Páginas rasterizadas à frente do consumidor, além de uma por thread
+RASTER_PREFETCH = 2
+# Tempo máximo de um pdftoppm (s)
+RASTER_TIMEOUT = 60
+
+
+def page_count(path: str) -> int:
+    """Número de páginas do PDF (pdfinfo); ValueError se o arquivo não for um PDF válido."""
+    from pdf2image import pdfinfo_from_path
+    from pdf2image.exceptions import PDFPageCountError, PDFSyntaxError
+
+    try:
+        return int(pdfinfo_from_path(path)['Pages'])
+    except (PDFPageCountError, PDFSyntaxError, KeyError) as e:
+        raise ValueError(f"PDF inválido: {e}")
+
+
+def clamp_dpi(dpi: int) -> int:
+    """DPI dentro de [PDF_DPI_MIN, PDF_DPI_MAX]."""
+    return max(PDF_DPI_MIN, min(PDF_DPI_MAX, int(dpi)))
+
+
+def page_bytes(path: str, dpi: int = PDF_DPI) -> int:
+    """Memória de pico de uma página rasterizada em dpi (tamanho da 1a página do pdfinfo)."""
+    from pdf2image import pdfinfo_from_path
+
+    try:
+        # 'Page size': '595.276 x 841.89 pts (A4)'
+        fields = pdfinfo_from_path(path)['Page size'].split()
+        width, height = float(fields[0]), float(fields[2])
+    except Exception:
+        width, height = A4_POINTS
+    return int(width / 72 * dpi) * int(height / 72 * dpi) * RASTER_BYTES_PER_PIXEL
+
+
+def render_page(path: str, page: int, dpi: int = PDF_DPI) -> np.ndarray:
+    """Uma página (1-indexed) em escala de cinza (PGM direto do pdftoppm, sem JPEG)."""
+    from pdf2image import convert_from_path
+
+    images = convert_from_path(path, dpi=dpi, first_page=page, last_page=page,
+                               grayscale=True, thread_count=1, timeout=RASTER_TIMEOUT)
+    if not images:
+        raise ValueError(f"Página {page} não pôde ser rasterizada")
+    return np.asarray(images[0].convert('L'))
+
+
+def iter_pages(path: str, first_page: int, last_page: int, dpi: int = PDF_DPI,
+               workers: int = RASTER_WORKERS, budget: Optional[MemoryBudget] = None,
+               nbytes: int = 0) -> Iterator[Tuple[int, Optional[np.ndarray], Optional[Exception]]]:
+    """
+    Rasteriza as páginas first_page..last_page em paralelo e as entrega em ordem.
+
+    Com budget, cada página reserva nbytes (page_bytes) antes de ser
+    rasterizada. Uma página entregue com imagem leva a reserva junto: quem
+    consome a devolve (budget.release) ao descartar a imagem. Páginas com
+    erro já saem sem reserva.
+
+    Yields:
+        (página, imagem cinza ou None, exceção ou None)
+    """
+    pages = list(range(first_page, last_page + 1))
+    window = max(1, workers) + RASTER_PREFETCH
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='pdf-raster') as pool:
+        # (página, future ou None, exceção ou None)
+        pending = []
+        next_index = 0
+        try:
+            while pending or next_index < len(pages):
+                while next_index < len(pages) and len(pending) < window:
+                    page = pages[next_index]
+                    if budget is not None:
+                        try:
+                            # Com páginas na janela não espera: elas só devolvem a
+                            # reserva depois de entregues, esperar aqui as travaria
+                            if pending:
+                                budget.acquire(nbytes, timeout=0)
+                            else:
+                                budget.acquire(nbytes)
+                        except MemoryBudgetExceeded as e:
+                            if pending and nbytes <= budget.limit:
+                                break
+                            pending.append((page, None, e))
+                            next_index += 1
+                            continue
+                    pending.append((page, pool.submit(render_page, path, page, dpi), None))
+                    next_index += 1
+
+                page, future, error = pending.pop(0)
+                if future is None:
+                    yield page, None, error
+                    continue
+                try:
+                    img = future.result()
+                except Exception as e:
+                    if budget is not None:
+                        budget.release(nbytes)
+                    yield page, None, e
+                    continue
+                yield page, img, None
+        finally:
+            # Consumidor desistiu (cliente desconectou): descartar o que não foi entregue
+            for _, future, _ in pending:
+                if future is not None:
+                    future.cancel()
+                    if budget is not None:
+                        budget.release(nbytes)
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Localizador do QR Code pelo template
+====================================
+
+No template X-TRI o QR fica sempre no mesmo lugar em relação aos marcadores
+do grid (acima do marcador superior direito). Em vez de procurar o QR numa
+área grande ou na página inteira:
+
+1. prevê o centro e o lado do QR pelos marcadores (ou, sem eles, pela
+   posição na página do template)
+2. recorta só a vizinhança prevista (QR_PAD de folga de cada lado)
+3. normaliza a escala para QR_MODULE_PX pixels por módulo: o recorte tem
+   sempre o mesmo tamanho (~150px), seja o scan de 150 ou 300 DPI
+4. acha o quadrilátero do QR no recorte (maior mancha escura do tamanho
+   previsto) e decodifica só ele, sem a etapa de detecção
+
+Medidas nos PDFs do template (150 e 200 DPI), em frações da distância entre
+os marcadores esquerdo e direito (S):
+    centro do QR = marcador superior direito + (-0.098 S, -0.261 S)
+    lado do QR   = 0.134 S
+
+Decodificador: QRCodeDetector do OpenCV (decode com os cantos) ou pyzbar,
+escolhido por QR_DECODER. Com os cantos já conhecidos o OpenCV decodifica o
+recorte em ~2ms; `python qr_locator.py bench <imagens>` compara os dois no
+corpus local.
+"""
+
+import os
+import sys
+import time
+import cv2
+import numpy as np
+from typing import Dict, List, Optional, Tuple, Union
+
+try:
+    from pyzbar import pyzbar
+except ImportError:  # libzbar ausente: só o decodificador do OpenCV
+    pyzbar = None
+
+# Posição do QR em relação aos marcadores (frações da distância entre eles)
+QR_MARKER_OFFSET = (-0.098, -0.261)
+QR_MARKER_SIDE = 0.134
+# Sem marcadores: centro e lado em frações da largura / altura da página
+QR_PAGE_CENTER = (0.840, 0.130)
+QR_PAGE_SIDE = 0.111
+
+# Folga do recorte em cada lado, em frações do lado previsto
+QR_PAD = 0.5
+# Módulos do QR (versão 1 + margem de 1 módulo) e pixels por módulo no recorte
+QR_MODULES = 23
+QR_MODULE_PX = 4
+
+# 'opencv' (padrão, mais rápido no corpus), 'pyzbar' ou 'both' (OpenCV e, se falhar, pyzbar)
+QR_DECODER = os.getenv('OMR_QR_DECODER', 'opencv').lower()
+
+Markers = Union[List[Tuple[float, float]], Dict[str, Tuple[float, float]], None]
+
+_detector = cv2.QRCodeDetector()
+
+
+def predict_qr(shape: Tuple[int, ...], markers: Markers = None) -> Tuple[float, float, float]:
+    """
+    Centro e lado previstos do QR, em pixels da página.
+
+    Args:
+        shape: shape da imagem (h, w[, c])
+        markers: marcadores do grid (lista de pontos da triagem ou dict
+                 TL/TR/BL/BR do leitor Hough); None = posição na página
+
+    Returns:
+        (cx, cy, lado)
+    """
+    h, w = shape[:2]
+    points = list(markers.values()) if isinstance(markers, dict) else (markers or [])
+    if len(points) >= 2:
+        xs = [p[0] for p in points]
+        ys = [p[1] for p in points]
+        span = max(xs) - min(xs)
+        # Marcadores alinhados na vertical (ou página deitada): usar a página
+        if span >= w * 0.5:
+            right, top = max(xs), min(ys)
+            return (right + QR_MARKER_OFFSET[0] * span,
+                    top + QR_MARKER_OFFSET[1] * span,
+                    QR_MARKER_SIDE * span)
+    return QR_PAGE_CENTER[0] * w, QR_PAGE_CENTER[1] * h, QR_PAGE_SIDE * w
+
+
+def crop_qr(gray: np.ndarray, markers: Markers = None) -> Optional[np.ndarray]:
+    """Recorte em volta do QR previsto, com QR_MODULE_PX pixels por módulo."""
+    cx, cy, side = predict_qr(gray.shape, markers)
+    h, w = gray.shape[:2]
+    half = side * (0.5 + QR_PAD)
+    x1, y1 = max(0, int(round(cx - half))), max(0, int(round(cy - half)))
+    x2, y2 = min(w, int(round(cx + half))), min(h, int(round(cy + half)))
+    if x2 - x1 < 20 or y2 - y1 < 20:
+        return None
+
+    scale = QR_MODULES * QR_MODULE_PX / side
+    interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+    return cv2.resize(gray[y1:y2, x1:x2], None, fx=scale, fy=scale, interpolation=interpolation)
+
+
+def find_qr_quad(crop: np.ndarray) -> Optional[np.ndarray]:
+    """
+    Cantos do QR no recorte normalizado: a maior mancha escura (módulos unidos
+    por fechamento) com o lado esperado.
+
+    Returns:
+        (1, 4, 2) float32 em ordem TL, TR, BR, BL, ou None
+    """
+    expected = (QR_MODULES - 2) * QR_MODULE_PX
+    _, binary = cv2.threshold(crop, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    kernel = np.ones((2 * QR_MODULE_PX + 1, 2 * QR_MODULE_PX + 1), np.uint8)
+    binary = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, kernel)
+    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    best, best_area = None, 0.0
+    for contour in contours:
+        _, _, bw, bh = cv2.boundingRect(contour)
+        if not (0.6 * expected < bw < 1.3 * expected and 0.6 * expected < bh < 1.3 * expected):
+            continue
+        area = cv2.contourArea(contour)
+        if area > best_area:
+            best, best_area = contour, area
+    if best is None:
+        return None
+
+    corners = cv2.boxPoints(cv2.minAreaRect(best))
+    total = corners.sum(axis=1)
+    diff = np.diff(corners, axis=1).ravel()
+    ordered = [corners[total.argmin()], corners[diff.argmin()], corners[total.argmax()], corners[diff.argmax()]]
+    return np.array(ordered, dtype=np.float32).reshape(1, 4, 2)
+
+
+def _decode_opencv(crop: np.ndarray) -> Optional[str]:
+    quad = find_qr_quad(crop)
+    text = _detector.decode(crop, quad)[0] if quad is not None else ''
+    if not text:
+        text = _detector.detectAndDecode(crop)[0]
+    return text or None
+
+
+def _decode_pyzbar(crop: np.ndarray) -> Optional[str]:
+    if pyzbar is None:
+        return None
+    for obj in pyzbar.decode(crop):
+        if obj.type == 'QRCODE':
+            try:
+                return obj.data.decode('utf-8')
+            except UnicodeDecodeError:
+                continue
+    return None
+
+
+DECODERS = {
+    'opencv': (_decode_opencv,),
+    'pyzbar': (_decode_pyzbar,),
+    'both': (_decode_opencv, _decode_pyzbar),
+}
+
+
+def read_qr_located(img: np.ndarray, markers: Markers = None, decoder: str = None) -> Optional[str]:
+    """
+    Lê o QR só no recorte previsto pelo template (custo constante em qualquer DPI).
+
+    Args:
+        img: imagem OpenCV (BGR ou cinza), já em pé
+        markers: marcadores do grid (opcional)
+        decoder: 'opencv', 'pyzbar' ou 'both' (padrão: QR_DECODER)
+
+    Returns:
+        Conteúdo do QR ou None
+    """
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if len(img.shape) == 3 else img
+    crop = crop_qr(gray, markers)
+    if crop is None:
+        return None
+    for decode in DECODERS.get(decoder or QR_DECODER, DECODERS['opencv']):
+        text = decode(crop)
+        if text:
+            return text.strip()
+    return None
+
+
+def benchmark(paths: List[str]) -> Dict[str, Dict]:
+    """Acertos e tempo (ms, mediana e máximo) de cada decodificador no recorte das imagens."""
+    from sheet_triage import triage
+
+    results = {name: {'hits': 0, 'times': []} for name in ('opencv', 'pyzbar')}
+    for path in paths:
+        img = cv2.imread(path)
+        if img is None:
+            continue
+        markers = triage(img)['markers'] or None
+        for name in results:
+            if name == 'pyzbar' and pyzbar is None:
+                continue
+            t0 = time.perf_counter()
+            text = read_qr_located(img, markers, decoder=name)
+            results[name]['times'].append((time.perf_counter() - t0) * 1000)
+            results[name]['hits'] += int(bool(text))
+
+    report = {}
+    for name, data in results.items():
+        times = data['times']
+        report[name] = {
+            'images': len(times),
+            'hits': data['hits'],
+            'median_ms': round(float(np.median(times)), 2) if times else None,
+            'max_ms': round(float(np.max(times)), 2) if times else None,
+        }
+    return report
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[1] != 'bench':
+        print("Uso: python qr_locator.py bench <imagem> [<imagem> ...]")
+        sys.exit(1)
+    for name, row in benchmark(sys.argv[2:]).items():
+        print(f"{name:7s} {row}")
@@ -7,19 +7,29 @@ Módulo para leitura robusta de QR Codes em gabaritos.
 Usa múltiplos métodos com fallback para máxima taxa de sucesso.
 
 Métodos:
-1. ROI (25% topo, 35% direita) - área onde o QR está no template
-2. Imagem completa
-3. Binarização threshold
+1. Recorte previsto pelo template (qr_locator), escala normalizada
+2. ROI (25% topo, 35% direita) e imagem completa
+3. Binarização threshold / CLAHE
 4. Versões escaladas
 
+QREngine: os métodos em níveis (recortes → variações do recorte → página
+inteira), com ordem adaptativa dentro de cada nível (acertos por ms de cada
+scanner/lote), orçamento de tempo por folha e métricas de acerto por método.
+
 Autor: GabaritAI / X-TRI
 """
 
 import cv2
 import numpy as np
 from pyzbar import pyzbar
+import os
 import re
+import time
+import threading
 import logging
+from collections import OrderedDict
+
+from qr_locator import read_qr_located
 
 logger = logging.getLogger(__name__)
 
@@ -54,6 +64,11 @@ def _decode_qr(image) -> str | None:
     return None
 
 
+def _to_gray(img):
+    """Escala de cinza sem cópia quando a imagem já é cinza."""
+    return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if len(img.shape) == 3 else img
+
+
 def read_qr_code(img) -> str | None:
     """
     Leitura básica de QR Code.
@@ -64,10 +79,7 @@ def read_qr_code(img) -> str | None:
     Returns:
         Conteúdo do QR Code ou None se não encontrar
     """
-    if len(img.shape) == 3:
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    else:
-        gray = img.copy()
+    gray = _to_gray(img)
 
     return _decode_qr(gray)
 
@@ -77,10 +89,7 @@ def read_qr_roi(img) -> str | None:
     Lê QR Code na região de interesse (canto superior direito).
     O QR Code no template X-TRI fica nos 25% superiores e 35% direitos.
     """
-    if len(img.shape) == 3:
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    else:
-        gray = img.copy()
+    gray = _to_gray(img)
 
     h, w = gray.shape
 
@@ -94,10 +103,7 @@ def read_qr_roi(img) -> str | None:
 
 def read_qr_binary(img) -> str | None:
     """Lê QR Code usando binarização adaptativa."""
-    if len(img.shape) == 3:
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    else:
-        gray = img.copy()
+    gray = _to_gray(img)
 
     binary = cv2.adaptiveThreshold(
         gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
@@ -108,10 +114,7 @@ def read_qr_binary(img) -> str | None:
 
 def read_qr_enhanced(img) -> str | None:
     """Lê QR Code com CLAHE para melhorar contraste."""
-    if len(img.shape) == 3:
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    else:
-        gray = img.copy()
+    gray = _to_gray(img)
 
     clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
     enhanced = clahe.apply(gray)
@@ -120,10 +123,7 @@ def read_qr_enhanced(img) -> str | None:
 
 def read_qr_scaled(img, scale: float = 0.5) -> str | None:
     """Lê QR Code em versão escalada da imagem."""
-    if len(img.shape) == 3:
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    else:
-        gray = img.copy()
+    gray = _to_gray(img)
 
     h, w = gray.shape
     new_w = int(w * scale)
@@ -136,61 +136,226 @@ def read_qr_scaled(img, scale: float = 0.5) -> str | None:
     return _decode_qr(scaled)
 
 
-def read_qr_with_fallback(img) -> dict:
+def _roi(gray):
+    h, w = gray.shape
+    return gray[0:int(h * 0.25), int(w * 0.65):w]
+
+
+def _binary(gray):
+    return cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 11, 2)
+
+
+def _enhanced(gray):
+    return cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(gray)
+
+
+def _scaled(gray, scale):
+    h, w = gray.shape
+    if int(w * scale) < 100 or int(h * scale) < 100:
+        return None
+    return cv2.resize(gray, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+
+
+def _decode_or_none(image):
+    return None if image is None or image.size == 0 else _decode_qr(image)
+
+
+# (nome, nível, custo inicial estimado em ms, função(gray, markers) -> texto ou None)
+# Nível 0: recortes; 1: variações do recorte; 2: página inteira
+QR_METHODS = [
+    ('located', 0, 3.0, lambda gray, markers: read_qr_located(gray, markers)),
+    ('roi', 0, 10.0, lambda gray, markers: _decode_or_none(_roi(gray))),
+    ('roi_binary', 1, 12.0, lambda gray, markers: _decode_or_none(_binary(np.ascontiguousarray(_roi(gray))))),
+    ('roi_enhanced', 1, 12.0, lambda gray, markers: _decode_or_none(_enhanced(np.ascontiguousarray(_roi(gray))))),
+    ('scaled_50', 2, 40.0, lambda gray, markers: _decode_or_none(_scaled(gray, 0.5))),
+    ('full', 2, 120.0, lambda gray, markers: _decode_or_none(gray)),
+    ('scaled_75', 2, 80.0, lambda gray, markers: _decode_or_none(_scaled(gray, 0.75))),
+    ('enhanced', 2, 130.0, lambda gray, markers: _decode_or_none(_enhanced(gray))),
+    ('binary', 2, 140.0, lambda gray, markers: _decode_or_none(_binary(gray))),
+]
+
+# Padrão: a cadeia inteira cabe com os custos iniciais (~550ms). Um orçamento
+# menor corta enhanced/binary nas folhas difíceis (budget_exhausted na resposta)
+QR_BUDGET_MS = float(os.getenv('OMR_QR_BUDGET_MS', 600))
+# Leituras de um contexto (scanner/lote) antes de usar a estatística dele
+MIN_CONTEXT_ATTEMPTS = 5
+MAX_CONTEXTS = 256
+
+
+class QREngine:
+    """
+    Leitura de QR com orçamento de tempo e ordem adaptativa.
+
+    Dentro de cada nível, os métodos vão em ordem decrescente de acertos por
+    ms (estimativa com prior de Laplace) do contexto (scanner ou lote); sem
+    leituras suficientes no contexto, vale a estatística global. Um método só
+    é tentado se o custo médio dele ainda cabe no orçamento da folha (o
+    primeiro sempre é tentado).
     """
-    Lê QR Code usando múltiplos métodos com fallback.
 
-    Tenta na ordem:
-    1. ROI (canto superior direito) - mais rápido
-    2. Imagem completa
-    3. CLAHE (contraste melhorado)
-    4. Binarização adaptativa
-    5. Escala 50%
-    6. Escala 75%
+    def __init__(self, methods=None, budget_ms: float = QR_BUDGET_MS):
+        self.methods = methods or QR_METHODS
+        self.budget_ms = budget_ms
+        self._lock = threading.Lock()
+        self._global = self._new_stats()
+        self._contexts = OrderedDict()
+        self._totals = {'reads': 0, 'found': 0, 'budget_exhausted': 0, 'time_ms': 0.0}
+
+    def _new_stats(self):
+        return {name: {'attempts': 0, 'hits': 0, 'time_ms': 0.0, 'prior_ms': cost}
+                for name, _, cost, _ in self.methods}
+
+    def _context_stats(self, context):
+        stats = self._contexts.get(context)
+        if stats is None:
+            stats = self._contexts[context] = self._new_stats()
+            if len(self._contexts) > MAX_CONTEXTS:
+                self._contexts.popitem(last=False)
+        else:
+            self._contexts.move_to_end(context)
+        return stats
+
+    @staticmethod
+    def _expected_ms(entry):
+        return entry['time_ms'] / entry['attempts'] if entry['attempts'] else entry['prior_ms']
+
+    @classmethod
+    def _score(cls, entry):
+        hit_rate = (entry['hits'] + 1.0) / (entry['attempts'] + 2.0)
+        return hit_rate / max(cls._expected_ms(entry), 0.1)
+
+    def order(self, context=None):
+        """Métodos na ordem em que serão tentados para o contexto."""
+        with self._lock:
+            stats = self._contexts.get(context) if context else None
+            attempts = sum(e['attempts'] for e in stats.values()) if stats else 0
+            source = stats if attempts >= MIN_CONTEXT_ATTEMPTS else self._global
+            ranked = sorted(
+                enumerate(self.methods),
+                key=lambda item: (item[1][1], -self._score(source[item[1][0]]), item[0])
+            )
+            return [(method, self._expected_ms(source[method[0]])) for _, method in ranked]
+
+    def _record(self, context, name, hit, elapsed_ms):
+        with self._lock:
+            targets = [self._global] + ([self._context_stats(context)] if context else [])
+            for stats in targets:
+                entry = stats[name]
+                entry['attempts'] += 1
+                entry['hits'] += int(hit)
+                entry['time_ms'] += elapsed_ms
+
+    def read(self, img, markers=None, context=None, budget_ms=None) -> dict:
+        """
+        Lê o QR da folha.
+
+        Args:
+            img: imagem OpenCV (BGR ou cinza)
+            markers: marcadores do grid (sheet_triage) para o recorte 'located'
+            context: chave do scanner/lote para a estatística adaptativa
+            budget_ms: orçamento desta folha (padrão: OMR_QR_BUDGET_MS)
+
+        Returns:
+            dict como read_qr_with_fallback, mais attempts, elapsed_ms e budget_exhausted
+        """
+        start = time.time()
+        budget = self.budget_ms if budget_ms is None else budget_ms
+        gray = _to_gray(img)
+
+        attempts = []
+        found = None
+        exhausted = False
+        for (name, _, _, func), expected_ms in self.order(context):
+            elapsed = (time.time() - start) * 1000
+            if attempts and elapsed + expected_ms > budget:
+                exhausted = True
+                continue
+            t0 = time.time()
+            try:
+                result = func(gray, markers)
+            except Exception as e:
+                logger.debug(f"QR method {name} failed: {e}")
+                result = None
+            self._record(context, name, bool(result), (time.time() - t0) * 1000)
+            attempts.append(name)
+            if result:
+                found = (name, result)
+                break
+
+        elapsed_ms = round((time.time() - start) * 1000, 2)
+        with self._lock:
+            self._totals['reads'] += 1
+            self._totals['found'] += int(found is not None)
+            self._totals['budget_exhausted'] += int(exhausted)
+            self._totals['time_ms'] += elapsed_ms
+
+        if found:
+            name, code = found
+            is_valid = validate_sheet_code(code)
+            logger.debug(f"QR found via {name}: {code} (valid={is_valid}, {elapsed_ms}ms)")
+            return {'success': True, 'sheet_code': code, 'method': name, 'valid': is_valid,
+                    'attempts': attempts, 'elapsed_ms': elapsed_ms, 'budget_exhausted': False}
+
+        logger.debug(f"QR Code not found ({len(attempts)} métodos, {elapsed_ms}ms, orçamento esgotado={exhausted})")
+        return {'success': False, 'sheet_code': None, 'method': None, 'valid': False,
+                'attempts': attempts, 'elapsed_ms': elapsed_ms, 'budget_exhausted': exhausted}
+
+    def metrics(self) -> dict:
+        """Taxa de acerto e tempo médio por método (global) e totais de leituras."""
+        with self._lock:
+            reads = self._totals['reads']
+            methods = {}
+            for name, level, _, _ in self.methods:
+                entry = self._global[name]
+                methods[name] = {
+                    'level': level,
+                    'attempts': entry['attempts'],
+                    'hits': entry['hits'],
+                    'hit_rate': round(entry['hits'] / entry['attempts'], 4) if entry['attempts'] else None,
+                    'avg_ms': round(entry['time_ms'] / entry['attempts'], 2) if entry['attempts'] else None,
+                }
+            return {
+                'reads': reads,
+                'found': self._totals['found'],
+                'found_rate': round(self._totals['found'] / reads, 4) if reads else None,
+                'budget_exhausted': self._totals['budget_exhausted'],
+                'avg_ms': round(self._totals['time_ms'] / reads, 2) if reads else None,
+                'budget_ms': self.budget_ms,
+                'contexts': len(self._contexts),
+                'methods': methods,
+            }
+
+
+qr_engine = QREngine()
+
+
+def read_qr_with_fallback(img, markers=None, context=None, budget_ms=None) -> dict:
+    """
+    Lê QR Code usando múltiplos métodos com fallback (QREngine compartilhado).
+
+    Ordem inicial:
+    1. Recorte previsto pelo template (qr_locator, pelos markers se houver) e ROI
+    2. ROI binarizada / com CLAHE
+    3. Página inteira: escala 50%, completa, escala 75%, CLAHE, binarização
 
     Args:
         img: Imagem OpenCV (BGR ou grayscale)
+        markers: marcadores do grid da triagem (opcional)
+        context: scanner/lote para a ordem adaptativa (opcional)
+        budget_ms: orçamento de tempo da folha (opcional)
 
     Returns:
         dict: {
             'success': bool,
             'sheet_code': str ou None,
             'method': str (método que funcionou),
-            'valid': bool (se código é válido)
+            'valid': bool (se código é válido),
+            'attempts': [métodos tentados],
+            'elapsed_ms': float,
+            'budget_exhausted': bool
         }
     """
-    methods = [
-        ('roi', lambda: read_qr_roi(img)),
-        ('full', lambda: read_qr_code(img)),
-        ('enhanced', lambda: read_qr_enhanced(img)),
-        ('binary', lambda: read_qr_binary(img)),
-        ('scaled_50', lambda: read_qr_scaled(img, 0.5)),
-        ('scaled_75', lambda: read_qr_scaled(img, 0.75)),
-    ]
-
-    for method_name, method_func in methods:
-        try:
-            result = method_func()
-            if result:
-                is_valid = validate_sheet_code(result)
-                logger.debug(f"QR found via {method_name}: {result} (valid={is_valid})")
-                return {
-                    'success': True,
-                    'sheet_code': result,
-                    'method': method_name,
-                    'valid': is_valid
-                }
-        except Exception as e:
-            logger.debug(f"QR method {method_name} failed: {e}")
-            continue
-
-    logger.debug("QR Code not found with any method")
-    return {
-        'success': False,
-        'sheet_code': None,
-        'method': None,
-        'valid': False
-    }
+    return qr_engine.read(img, markers=markers, context=context, budget_ms=budget_ms)
 
 
 # Alias para compatibilidade
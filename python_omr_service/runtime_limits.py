@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Limites de CPU e memória do contêiner
+=====================================
+
+A máquina do Fly tem 1 vCPU compartilhada, mas os.cpu_count() enxerga os
+núcleos do host. Com 8 workers × 2 threads e o pool interno do OpenCV em cada
+worker, o serviço disputa a mesma CPU dezenas de vezes e multiplica a memória.
+
+Aqui os limites vêm do cgroup (v2: cpu.max / memory.max; v1: cfs_quota_us /
+memory.limit_in_bytes), com afinidade e /proc/meminfo como reserva, e viram
+um plano único usado pelo gunicorn.conf.py e pelo app:
+
+- workers: um por CPU, limitado pelo que cabe na memória
+- threads por worker: para sobrepor rede (Supabase) e upload com o OMR
+- OpenCV: CPUs divididas entre os workers (1 quando há um worker por CPU)
+- vagas de OMR, pools (rasterização de PDF, I/O) e orçamento de memória
+  por worker
+
+Todo valor pode ser fixado por variável de ambiente (OMR_WORKERS,
+OMR_THREADS, OMR_OPENCV_THREADS, ...); o plano só preenche o que faltar.
+"""
+
+import math
+import os
+from typing import Any, Dict, Optional
+
+# Memória base de um worker carregado (Flask, OpenCV, templates), sem páginas
+WORKER_BASE_MB = 150
+# Orçamento de páginas decodificadas por worker (teto e piso)
+MAX_PAGE_BUDGET_MB = 256
+MIN_PAGE_BUDGET_MB = 64
+# Fração da memória do contêiner que os workers podem ocupar
+MEMORY_FRACTION = 0.75
+# Threads por worker: poucas, porque o OMR é CPU; as outras esperam rede
+DEFAULT_THREADS = 4
+MAX_RASTER_WORKERS = 4
+
+_CGROUP = '/sys/fs/cgroup'
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def _cgroup_cpus() -> Optional[float]:
+    """CPUs permitidas pela cota do cgroup (None sem cota)."""
+    value = _read(f'{_CGROUP}/cpu.max')
+    if value:
+        quota, _, period = value.partition(' ')
+        if quota != 'max':
+            return int(quota) / int(period or 100000)
+        return None
+    quota = _read(f'{_CGROUP}/cpu/cpu.cfs_quota_us')
+    period = _read(f'{_CGROUP}/cpu/cpu.cfs_period_us')
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period)
+    return None
+
+
+def _cgroup_memory_mb() -> Optional[int]:
+    """Limite de memória do cgroup em MB (None sem limite)."""
+    value = _read(f'{_CGROUP}/memory.max') or _read(f'{_CGROUP}/memory/memory.limit_in_bytes')
+    if not value or value == 'max':
+        return None
+    limit = int(value)
+    # cgroup v1 sem limite reporta um número próximo de 2**63
+    return limit // 2**20 if limit < 2**60 else None
+
+
+def _host_memory_mb() -> Optional[int]:
+    meminfo = _read('/proc/meminfo') or ''
+    for line in meminfo.splitlines():
+        if line.startswith('MemTotal:'):
+            return int(line.split()[1]) // 1024
+    return None
+
+
+def detect() -> Dict[str, Any]:
+    """CPUs e memória disponíveis, com a origem de cada valor."""
+    try:
+        affinity = len(os.sched_getaffinity(0))
+    except AttributeError:
+        affinity = os.cpu_count() or 1
+
+    quota = _cgroup_cpus()
+    cpus = max(1, min(affinity, math.ceil(quota))) if quota else affinity
+
+    memory_mb = _cgroup_memory_mb()
+    host_mb = _host_memory_mb()
+    memory_source = 'cgroup'
+    if memory_mb is None or (host_mb and memory_mb > host_mb):
+        memory_mb, memory_source = host_mb, 'host'
+
+    return {
+        'cpus': cpus,
+        'cpu_source': 'cgroup' if quota else 'affinity',
+        'memory_mb': memory_mb,
+        'memory_source': memory_source if memory_mb else None,
+    }
+
+
+def _env_int(name: str) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+def plan(limits: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Workers, threads e pools para os limites detectados.
+
+    Variáveis de ambiente têm precedência: OMR_WORKERS, OMR_THREADS,
+    OMR_OPENCV_THREADS, OMR_PDF_WORKERS, OMR_MEMORY_BUDGET_MB.
+    """
+    limits = limits or detect()
+    cpus = limits['cpus']
+    memory_mb = limits['memory_mb']
+
+    workers = _env_int('OMR_WORKERS')
+    if workers is None:
+        workers = cpus
+        if memory_mb:
+            fits = int(memory_mb * MEMORY_FRACTION // (WORKER_BASE_MB + MIN_PAGE_BUDGET_MB))
+            workers = max(1, min(workers, fits))
+
+    budget_mb = _env_int('OMR_MEMORY_BUDGET_MB')
+    if budget_mb is None:
+        budget_mb = MAX_PAGE_BUDGET_MB
+        if memory_mb:
+            share = memory_mb * MEMORY_FRACTION / workers - WORKER_BASE_MB
+            budget_mb = int(max(MIN_PAGE_BUDGET_MB, min(MAX_PAGE_BUDGET_MB, share)))
+
+    cpus_per_worker = max(1, cpus // workers)
+    opencv_threads = _env_int('OMR_OPENCV_THREADS') or cpus_per_worker
+    pdf_workers = _env_int('OMR_PDF_WORKERS') or min(MAX_RASTER_WORKERS, cpus_per_worker)
+
+    return {
+        **limits,
+        'workers': workers,
+        'threads': _env_int('OMR_THREADS') or DEFAULT_THREADS,
+        'opencv_threads': opencv_threads,
+        # Triagem/QR/OMR simultâneos por worker (admission)
+        'omr_slots': cpus_per_worker,
+        'pdf_workers': pdf_workers,
+        'memory_budget_mb': budget_mb,
+    }
+
+
+runtime = plan()
+
+
+def apply_opencv_threads():
+    """Ajusta o pool interno do OpenCV deste processo (chamar também depois do fork)."""
+    import cv2
+    cv2.setNumThreads(runtime['opencv_threads'])
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+I/O do Supabase em paralelo com o OMR
+=====================================
+
+A busca do aluno e o salvamento do resultado são idas e voltas de rede;
+o OMR é OpenCV, que solta o GIL. Em vez de QR → busca → OMR → salvar em
+sequência, a busca sai numa thread de I/O assim que o sheet_code é lido e
+roda junto com o OMR. O salvamento sai na mesma thread de I/O e a resposta
+espera por ele até SAVE_WAIT_MS, para informar se a folha foi salva.
+
+Com OMR_SAVE_ASYNC=true a resposta não espera (status 'pending'); salvamentos
+que terminam depois da resposta são registrados no log e nas contagens de
+metrics() (/api/metrics).
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app_log import logger
+from runtime_limits import runtime
+
+# Uma busca/salvamento em voo por thread de requisição do worker
+IO_THREADS = int(os.getenv('OMR_IO_THREADS', runtime['threads']))
+# Quanto a resposta espera pelo salvamento; passado o limite o status vem como 'pending'.
+# OMR_SAVE_ASYNC=true: não espera (o desfecho só aparece no log e em /api/metrics)
+SAVE_ASYNC = os.getenv('OMR_SAVE_ASYNC', 'false').lower() == 'true'
+SAVE_WAIT_MS = 0.0 if SAVE_ASYNC else float(os.getenv('OMR_SAVE_WAIT_MS', 5000))
+# Espera máxima pela busca do aluno (s)
+LOOKUP_TIMEOUT = 30
+
+SAVE_SAVED = 'saved'
+SAVE_NOT_SAVED = 'not_saved'
+SAVE_PENDING = 'pending'
+
+
+class SheetIO:
+    """Pool de threads de I/O do worker e contagem dos salvamentos assíncronos."""
+
+    def __init__(self, threads: int = IO_THREADS):
+        self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='omr-io')
+        self._lock = threading.Lock()
+        self._saves = {'submitted': 0, SAVE_SAVED: 0, SAVE_NOT_SAVED: 0, 'errors': 0,
+                       'late': 0, 'time_ms': 0.0}
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """Executa fn(*args) numa thread de I/O; o Future resolve em (resultado, ms)."""
+        def timed():
+            t0 = time.time()
+            value = fn(*args)
+            return value, round((time.time() - t0) * 1000, 2)
+        return self._pool.submit(timed)
+
+    def lookup(self, fn: Callable, sheet_code: str) -> Callable[[], Tuple[Any, Optional[float], float]]:
+        """Dispara a busca do aluno; retorna a função que espera (aluno, ms da busca, ms esperando)."""
+        future = self.submit(fn, sheet_code)
+
+        def wait():
+            t0 = time.time()
+            try:
+                student, elapsed_ms = future.result(timeout=LOOKUP_TIMEOUT)
+            except Exception as e:
+                logger.error(f"Busca do aluno {sheet_code} falhou: {e}")
+                student, elapsed_ms = None, None
+            return student, elapsed_ms, round((time.time() - t0) * 1000, 2)
+        return wait
+
+    def save(self, fn: Callable, sheet_code: str, *args, wait_ms: float = None) -> Dict[str, Any]:
+        """
+        Dispara o salvamento e espera até wait_ms (padrão SAVE_WAIT_MS).
+
+        Returns:
+            {'status': 'saved' | 'not_saved' | 'pending', 'saved': bool ou None, 'save_ms': ms ou None}
+        """
+        wait_ms = SAVE_WAIT_MS if wait_ms is None else wait_ms
+        submitted = time.time()
+        future = self.submit(fn, sheet_code, *args)
+        with self._lock:
+            self._saves['submitted'] += 1
+
+        def done(f: Future):
+            late = (time.time() - submitted) * 1000 > wait_ms
+            with self._lock:
+                try:
+                    saved, elapsed_ms = f.result()
+                    self._saves[SAVE_SAVED if saved else SAVE_NOT_SAVED] += 1
+                    self._saves['time_ms'] += elapsed_ms
+                except Exception as e:
+                    saved = False
+                    self._saves['errors'] += 1
+                    logger.error(f"Salvamento de {sheet_code} falhou: {e}")
+                self._saves['late'] += int(late)
+            if late:
+                logger.info(f"Salvamento assíncrono de {sheet_code}: {'ok' if saved else 'não salvo'}")
+
+        future.add_done_callback(done)
+        try:
+            saved, elapsed_ms = future.result(timeout=wait_ms / 1000.0)
+        except FutureTimeout:
+            return {'status': SAVE_PENDING, 'saved': None, 'save_ms': None}
+        except Exception:
+            return {'status': SAVE_NOT_SAVED, 'saved': False, 'save_ms': None}
+        return {'status': SAVE_SAVED if saved else SAVE_NOT_SAVED, 'saved': saved, 'save_ms': elapsed_ms}
+
+    def metrics(self) -> Dict[str, Any]:
+        """Contagem dos salvamentos deste worker (inclusive os que terminaram depois da resposta)."""
+        with self._lock:
+            saves = dict(self._saves)
+        finished = saves[SAVE_SAVED] + saves[SAVE_NOT_SAVED]
+        saves['in_flight'] = saves['submitted'] - finished - saves['errors']
+        time_ms = saves.pop('time_ms')
+        saves['avg_ms'] = round(time_ms / finished, 2) if finished else None
+        return saves
+
+
+sheet_io = SheetIO()
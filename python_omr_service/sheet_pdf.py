@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+PDF de gabaritos de um lote (/api/download-pdf)
+===============================================
+
+Tudo o que é igual em todas as folhas (título, 4 marcadores, cabeçalhos das
+6 colunas, 90 números de questão e 450 bolhas) é desenhado uma única vez
+como form XObject do reportlab e cada página só o referencia (doForm). Por
+aluno entram apenas o texto de identificação e o QR Code, desenhado como
+vetor (um path com os módulos escuros) em vez de PNG → BytesIO → ImageReader.
+
+Tempo de geração e tamanho do arquivo passam a crescer só com o conteúdo
+variável de cada folha.
+"""
+
+import io
+from typing import Dict, List
+
+import qrcode
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfgen import canvas
+
+# Nome do form XObject com a parte fixa da folha
+STATIC_FORM = 'xtri_sheet_static'
+
+# Layout da folha (pontos; origem no canto inferior esquerdo)
+PAGE_WIDTH, PAGE_HEIGHT = A4
+QR_SIZE = 35 * mm
+QR_BORDER = 2
+MARKER_SIZE = 5 * mm
+GRID_TOP = PAGE_HEIGHT - 140 * mm
+COL_WIDTH = 28 * mm
+ROW_HEIGHT = 8 * mm
+BUBBLE_RADIUS = 2.5 * mm
+
+
+def draw_static_sheet(c: canvas.Canvas):
+    """Título, marcadores de canto e grade de 90 questões (parte igual em todas as folhas)."""
+    width, height = PAGE_WIDTH, PAGE_HEIGHT
+
+    # Cabeçalho
+    c.setFont("Helvetica-Bold", 16)
+    c.drawString(20*mm, height - 20*mm, "GABARITO - PROVA")
+
+    # Marcadores de canto (quadrados pretos para alinhamento)
+    c.rect(15*mm, height - 130*mm, MARKER_SIZE, MARKER_SIZE, fill=1)          # Top-left
+    c.rect(width - 20*mm, height - 130*mm, MARKER_SIZE, MARKER_SIZE, fill=1)  # Top-right
+    c.rect(15*mm, 40*mm, MARKER_SIZE, MARKER_SIZE, fill=1)                    # Bottom-left
+    c.rect(width - 20*mm, 40*mm, MARKER_SIZE, MARKER_SIZE, fill=1)            # Bottom-right
+
+    # Grid de respostas (6 colunas x 15 linhas = 90 questões)
+    bubbles = c.beginPath()
+    for col in range(6):
+        col_x = 20*mm + col * COL_WIDTH
+
+        # Cabeçalho da coluna
+        c.setFont("Helvetica-Bold", 8)
+        c.drawString(col_x + 8*mm, GRID_TOP + 5*mm, "A  B  C  D  E")
+        c.setFont("Helvetica", 8)
+
+        for row in range(15):
+            q_num = col * 15 + row + 1
+            row_y = GRID_TOP - row * ROW_HEIGHT
+
+            # Número da questão
+            c.drawString(col_x, row_y, f"{q_num:02d}")
+
+            # Bolhas A-E (um path só para as 450)
+            for opt in range(5):
+                bubbles.circle(col_x + 10*mm + opt * 5*mm, row_y + 1.5*mm, BUBBLE_RADIUS)
+    c.drawPath(bubbles, stroke=1, fill=0)
+
+
+def draw_qr(c: canvas.Canvas, data: str, x: float, y: float, size: float = QR_SIZE):
+    """
+    QR Code vetorial: módulos escuros como retângulos de um único path
+    (trechos horizontais contíguos viram um retângulo só).
+    """
+    qr = qrcode.QRCode(version=1, border=QR_BORDER)
+    qr.add_data(data)
+    qr.make(fit=True)
+    matrix = qr.get_matrix()
+    module = size / len(matrix)
+
+    path = c.beginPath()
+    for r, row in enumerate(matrix):
+        top = y + size - (r + 1) * module
+        start = None
+        for col, dark in enumerate(row + [False]):
+            if dark and start is None:
+                start = col
+            elif not dark and start is not None:
+                path.rect(x + start * module, top, (col - start) * module, module)
+                start = None
+    c.drawPath(path, stroke=0, fill=1)
+
+
+def draw_student(c: canvas.Canvas, student: Dict):
+    """Identificação do aluno e QR Code (parte variável da folha)."""
+    width, height = PAGE_WIDTH, PAGE_HEIGHT
+
+    c.setFont("Helvetica", 12)
+    c.drawString(20*mm, height - 35*mm, f"Nome: {student['student_name']}")
+    c.drawString(20*mm, height - 42*mm, f"Matrícula: {student.get('enrollment_code', '-')}")
+    c.drawString(20*mm, height - 49*mm, f"Turma: {student.get('class_name', '-')}")
+    c.drawString(20*mm, height - 56*mm, f"Código: {student['sheet_code']}")
+
+    # QR Code (canto superior direito)
+    draw_qr(c, student['sheet_code'], width - 45*mm, height - 45*mm)
+
+
+def render_batch_pdf(students: List[Dict]) -> io.BytesIO:
+    """PDF com uma folha por aluno; a parte fixa é um form XObject reutilizado."""
+    pdf_buffer = io.BytesIO()
+    c = canvas.Canvas(pdf_buffer, pagesize=A4)
+
+    c.beginForm(STATIC_FORM)
+    draw_static_sheet(c)
+    c.endForm()
+
+    for student in students:
+        c.doForm(STATIC_FORM)
+        draw_student(c, student)
+        c.showPage()
+
+    c.save()
+    pdf_buffer.seek(0)
+    return pdf_buffer
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Triagem rápida de páginas
+=========================
+
+Classifica a página numa miniatura (THUMB_WIDTH px de largura), em poucos
+milissegundos, antes do pipeline caro (QR com fallback + leitores OMR):
+
+- blank: sem tinta (verso em branco do scanner duplex)
+- not_sheet: tem conteúdo mas não tem os 4 marcadores do cartão-resposta
+- low_quality: cartão sem nitidez ou contraste para leitura confiável
+- candidate: segue para o processamento completo
+
+Sinais medidos:
+- ink: % de pixels bem mais escuros que o papel (percentil 95)
+- markers: quadrados sólidos escuros formando o retângulo do grid (3 ou 4 cantos,
+  em qualquer orientação múltipla de 90° e inclinado até MARKER_MAX_SKEW_DEG)
+- sharpness: variância do Laplaciano da miniatura
+- contrast: papel - tinta (percentis 95 e 1)
+- rotation: giro (0/90/180/270, horário) que deixa o cartão em pé; o cabeçalho
+  (título, nome, QR) fica do lado do grid com mais tinta, o rodapé quase vazio
+- skew: inclinação (graus) do retângulo dos marcadores; corrigida depois
+  pelos leitores (deskew), não aqui
+"""
+
+import time
+import cv2
+import numpy as np
+from typing import Any, Dict, List, Optional, Tuple
+
+THUMB_WIDTH = 400
+
+# Pixel é tinta se estiver INK_DELTA níveis abaixo do papel
+INK_DELTA = 60
+# Menos que isso (% da página) = página em branco
+BLANK_INK_PERCENT = 0.3
+# Sem tinta mas com esse contraste: pode ser digitalização clara demais; os
+# marcadores são procurados de novo com limiar pela metade do contraste
+# (verso com transparência do outro lado fica abaixo disso)
+FAINT_MIN_CONTRAST = 40.0
+
+# Marcador no template: ~2.3% da largura da página (28px em 1240px)
+MARKER_SIZE_RANGE = (0.015, 0.04)   # lado, em fração da largura da miniatura
+MARKER_MIN_FILL = 0.65              # área / bounding box (bolha preenchida ~0.78, quadrado ~1)
+# Distância entre marcadores em fração da página: 0.83 na largura, 0.35 na altura
+MARKER_MIN_SPAN = 0.6
+MARKER_MIN_SIDE = 0.15
+# Inclinação aceita (a mesma que deskew_image corrige) e desvio do ângulo reto
+# entre os lados (foto com perspectiva)
+MARKER_MAX_SKEW_DEG = 15.0
+MARKER_RIGHT_ANGLE_TOLERANCE_DEG = 4.0
+# Abaixo disso a inclinação é ignorada ao medir a orientação
+ORIENTATION_DESKEW_MIN_DEG = 0.5
+
+MIN_SHARPNESS = 150.0
+MIN_CONTRAST = 80.0
+
+# Tinta no lado do cabeçalho / tinta no lado oposto para decidir a orientação
+ORIENTATION_MIN_RATIO = 1.5
+
+# Giro horário a aplicar -> código do cv2.rotate (transposição + flip, sem interpolação)
+ROTATE_CODES = {
+    90: cv2.ROTATE_90_CLOCKWISE,
+    180: cv2.ROTATE_180,
+    270: cv2.ROTATE_90_COUNTERCLOCKWISE,
+}
+
+STATUS_BLANK = 'blank'
+STATUS_NOT_SHEET = 'not_sheet'
+STATUS_LOW_QUALITY = 'low_quality'
+STATUS_CANDIDATE = 'candidate'
+
+
+def make_thumbnail(img: np.ndarray, width: int = THUMB_WIDTH) -> np.ndarray:
+    """
+    Miniatura em escala de cinza.
+
+    Amostra 1 a cada k pixels do canal verde (view, sem cópia) até pouco acima da
+    largura final e só então faz a média por área: reduzir a imagem inteira
+    com INTER_AREA custaria mais que a própria triagem.
+    """
+    h, w = img.shape[:2]
+    step = max(1, w // width)
+    small = img[::step, ::step, 1] if img.ndim == 3 else img[::step, ::step]
+    sh, sw = small.shape
+    if sw > width:
+        small = cv2.resize(small, (width, max(1, int(round(sh * width / sw)))), interpolation=cv2.INTER_AREA)
+    return np.ascontiguousarray(small)
+
+
+def find_marker_candidates(ink: np.ndarray) -> List[Tuple[float, float]]:
+    """Centros de blobs quadrados e sólidos do tamanho de um marcador."""
+    h, w = ink.shape
+    ref = min(w, h)  # página deitada: o lado menor continua sendo a largura do papel
+    lo, hi = MARKER_SIZE_RANGE[0] * ref, MARKER_SIZE_RANGE[1] * ref
+    n, _, stats, centroids = cv2.connectedComponentsWithStats(ink, connectivity=8)
+    found = []
+    for i in range(1, n):
+        x, y, bw, bh, area = stats[i]
+        if not (lo <= bw <= hi and lo <= bh <= hi):
+            continue
+        if not 0.7 <= bw / bh <= 1.4:
+            continue
+        if area / float(bw * bh) < MARKER_MIN_FILL:
+            continue
+        found.append((float(centroids[i][0]), float(centroids[i][1])))
+    return found
+
+
+def find_marker_rectangle(candidates: List[Tuple[float, float]], shape: Tuple[int, int]) -> Optional[List]:
+    """
+    Três marcadores em ângulo reto (um vizinho na horizontal e um na vertical,
+    inclinados até MARKER_MAX_SKEW_DEG) com o lado maior cobrindo
+    >= MARKER_MIN_SPAN da página.
+
+    Returns:
+        [canto, vizinho horizontal, vizinho vertical] ou None
+    """
+    if len(candidates) < 3:
+        return None
+    h, w = shape
+    points = np.asarray(candidates, dtype=np.float64)
+    dx = points[None, :, 0] - points[:, None, 0]
+    dy = points[None, :, 1] - points[:, None, 1]
+    slope = np.tan(np.radians(MARKER_MAX_SKEW_DEG))
+    horizontal = (np.abs(dy) <= slope * np.abs(dx)) & (np.abs(dx) >= MARKER_MIN_SIDE * w)
+    vertical = (np.abs(dx) <= slope * np.abs(dy)) & (np.abs(dy) >= MARKER_MIN_SIDE * h)
+    max_cos = np.sin(np.radians(MARKER_RIGHT_ANGLE_TOLERANCE_DEG))
+
+    best = None
+    for i in range(len(points)):
+        b_idx, c_idx = np.flatnonzero(horizontal[i]), np.flatnonzero(vertical[i])
+        if not len(b_idx) or not len(c_idx):
+            continue
+        u = np.stack([dx[i, b_idx], dy[i, b_idx]], axis=1)
+        v = np.stack([dx[i, c_idx], dy[i, c_idx]], axis=1)
+        len_u, len_v = np.hypot(u[:, 0], u[:, 1]), np.hypot(v[:, 0], v[:, 1])
+        cos = np.abs(u @ v.T) / np.outer(len_u, len_v)
+        span_x, span_y = (len_u / w)[:, None], (len_v / h)[None, :]
+        ok = (cos <= max_cos) & (np.maximum(span_x, span_y) >= MARKER_MIN_SPAN)
+        if not ok.any():
+            continue
+        area = np.where(ok, span_x * span_y, -1.0)
+        j, k = np.unravel_index(np.argmax(area), area.shape)
+        if best is None or area[j, k] > best[0]:
+            best = (area[j, k], [candidates[i], candidates[b_idx[j]], candidates[c_idx[k]]])
+    return best[1] if best else None
+
+
+def marker_skew(rectangle: List) -> float:
+    """Inclinação (graus, positiva = horário na imagem) do lado horizontal do retângulo."""
+    (ax, ay), (bx, by) = rectangle[0], rectangle[1]
+    if bx < ax:
+        ax, ay, bx, by = bx, by, ax, ay
+    return float(np.degrees(np.arctan2(by - ay, bx - ax)))
+
+
+def detect_rotation(ink: np.ndarray, rectangle: List) -> int:
+    """
+    Giro horário (0, 90, 180, 270) que põe o cartão em pé.
+
+    O lado maior do retângulo dos marcadores diz se a página está deitada; a
+    faixa com mais tinta de cada lado dele é o cabeçalho. Página inclinada:
+    a máscara é endireitada antes de medir as faixas. Empate = 0.
+    """
+    h, w = ink.shape
+    skew = marker_skew(rectangle)
+    if abs(skew) >= ORIENTATION_DESKEW_MIN_DEG:
+        matrix = cv2.getRotationMatrix2D((w / 2.0, h / 2.0), skew, 1.0)
+        ink = cv2.warpAffine(ink, matrix, (w, h), flags=cv2.INTER_NEAREST, borderValue=0)
+        rectangle = cv2.transform(np.asarray(rectangle, dtype=np.float64).reshape(-1, 1, 2), matrix).reshape(-1, 2)
+    xs = [p[0] for p in rectangle]
+    ys = [p[1] for p in rectangle]
+    x0, x1, y0, y1 = int(min(xs)), int(max(xs)), int(min(ys)), int(max(ys))
+
+    if x1 - x0 >= y1 - y0:
+        depth = y1 - y0
+        before = ink[max(0, y0 - depth):y0, x0:x1]
+        after = ink[y1 + 1:min(h, y1 + 1 + depth), x0:x1]
+        rotations = (0, 180)
+    else:
+        depth = x1 - x0
+        before = ink[y0:y1, max(0, x0 - depth):x0]
+        after = ink[y0:y1, x1 + 1:min(w, x1 + 1 + depth)]
+        # Cabeçalho à esquerda: página girada 90° anti-horário
+        rotations = (90, 270)
+
+    ink_before = before.mean() if before.size else 0.0
+    ink_after = after.mean() if after.size else 0.0
+    if ink_before >= ink_after * ORIENTATION_MIN_RATIO:
+        return rotations[0]
+    if ink_after >= ink_before * ORIENTATION_MIN_RATIO:
+        return rotations[1]
+    return 0
+
+
+def rotate_page(img: np.ndarray, rotation: int) -> np.ndarray:
+    """Aplica o giro de detect_rotation (múltiplos de 90°: cópia, sem interpolação)."""
+    if rotation not in ROTATE_CODES:
+        return img
+    return cv2.rotate(img, ROTATE_CODES[rotation])
+
+
+def rotate_points(points: List, shape: Tuple[int, int], rotation: int) -> List[Tuple[int, int]]:
+    """Pontos da imagem original (shape = (h, w)) nas coordenadas da imagem girada por rotate_page."""
+    h, w = shape[:2]
+    if rotation == 90:
+        return [(h - 1 - y, x) for x, y in points]
+    if rotation == 180:
+        return [(w - 1 - x, h - 1 - y) for x, y in points]
+    if rotation == 270:
+        return [(y, w - 1 - x) for x, y in points]
+    return [(x, y) for x, y in points]
+
+
+def oriented_markers(page: Optional[Dict[str, Any]], shape: Tuple[int, int]) -> Optional[List[Tuple[int, int]]]:
+    """Marcadores da triagem nas coordenadas da página já girada (recorte do QR)."""
+    if not page or not page['markers']:
+        return None
+    return rotate_points(page['markers'], shape, page['rotation'])
+
+
+def triage(img: np.ndarray) -> Dict[str, Any]:
+    """
+    Classifica a página (BGR ou cinza, qualquer resolução).
+
+    Returns:
+        Dict com status (blank / not_sheet / low_quality / candidate), reason,
+        métricas (ink_percent, markers, sharpness, contrast), rotation, skew
+        e elapsed_ms. rotation vale também para low_quality com marcadores.
+    """
+    t0 = time.time()
+    thumb = make_thumbnail(img)
+    h, w = thumb.shape
+
+    cumulative = np.cumsum(cv2.calcHist([thumb], [0], None, [256], [0, 256]).ravel()) / thumb.size
+    paper, dark = float(np.searchsorted(cumulative, 0.95)), float(np.searchsorted(cumulative, 0.01))
+    ink_mask = (thumb < paper - INK_DELTA).astype(np.uint8)
+    ink_percent = float(ink_mask.mean() * 100.0)
+    contrast = float(paper - dark)
+    sharpness = float(cv2.Laplacian(thumb, cv2.CV_64F).var())
+    faint = ink_percent < BLANK_INK_PERCENT and contrast >= FAINT_MIN_CONTRAST
+    if faint:
+        ink_mask = (thumb < paper - contrast / 2).astype(np.uint8)
+
+    # Marcadores impressos em retícula (cinza pontilhado): fechar antes de medir
+    closed = cv2.morphologyEx(ink_mask, cv2.MORPH_CLOSE, np.ones((3, 3), np.uint8))
+    candidates = find_marker_candidates(closed)
+    rectangle = find_marker_rectangle(candidates, (h, w))
+
+    if ink_percent < BLANK_INK_PERCENT and rectangle is None:
+        status, reason = STATUS_BLANK, f'{ink_percent:.2f}% de tinta'
+    elif faint:
+        status, reason = STATUS_LOW_QUALITY, f'imagem clara demais ({ink_percent:.2f}% de tinta, contraste {contrast:.0f})'
+    elif rectangle is None:
+        if sharpness < MIN_SHARPNESS or contrast < MIN_CONTRAST:
+            status, reason = STATUS_LOW_QUALITY, 'marcadores não encontrados (imagem borrada ou sem contraste)'
+        else:
+            status, reason = STATUS_NOT_SHEET, 'marcadores do cartão-resposta não encontrados'
+    elif sharpness < MIN_SHARPNESS:
+        status, reason = STATUS_LOW_QUALITY, f'imagem borrada (nitidez {sharpness:.0f} < {MIN_SHARPNESS:.0f})'
+    elif contrast < MIN_CONTRAST:
+        status, reason = STATUS_LOW_QUALITY, f'contraste baixo ({contrast:.0f} < {MIN_CONTRAST:.0f})'
+    else:
+        status, reason = STATUS_CANDIDATE, None
+
+    has_markers = rectangle is not None
+    rotation = detect_rotation(ink_mask, rectangle) if has_markers else 0
+
+    scale = img.shape[1] / float(w)
+    return {
+        'status': status,
+        'reason': reason,
+        'rotation': rotation,
+        'skew': round(marker_skew(rectangle), 1) if has_markers else None,
+        'ink_percent': round(ink_percent, 2),
+        'markers': [(int(x * scale), int(y * scale)) for x, y in rectangle] if has_markers else [],
+        'sharpness': round(sharpness, 1),
+        'contrast': round(contrast, 1),
+        'elapsed_ms': round((time.time() - t0) * 1000, 2),
+    }
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Pipeline em estágios dentro de uma requisição
+=============================================
+
+Cada folha de um lote passa por estágios com perfis diferentes: decodificar
+e OMR usam CPU (OpenCV solta o GIL), busca do aluno e salvamento esperam a
+rede. Em sequência, a CPU fica parada durante as idas ao Supabase e a rede
+fica parada durante o OpenCV.
+
+StagePipeline liga os estágios por filas limitadas, com poucas threads por
+estágio: enquanto a folha N é salva, a N+1 está no OMR e a N+2 no QR. Ganha
+mesmo com 1 vCPU, porque o que se sobrepõe é I/O com CPU.
+
+- A ordem de entrada é preservada na saída
+- Filas limitadas (queue_size): quem alimenta espera quando o pipeline
+  está cheio (contrapressão até o upload)
+- Um estágio pode encerrar o item antes do fim (job['outcome']): os
+  seguintes só repassam
+- Exceção num estágio vira job['error'] e o item segue direto para a saída
+- Se quem consome fecha o gerador antes do fim (cliente desconectou), os
+  jobs que não foram entregues passam por cleanup (ex.: devolver a memória
+  reservada da imagem) quando saem dos estágios
+"""
+
+import os
+import queue
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Itens parados em cada fila entre estágios
+PIPELINE_QUEUE_SIZE = int(os.getenv('OMR_PIPELINE_QUEUE', 2))
+
+_STOP = object()
+
+
+class StagePipeline:
+    """
+    Estágios (nome, função(job) -> None, threads) ligados por filas limitadas.
+
+    A função altera o job (dict) no lugar; para encerrar o item antes do
+    fim, preenche job['outcome']. cleanup(job) roda nos jobs abandonados
+    (gerador fechado antes de entregá-los).
+    """
+
+    def __init__(self, stages: List[Tuple[str, Callable[[Dict], None], int]],
+                 queue_size: int = PIPELINE_QUEUE_SIZE,
+                 cleanup: Optional[Callable[[Dict], None]] = None):
+        self.stages = stages
+        self.queue_size = max(1, queue_size)
+        self.cleanup = cleanup
+
+    def _abandon(self, ready: Dict[int, Dict], output: queue.Queue, threads: List[threading.Thread]):
+        """
+        Limpa os jobs não entregues: os prontos agora e, numa thread, os que
+        ainda estão nos estágios (quem fechou o gerador não espera por eles).
+        """
+        if self.cleanup is None:
+            return
+        for job in ready.values():
+            self.cleanup(job)
+        ready.clear()
+
+        def drain():
+            while True:
+                entry = output.get()
+                if entry is _STOP:
+                    break
+                self.cleanup(entry[1])
+            for thread in threads:
+                thread.join()
+
+        threading.Thread(target=drain, name='pipeline-drain', daemon=True).start()
+
+    def run(self, items: Iterable[Dict[str, Any]]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """
+        Passa os jobs pelos estágios; entrega (índice, job) na ordem de entrada.
+
+        items é consumido na thread que chama (pode ler o upload). Uma exceção
+        de items é repassada depois que as threads dos estágios terminam.
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        output = queue.Queue()
+        threads = []
+        remaining = [workers for _, _, workers in self.stages]
+        lock = threading.Lock()
+
+        def worker(position: int, func: Callable[[Dict], None]):
+            inbox = queues[position]
+            last = position == len(self.stages) - 1
+            while True:
+                entry = inbox.get()
+                if entry is _STOP:
+                    break
+                index, job = entry
+                if 'outcome' not in job and 'error' not in job:
+                    try:
+                        func(job)
+                    except Exception as e:
+                        job['error'] = e
+                if last or 'outcome' in job or 'error' in job:
+                    output.put((index, job))
+                else:
+                    queues[position + 1].put((index, job))
+            # Última thread do estágio avisa o próximo
+            with lock:
+                remaining[position] -= 1
+                done = remaining[position] == 0
+            if done:
+                if last:
+                    output.put(_STOP)
+                else:
+                    for _ in range(self.stages[position + 1][2]):
+                        queues[position + 1].put(_STOP)
+
+        for position, (name, func, workers) in enumerate(self.stages):
+            for n in range(workers):
+                thread = threading.Thread(target=worker, args=(position, func),
+                                          name=f'pipeline-{name}-{n}', daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        ready = {}
+        next_index = 0
+        fed = 0
+        feed_error = None
+        try:
+            try:
+                for job in items:
+                    queues[0].put((fed, job))
+                    fed += 1
+                    # Entregar o que já saiu, sem esperar
+                    while True:
+                        try:
+                            index, finished = output.get_nowait()
+                        except queue.Empty:
+                            break
+                        ready[index] = finished
+                    while next_index in ready:
+                        yield next_index, ready.pop(next_index)
+                        next_index += 1
+            except GeneratorExit:
+                raise
+            except Exception as e:
+                feed_error = e
+            finally:
+                for _ in range(self.stages[0][2]):
+                    queues[0].put(_STOP)
+
+            while True:
+                entry = output.get()
+                if entry is _STOP:
+                    break
+                index, finished = entry
+                ready[index] = finished
+                while next_index in ready:
+                    yield next_index, ready.pop(next_index)
+                    next_index += 1
+        except GeneratorExit:
+            self._abandon(ready, output, threads)
+            raise
+        for thread in threads:
+            thread.join()
+        if feed_error is not None:
+            raise feed_error
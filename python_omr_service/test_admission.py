@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Testes da admissão e prioridade (admission)
+
+Rodar: python -m pytest python_omr_service/test_admission.py
+"""
+
+import threading
+import time
+
+import pytest
+
+from admission import Admission, AdmissionRejected, INTERACTIVE, BULK
+
+
+def _wait_until(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, 'timeout esperando a fila'
+        time.sleep(0.001)
+
+
+def _queue(admission, order, priority, key=None):
+    """Enfileira um pedido e espera ele aparecer na fila."""
+    before = admission.snapshot()
+    field = 'waiting_interactive' if priority == INTERACTIVE else 'waiting_bulk'
+
+    def run():
+        with admission.acquire(priority, key, timeout=5):
+            order.append((priority, key))
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    _wait_until(lambda: admission.snapshot()[field] == before[field] + 1)
+    return thread
+
+
+def test_interactive_before_bulk_and_round_robin_between_keys():
+    admission = Admission(slots=1, max_waiting=8, max_batches=2)
+    order = []
+    held = admission.acquire(INTERACTIVE)
+
+    threads = [_queue(admission, order, BULK, key) for key in ('escola-a', 'escola-a', 'escola-a')]
+    threads += [_queue(admission, order, BULK, key) for key in ('escola-b', 'escola-b')]
+    threads.append(_queue(admission, order, INTERACTIVE))
+    held.release()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert order == [
+        (INTERACTIVE, None),
+        (BULK, 'escola-a'), (BULK, 'escola-b'),
+        (BULK, 'escola-a'), (BULK, 'escola-b'),
+        (BULK, 'escola-a'),
+    ]
+    snapshot = admission.snapshot()
+    assert snapshot['busy'] == 0
+    assert snapshot['bulk_keys'] == 0
+    assert snapshot['granted_bulk'] == 5
+
+
+def test_full_interactive_queue_is_rejected():
+    admission = Admission(slots=1, max_waiting=2, max_batches=1)
+    order = []
+    held = admission.acquire(INTERACTIVE)
+    threads = [_queue(admission, order, INTERACTIVE) for _ in range(2)]
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.acquire(INTERACTIVE)
+    assert rejected.value.retry_after >= 1
+
+    held.release()
+    for thread in threads:
+        thread.join(timeout=5)
+    assert len(order) == 2
+    assert admission.snapshot()['rejected_interactive'] == 1
+
+
+def test_interactive_wait_timeout_is_rejected_and_leaves_queue():
+    admission = Admission(slots=1, max_waiting=8, max_batches=1)
+    held = admission.acquire(INTERACTIVE)
+
+    with pytest.raises(AdmissionRejected):
+        admission.acquire(INTERACTIVE, timeout=0.05)
+
+    assert admission.snapshot()['waiting_interactive'] == 0
+    held.release()
+    with admission.acquire(INTERACTIVE, timeout=0.05) as slot:
+        assert slot.priority == INTERACTIVE
+
+
+def test_bulk_items_wait_instead_of_rejection():
+    admission = Admission(slots=1, max_waiting=0, max_batches=1)
+    order = []
+    held = admission.acquire(BULK, 'lote')
+    threads = [_queue(admission, order, BULK, 'lote') for _ in range(3)]
+    held.release()
+    for thread in threads:
+        thread.join(timeout=5)
+    assert len(order) == 3
+
+
+def test_batches_over_limit_are_rejected_until_one_ends():
+    admission = Admission(slots=1, max_batches=2)
+    first = admission.begin_batch()
+    admission.begin_batch()
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.begin_batch()
+    assert rejected.value.retry_after >= 1
+
+    admission.end_batch(first)
+    admission.end_batch(first)  # idempotente
+    assert admission.begin_batch() is not None
+    assert admission.snapshot()['rejected_batches'] == 1
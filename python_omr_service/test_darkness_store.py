@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Testes da re-correção offline (darkness_store)
+
+Rodar: python -m pytest python_omr_service/test_darkness_store.py
+"""
+
+import os
+
+import numpy as np
+
+from darkness_store import (
+    DarknessStore, READER_HOUGH, READER_LEGACY, NUM_QUESTIONS, make_record, regrade, split_overrides,
+    summarize, latest_per_key
+)
+from omr_decision import HOUGH_RULES, LEGACY_RULES, DARK_LEVELS, OPTIONS, decide, stored_precision
+
+BASE_RULES = {READER_HOUGH: HOUGH_RULES, READER_LEGACY: LEGACY_RULES}
+
+
+def _sheets(n, seed=7):
+    """Matrizes de escuridão concentradas perto dos limiares e das diferenças de dupla."""
+    rng = np.random.default_rng(seed)
+    darkness = rng.uniform(0, 40, size=(n, NUM_QUESTIONS, len(OPTIONS)))
+    near = rng.choice([16.0, 22.0, 27.0, 28.0, 32.0], size=(n, NUM_QUESTIONS, 2))
+    darkness[..., :2] = near + rng.normal(0, 0.05, size=near.shape)
+    # Leitor legado: valores sem arredondamento; Hough: arredondados a 0.1
+    darkness[: n // 2] = np.round(darkness[: n // 2], 1)
+    levels = rng.uniform(0, 60, size=(n, len(DARK_LEVELS), NUM_QUESTIONS, len(OPTIONS)))
+    return darkness, levels
+
+
+def _store(tmp_path, n=200):
+    store = DarknessStore(str(tmp_path))
+    darkness, levels = _sheets(n)
+    for i in range(n):
+        reader = READER_HOUGH if i < n // 2 else READER_LEGACY
+        measured = stored_precision(darkness[i])
+        codes = decide(measured, BASE_RULES[reader])
+        store.append(make_record(f'XTRI-{i:06d}', reader, codes, measured, levels[i], 185,
+                                 created=1_760_000_000 + i))
+    return store
+
+
+def test_noop_regrade_reproduces_recorded_answers(tmp_path):
+    records, levels = _store(tmp_path).load()
+    assert len(records) == 200
+
+    new_codes = regrade(records, levels, BASE_RULES, split_overrides())
+    summary = summarize(records, new_codes)
+
+    assert summary['changed_answers'] == 0
+    assert summary['changed_sheets'] == 0
+
+
+def test_noop_regrade_with_recorded_dark_pixel_value(tmp_path):
+    records, levels = _store(tmp_path).load()
+
+    overrides = split_overrides(constants={'DARK_PIXEL_VALUE': 185, 'DARK_PIXEL_THRESHOLD': 185})
+    new_codes = regrade(records, levels, BASE_RULES, overrides)
+
+    assert summarize(records, new_codes)['changed_answers'] == 0
+
+
+def test_rule_change_is_reported(tmp_path):
+    records, levels = _store(tmp_path).load()
+
+    new_codes = regrade(records, levels, BASE_RULES, split_overrides({'blank_threshold': 30.0}))
+    summary = summarize(records, new_codes)
+
+    assert summary['changed_answers'] > 0
+    assert all(t.endswith('->-') for t in summary['transitions'])
+
+
+def test_latest_per_key_keeps_reprocessed_sheet(tmp_path):
+    store = DarknessStore(str(tmp_path))
+    darkness = np.zeros((NUM_QUESTIONS, len(OPTIONS)))
+    levels = np.zeros((len(DARK_LEVELS), NUM_QUESTIONS, len(OPTIONS)))
+    for created, code in ((1_760_000_000, 0), (1_760_000_010, 3)):
+        store.append(make_record('XTRI-A', READER_HOUGH, np.full(NUM_QUESTIONS, code), darkness, levels, 185,
+                                 created=created))
+
+    records, _ = store.load()
+    latest = latest_per_key(records)
+
+    assert len(records) == 2
+    assert len(latest) == 1
+    assert int(latest['codes'][0][0]) == 3
+
+
+def test_retention_prunes_old_days_when_a_new_day_starts(tmp_path):
+    store = DarknessStore(str(tmp_path), retention_days=30)
+    day = 86400
+    start = 1_760_000_000
+    darkness, levels = _sheets(1)
+    codes = decide(stored_precision(darkness[0]), HOUGH_RULES)
+
+    def append(created):
+        return store.append(make_record('XTRI-000001', READER_HOUGH, codes, darkness[0], levels[0], 185,
+                                        created=created))
+
+    old = append(start)
+    kept = append(start + 10 * day)
+    legacy = tmp_path / 'darkness-20200101.omrd'
+    legacy.write_bytes(b'v1')
+
+    # Mesmo dia de kept: arquivo já existe, nada é apagado
+    append(start + 10 * day + 60)
+    assert len(store.files()) == 2 and legacy.exists()
+
+    newest = append(start + 35 * day)
+
+    assert store.files() == [kept, newest]
+    assert not legacy.exists()
+    assert not os.path.exists(old)
+    assert len(store.load()[0]) == 3
+
+
+def test_retention_zero_keeps_everything(tmp_path):
+    store = DarknessStore(str(tmp_path), retention_days=0)
+    (tmp_path / 'darkness-20000101.v2.omrd').write_bytes(b'')
+
+    assert store.prune() == 0
+    assert len(store.files()) == 1
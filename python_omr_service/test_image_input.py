@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Testes dos formatos de entrada da página (image_input.decode_body_image)
+
+Rodar: python -m pytest python_omr_service/test_image_input.py
+"""
+
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+from image_input import decode_body_image, is_body_image, ImageInputError, RAW_MIMETYPE, MIN_SIDE, MAX_SIDE
+from qr_locator import read_qr_located
+from sheet_triage import triage, STATUS_CANDIDATE
+
+SHEET = Path(__file__).parent.parent / 'debug_pages' / 'page_1.jpg'
+
+
+def _gray_sheet():
+    if not SHEET.exists():
+        pytest.skip(f'{SHEET} ausente')
+    return cv2.cvtColor(cv2.imread(str(SHEET)), cv2.COLOR_BGR2GRAY)
+
+
+def _raw_headers(gray, **extra):
+    return dict({'X-Image-Width': str(gray.shape[1]), 'X-Image-Height': str(gray.shape[0])}, **extra)
+
+
+def test_raw_frame_is_a_read_only_view_of_the_body():
+    gray = _gray_sheet()
+    body = gray.tobytes()
+
+    img, info = decode_body_image(RAW_MIMETYPE, _raw_headers(gray, **{'X-Image-DPI': '200'}), body)
+
+    assert np.array_equal(img, gray)
+    assert info == {'format': 'raw', 'dpi': 200}
+    assert not img.flags.writeable
+    assert np.shares_memory(img, np.frombuffer(body, dtype=np.uint8))
+
+
+def test_read_only_frame_goes_through_triage_and_qr():
+    gray = _gray_sheet()
+    img, _ = decode_body_image(RAW_MIMETYPE, _raw_headers(gray), gray.tobytes())
+
+    page = triage(img)
+
+    assert page['status'] == STATUS_CANDIDATE
+    assert read_qr_located(img, page['markers']) == read_qr_located(gray, page['markers']) is not None
+
+
+@pytest.mark.parametrize('extension, mimetype', [('.png', 'image/png'), ('.pgm', 'image/x-portable-graymap'),
+                                                 ('.png', RAW_MIMETYPE)])
+def test_encoded_image_decodes_to_the_same_gray_page(extension, mimetype):
+    gray = _gray_sheet()
+    _, encoded = cv2.imencode(extension, gray)
+
+    img, info = decode_body_image(mimetype, {}, encoded.tobytes())
+
+    assert np.array_equal(img, gray)
+    assert info == {'format': 'encoded', 'dpi': None}
+
+
+def test_color_jpeg_is_decoded_in_one_channel():
+    _, encoded = cv2.imencode('.jpg', np.full((300, 250, 3), (40, 120, 200), dtype=np.uint8))
+
+    img, _ = decode_body_image('image/jpeg', {}, encoded.tobytes())
+
+    assert img.shape == (300, 250) and img.dtype == np.uint8
+
+
+@pytest.mark.parametrize('headers, body_size, code', [
+    ({'X-Image-Width': '300', 'X-Image-Height': '400'}, 300 * 400 - 1, 'INVALID_DIMENSIONS'),
+    ({'X-Image-Width': '300', 'X-Image-Height': '400'}, 300 * 400 + 300, 'INVALID_DIMENSIONS'),
+    ({'X-Image-Width': '300'}, 300 * 400, 'INVALID_HEADER'),
+    ({'X-Image-Width': 'largo', 'X-Image-Height': '400'}, 300 * 400, 'INVALID_HEADER'),
+    ({'X-Image-Width': str(MIN_SIDE - 1), 'X-Image-Height': '400'}, (MIN_SIDE - 1) * 400, 'INVALID_HEADER'),
+    ({'X-Image-Width': str(MAX_SIDE + 1), 'X-Image-Height': '400'}, 10, 'INVALID_HEADER'),
+    ({'X-Image-Width': '300', 'X-Image-Height': '400', 'X-Image-DPI': '20'}, 300 * 400, 'INVALID_HEADER'),
+    ({'X-Image-Width': '300', 'X-Image-Height': '400', 'X-Image-DPI': '2400'}, 300 * 400, 'INVALID_HEADER'),
+    ({}, 0, 'EMPTY_FILE'),
+    ({}, 1000, 'INVALID_IMAGE'),
+])
+def test_invalid_raw_bodies(headers, body_size, code):
+    with pytest.raises(ImageInputError) as error:
+        decode_body_image(RAW_MIMETYPE, headers, b'\x80' * body_size)
+
+    assert error.value.code == code
+    assert isinstance(error.value, ValueError)
+
+
+def test_dpi_header_on_encoded_image_and_body_mimetypes():
+    _, encoded = cv2.imencode('.png', np.zeros((300, 300), dtype=np.uint8))
+
+    assert decode_body_image('image/png', {'X-Image-DPI': '150'}, encoded.tobytes())[1]['dpi'] == 150
+    # Dimensões só valem para a imagem crua
+    assert decode_body_image('image/png', {'X-Image-Width': '1'}, encoded.tobytes())[0].shape == (300, 300)
+    assert is_body_image(RAW_MIMETYPE) and is_body_image('image/webp')
+    assert not is_body_image('multipart/form-data') and not is_body_image('application/json')
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Testes das regras de decisão OMR (omr_decision)
+
+Fixa decide() com HOUGH_RULES / LEGACY_RULES nos desvios de detect_answer e
+read_question de antes da vetorização.
+
+Rodar: python -m pytest python_omr_service/test_omr_decision.py
+"""
+
+import numpy as np
+import pytest
+
+from omr_decision import (
+    HOUGH_RULES, LEGACY_RULES, CODE_BLANK, CODE_DOUBLE, OPTIONS, decide, decision_margin, _top2
+)
+
+
+def _sorted_top2(darkness):
+    """Ordenação estável como nos leitores antigos: empate fica com a primeira opção."""
+    ranked = sorted(range(len(darkness)), key=lambda i: darkness[i], reverse=True)
+    return ranked[0], float(darkness[ranked[0]]), float(darkness[ranked[1]])
+
+
+def _detect_answer_reference(darkness):
+    """detect_answer (xtri_gabarito_reader) antes de omr_decision."""
+    idx, best, second = _sorted_top2(darkness)
+    diff = best - second
+    if best < 22:
+        return CODE_BLANK
+    if second >= 22 and diff < 6:
+        return CODE_DOUBLE
+    relative_diff = (diff / best * 100) if best > 0 else 0
+    if diff >= 5 or relative_diff >= 15:
+        return idx
+    if best >= 22 + 10:
+        return idx
+    return CODE_BLANK
+
+
+def _read_question_reference(darkness):
+    """read_question (app.py) antes de omr_decision."""
+    idx, best, second = _sorted_top2(darkness)
+    diff = best - second
+    relative_diff = (diff / best * 100) if best > 0 else 0
+    if best < 16:
+        return CODE_BLANK
+    if best >= 22 and second >= 22 and diff < 5:
+        return CODE_DOUBLE
+    if best >= 22 and (diff >= 5 or relative_diff >= 15):
+        return idx
+    if best >= 16 and relative_diff >= 20:
+        return idx
+    if best >= 22 + 8:
+        return idx
+    return CODE_BLANK
+
+
+A, B, C, D, E = range(len(OPTIONS))
+
+# (escuridão A-E, código Hough, código legado)
+CASES = [
+    # Em branco
+    ([0.0, 0.0, 0.0, 0.0, 0.0], CODE_BLANK, CODE_BLANK),
+    ([21.9, 3.0, 2.0, 1.0, 0.0], CODE_BLANK, A),               # legado: marca leve (relativa >= 20)
+    ([15.9, 0.0, 0.0, 0.0, 0.0], CODE_BLANK, CODE_BLANK),
+    # Marcação clara
+    ([5.0, 5.0, 40.0, 5.0, 5.0], C, C),
+    ([22.0, 17.0, 0.0, 0.0, 0.0], A, A),                       # diff == 5 no limite
+    ([25.0, 21.2, 0.0, 0.0, 0.0], A, A),                       # diff < 5, relativa >= 15%
+    # Dupla marcação
+    ([30.0, 26.0, 0.0, 0.0, 0.0], CODE_DOUBLE, CODE_DOUBLE),
+    ([30.0, 25.0, 0.0, 0.0, 0.0], CODE_DOUBLE, A),             # diff 5: dupla só no Hough (< 6)
+    ([40.0, 40.0, 0.0, 0.0, 0.0], CODE_DOUBLE, CODE_DOUBLE),
+    ([28.0, 24.5, 0.0, 0.0, 0.0], CODE_DOUBLE, CODE_DOUBLE),
+    # Incerto: acima do limiar sem diferença clara = branco
+    ([25.0, 21.5, 0.0, 0.0, 0.0], CODE_BLANK, CODE_BLANK),     # diff 3.5, relativa 14%
+    ([20.0, 17.5, 0.0, 0.0, 0.0], CODE_BLANK, CODE_BLANK),     # legado: relativa 12.5% < 20
+    # Empates no topo nunca viram marcação (a primeira opção vence em _top2)
+    ([0.0, 35.0, 10.0, 35.0, 0.0], CODE_DOUBLE, CODE_DOUBLE),
+    ([0.0, 18.0, 0.0, 18.0, 0.0], CODE_BLANK, CODE_BLANK),
+    ([0.0, 0.0, 0.0, 50.0, 50.0], CODE_DOUBLE, CODE_DOUBLE),
+    ([40.0, 12.0, 12.0, 12.0, 12.0], A, A),
+]
+
+
+@pytest.mark.parametrize('darkness, hough, legacy', CASES)
+def test_decide_table(darkness, hough, legacy):
+    assert _detect_answer_reference(darkness) == hough
+    assert _read_question_reference(darkness) == legacy
+    assert int(decide(np.array(darkness), HOUGH_RULES)) == hough
+    assert int(decide(np.array(darkness), LEGACY_RULES)) == legacy
+
+
+@pytest.mark.parametrize('rules, reference', [
+    (HOUGH_RULES, _detect_answer_reference),
+    (LEGACY_RULES, _read_question_reference),
+])
+def test_decide_matches_old_branches(rules, reference):
+    rng = np.random.default_rng(11)
+    darkness = rng.uniform(0, 45, size=(4000, len(OPTIONS)))
+    # Perto dos limiares e das diferenças de dupla, em passos de 0.1 (como detect_answer)
+    near = rng.choice([16.0, 22.0, 27.0, 30.0, 32.0], size=(4000, 2))
+    darkness[:, :2] = np.round(near + rng.normal(0, 1.5, size=near.shape), 1)
+    darkness[::10, 3] = darkness[::10, 0]  # empates
+
+    expected = np.array([reference(list(row)) for row in darkness])
+    assert np.array_equal(decide(darkness, rules), expected)
+
+
+def test_top2_tie_goes_to_first_option():
+    darkness = np.array([
+        [10.0, 45.0, 0.0, 45.0, 45.0],
+        [30.0, 30.0, 30.0, 30.0, 30.0],
+        [0.0, 20.0, 35.0, 20.0, 35.0],
+        [0.0, 0.0, 0.0, 0.0, 0.0],
+    ])
+    expected = [_sorted_top2(list(row)) for row in darkness]
+
+    best_idx, best, second = _top2(darkness)
+
+    assert list(best_idx) == [B, A, C, A]
+    assert [(int(i), float(b), float(s)) for i, b, s in zip(best_idx, best, second)] == expected
+
+
+def test_decide_shapes():
+    darkness = np.zeros((3, 90, len(OPTIONS)))
+    darkness[..., B] = 50.0
+    codes = decide(darkness)
+    assert codes.shape == (3, 90)
+    assert codes.dtype == np.uint8
+    assert (codes == B).all()
+
+
+@pytest.mark.parametrize('rules', [HOUGH_RULES, LEGACY_RULES])
+def test_margin_grows_with_clearer_mark(rules):
+    # Mesma segunda bolha, melhor bolha cada vez mais escura: a margem não diminui
+    best = np.arange(35.0, 80.0, 0.5)
+    darkness = np.zeros((len(best), len(OPTIONS)))
+    darkness[:, A] = best
+    darkness[:, C] = 5.0
+    assert (decide(darkness, rules) == A).all()
+
+    margin = decision_margin(darkness, rules)
+    assert np.all(np.diff(margin) >= 0)
+    assert margin[-1] == 20.0
+
+
+@pytest.mark.parametrize('rules', [HOUGH_RULES, LEGACY_RULES])
+def test_margin_is_small_near_threshold(rules):
+    darkness = np.zeros((2, len(OPTIONS)))
+    darkness[0, A] = rules['blank_threshold'] + 0.2
+    darkness[1, A] = 60.0
+    margin = decision_margin(darkness, rules)
+    assert margin[0] <= 0.5
+    assert margin[0] < margin[1]
+
+
+@pytest.mark.parametrize('rules', [HOUGH_RULES, LEGACY_RULES])
+def test_blank_margin_shrinks_towards_threshold(rules):
+    # Em branco cada vez mais perto do limiar: a margem não aumenta
+    best = np.arange(0.0, rules['blank_threshold'] - 0.5, 0.5)
+    darkness = np.zeros((len(best), len(OPTIONS)))
+    darkness[:, E] = best
+    assert (decide(darkness, rules) == CODE_BLANK).all()
+
+    margin = decision_margin(darkness, rules)
+    assert np.all(np.diff(margin) <= 0)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Testes da rasterização de PDFs (pdf_raster.iter_pages)
+
+render_page é trocado por uma página sintética (tempo aleatório, falha
+controlada) para conferir ordem, orçamento de memória e cancelamento sem
+depender do pdftoppm.
+
+Rodar: python -m pytest python_omr_service/test_pdf_raster.py
+"""
+
+import random
+import threading
+import time
+
+import numpy as np
+import pytest
+
+import pdf_raster
+from pdf_raster import iter_pages, clamp_dpi, page_bytes, A4_POINTS, PDF_DPI_MIN, PDF_DPI_MAX
+from upload_stream import MemoryBudget, MemoryBudgetExceeded
+
+PAGE_BYTES = 1000
+
+
+@pytest.fixture
+def rendered(monkeypatch):
+    """Páginas sintéticas: o valor dos pixels é o número da página."""
+    state = {'calls': [], 'fail': set(), 'max_used': 0, 'budget': None}
+    lock = threading.Lock()
+    rng = random.Random(43)
+
+    def render(path, page, dpi=pdf_raster.PDF_DPI):
+        with lock:
+            state['calls'].append(page)
+            delay = rng.uniform(0, 0.005)
+            if state['budget'] is not None:
+                state['max_used'] = max(state['max_used'], state['budget'].used)
+        time.sleep(delay)
+        if page in state['fail']:
+            raise ValueError(f'página {page} corrompida')
+        return np.full((4, 3), page, dtype=np.uint8)
+
+    monkeypatch.setattr(pdf_raster, 'render_page', render)
+    return state
+
+
+def test_pages_come_out_in_order(rendered):
+    pages = list(iter_pages('x.pdf', 3, 40, workers=4))
+
+    assert [page for page, _, _ in pages] == list(range(3, 41))
+    assert all(img[0, 0] == page and error is None for page, img, error in pages)
+
+
+def test_budget_bounds_pages_in_flight_and_consumer_releases(rendered):
+    budget = MemoryBudget(3 * PAGE_BYTES)
+    rendered['budget'] = budget
+
+    delivered = []
+    for page, img, error in iter_pages('x.pdf', 1, 30, workers=4, budget=budget, nbytes=PAGE_BYTES):
+        assert error is None
+        delivered.append(page)
+        # A página entregue ainda está reservada até o consumidor liberar
+        assert budget.used >= PAGE_BYTES
+        budget.release(PAGE_BYTES)
+
+    assert delivered == list(range(1, 31))
+    assert rendered['max_used'] <= budget.limit
+    assert budget.used == 0
+
+
+def test_page_larger_than_budget_is_an_error_per_page(rendered):
+    budget = MemoryBudget(PAGE_BYTES)
+
+    pages = list(iter_pages('x.pdf', 1, 3, budget=budget, nbytes=2 * PAGE_BYTES))
+
+    assert [page for page, _, _ in pages] == [1, 2, 3]
+    assert all(img is None and isinstance(error, MemoryBudgetExceeded) for _, img, error in pages)
+    assert rendered['calls'] == [] and budget.used == 0
+
+
+def test_render_error_is_delivered_without_reservation(rendered):
+    rendered['fail'] = {2, 5}
+    budget = MemoryBudget(10 * PAGE_BYTES)
+
+    pages = list(iter_pages('x.pdf', 1, 6, workers=2, budget=budget, nbytes=PAGE_BYTES))
+
+    assert [page for page, _, _ in pages] == [1, 2, 3, 4, 5, 6]
+    assert [page for page, img, error in pages if error is not None] == [2, 5]
+    assert all(img is None for page, img, _ in pages if page in (2, 5))
+    # Só as 4 páginas boas continuam reservadas (o consumidor não liberou)
+    assert budget.used == 4 * PAGE_BYTES
+
+
+def test_closing_early_releases_pages_not_delivered(rendered):
+    budget = MemoryBudget(100 * PAGE_BYTES)
+    pages = iter_pages('x.pdf', 1, 50, workers=2, budget=budget, nbytes=PAGE_BYTES)
+
+    page, img, _ = next(pages)
+    pages.close()
+
+    # Só a página entregue segue reservada; nada além da janela foi rasterizado
+    assert page == 1 and budget.used == PAGE_BYTES
+    assert len(rendered['calls']) <= 2 + pdf_raster.RASTER_PREFETCH
+
+
+def test_waiting_consumer_does_not_deadlock_the_window(rendered):
+    # Orçamento para uma página: a janela não pode travar esperando a si mesma
+    budget = MemoryBudget(PAGE_BYTES)
+
+    delivered = []
+    for page, img, error in iter_pages('x.pdf', 1, 8, workers=3, budget=budget, nbytes=PAGE_BYTES):
+        assert error is None
+        delivered.append(page)
+        budget.release(PAGE_BYTES)
+
+    assert delivered == list(range(1, 9))
+
+
+def test_clamp_dpi_and_a4_page_bytes(tmp_path):
+    assert clamp_dpi(20) == PDF_DPI_MIN and clamp_dpi(1200) == PDF_DPI_MAX and clamp_dpi('200') == 200
+
+    # Sem pdfinfo (ou arquivo ilegível) vale o tamanho A4
+    missing = str(tmp_path / 'missing.pdf')
+    expected = int(A4_POINTS[0] / 72 * 200) * int(A4_POINTS[1] / 72 * 200) * pdf_raster.RASTER_BYTES_PER_PIXEL
+    assert page_bytes(missing, 200) == expected
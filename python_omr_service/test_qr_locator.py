@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Testes do localizador de QR pelo template (qr_locator)
+
+A previsão é conferida contra o QR achado por uma busca ingênua (maior
+mancha escura quadrada no canto superior direito) nos cartões reais de
+debug_pages/, em várias resoluções.
+
+Rodar: python -m pytest python_omr_service/test_qr_locator.py
+"""
+
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+from qr_locator import (
+    predict_qr, crop_qr, find_qr_quad, read_qr_located,
+    QR_MODULES, QR_MODULE_PX, QR_PAD, QR_PAGE_CENTER, QR_PAGE_SIDE
+)
+from sheet_triage import triage
+
+DEBUG_PAGES = Path(__file__).parent.parent / 'debug_pages'
+# Códigos impressos nos cartões
+SHEET_CODES = {1: 'XTRI-Y8B2YS', 7: 'XTRI-TYW2B4', 8: 'XTRI-92525U', 10: 'XTRI-VGR3J2', 18: 'XTRI-P9C2PX'}
+SHEETS = [DEBUG_PAGES / f'page_{n}.jpg' for n in SHEET_CODES]
+# Escalas em relação ao scan de 200 DPI: ~150 DPI e ~300 DPI
+SCALES = [0.75, 1.0, 1.5]
+CROP_SIDE = QR_MODULES * QR_MODULE_PX * (1 + 2 * QR_PAD)
+
+
+def _sheet(path=SHEETS[0], scale=1.0):
+    if not path.exists():
+        pytest.skip(f'{path} ausente')
+    img = cv2.imread(str(path))
+    if scale != 1.0:
+        img = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return img
+
+
+def _code(path):
+    return SHEET_CODES[int(path.stem.split('_')[1])]
+
+
+def _detected_qr(img):
+    """Centro e lado da maior mancha escura quadrada no canto superior direito."""
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    h, w = gray.shape
+    x0 = int(w * 0.65)
+    _, ink = cv2.threshold(gray[:h // 4, x0:], 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    size = max(3, int(w * 0.006)) | 1
+    ink = cv2.morphologyEx(ink, cv2.MORPH_CLOSE, np.ones((size, size), np.uint8))
+    contours, _ = cv2.findContours(ink, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    boxes = [cv2.boundingRect(c) for c in contours]
+    x, y, bw, bh = max((b for b in boxes if 0.06 * w < b[2] < 0.2 * w and 0.8 < b[2] / b[3] < 1.25),
+                       key=lambda b: b[2] * b[3])
+    return (x0 + x + bw / 2, y + bh / 2), (bw + bh) / 2
+
+
+@pytest.mark.parametrize('scale', SCALES)
+@pytest.mark.parametrize('path', SHEETS, ids=lambda p: p.stem)
+def test_prediction_matches_detected_qr(path, scale):
+    img = _sheet(path, scale)
+    center, side = _detected_qr(img)
+
+    for markers in (triage(img)['markers'], None):
+        cx, cy, predicted_side = predict_qr(img.shape, markers)
+        # Centro dentro de 1/4 do lado; o recorte tem folga de QR_PAD lados
+        assert np.hypot(cx - center[0], cy - center[1]) < 0.25 * side
+        assert predicted_side == pytest.approx(side, rel=0.15)
+
+
+def test_markers_as_list_or_dict_and_fallback_to_page():
+    points = [(100.0, 400.0), (1500.0, 405.0), (102.0, 2200.0)]
+    named = {'TL': points[0], 'TR': points[1], 'BL': points[2]}
+    shape = (2339, 1654, 3)
+
+    assert predict_qr(shape, points) == predict_qr(shape, named)
+    page = (QR_PAGE_CENTER[0] * 1654, QR_PAGE_CENTER[1] * 2339, QR_PAGE_SIDE * 1654)
+    assert predict_qr(shape, None) == page
+    # Marcadores que não cobrem metade da largura não servem de régua
+    assert predict_qr(shape, [(100.0, 400.0), (600.0, 2200.0)]) == page
+    assert predict_qr(shape, [(100.0, 400.0)]) == page
+
+
+@pytest.mark.parametrize('scale', SCALES)
+def test_crop_has_the_same_size_at_any_resolution(scale):
+    img = _sheet(scale=scale)
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+    crop = crop_qr(gray, triage(img)['markers'])
+
+    assert crop.shape[0] == pytest.approx(CROP_SIDE, abs=3)
+    assert crop.shape[1] == pytest.approx(CROP_SIDE, abs=3)
+    quad = find_qr_quad(crop)
+    assert quad is not None and quad.shape == (1, 4, 2)
+    # Cantos em ordem TL, TR, BR, BL
+    tl, tr, br, bl = quad[0]
+    assert tl[0] < tr[0] and tl[1] < bl[1] and br[0] > bl[0] and br[1] > tr[1]
+
+
+@pytest.mark.parametrize('scale', SCALES)
+@pytest.mark.parametrize('path', SHEETS, ids=lambda p: p.stem)
+def test_read_located_at_any_resolution(path, scale):
+    img = _sheet(path, scale)
+
+    assert read_qr_located(img, triage(img)['markers']) == _code(path)
+    assert read_qr_located(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)) == _code(path)
+
+
+def test_page_without_qr():
+    blank = np.full((2339, 1654), 255, dtype=np.uint8)
+
+    assert find_qr_quad(crop_qr(blank)) is None
+    assert read_qr_located(blank) is None
+    # Página pequena demais para o recorte
+    assert crop_qr(np.full((60, 40), 255, dtype=np.uint8)) is None
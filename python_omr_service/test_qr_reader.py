@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Testes do motor de leitura de QR (qr_reader_module.QREngine)
+
+Orçamento e ordem adaptativa com métodos sintéticos (custo e acerto
+controlados); a cadeia padrão com os cartões reais de debug_pages/.
+
+Rodar: python -m pytest python_omr_service/test_qr_reader.py
+"""
+
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+from qr_reader_module import QREngine, MIN_CONTEXT_ATTEMPTS, validate_sheet_code
+from sheet_triage import triage
+
+DEBUG_PAGES = Path(__file__).parent.parent / 'debug_pages'
+GRAY = np.zeros((8, 8), dtype=np.uint8)
+
+
+def _method(name, level, cost_ms, hits=lambda markers: False, sleep_ms=0.0, calls=None):
+    """Método sintético: acerta quando hits(markers), dormindo sleep_ms."""
+    def read(gray, markers):
+        if calls is not None:
+            calls.append(name)
+        time.sleep(sleep_ms / 1000)
+        return f'XTRI-{name.upper()[:6]:A<6}' if hits(markers) else None
+    return name, level, cost_ms, read
+
+
+def test_first_method_runs_even_over_budget_and_the_rest_is_cut():
+    calls = []
+    engine = QREngine([
+        _method('crop', 0, 500.0, calls=calls),
+        _method('page', 2, 500.0, calls=calls),
+    ], budget_ms=100)
+
+    result = engine.read(GRAY)
+
+    assert calls == ['crop']
+    assert result['success'] is False
+    assert result['attempts'] == ['crop']
+    assert result['budget_exhausted'] is True
+    assert engine.metrics()['budget_exhausted'] == 1
+
+
+def test_budget_counts_the_time_already_spent():
+    calls = []
+    engine = QREngine([
+        _method('slow', 0, 1.0, sleep_ms=60, calls=calls),
+        _method('cheap', 1, 10.0, calls=calls),
+        _method('pricey', 2, 50.0, calls=calls),
+    ], budget_ms=100)
+
+    result = engine.read(GRAY)
+
+    # 60ms gastos + 10 cabem em 100; + 50 não
+    assert calls == ['slow', 'cheap']
+    assert result['budget_exhausted'] is True
+    # Orçamento da folha sobrepõe o do motor
+    assert engine.read(GRAY, budget_ms=1000)['attempts'] == ['slow', 'cheap', 'pricey']
+
+
+def test_found_code_stops_the_chain():
+    calls = []
+    engine = QREngine([
+        _method('miss', 0, 1.0, calls=calls),
+        _method('hit', 1, 1.0, hits=lambda markers: True, calls=calls),
+        _method('never', 2, 1.0, calls=calls),
+    ])
+
+    result = engine.read(GRAY)
+
+    assert calls == ['miss', 'hit']
+    assert result['success'] and result['method'] == 'hit' and result['budget_exhausted'] is False
+    assert result['valid'] == validate_sheet_code(result['sheet_code'])
+
+
+def test_order_adapts_per_context_within_each_level():
+    engine = QREngine([
+        _method('alfa', 0, 5.0, hits=lambda markers: markers == 'alfa'),
+        _method('beta', 0, 5.0, hits=lambda markers: markers == 'beta'),
+        _method('page', 1, 0.1, hits=lambda markers: True),
+    ])
+
+    def order(context):
+        return [method[0] for method, _ in engine.order(context)]
+
+    assert order('scanner-1') == ['alfa', 'beta', 'page']
+    for _ in range(MIN_CONTEXT_ATTEMPTS):
+        engine.read(GRAY, markers='alfa', context='scanner-1')
+        engine.read(GRAY, markers='beta', context='scanner-2')
+
+    assert order('scanner-1') == ['alfa', 'beta', 'page']
+    assert order('scanner-2') == ['beta', 'alfa', 'page']
+    # Nível 1, mesmo mais barato e sempre certeiro, fica depois dos recortes
+    assert order('scanner-2')[-1] == 'page'
+    # Contexto novo (sem leituras suficientes) usa a estatística global
+    assert order('scanner-3') == order(None)
+
+
+def test_failing_method_counts_as_miss():
+    def broken(gray, markers):
+        raise ValueError('recorte vazio')
+
+    engine = QREngine([('broken', 0, 1.0, broken), _method('hit', 1, 1.0, hits=lambda markers: True)])
+
+    result = engine.read(GRAY)
+
+    assert result['attempts'] == ['broken', 'hit'] and result['success']
+    methods = engine.metrics()['methods']
+    assert methods['broken']['attempts'] == 1 and methods['broken']['hits'] == 0
+    assert methods['hit']['hit_rate'] == 1.0
+
+
+@pytest.mark.parametrize('n', [1, 7, 8, 10, 18])
+def test_default_chain_reads_real_sheets(n):
+    path = DEBUG_PAGES / f'page_{n}.jpg'
+    if not path.exists():
+        pytest.skip(f'{path} ausente')
+    img = cv2.imread(str(path))
+    engine = QREngine()
+
+    result = engine.read(img, markers=triage(img)['markers'])
+
+    assert result['success'] and result['valid']
+    # O recorte previsto pelo template resolve sem cair na página inteira
+    assert result['method'] in ('located', 'roi')
+    assert result['attempts'][0] == 'located'
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Testes do plano de workers / threads / memória (runtime_limits)
+
+Rodar: python -m pytest python_omr_service/test_runtime_limits.py
+"""
+
+import pytest
+
+import runtime_limits
+from runtime_limits import plan, detect, MAX_PAGE_BUDGET_MB, MIN_PAGE_BUDGET_MB, DEFAULT_THREADS
+
+ENV = ('OMR_WORKERS', 'OMR_THREADS', 'OMR_OPENCV_THREADS', 'OMR_PDF_WORKERS', 'OMR_MEMORY_BUDGET_MB')
+
+
+@pytest.fixture(autouse=True)
+def clean_env(monkeypatch):
+    for name in ENV:
+        monkeypatch.delenv(name, raising=False)
+
+
+def _limits(cpus, memory_mb):
+    return {'cpus': cpus, 'cpu_source': 'cgroup', 'memory_mb': memory_mb, 'memory_source': 'cgroup'}
+
+
+def _shape(result):
+    return {key: result[key] for key in
+            ('workers', 'threads', 'opencv_threads', 'omr_slots', 'pdf_workers', 'memory_budget_mb')}
+
+
+def test_one_shared_vcpu_with_2gb():
+    # A máquina do Fly: um worker, sem disputa de threads do OpenCV
+    assert _shape(plan(_limits(1, 2048))) == {
+        'workers': 1, 'threads': DEFAULT_THREADS, 'opencv_threads': 1,
+        'omr_slots': 1, 'pdf_workers': 1, 'memory_budget_mb': MAX_PAGE_BUDGET_MB,
+    }
+
+
+def test_sixteen_vcpus_with_plenty_of_memory():
+    assert _shape(plan(_limits(16, 32768))) == {
+        'workers': 16, 'threads': DEFAULT_THREADS, 'opencv_threads': 1,
+        'omr_slots': 1, 'pdf_workers': 1, 'memory_budget_mb': MAX_PAGE_BUDGET_MB,
+    }
+
+
+def test_sixteen_vcpus_limited_by_memory():
+    result = plan(_limits(16, 2048))
+
+    # 2048 * 0.75 // (150 + 64) = 7 workers, e as CPUs que sobram vão para o OpenCV
+    assert result['workers'] == 7
+    assert result['opencv_threads'] == result['omr_slots'] == result['pdf_workers'] == 2
+    assert MIN_PAGE_BUDGET_MB <= result['memory_budget_mb'] < MAX_PAGE_BUDGET_MB
+    total_mb = result['workers'] * (runtime_limits.WORKER_BASE_MB + result['memory_budget_mb'])
+    assert total_mb <= 2048 * runtime_limits.MEMORY_FRACTION
+
+
+def test_tiny_container_keeps_one_worker_and_the_minimum_budget():
+    result = plan(_limits(2, 256))
+
+    assert result['workers'] == 1
+    assert result['memory_budget_mb'] == MIN_PAGE_BUDGET_MB
+    assert result['pdf_workers'] == 2
+
+
+def test_unknown_memory_uses_one_worker_per_cpu():
+    result = plan(_limits(32, None))
+
+    assert result['workers'] == 32 and result['memory_budget_mb'] == MAX_PAGE_BUDGET_MB
+
+
+def test_environment_overrides_the_plan(monkeypatch):
+    monkeypatch.setenv('OMR_WORKERS', '3')
+    monkeypatch.setenv('OMR_THREADS', '8')
+    monkeypatch.setenv('OMR_OPENCV_THREADS', '2')
+    monkeypatch.setenv('OMR_MEMORY_BUDGET_MB', '128')
+
+    result = plan(_limits(16, 32768))
+
+    assert _shape(result) == {
+        'workers': 3, 'threads': 8, 'opencv_threads': 2,
+        'omr_slots': 5, 'pdf_workers': runtime_limits.MAX_RASTER_WORKERS, 'memory_budget_mb': 128,
+    }
+
+
+def _cgroup(tmp_path, monkeypatch, files, affinity=16):
+    for name, content in files.items():
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content + '\n')
+    monkeypatch.setattr(runtime_limits, '_CGROUP', str(tmp_path))
+    monkeypatch.setattr(runtime_limits.os, 'sched_getaffinity', lambda pid: set(range(affinity)), raising=False)
+
+
+def test_detect_cgroup_v2_quota_and_memory(tmp_path, monkeypatch):
+    _cgroup(tmp_path, monkeypatch, {'cpu.max': '150000 100000', 'memory.max': str(512 * 2**20)})
+
+    limits = detect()
+
+    # Cota de 1.5 CPU arredonda para cima; o host enxerga 16
+    assert limits == {'cpus': 2, 'cpu_source': 'cgroup', 'memory_mb': 512, 'memory_source': 'cgroup'}
+
+
+def test_detect_cgroup_v1(tmp_path, monkeypatch):
+    _cgroup(tmp_path, monkeypatch, {
+        'cpu/cpu.cfs_quota_us': '100000', 'cpu/cpu.cfs_period_us': '100000',
+        'memory/memory.limit_in_bytes': str(1024 * 2**20),
+    })
+
+    limits = detect()
+
+    assert (limits['cpus'], limits['memory_mb']) == (1, 1024)
+
+
+def test_detect_without_limits_uses_affinity_and_host(tmp_path, monkeypatch):
+    _cgroup(tmp_path, monkeypatch, {'cpu.max': 'max 100000', 'memory.max': 'max'}, affinity=6)
+
+    limits = detect()
+
+    assert limits['cpus'] == 6 and limits['cpu_source'] == 'affinity'
+    assert limits['memory_source'] in ('host', None)
+    assert limits['memory_mb'] == runtime_limits._host_memory_mb()
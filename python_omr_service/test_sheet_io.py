@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Testes do I/O paralelo ao OMR (sheet_io.SheetIO)
+
+Os salvamentos lentos são segurados por um Event, para conferir as
+respostas 'pending' e a contagem dos que terminam depois da resposta.
+
+Rodar: python -m pytest python_omr_service/test_sheet_io.py
+"""
+
+import threading
+import time
+
+import pytest
+
+from sheet_io import SheetIO, SAVE_SAVED, SAVE_NOT_SAVED, SAVE_PENDING
+
+
+def _wait_until(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, 'condição não atingida'
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def sheet_io():
+    io = SheetIO(threads=2)
+    yield io
+    io._pool.shutdown(wait=True)
+
+
+def _settled(io):
+    return lambda: io.metrics()['in_flight'] == 0
+
+
+def test_saved_and_not_saved_within_the_wait(sheet_io):
+    saved = sheet_io.save(lambda code, answers: True, 'XTRI-AAAAAA', ['A'], wait_ms=1000)
+    refused = sheet_io.save(lambda code, answers: False, 'XTRI-BBBBBB', ['B'], wait_ms=1000)
+
+    assert saved['status'] == SAVE_SAVED and saved['saved'] is True and saved['save_ms'] >= 0
+    assert refused['status'] == SAVE_NOT_SAVED and refused['saved'] is False
+    _wait_until(_settled(sheet_io))
+    metrics = sheet_io.metrics()
+    assert (metrics['submitted'], metrics[SAVE_SAVED], metrics[SAVE_NOT_SAVED]) == (2, 1, 1)
+    assert metrics['late'] == 0 and metrics['errors'] == 0
+
+
+def test_failing_save_is_not_saved_and_counted_as_error(sheet_io):
+    def explode(code):
+        raise ConnectionError('supabase fora do ar')
+
+    result = sheet_io.save(explode, 'XTRI-CCCCCC', wait_ms=1000)
+
+    assert result == {'status': SAVE_NOT_SAVED, 'saved': False, 'save_ms': None}
+    _wait_until(lambda: sheet_io.metrics()['errors'] == 1)
+    assert sheet_io.metrics()['in_flight'] == 0
+
+
+@pytest.mark.parametrize('wait_ms', [0.0, 30.0])
+def test_slow_save_is_pending_then_counted_late(sheet_io, wait_ms):
+    release = threading.Event()
+
+    def slow(code):
+        release.wait(2)
+        return True
+
+    result = sheet_io.save(slow, 'XTRI-DDDDDD', wait_ms=wait_ms)
+
+    assert result == {'status': SAVE_PENDING, 'saved': None, 'save_ms': None}
+    assert sheet_io.metrics()['in_flight'] == 1
+    release.set()
+    _wait_until(_settled(sheet_io))
+    metrics = sheet_io.metrics()
+    assert metrics[SAVE_SAVED] == 1 and metrics['late'] == 1
+    assert metrics['avg_ms'] > wait_ms
+
+
+def test_late_failure_counts_as_error_and_late(sheet_io):
+    release = threading.Event()
+
+    def slow_failure(code):
+        release.wait(2)
+        raise TimeoutError('gravação expirou')
+
+    assert sheet_io.save(slow_failure, 'XTRI-EEEEEE', wait_ms=10)['status'] == SAVE_PENDING
+    release.set()
+
+    _wait_until(lambda: sheet_io.metrics()['errors'] == 1)
+    metrics = sheet_io.metrics()
+    assert metrics['late'] == 1 and metrics['in_flight'] == 0 and metrics['avg_ms'] is None
+
+
+def test_lookup_runs_while_caller_works(sheet_io):
+    started = threading.Event()
+
+    def lookup(code):
+        started.set()
+        return {'sheet_code': code, 'nome': 'Aluno'}
+
+    wait = sheet_io.lookup(lookup, 'XTRI-FFFFFF')
+    assert started.wait(1)
+
+    student, lookup_ms, waited_ms = wait()
+
+    assert student == {'sheet_code': 'XTRI-FFFFFF', 'nome': 'Aluno'}
+    assert lookup_ms >= 0 and waited_ms >= 0
+
+
+def test_failed_lookup_returns_no_student(sheet_io):
+    def lookup(code):
+        raise ConnectionError('supabase fora do ar')
+
+    student, lookup_ms, _ = sheet_io.lookup(lookup, 'XTRI-GGGGGG')()
+
+    assert student is None and lookup_ms is None
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Testes do PDF de gabaritos do lote (sheet_pdf.render_batch_pdf)
+
+Os content streams do PDF (ASCII85 + Flate do reportlab) são lidos direto,
+sem rasterizar: a parte fixa precisa estar num único form XObject e o QR
+vetorial precisa reproduzir a matriz do qrcode e ser legível.
+
+Rodar: python -m pytest python_omr_service/test_sheet_pdf.py
+"""
+
+import base64
+import re
+import zlib
+
+import cv2
+import numpy as np
+import qrcode
+from reportlab.lib.units import mm
+
+from sheet_pdf import render_batch_pdf, STATIC_FORM, PAGE_WIDTH, PAGE_HEIGHT, QR_SIZE, QR_BORDER
+
+
+def _students(n):
+    return [{'student_name': f'Aluno {i}', 'enrollment_code': f'M{i:04d}', 'class_name': '3A',
+             'sheet_code': f'XTRI-{"ABCDEFGH"[i % 8]}{i:05d}'[:11]} for i in range(n)]
+
+
+def _streams(pdf):
+    """(dicionário, conteúdo decodificado) de cada stream do PDF."""
+    streams = []
+    for match in re.finditer(rb'<<(.*?)>>\s*stream\r?\n(.*?)endstream', pdf, re.S):
+        data = match.group(2).strip()
+        if data.endswith(b'~>'):
+            data = data[:-2]
+        streams.append((match.group(1), zlib.decompress(base64.a85decode(data)).decode('latin-1')))
+    return streams
+
+
+def _pages(pdf):
+    return [content for header, content in _streams(pdf) if b'/Subtype /Form' not in header]
+
+
+def test_one_page_per_student_referencing_a_single_static_form():
+    students = _students(5)
+    pdf = render_batch_pdf(students).getvalue()
+
+    forms = [content for header, content in _streams(pdf) if b'/Subtype /Form' in header]
+    pages = _pages(pdf)
+
+    assert pdf.startswith(b'%PDF') and pdf.count(b'/Type /Page\n') == 5
+    assert len(forms) == 1
+    # A parte fixa: 90 números de questão e 450 bolhas ficam só no form
+    assert all(f'({q:02d}) Tj' in forms[0] for q in range(1, 91))
+    assert len(pages) == 5
+    for student, page in zip(students, pages):
+        assert page.count(f'/FormXob.{STATIC_FORM} Do') == 1
+        assert f"(Nome: {student['student_name']})" in page
+        assert student['sheet_code'] in page
+        assert '(01) Tj' not in page
+
+
+def test_size_grows_only_with_the_variable_part():
+    sizes = {n: len(render_batch_pdf(_students(n)).getvalue()) for n in (1, 11, 21)}
+
+    per_page = (sizes[21] - sizes[11]) / 10
+    # Cada folha a mais custa uma fração da primeira (que leva a parte fixa)
+    assert per_page < 0.15 * sizes[1]
+    assert abs((sizes[11] - sizes[1]) / 10 - per_page) < 0.1 * per_page
+
+
+def _qr_modules(page, size):
+    """Grade de módulos reconstruída dos retângulos do QR na página."""
+    module = QR_SIZE / size
+    x0, y0 = PAGE_WIDTH - 45 * mm, PAGE_HEIGHT - 45 * mm
+    grid = np.zeros((size, size), dtype=bool)
+    for x, y, w, h in re.findall(r'([\d.]+) ([\d.]+) ([\d.]+) ([\d.]+) re', page):
+        col, width = round((float(x) - x0) / module), round(float(w) / module)
+        row = round((y0 + QR_SIZE - float(y) - float(h)) / module)
+        assert round(float(h) / module) == 1
+        grid[row, col:col + width] = True
+    return grid
+
+
+def test_vector_qr_matches_the_qrcode_matrix_and_decodes():
+    student = _students(1)[0]
+    page = _pages(render_batch_pdf([student]).getvalue())[0]
+    qr = qrcode.QRCode(version=1, border=QR_BORDER)
+    qr.add_data(student['sheet_code'])
+    qr.make(fit=True)
+    expected = np.array(qr.get_matrix(), dtype=bool)
+
+    grid = _qr_modules(page, expected.shape[0])
+
+    assert np.array_equal(grid, expected)
+    image = np.where(np.kron(grid, np.ones((10, 10))), 0, 255).astype(np.uint8)
+    assert cv2.QRCodeDetector().detectAndDecode(image)[0] == student['sheet_code']
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Testes da triagem de páginas (sheet_triage)
+
+Usa os cartões reais de debug_pages/, inclinados, girados, borrados e clareados.
+
+Rodar: python -m pytest python_omr_service/test_sheet_triage.py
+"""
+
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+
+from qr_locator import read_qr_located
+from sheet_triage import (
+    triage, find_marker_rectangle, marker_skew, rotate_page, rotate_points, oriented_markers,
+    ROTATE_CODES, STATUS_BLANK, STATUS_NOT_SHEET, STATUS_LOW_QUALITY, STATUS_CANDIDATE
+)
+
+DEBUG_PAGES = Path(__file__).parent.parent / 'debug_pages'
+SHEETS = [DEBUG_PAGES / f'page_{n}.jpg' for n in (1, 7, 8, 10, 18)]
+
+
+def _sheet(path=SHEETS[0]):
+    if not path.exists():
+        pytest.skip(f'{path} ausente')
+    return cv2.imread(str(path))
+
+
+def _skew(img, degrees):
+    """Gira a página (anti-horário na imagem) com fundo branco, como um scanner torto."""
+    h, w = img.shape[:2]
+    matrix = cv2.getRotationMatrix2D((w / 2.0, h / 2.0), degrees, 1.0)
+    return cv2.warpAffine(img, matrix, (w, h), borderValue=(255, 255, 255))
+
+
+def _lighten(img, strength):
+    """Só strength da tinta sobre o papel branco (digitalização clara / transparência)."""
+    return (img.astype(np.float32) * strength + 255.0 * (1.0 - strength)).astype(np.uint8)
+
+
+@pytest.mark.parametrize('path', SHEETS, ids=lambda p: p.stem)
+def test_real_sheet_is_candidate(path):
+    page = triage(_sheet(path))
+
+    assert page['status'] == STATUS_CANDIDATE
+    assert page['rotation'] == 0
+    assert len(page['markers']) == 3
+    assert abs(page['skew']) < 1.0
+
+
+@pytest.mark.parametrize('degrees', [1, 2, 3, 5, -2, -5, 8, 12])
+@pytest.mark.parametrize('path', SHEETS[:2], ids=lambda p: p.stem)
+def test_skewed_sheet_is_candidate(path, degrees):
+    page = triage(_skew(_sheet(path), degrees))
+
+    assert page['status'] == STATUS_CANDIDATE
+    # Giro anti-horário sobe o lado direito: inclinação negativa
+    assert page['skew'] == pytest.approx(-degrees, abs=1.0)
+
+
+def test_mild_blur_is_candidate_and_heavy_blur_is_low_quality():
+    img = _sheet()
+
+    assert triage(cv2.GaussianBlur(img, (9, 9), 0))['status'] == STATUS_CANDIDATE
+    page = triage(cv2.GaussianBlur(img, (51, 51), 0))
+    assert page['status'] == STATUS_LOW_QUALITY
+    assert 'borrada' in page['reason']
+
+
+def test_faint_scan_is_low_quality_not_blank():
+    page = triage(_lighten(_sheet(), 0.2))
+
+    assert page['status'] == STATUS_LOW_QUALITY
+    assert page['markers']
+
+
+def test_blank_page():
+    rng = np.random.default_rng(0)
+    noise = np.clip(235.0 + rng.normal(0, 4, size=(2339, 1654, 3)), 0, 255).astype(np.uint8)
+
+    page = triage(noise)
+
+    assert page['status'] == STATUS_BLANK
+    assert page['markers'] == []
+    assert page['skew'] is None
+
+
+def test_back_with_bleed_through_is_blank():
+    assert triage(_lighten(cv2.flip(_sheet(), 1), 0.08))['status'] == STATUS_BLANK
+
+
+def test_text_page_is_not_sheet():
+    page = np.full((2339, 1654, 3), 250, dtype=np.uint8)
+    for y in range(100, 2200, 40):
+        cv2.putText(page, 'Lorem ipsum dolor sit amet consectetur', (100, y),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1.5, (0, 0, 0), 3)
+
+    assert triage(page)['status'] == STATUS_NOT_SHEET
+
+
+def _corners(degrees, shape=(560, 400)):
+    """Três cantos do grid (miniatura) girados em torno do centro."""
+    h, w = shape
+    angle = np.radians(degrees)
+    rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+    corners = np.array([[36.0, 160.0], [366.0, 160.0], [36.0, 356.0]]) - (w / 2, h / 2)
+    return [tuple(p) for p in corners @ rotation.T + (w / 2, h / 2)]
+
+
+@pytest.mark.parametrize('degrees', [0, 4, -9, 14])
+def test_find_marker_rectangle_accepts_skew(degrees):
+    corners = _corners(degrees)
+    # Bolhas preenchidas também viram candidatas: não podem formar o retângulo
+    bubbles = [(120.0 + 14 * i, 220.0 + 9 * i) for i in range(12)]
+
+    rectangle = find_marker_rectangle(bubbles + corners + bubbles[::3], (560, 400))
+
+    assert rectangle == corners
+    assert marker_skew(rectangle) == pytest.approx(degrees, abs=1e-6)
+
+
+def test_find_marker_rectangle_rejects_skew_beyond_limit_and_non_right_angle():
+    assert find_marker_rectangle(_corners(25), (560, 400)) is None
+    a, b, c = _corners(0)
+    assert find_marker_rectangle([a, b, (c[0] + 40, c[1])], (560, 400)) is None
+
+
+# Página girada `turned` graus (horário) precisa do giro inverso para ficar em pé
+TURNS = [90, 180, 270]
+
+
+@pytest.mark.parametrize('degrees', [0, -5, 3, 9])
+@pytest.mark.parametrize('turned', TURNS)
+@pytest.mark.parametrize('path', SHEETS[:2], ids=lambda p: p.stem)
+def test_detect_rotation_on_turned_and_skewed_sheet(path, turned, degrees):
+    page = triage(_skew(rotate_page(_sheet(path), turned), degrees))
+
+    assert page['status'] == STATUS_CANDIDATE
+    assert page['rotation'] == (360 - turned) % 360
+
+
+@pytest.mark.parametrize('rotation', TURNS)
+def test_rotate_points_matches_rotate_page(rotation):
+    img = np.zeros((7, 11), dtype=np.uint8)
+    points = [(0, 0), (10, 0), (0, 6), (10, 6), (3, 2), (8, 5)]
+    for value, (x, y) in enumerate(points, 1):
+        img[y, x] = value
+
+    rotated = rotate_page(img, rotation)
+    for value, (x, y) in enumerate(rotate_points(points, img.shape, rotation), 1):
+        assert rotated[y, x] == value
+
+
+def test_rotate_page_ignores_other_angles():
+    img = np.zeros((7, 11), dtype=np.uint8)
+    assert rotate_page(img, 0) is img
+    assert rotate_points([(3, 2)], img.shape, 0) == [(3, 2)]
+    assert set(ROTATE_CODES) == set(TURNS)
+
+
+def _dark_at(gray, point, radius=6):
+    x, y = point
+    return gray[y - radius:y + radius + 1, x - radius:x + radius + 1].mean() < 100
+
+
+@pytest.mark.parametrize('turned', TURNS)
+def test_oriented_markers_follow_rotated_page(turned):
+    """Marcadores passados a read_qr_with_fallback: sobre os quadrados da página em pé."""
+    upright = _sheet()
+    img = rotate_page(upright, turned)
+    page = triage(img)
+
+    markers = oriented_markers(page, img.shape)
+    fixed = rotate_page(img, page['rotation'])
+    gray = cv2.cvtColor(fixed, cv2.COLOR_BGR2GRAY)
+
+    assert fixed.shape == upright.shape
+    assert all(_dark_at(gray, m) for m in markers)
+    # A triagem escolhe 3 dos 4 cantos; o quarto completa o paralelogramo
+    expected = triage(upright)['markers']
+    (ax, ay), (bx, by), (cx, cy) = expected
+    corners = expected + [(bx + cx - ax, by + cy - ay)]
+    for marker in markers:
+        assert min(np.hypot(marker[0] - x, marker[1] - y) for x, y in corners) < 15
+    assert read_qr_located(fixed, markers) == read_qr_located(upright, expected) is not None
+
+
+def test_oriented_markers_without_markers():
+    assert oriented_markers(None, (10, 10)) is None
+    assert oriented_markers({'markers': [], 'rotation': 0}, (10, 10)) is None
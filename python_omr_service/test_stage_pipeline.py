@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Testes do pipeline em estágios (stage_pipeline)
+
+Rodar: python -m pytest python_omr_service/test_stage_pipeline.py
+"""
+
+import random
+import threading
+import time
+
+import pytest
+
+from stage_pipeline import StagePipeline
+from upload_stream import MemoryBudget
+
+
+def _sleepy(name, seed):
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    def stage(job):
+        with lock:
+            delay = rng.uniform(0, 0.004)
+        time.sleep(delay)
+        job.setdefault('stages', []).append(name)
+    return stage
+
+
+def test_output_keeps_input_order():
+    pipeline = StagePipeline([
+        ('decode', _sleepy('decode', 1), 3),
+        ('omr', _sleepy('omr', 2), 2),
+        ('save', _sleepy('save', 3), 4),
+    ], queue_size=2)
+
+    results = list(pipeline.run({'n': n} for n in range(60)))
+
+    assert [index for index, _ in results] == list(range(60))
+    assert [job['n'] for _, job in results] == list(range(60))
+    assert all(job['stages'] == ['decode', 'omr', 'save'] for _, job in results)
+
+
+def test_exception_becomes_error_and_skips_later_stages():
+    def decode(job):
+        if job['n'] % 3 == 0:
+            raise ValueError(f"folha {job['n']} ilegível")
+        job['decoded'] = True
+
+    def save(job):
+        job['saved'] = True
+
+    results = [job for _, job in StagePipeline([('decode', decode, 2), ('save', save, 1)]).run(
+        {'n': n} for n in range(10))]
+
+    assert [job['n'] for job in results] == list(range(10))
+    for job in results:
+        if job['n'] % 3 == 0:
+            assert isinstance(job['error'], ValueError)
+            assert 'saved' not in job
+        else:
+            assert 'error' not in job
+            assert job['saved']
+
+
+def test_early_outcome_skips_later_stages():
+    def qr(job):
+        if job['n'] % 2:
+            job['outcome'] = {'status': 'erro', 'code': 'QR_NOT_FOUND'}
+
+    calls = []
+
+    def omr(job):
+        calls.append(job['n'])
+
+    results = [job for _, job in StagePipeline([('qr', qr, 1), ('omr', omr, 2)]).run(
+        {'n': n} for n in range(8))]
+
+    assert sorted(calls) == [0, 2, 4, 6]
+    assert [job.get('outcome', {}).get('code') for job in results] == [None, 'QR_NOT_FOUND'] * 4
+
+
+def test_feed_error_is_raised_after_fed_jobs():
+    def items():
+        for n in range(5):
+            yield {'n': n}
+        raise IOError('upload interrompido')
+
+    seen = []
+    with pytest.raises(IOError):
+        for index, job in StagePipeline([('a', _sleepy('a', 4), 2)]).run(items()):
+            seen.append(index)
+
+    assert seen == list(range(5))
+
+
+def test_empty_input():
+    assert list(StagePipeline([('a', _sleepy('a', 5), 2), ('b', _sleepy('b', 6), 1)]).run([])) == []
+
+
+def _wait_until(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, 'timeout esperando o pipeline'
+        time.sleep(0.001)
+
+
+def test_closing_early_cleans_up_jobs_not_delivered():
+    """Cliente desconecta: a memória das páginas ainda nos estágios volta ao orçamento."""
+    budget = MemoryBudget(100)
+    gate = threading.Event()
+
+    def decode(job):
+        budget.acquire(1)
+        job['reserved'] = 1
+
+    def omr(job):
+        if job['n']:
+            gate.wait(2)
+        # Ímpares falham com a imagem ainda reservada (quem libera é o consumidor)
+        if job['n'] % 2:
+            raise ValueError('folha ilegível')
+        budget.release(job.pop('reserved'))
+
+    def cleanup(job):
+        budget.release(job.pop('reserved', 0))
+
+    run = StagePipeline([('decode', decode, 1), ('omr', omr, 2)], queue_size=2, cleanup=cleanup).run(
+        {'n': n} for n in range(8))
+    index, _ = next(run)
+    assert index == 0
+    assert budget.used > 0
+
+    run.close()
+    gate.set()
+
+    _wait_until(lambda: budget.used == 0)
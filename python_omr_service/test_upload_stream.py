@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Testes da ingestão em streaming (upload_stream)
+
+O corpo multipart é montado pelo werkzeug e lido por um stream que conta
+os bytes consumidos, para conferir que cada arquivo sai antes do resto do
+upload ser lido.
+
+Rodar: python -m pytest python_omr_service/test_upload_stream.py
+"""
+
+import io
+import threading
+import time
+
+import pytest
+from werkzeug.test import EnvironBuilder
+
+import upload_stream
+from upload_stream import iter_multipart, MemoryBudget, MemoryBudgetExceeded, CHUNK_SIZE, MAX_FIELD_BYTES
+
+
+class CountingStream(io.BytesIO):
+    """Corpo da requisição que registra quanto já foi lido do socket."""
+
+    @property
+    def consumed(self):
+        return self.tell()
+
+
+class FakeRequest:
+    def __init__(self, body, content_type):
+        self.headers = {'Content-Type': content_type}
+        self.stream = CountingStream(body)
+
+
+def _request(data):
+    builder = EnvironBuilder(method='POST', data=data)
+    environ = builder.get_environ()
+    return FakeRequest(environ['wsgi.input'].read(), environ['CONTENT_TYPE'])
+
+
+def _files(*sizes):
+    return {f'file{i}': (io.BytesIO(bytes([i]) * size), f'folha{i}.jpg') for i, size in enumerate(sizes)}
+
+
+def test_fields_and_files_in_arrival_order():
+    request = _request(dict({'scanner': 'canon-1'}, **_files(10, 20, 30)))
+    fields = {}
+
+    files = [(f.filename, f.read()) for f in iter_multipart(request, fields)]
+
+    assert files == [(f'folha{i}.jpg', bytes([i]) * size) for i, size in enumerate((10, 20, 30))]
+    assert fields == {'scanner': 'canon-1'}
+
+
+def test_each_file_comes_out_before_the_rest_is_read():
+    request = _request(_files(*[3 * CHUNK_SIZE] * 4))
+    total = len(request.stream.getvalue())
+
+    consumed = [request.stream.consumed for _ in iter_multipart(request, {})]
+
+    assert len(consumed) == 4
+    # A primeira folha sai com pouco mais que ela mesma lida
+    assert consumed[0] <= 3 * CHUNK_SIZE + 2 * CHUNK_SIZE
+    assert consumed == sorted(consumed) and consumed[-1] <= total
+
+
+def test_large_part_is_spooled_to_disk():
+    request = _request(_files(100, upload_stream.SPOOL_MEMORY_BYTES + 1))
+
+    small, large = [(f.stream._rolled, f.read()) for f in iter_multipart(request, {})]
+
+    assert small[0] is False
+    assert large[0] is True and len(large[1]) == upload_stream.SPOOL_MEMORY_BYTES + 1
+
+
+def test_truncated_body_is_an_error():
+    request = _request(_files(10, 5 * CHUNK_SIZE))
+    body = request.stream.getvalue()
+    request.stream = CountingStream(body[:len(body) // 2])
+
+    received = []
+    with pytest.raises(ValueError, match='incompleto'):
+        for part in iter_multipart(request, {}):
+            received.append(part.read())
+
+    # A folha completa antes do corte já tinha sido entregue
+    assert received == [bytes([0]) * 10]
+
+
+@pytest.mark.parametrize('content_type', ['application/json', 'multipart/form-data', 'text/plain; boundary=x'])
+def test_not_multipart(content_type):
+    with pytest.raises(ValueError, match='multipart'):
+        next(iter_multipart(FakeRequest(b'{}', content_type), {}))
+
+
+def test_malformed_multipart():
+    request = FakeRequest(b'--outra\r\nlixo sem cabecalhos\r\n\r\n',
+                          'multipart/form-data; boundary=esperado')
+
+    with pytest.raises(ValueError):
+        list(iter_multipart(request, {}))
+
+
+def test_oversized_text_field():
+    request = _request(dict({'scanner': 'x' * (MAX_FIELD_BYTES + 1)}, **_files(10)))
+
+    with pytest.raises(ValueError, match='scanner'):
+        list(iter_multipart(request, {}))
+
+
+def test_memory_budget_blocks_until_release():
+    budget = MemoryBudget(100)
+    budget.acquire(80)
+    acquired = threading.Event()
+
+    def waiter():
+        budget.acquire(50)
+        acquired.set()
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    time.sleep(0.05)
+    assert not acquired.is_set()
+
+    budget.release(80)
+    thread.join(timeout=1)
+
+    assert acquired.is_set() and budget.used == 50
+
+
+def test_memory_budget_errors():
+    budget = MemoryBudget(100)
+
+    with pytest.raises(MemoryBudgetExceeded):
+        budget.acquire(101, timeout=10)
+    with budget.reserve(60):
+        with pytest.raises(MemoryBudgetExceeded):
+            budget.acquire(60, timeout=0.01)
+    assert budget.used == 0
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Ingestão de uploads em streaming
+================================
+
+O parser padrão do Flask lê o multipart inteiro antes da rota começar. Aqui
+as partes são entregues uma a uma, assim que chegam:
+
+- iter_multipart: decodifica o corpo da requisição aos poucos (CHUNK_SIZE)
+  e entrega cada arquivo como FileStorage logo que a parte termina; partes
+  acima de SPOOL_MEMORY_BYTES vão para disco (SpooledTemporaryFile)
+- MemoryBudget: orçamento de memória por worker para as páginas
+  decodificadas. Sem orçamento livre a thread espera, sem ler mais do
+  socket: o cliente sente a contrapressão pelo TCP
+
+A rota lê no máximo algumas partes à frente da folha em processamento (filas
+do stage_pipeline), então o pico de memória depende das requisições
+simultâneas, não do tamanho do upload.
+"""
+
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+from werkzeug.datastructures import FileStorage
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+from runtime_limits import runtime
+
+CHUNK_SIZE = 64 * 1024
+# Parte maior que isso vai para disco
+SPOOL_MEMORY_BYTES = 1024 * 1024
+# Campos de texto (scanner etc.) não passam disso
+MAX_FIELD_BYTES = 64 * 1024
+
+# Orçamento de memória por worker para páginas decodificadas (OMR_MEMORY_BUDGET_MB,
+# ou a memória do contêiner dividida entre os workers, até 256MB)
+MEMORY_BUDGET_MB = runtime['memory_budget_mb']
+# Espera máxima por orçamento livre (s)
+MEMORY_WAIT_SECONDS = 60
+
+
+class MemoryBudgetExceeded(Exception):
+    """Página maior que o orçamento inteiro ou orçamento ocupado por tempo demais."""
+
+
+class MemoryBudget:
+    """Bytes reservados por threads do worker; reservar além do limite bloqueia."""
+
+    def __init__(self, limit_bytes: int):
+        self.limit = limit_bytes
+        self.used = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, nbytes: int, timeout: float = MEMORY_WAIT_SECONDS):
+        """Reserva nbytes, esperando até timeout; MemoryBudgetExceeded se não couber."""
+        if nbytes > self.limit:
+            raise MemoryBudgetExceeded(
+                f"Página precisa de {nbytes // 2**20}MB, orçamento do worker é {self.limit // 2**20}MB")
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.used + nbytes <= self.limit, timeout=timeout):
+                raise MemoryBudgetExceeded(f"Orçamento de memória ocupado há mais de {timeout:.0f}s")
+            self.used += nbytes
+
+    def release(self, nbytes: int):
+        with self._cond:
+            self.used -= nbytes
+            self._cond.notify_all()
+
+    @contextmanager
+    def reserve(self, nbytes: int, timeout: float = MEMORY_WAIT_SECONDS):
+        self.acquire(nbytes, timeout)
+        try:
+            yield
+        finally:
+            self.release(nbytes)
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._cond:
+            return {'limit_mb': self.limit // 2**20, 'used_mb': round(self.used / 2**20, 1)}
+
+
+memory_budget = MemoryBudget(MEMORY_BUDGET_MB * 2**20)
+
+
+def decoded_bytes(pil_img) -> int:
+    """Memória de pico para decodificar a imagem e convertê-la para o array BGR + cinza."""
+    w, h = pil_img.size
+    # PIL RGB + array BGR (3 bytes/pixel cada) + cinza
+    return w * h * 7
+
+
+def _next_event(decoder: MultipartDecoder, eof: bool):
+    """Próximo evento; o corpo cortado no meio de uma parte vira "Multipart incompleto"."""
+    try:
+        return decoder.next_event()
+    except ValueError:
+        if eof:
+            raise ValueError("Multipart incompleto (conexão encerrada antes do fim)")
+        raise
+
+
+def iter_multipart(request, fields: Dict[str, str]) -> Iterator[FileStorage]:
+    """
+    Arquivos do corpo multipart, na ordem em que chegam.
+
+    Campos de texto vão para `fields` assim que chegam (envie-os antes dos
+    arquivos para usá-los já na primeira folha).
+
+    Raises:
+        ValueError: corpo que não é multipart/form-data ou multipart malformado
+    """
+    mimetype, options = parse_options_header(request.headers.get('Content-Type', ''))
+    boundary = options.get('boundary')
+    if mimetype != 'multipart/form-data' or not boundary:
+        raise ValueError("Corpo não é multipart/form-data")
+
+    decoder = MultipartDecoder(boundary.encode('latin-1'))
+    stream = request.stream
+    part, container = None, None
+    finished = False
+
+    while not finished:
+        chunk = stream.read(CHUNK_SIZE)
+        decoder.receive_data(chunk or None)
+        event = _next_event(decoder, not chunk)
+        while not isinstance(event, NeedData):
+            if isinstance(event, Epilogue):
+                finished = True
+                break
+            if isinstance(event, Field):
+                part, container = event, bytearray()
+            elif isinstance(event, File):
+                part = event
+                container = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+            elif isinstance(event, Data):
+                if isinstance(part, Field):
+                    if len(container) + len(event.data) > MAX_FIELD_BYTES:
+                        raise ValueError(f"Campo {part.name} maior que {MAX_FIELD_BYTES} bytes")
+                    container.extend(event.data)
+                else:
+                    container.write(event.data)
+                if not event.more_data:
+                    if isinstance(part, Field):
+                        fields[part.name] = container.decode('utf-8', 'replace')
+                    else:
+                        container.seek(0)
+                        yield FileStorage(container, part.filename, part.name, headers=part.headers)
+                    part, container = None, None
+            event = _next_event(decoder, not chunk)
+        if not chunk and not finished:
+            raise ValueError("Multipart incompleto (conexão encerrada antes do fim)")
@@ -29,6 +29,13 @@ import cv2
 import numpy as np
 from typing import Dict, List, Tuple, Optional, Any
 
+from qr_locator import read_qr_located
+from omr_decision import (
+    HOUGH_RULES, LOW_CONFIDENCE_MARGIN, merge_rules, decide, decision_margin,
+    confidence_from_margin, code_to_answer, darkness_levels, CODE_DOUBLE, DARK_LEVELS,
+    stored_precision
+)
+
 # ============================================================
 # CONFIGURAÇÃO DO TEMPLATE
 # ============================================================
@@ -43,6 +50,16 @@ OPTIONS = ['A', 'B', 'C', 'D', 'E']
 FILL_THRESHOLD = 22      # % mínimo de pixels escuros para considerar marcado
 DARK_PIXEL_VALUE = 185   # Valor de pixel considerado "escuro" (0-255) - inclui cinzas mais claros
 
+# Regras de decisão (omr_decision) com o FILL_THRESHOLD deste módulo
+DECISION_RULES = merge_rules(HOUGH_RULES, {
+    'blank_threshold': FILL_THRESHOLD,
+    'marked_threshold': FILL_THRESHOLD,
+})
+
+# Releitura de questões com margem de confiança baixa
+REREAD_UPSCALE = 2       # Fator de ampliação da faixa da questão
+REREAD_SHIFT = 0.25      # Busca local: deslocamento em frações do raio
+
 
 # ============================================================
 # DETECÇÃO DE MARCADORES
@@ -178,12 +195,31 @@ def detect_bubbles(gray: np.ndarray, markers: Dict) -> List[Dict]:
     if len(rows) != 15:
         return []
 
+    # Linhas com círculos faltando (ou sobrando) herdam as colunas das linhas
+    # completas; só essas questões ficam marcadas como 'inferred'
+    complete = [row for row in rows if len(row) == 30]
+    if not complete:
+        return []
+    if len(complete) < len(rows):
+        grid_x = np.median([[c[0] for c in row] for row in complete], axis=0).astype(int)
+        grid_r = int(np.median([c[2] for row in complete for c in row]))
+
     # Criar estrutura de questões
     # Cada linha tem 30 círculos (6 colunas × 5 opções)
     bubble_positions = []
 
     for row_idx, row in enumerate(rows):
         if len(row) != 30:
+            row_y = int(np.median([c[1] for c in row]))
+            for col_idx in range(NUM_COLUMNS):
+                bubble_positions.append({
+                    'question': col_idx * QUESTIONS_PER_COLUMN + row_idx + 1,
+                    'inferred': True,
+                    'options': [
+                        {'option': OPTIONS[i], 'x': int(grid_x[col_idx * 5 + i]), 'y': row_y, 'r': grid_r}
+                        for i in range(5)
+                    ]
+                })
             continue
 
         for col_idx in range(NUM_COLUMNS):
@@ -277,65 +313,173 @@ def detect_answer(gray: np.ndarray, options: List[Dict]) -> Tuple[Optional[str],
         'diff': diff
     }
 
-    # Decisão - lógica melhorada para marcações leves
-    # 1. Em branco: nenhuma bolha significativamente escura
-    if best['darkness'] < FILL_THRESHOLD:
-        return None, stats  # Em branco
-
-    # 2. Dupla marcação: duas bolhas muito próximas em escuridão (ambas acima do threshold)
-    if second['darkness'] >= FILL_THRESHOLD and diff < 6:
+    # Decisão (omr_decision): branco, dupla marcação, marcação clara/leve
+    code = int(decide(np.array([r['darkness'] for r in sorted(results, key=lambda r: r['option'])]),
+                      DECISION_RULES))
+    if code == CODE_DOUBLE:
         stats['warning'] = 'double_mark'
         return None, stats  # Dupla marcação
+    return code_to_answer(code), stats
+
+
+def measure_darkness(gray: np.ndarray, bubble_positions: List[Dict]) -> np.ndarray:
+    """
+    Matriz de escuridão (questões x 5), na ordem de bubble_positions.
+
+    Mesma medida de detect_answer (arredondada a 0.1).
+    """
+    return np.array([
+        [round(analyze_bubble(gray, opt['x'], opt['y'], opt.get('r', 12)), 1) for opt in q['options']]
+        for q in bubble_positions
+    ], dtype=np.float64).reshape(-1, len(OPTIONS))
+
+
+def measure_darkness_levels(gray: np.ndarray, bubble_positions: List[Dict],
+                            levels=DARK_LEVELS) -> np.ndarray:
+    """
+    Escuridão de cada bolha em vários limiares de pixel escuro: (len(levels), questões, 5).
+
+    Mesma máscara circular de analyze_bubble; guardada com a folha para
+    testar outro DARK_PIXEL_VALUE sem reler a imagem.
+    """
+    h, w = gray.shape
+    masks = {}
+    out = np.zeros((len(levels), len(bubble_positions), len(OPTIONS)), dtype=np.float64)
+    for qi, q in enumerate(bubble_positions):
+        for oi, opt in enumerate(q['options']):
+            r = opt.get('r', 12)
+            x = max(r, min(opt['x'], w - r - 1))
+            y = max(r, min(opt['y'], h - r - 1))
+            if r not in masks:
+                mask = np.zeros((2 * r, 2 * r), dtype=np.uint8)
+                cv2.circle(mask, (r, r), r, 1, -1)
+                masks[r] = mask.astype(bool)
+            roi = gray[y-r:y+r, x-r:x+r]
+            if roi.shape != masks[r].shape:
+                continue
+            out[:, qi, oi] = darkness_levels(roi[masks[r]], levels)
+    return out
+
+
+def reread_question(gray: np.ndarray, options: List[Dict]) -> List[float]:
+    """
+    Releitura cara de uma questão de baixa confiança.
+
+    - Faixa das 5 bolhas ampliada REREAD_UPSCALE vezes (INTER_CUBIC)
+    - Limiar de pixel escuro adaptado à faixa (média entre Otsu e DARK_PIXEL_VALUE)
+    - Busca local: máscara circular deslocada ±REREAD_SHIFT do raio, fica a maior escuridão
+
+    Returns:
+        Escuridão de A-E em % (mesma escala de analyze_bubble)
+    """
+    h, w = gray.shape
+    r = int(np.median([opt.get('r', 12) for opt in options]))
+    pad = 2 * r
+    x1 = max(0, min(opt['x'] for opt in options) - pad)
+    x2 = min(w, max(opt['x'] for opt in options) + pad)
+    y1 = max(0, min(opt['y'] for opt in options) - pad)
+    y2 = min(h, max(opt['y'] for opt in options) + pad)
+    strip = gray[y1:y2, x1:x2]
+    if strip.size == 0:
+        return [0.0] * len(options)
+
+    k = REREAD_UPSCALE
+    up = cv2.resize(strip, None, fx=k, fy=k, interpolation=cv2.INTER_CUBIC)
+    otsu, _ = cv2.threshold(up, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    dark_value = float(np.clip((otsu + DARK_PIXEL_VALUE) / 2, DARK_PIXEL_VALUE - 25, DARK_PIXEL_VALUE + 25))
+    dark = up < dark_value
+
+    rr = r * k
+    mask = np.zeros((2 * rr, 2 * rr), dtype=np.uint8)
+    cv2.circle(mask, (rr, rr), rr, 1, -1)
+    mask = mask.astype(bool)
+    total = mask.sum()
+    shift = max(1, int(round(rr * REREAD_SHIFT)))
+    uh, uw = dark.shape
+
+    darkness = []
+    for opt in options:
+        cx, cy = (opt['x'] - x1) * k, (opt['y'] - y1) * k
+        best = 0.0
+        for dy in (-shift, 0, shift):
+            for dx in (-shift, 0, shift):
+                x, y = cx + dx, cy + dy
+                if x - rr < 0 or y - rr < 0 or x + rr > uw or y + rr > uh:
+                    continue
+                value = np.count_nonzero(dark[y - rr:y + rr, x - rr:x + rr] & mask) / total * 100
+                best = max(best, value)
+        darkness.append(round(best, 1))
+    return darkness
+
+
+def read_answers(gray: np.ndarray, bubble_positions: List[Dict],
+                 low_margin: float = LOW_CONFIDENCE_MARGIN) -> Dict[str, Any]:
+    """
+    Lê todas as questões com margem de confiança e releitura seletiva.
 
-    # 3. Marcação clara: melhor bolha é significativamente mais escura
-    # Usa diferença relativa para lidar com marcações leves
-    relative_diff = (diff / best['darkness'] * 100) if best['darkness'] > 0 else 0
-    if diff >= 5 or relative_diff >= 15:  # diff absoluta >= 5% OU relativa >= 15%
-        return best['option'], stats
+    Caminho barato (analyze_bubble) para todas; só as questões com margem
+    abaixo de low_margin (ou com posição inferida) passam por reread_question.
+    A releitura é adotada quando aumenta a margem.
+
+    Returns:
+        Dict com 'codes' (0-4, 5 branco, 6 dupla), 'margins', 'darkness' (q x 5),
+        'escalated' (índices relidos)
+    """
+    darkness = stored_precision(measure_darkness(gray, bubble_positions))
+    codes = decide(darkness, DECISION_RULES)
+    margins = decision_margin(darkness, DECISION_RULES)
 
-    # 4. Fallback: se melhor está bem acima do threshold, aceitar
-    if best['darkness'] >= FILL_THRESHOLD + 10:
-        return best['option'], stats
+    inferred = np.array([bool(q.get('inferred')) for q in bubble_positions], dtype=bool)
+    escalate = np.flatnonzero((margins < low_margin) | inferred)
+    for i in escalate.tolist():
+        reread = stored_precision(reread_question(gray, bubble_positions[i]['options']))
+        reread_margin = float(decision_margin(reread, DECISION_RULES))
+        if reread_margin > margins[i] or inferred[i]:
+            darkness[i] = reread
+            codes[i] = decide(reread, DECISION_RULES)
+            margins[i] = reread_margin
 
-    # Incerto = em branco (evita falsos positivos)
-    return None, stats
+    return {'codes': codes, 'margins': margins, 'darkness': darkness, 'escalated': escalate}
 
 
 # ============================================================
 # LEITURA DE QR CODE
 # ============================================================
 
-def read_qr_code(image: np.ndarray) -> Tuple[Optional[str], int]:
+def read_qr_code(image: np.ndarray, markers: Optional[Dict] = None) -> Tuple[Optional[str], int]:
     """
     Lê o QR Code do gabarito e extrai sheet_code e dia.
 
     Args:
         image: Imagem BGR ou grayscale
+        markers: marcadores do grid (find_grid_markers), para prever o recorte do QR
 
     Returns:
         Tuple (sheet_code, start_question):
         - sheet_code: Código do gabarito (ex: XTRI-U6M9R7) ou None
         - start_question: 1 para DIA 1, 91 para DIA 2
     """
-    try:
-        from pyzbar import pyzbar
-    except ImportError:
-        return None, 1
-
     gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
     h, w = gray.shape
 
-    qr_data = None
+    # Recorte previsto pelo template, escala normalizada (custo constante em qualquer DPI)
+    qr_data = read_qr_located(gray, markers)
 
-    # Tentar ROI do canto superior direito primeiro
-    roi = gray[0:int(h*0.3), int(w*0.6):w]
-    for obj in pyzbar.decode(roi):
-        if obj.type == 'QRCODE':
-            qr_data = obj.data.decode('utf-8').strip()
-            break
+    try:
+        from pyzbar import pyzbar
+    except ImportError:
+        pyzbar = None
 
-    # Fallback: imagem completa
-    if qr_data is None:
+    # Fallback: ROI do canto superior direito
+    if qr_data is None and pyzbar is not None:
+        roi = gray[0:int(h*0.3), int(w*0.6):w]
+        for obj in pyzbar.decode(roi):
+            if obj.type == 'QRCODE':
+                qr_data = obj.data.decode('utf-8').strip()
+                break
+
+    # Último recurso: imagem completa
+    if qr_data is None and pyzbar is not None:
         for obj in pyzbar.decode(gray):
             if obj.type == 'QRCODE':
                 qr_data = obj.data.decode('utf-8').strip()
@@ -377,8 +521,11 @@ def process_answer_sheet(image: np.ndarray) -> Dict[str, Any]:
     """
     gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
 
+    # Marcadores antes do QR: eles dizem onde o QR está
+    markers = find_grid_markers(gray)
+
     # Ler QR Code para obter sheet_code e start_question
-    sheet_code, start_question = read_qr_code(image)
+    sheet_code, start_question = read_qr_code(image, markers)
 
     result = {
         'success': False,
@@ -392,8 +539,7 @@ def process_answer_sheet(image: np.ndarray) -> Dict[str, Any]:
         }
     }
 
-    # 1. Encontrar marcadores
-    markers = find_grid_markers(gray)
+    # 1. Marcadores do grid
     if not markers:
         result['error'] = 'Marcadores do grid não encontrados'
         return result
@@ -405,23 +551,38 @@ def process_answer_sheet(image: np.ndarray) -> Dict[str, Any]:
         result['error'] = f'Mapeamento incorreto: {len(bubble_positions)} questões detectadas'
         return result
 
-    # 3. Analisar cada questão
+    # 3. Analisar cada questão (margem de confiança + releitura seletiva)
     # Aplicar offset baseado no start_question (1 para DIA 1, 91 para DIA 2)
     question_offset = start_question - 1
+    reading = read_answers(gray, bubble_positions)
+    confidence = confidence_from_margin(reading['margins'])
 
-    for q_data in bubble_positions:
+    result['confidence'] = {}
+    result['low_confidence'] = []
+    for i, q_data in enumerate(bubble_positions):
         q_num = q_data['question'] + question_offset  # Ajusta numeração
-        answer, stats = detect_answer(gray, q_data['options'])
+        code = int(reading['codes'][i])
+        answer = None if code == CODE_DOUBLE else code_to_answer(code)
 
         result['answers'][str(q_num)] = answer
+        result['confidence'][str(q_num)] = round(float(confidence[i]), 2)
+        if reading['margins'][i] < LOW_CONFIDENCE_MARGIN:
+            result['low_confidence'].append(q_num)
 
         if answer:
             result['stats']['answered'] += 1
-        elif stats.get('warning') == 'double_mark':
+        elif code == CODE_DOUBLE:
             result['stats']['double_marked'] += 1
         else:
             result['stats']['blank'] += 1
 
+    # Matrizes para re-correção offline (darkness_store)
+    result['codes'] = reading['codes'].tolist()
+    result['darkness'] = reading['darkness'].tolist()
+    result['darkness_levels'] = np.round(measure_darkness_levels(gray, bubble_positions), 1).tolist()
+
+    result['stats']['escalated'] = int(len(reading['escalated']))
+    result['stats']['low_confidence'] = len(result['low_confidence'])
     result['success'] = True
     return result
 
@@ -530,6 +691,7 @@ if __name__ == '__main__':
 
     # Output
     if output_json:
+        result.pop('darkness_levels', None)
         print(json.dumps(result, indent=2, ensure_ascii=False))
     else:
         print(f"\n{'='*60}")
@@ -5,15 +5,32 @@ SERVIÇO PYTHON TRI V2 - API REST
 Porta 5003 (para não conflitar com OMR na 5002)
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, send_file
 from flask_cors import CORS
 import sys
 import os
 import json
+import tempfile
 import numpy as np
+from typing import Optional
 
 # Importar motor TRI V2 do arquivo LOCAL (versão corrigida com coerência)
-from tri_v2_producao import TRIProcessadorV2 as ProcessadorTRICompleto, TabelaReferenciaTRI
+from tri_v2_producao import TRIProcessadorV2 as ProcessadorTRICompleto, TabelaReferenciaTRI, localizar_tabela
+from tri_matriz import (
+    MatrizRespostas, TRIVetorizado, RepositorioMatrizes,
+    AREAS_CONFIG_PADRAO, converter_aluno, converter_gabarito
+)
+from tri_calibracao import CalibradorMML, RepositorioCalibracoes, MODELOS
+from tri_irt import ParametrosItens
+from tri_analise_itens import analisar_itens
+from tri_ranking import IndiceRanking, RepositorioRankings, notas_de_resultado
+from tri_jobs import GerenciadorJobs, LimiteTenantExcedido
+from tri_cache import CacheResultados
+from tri_exportacao import RepositorioExportacoes, ExportacaoIndisponivel, PYARROW_DISPONIVEL
+from tri_streaming import (
+    ProcessadorStreaming, ler_blocos, formatar_saida, detectar_formato,
+    FORMATOS_SAIDA, TAMANHO_BLOCO_PADRAO
+)
 
 app = Flask(__name__)
 CORS(app)
@@ -31,23 +48,114 @@ class NumpyEncoder(json.JSONEncoder):
 
 app.json_encoder = NumpyEncoder
 
+
+def convert_numpy(obj):
+    """Converte recursivamente tipos numpy para Python nativos"""
+    if isinstance(obj, (np.integer, np.int64, np.int32)):
+        return int(obj)
+    elif isinstance(obj, (np.floating, np.float64, np.float32)):
+        return float(obj)
+    elif isinstance(obj, np.ndarray):
+        return obj.tolist()
+    elif isinstance(obj, dict):
+        return {key: convert_numpy(value) for key, value in obj.items()}
+    elif isinstance(obj, list):
+        return [convert_numpy(item) for item in obj]
+    return obj
+
 # ============================================================================
 # CONFIGURAÇÃO GLOBAL
 # ============================================================================
 
-TABELA_TRI_PATH = os.path.join(
-    os.path.dirname(__file__),
-    'tri_tabela_referencia_oficial.csv'
-)
+TABELA_TRI_PATH = os.getenv('TRI_TABELA_PATH') or localizar_tabela(os.path.dirname(os.path.abspath(__file__)))
 
 # Instanciar processador (carrega tabela UMA VEZ)
 try:
     tabela_referencia = TabelaReferenciaTRI(TABELA_TRI_PATH)
     processador = ProcessadorTRICompleto(tabela_referencia)
+    vetorizado = TRIVetorizado(tabela_referencia)
     print(f"✅ Processador TRI V2 inicializado com tabela: {TABELA_TRI_PATH}")
 except Exception as e:
     print(f"❌ ERRO ao carregar tabela TRI: {e}")
     processador = None
+    vetorizado = None
+
+# Matrizes das turmas calculadas (para recorreção sem reenviar a turma)
+try:
+    repositorio_matrizes = RepositorioMatrizes()
+except OSError as e:
+    print(f"⚠️  Repositório de matrizes indisponível: {e}")
+    repositorio_matrizes = None
+
+# A matriz guarda nomes e ids dos alunos: só vai para o disco quando pedido
+# ("armazenar_matriz": true) ou com TRI_ARMAZENAR_MATRIZES=1
+ARMAZENAR_MATRIZES = os.getenv('TRI_ARMAZENAR_MATRIZES', '0') == '1'
+
+
+def armazenar_matriz(data: dict) -> bool:
+    return repositorio_matrizes is not None and bool(data.get('armazenar_matriz', ARMAZENAR_MATRIZES))
+
+
+def salvar_matriz(data: dict, matriz: MatrizRespostas, areas_config: dict, opcoes: dict = None):
+    """Guarda a matriz para recorreção se pedido; retorna matriz_id (ou None)."""
+    if not armazenar_matriz(data):
+        return None
+    try:
+        return repositorio_matrizes.salvar(matriz, areas_config, opcoes)
+    except Exception as e:
+        print(f"⚠️  [TRI SERVICE] Matriz não armazenada: {e}")
+        return None
+
+# Rankings (turma / escola / rede) por matriz, com inserções incrementais;
+# o registro de inserções (nomes, ids) é apagado com a matriz
+try:
+    repositorio_rankings = RepositorioRankings()
+    if repositorio_matrizes is not None:
+        repositorio_matrizes.registrar_derivados(repositorio_rankings.diretorio)
+except OSError as e:
+    print(f"⚠️  Repositório de rankings indisponível: {e}")
+    repositorio_rankings = None
+
+# Cache de respostas de /api/calcular-tri (LRU + disco opcional)
+try:
+    cache_resultados = CacheResultados()
+except OSError as e:
+    print(f"⚠️  Cache de resultados indisponível: {e}")
+    cache_resultados = None
+
+# Jobs assíncronos para turmas grandes (acima do limiar de alunos)
+JOB_LIMIAR_ALUNOS = int(os.getenv('TRI_JOB_LIMIAR_ALUNOS', '2000'))
+# "execucao" quando a requisição não informa: síncrono por padrão (clientes
+# que não consultam /api/jobs recebem sempre os resultados); "auto" usa o limiar
+EXECUCAO_PADRAO = os.getenv('TRI_EXECUCAO_PADRAO', 'sincrona')
+
+
+def _executar_job_calculo(dados):
+    """Roda no pool de jobs (referência de módulo: precisa ser picklável)."""
+    return calcular_turma(dados)
+
+
+try:
+    gerenciador_jobs = GerenciadorJobs(_executar_job_calculo)
+except OSError as e:
+    print(f"⚠️  Jobs assíncronos indisponíveis: {e}")
+    gerenciador_jobs = None
+
+# Parâmetros de itens calibrados por prova (modo 'irt' em provas de escola)
+try:
+    repositorio_calibracoes = RepositorioCalibracoes()
+except OSError as e:
+    print(f"⚠️  Repositório de calibrações indisponível: {e}")
+    repositorio_calibracoes = None
+
+# Exportações colunares (Parquet / Arrow IPC) por matriz; apagadas com a matriz
+try:
+    repositorio_exportacoes = RepositorioExportacoes()
+    if repositorio_matrizes is not None:
+        repositorio_matrizes.registrar_derivados(repositorio_exportacoes.diretorio)
+except OSError as e:
+    print(f"⚠️  Exportação colunar indisponível: {e}")
+    repositorio_exportacoes = None
 
 
 # ============================================================================
@@ -93,13 +201,25 @@ def calcular_tri():
         "CH": [46, 90],
         "CN": [1, 45],
         "MT": [46, 90]
-      }
+      },
+      "modo": "tabela",                 (opcional: "tabela" ou "irt")
+      "parametros_itens": {             (modo "irt": parâmetros 3PL por questão)
+        "1": {"a": 1.2, "b": 0.4, "c": 0.18},
+        ...
+      },
+      "estimador": "eap",               (modo "irt": "eap" ou "map")
+      "calibracao_id": "9c1e...",       (modo "irt": alternativa a parametros_itens,
+                                         retornado por /api/calibrar)
+      "armazenar_matriz": true          (opcional: guarda a matriz e retorna
+                                         matriz_id para recorreção/ranking)
     }
     
     Saída JSON:
     {
       "status": "sucesso",
       "total_alunos": 30,
+      "matriz_id": "3f2a...",           (null sem armazenar_matriz)
+      "cache_id": "3f2a...",            (sempre: chave de /api/cache/invalidar)
       "prova_analysis": {...},
       "resultados": [
         {
@@ -143,93 +263,508 @@ def calcular_tri():
                 'mensagem': 'Dados inválidos. Necessário: alunos, gabarito'
             }), 400
         
-        alunos = data['alunos']
-        gabarito_raw = data['gabarito']
-        areas_config_raw = data.get('areas_config', {
-            'LC': [1, 45],
-            'CH': [46, 90],
-            'CN': [1, 45],
-            'MT': [46, 90]
-        })
-        
-        # Converter gabarito garantindo que as chaves sejam strings (qN usa string)
-        # Aceita tanto lista quanto dicionário
-        if isinstance(gabarito_raw, list):
-            # Se é lista, converter para dicionário {1: 'A', 2: 'B', ...}
-            gabarito = {str(i+1): v for i, v in enumerate(gabarito_raw)}
-        else:
-            gabarito = {str(k): v for k, v in gabarito_raw.items()}
-        
-        # Converter areas_config de list para tuple
-        areas_config = {k: tuple(v) for k, v in areas_config_raw.items()}
+        if not data.get('parametros_itens') and data.get('calibracao_id'):
+            try:
+                if repositorio_calibracoes is None:
+                    raise KeyError(data['calibracao_id'])
+                data['parametros_itens'] = repositorio_calibracoes.carregar(data['calibracao_id'])['parametros']
+            except KeyError:
+                return jsonify({
+                    'status': 'erro',
+                    'mensagem': f"Calibração não encontrada: {data['calibracao_id']}. Calibre via /api/calibrar"
+                }), 404
         
-        # Converter alunos do formato lista para formato qN
-        # Aceita: {'respostas': ['A', 'B', ...]} ou {'q1': 'A', 'q2': 'B', ...}
-        alunos_convertidos = []
-        for aluno in alunos:
-            aluno_conv = {'id': aluno.get('id', ''), 'nome': aluno.get('nome', '')}
+        # "assincrona" (ou "auto" com turma grande) vira job: 202 + job_id
+        execucao = data.get('execucao', EXECUCAO_PADRAO)
+        assincrono = execucao == 'assincrona' or (
+            execucao == 'auto' and len(data['alunos']) > JOB_LIMIAR_ALUNOS
+        )
+        if assincrono and gerenciador_jobs is not None:
+            # Turma já calculada: responde na hora, sem job
+            turma = preparar_turma(data)
+            resposta = resposta_em_cache(data, turma)
+            if resposta is not None:
+                return jsonify(resposta), 200
             
-            # Se tem 'respostas' como lista, converter para q1, q2, ...
-            if 'respostas' in aluno and isinstance(aluno['respostas'], list):
-                for i, resp in enumerate(aluno['respostas']):
-                    aluno_conv[f'q{i+1}'] = resp if resp else ''
-            else:
-                # Já está no formato qN, copiar
-                for key, val in aluno.items():
-                    if key.startswith('q') or key in ['id', 'nome', 'studentNumber', 'studentName', 'turma']:
-                        aluno_conv[key] = val
+            tenant = str(request.headers.get('X-Tenant-Id') or data.get('tenant') or 'padrao')
+            try:
+                job_id = gerenciador_jobs.submeter(tenant, data, tamanho=len(data['alunos']))
+            except LimiteTenantExcedido as e:
+                return jsonify({
+                    'status': 'erro',
+                    'mensagem': str(e)
+                }), 429
             
-            alunos_convertidos.append(aluno_conv)
-        
-        alunos = alunos_convertidos
-        
-        print(f"\n{'='*100}")
-        print(f"[TRI SERVICE] Processando {len(alunos)} alunos...")
-        print(f"[TRI SERVICE] Gabarito: {len(gabarito)} questões")
-        print(f"[TRI SERVICE] Áreas: {list(areas_config.keys())}")
-        print(f"[TRI SERVICE] Primeiro aluno tem chaves: {list(alunos[0].keys())[:10]}..." if alunos else "")
-        print(f"{'='*100}")
-        
-        # Processar com TRI V2
-        prova_analysis, resultados = processador.processar_turma(
-            alunos=alunos,
-            gabarito=gabarito,
-            areas_config=areas_config
-        )
+            print(f"[TRI SERVICE] Job {job_id[:12]} ({tenant}): {len(data['alunos'])} alunos")
+            return jsonify({
+                'status': 'aceito',
+                'job_id': job_id,
+                'cache_id': turma['matriz_id'],
+                'consultar': f'/api/jobs/{job_id}'
+            }), 202
+        
+        return jsonify(calcular_turma(data)), 200
+        
+    except KeyError as e:
+        return jsonify({
+            'status': 'erro',
+            'mensagem': f'Campo obrigatório ausente: {str(e)}'
+        }), 400
+        
+    except ValueError as e:
+        return jsonify({
+            'status': 'erro',
+            'mensagem': str(e)
+        }), 400
+        
+    except Exception as e:
+        import traceback
+        error_trace = traceback.format_exc()
+        print(f"❌ [TRI SERVICE] ERRO: {error_trace}")
+        
+        return jsonify({
+            'status': 'erro',
+            'mensagem': str(e),
+            'trace': error_trace
+        }), 500
+
+
+def preparar_turma(data: dict) -> dict:
+    """
+    Entrada de /api/calcular-tri convertida: alunos, gabarito, areas_config,
+    matriz, opcoes, matriz_id e a chave do cache.
+    
+    Raises:
+        KeyError, ValueError: entrada inválida
+    """
+    alunos = data['alunos']
+    gabarito_raw = data['gabarito']
+    areas_config_raw = data.get('areas_config', AREAS_CONFIG_PADRAO)
+    
+    # Converter gabarito garantindo que as chaves sejam strings (qN usa string)
+    gabarito = converter_gabarito(gabarito_raw)
+    
+    # Converter areas_config de list para tuple
+    areas_config = {k: tuple(v) for k, v in areas_config_raw.items()}
+    
+    # Converter alunos do formato lista para formato qN
+    # Aceita: {'respostas': ['A', 'B', ...]} ou {'q1': 'A', 'q2': 'B', ...}
+    alunos = [converter_aluno(aluno) for aluno in alunos]
+    
+    matriz = MatrizRespostas.de_alunos(alunos, gabarito)
+    opcoes = {'modo': data.get('modo', 'tabela')}
+    if opcoes['modo'] == 'irt':
+        opcoes.update(estimador=data.get('estimador', 'eap'), parametros_itens=data.get('parametros_itens'))
+    matriz_id = RepositorioMatrizes.identificador(matriz, areas_config, opcoes)
+    return {
+        'alunos': alunos,
+        'gabarito': gabarito,
+        'areas_config': areas_config,
+        'matriz': matriz,
+        'opcoes': opcoes,
+        'matriz_id': matriz_id,
+        'chave': CacheResultados.chave(matriz_id, opcoes),
+    }
+
+
+def resposta_em_cache(data: dict, turma: dict) -> Optional[dict]:
+    """Mesma turma + mesmas opções → resposta em cache (sem recalcular nem logar); None se não houver."""
+    if cache_resultados is None or not cache_resultados.ativo:
+        return None
+    resposta = cache_resultados.obter(turma['chave'])
+    if resposta is None:
+        return None
+    print(f"[TRI SERVICE] Cache: {len(turma['alunos'])} alunos ({turma['matriz_id'][:12]})")
+    return dict(resposta, cache_id=turma['matriz_id'],
+                matriz_id=salvar_matriz(data, turma['matriz'], turma['areas_config'], turma['opcoes']))
+
+
+def calcular_turma(data: dict, turma: Optional[dict] = None) -> dict:
+    """
+    Núcleo de /api/calcular-tri (caminho síncrono e jobs).
+    
+    Args:
+        data: corpo da requisição
+        turma: preparar_turma(data), se já calculado
+    
+    Raises:
+        KeyError, ValueError: entrada inválida
+    """
+    turma = turma or preparar_turma(data)
+    resposta = resposta_em_cache(data, turma)
+    if resposta is not None:
+        return resposta
+    alunos, gabarito, areas_config = turma['alunos'], turma['gabarito'], turma['areas_config']
+    matriz, opcoes = turma['matriz'], turma['opcoes']
+    
+    print(f"\n{'='*100}")
+    print(f"[TRI SERVICE] Processando {len(alunos)} alunos...")
+    print(f"[TRI SERVICE] Gabarito: {len(gabarito)} questões")
+    print(f"[TRI SERVICE] Áreas: {list(areas_config.keys())}")
+    print(f"[TRI SERVICE] Primeiro aluno tem chaves: {list(alunos[0].keys())[:10]}..." if alunos else "")
+    print(f"{'='*100}")
+    
+    # Processar com TRI V2
+    prova_analysis, resultados = processador.processar_turma(
+        alunos=alunos,
+        gabarito=gabarito,
+        areas_config=areas_config,
+        modo=data.get('modo', 'tabela'),
+        parametros_itens=data.get('parametros_itens'),
+        estimador=data.get('estimador', 'eap')
+    )
+    
+    print(f"\n✅ [TRI SERVICE] Processamento concluído!")
+    print(f"   Total de resultados: {len(resultados)}")
+    
+    # Guardar matriz de respostas para recorreções (anulação / troca de gabarito)
+    matriz_salva = salvar_matriz(data, matriz, areas_config, opcoes)
+    
+    # Converter resultados
+    resultados_converted = convert_numpy(resultados)
+    prova_analysis_converted = convert_numpy(prova_analysis)
+    
+    resposta = {
+        'status': 'sucesso',
+        'total_alunos': len(alunos),
+        'matriz_id': matriz_salva,
+        'cache_id': turma['matriz_id'],
+        'prova_analysis': prova_analysis_converted,
+        'resultados': resultados_converted
+    }
+    if cache_resultados is not None and cache_resultados.ativo:
+        # Sem matriz_id: cada chamada decide se guarda a matriz
+        cache_resultados.guardar(turma['chave'], dict(resposta, matriz_id=None))
+    return resposta
+
+
+@app.route('/api/calcular-tri-lote', methods=['POST'])
+def calcular_tri_lote():
+    """
+    Várias turmas da mesma prova numa única chamada.
+    
+    Entrada JSON:
+    {
+      "gabarito": {...},                 (mesmo formato de /api/calcular-tri)
+      "areas_config": {...},
+      "dificuldade": "compartilhada",    ("compartilhada" ou "por_grupo")
+      "grupos": [
+        {"grupo": "3A", "alunos": [...]},
+        {"grupo": "3B", "alunos": [...]}
+      ],
+      "armazenar_matriz": true           (opcional, como em /api/calcular-tri)
+    }
+    
+    "compartilhada": dificuldade das questões calculada sobre todos os alunos
+    (as notas são as de uma única turma com todos os grupos); "por_grupo":
+    cada grupo é corrigido como uma turma isolada. Em ambos os modos as
+    respostas são convertidas numa única matriz alunos × questões.
+    
+    Saída JSON: prova_analysis geral (só em "compartilhada") e, por grupo,
+    prova_analysis e resultados no formato de /api/calcular-tri.
+    """
+    
+    if vetorizado is None:
+        return jsonify({
+            'status': 'erro',
+            'mensagem': 'Tabela de referência não carregada'
+        }), 500
+    
+    try:
+        data = request.get_json()
         
-        print(f"\n✅ [TRI SERVICE] Processamento concluído!")
-        print(f"   Total de resultados: {len(resultados)}")
-        
-        # Converter tipos numpy para tipos Python nativos (para JSON)
-        def convert_numpy(obj):
-            """Converte recursivamente tipos numpy para Python nativos"""
-            if isinstance(obj, (np.integer, np.int64, np.int32)):
-                return int(obj)
-            elif isinstance(obj, (np.floating, np.float64, np.float32)):
-                return float(obj)
-            elif isinstance(obj, np.ndarray):
-                return obj.tolist()
-            elif isinstance(obj, dict):
-                return {key: convert_numpy(value) for key, value in obj.items()}
-            elif isinstance(obj, list):
-                return [convert_numpy(item) for item in obj]
-            return obj
-        
-        # Converter resultados
-        resultados_converted = convert_numpy(resultados)
-        prova_analysis_converted = convert_numpy(prova_analysis)
+        if not data or 'gabarito' not in data or not data.get('grupos'):
+            return jsonify({
+                'status': 'erro',
+                'mensagem': 'Dados inválidos. Necessário: gabarito, grupos'
+            }), 400
+        
+        dificuldade = data.get('dificuldade', 'compartilhada')
+        if dificuldade not in ('compartilhada', 'por_grupo'):
+            raise ValueError(f"dificuldade inválida: {dificuldade}. Use 'compartilhada' ou 'por_grupo'")
+        
+        gabarito = converter_gabarito(data['gabarito'])
+        areas_config = {k: tuple(v) for k, v in data.get('areas_config', AREAS_CONFIG_PADRAO).items()}
+        
+        # Alunos de todos os grupos em sequência; limites marcam onde cada grupo termina
+        nomes_grupos, alunos, limites = [], [], [0]
+        for i, grupo in enumerate(data['grupos']):
+            nome_grupo = str(grupo.get('grupo', i + 1))
+            for aluno in grupo['alunos']:
+                aluno = converter_aluno(aluno)
+                if not aluno.get('turma'):
+                    aluno['turma'] = nome_grupo
+                alunos.append(aluno)
+            nomes_grupos.append(nome_grupo)
+            limites.append(len(alunos))
+        
+        print(f"[TRI SERVICE] Lote: {len(nomes_grupos)} grupos, {len(alunos)} alunos "
+              f"(dificuldade {dificuldade})")
+        
+        matriz = MatrizRespostas.de_alunos(alunos, gabarito)
+        compartilhada = dificuldade == 'compartilhada'
+        prova_analysis, por_grupo = vetorizado.processar_lote(matriz, limites, areas_config, compartilhada)
+        
+        # Matrizes para recorreção: a combinada (compartilhada) ou uma por grupo
+        ids_grupos = [None] * len(nomes_grupos)
+        matriz_id = None
+        if armazenar_matriz(data):
+            try:
+                if compartilhada:
+                    matriz_id = repositorio_matrizes.salvar(matriz, areas_config)
+                else:
+                    ids_grupos = [
+                        repositorio_matrizes.salvar(matriz.fatia(inicio, fim), areas_config)
+                        for inicio, fim in zip(limites[:-1], limites[1:])
+                    ]
+            except Exception as e:
+                print(f"⚠️  [TRI SERVICE] Matriz não armazenada: {e}")
+        
+        grupos = []
+        for nome_grupo, id_grupo, (analise, resultados) in zip(nomes_grupos, ids_grupos, por_grupo):
+            item = {
+                'grupo': nome_grupo,
+                'total_alunos': len(resultados),
+                'prova_analysis': convert_numpy(analise),
+                'resultados': convert_numpy(resultados)
+            }
+            if not compartilhada:
+                item['matriz_id'] = id_grupo
+            grupos.append(item)
         
         return jsonify({
             'status': 'sucesso',
+            'dificuldade': dificuldade,
             'total_alunos': len(alunos),
-            'prova_analysis': prova_analysis_converted,
-            'resultados': resultados_converted
+            'matriz_id': matriz_id,
+            'prova_analysis': convert_numpy(prova_analysis),
+            'grupos': grupos
         }), 200
         
+    except (KeyError, ValueError) as e:
+        return jsonify({
+            'status': 'erro',
+            'mensagem': e.args[0] if e.args else str(e)
+        }), 400
+        
+    except Exception as e:
+        import traceback
+        error_trace = traceback.format_exc()
+        print(f"❌ [TRI SERVICE] ERRO: {error_trace}")
+        
+        return jsonify({
+            'status': 'erro',
+            'mensagem': str(e),
+            'trace': error_trace
+        }), 500
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def consultar_job(job_id):
+    """
+    Estado de um job de /api/calcular-tri.
+    
+    Saída: {"job_id", "status": "pendente" | "processando" | "concluido" | "erro", ...}
+    Com "concluido", "resultado" tem o mesmo corpo da resposta síncrona.
+    """
+    
+    if gerenciador_jobs is None:
+        return jsonify({
+            'status': 'erro',
+            'mensagem': 'Jobs indisponíveis'
+        }), 500
+    
+    try:
+        return jsonify(gerenciador_jobs.consultar(job_id)), 200
     except KeyError as e:
         return jsonify({
             'status': 'erro',
-            'mensagem': f'Campo obrigatório ausente: {str(e)}'
+            'mensagem': e.args[0] if e.args else str(e)
+        }), 404
+
+
+@app.route('/api/cache/invalidar', methods=['POST'])
+def invalidar_cache():
+    """
+    Invalida respostas em cache de /api/calcular-tri.
+    
+    Entrada JSON, uma das formas:
+      {"cache_id": "3f2a..."}             (retornado por /api/calcular-tri;
+                                           "matriz_id" também é aceito)
+      {"alunos": [...], "gabarito": {...}, "areas_config": {...}, "modo": ...}
+                                          (mesma entrada do cálculo: a chave é derivada)
+      {"tudo": true}
+    """
+    
+    if cache_resultados is None:
+        return jsonify({
+            'status': 'erro',
+            'mensagem': 'Cache indisponível'
+        }), 500
+    
+    data = request.get_json(silent=True) or {}
+    calculo = 'alunos' in data and 'gabarito' in data
+    if not (data.get('cache_id') or data.get('matriz_id') or calculo or data.get('tudo')):
+        return jsonify({
+            'status': 'erro',
+            'mensagem': 'Dados inválidos. Necessário: cache_id, alunos + gabarito ou tudo'
+        }), 400
+    
+    try:
+        cache_id = None
+        if not data.get('tudo') and not (data.get('cache_id') or data.get('matriz_id')):
+            if not data.get('parametros_itens') and data.get('calibracao_id') and repositorio_calibracoes:
+                data['parametros_itens'] = repositorio_calibracoes.carregar(data['calibracao_id'])['parametros']
+            cache_id = preparar_turma(data)['matriz_id']
+        elif not data.get('tudo'):
+            cache_id = data.get('cache_id') or data['matriz_id']
+        removidas = cache_resultados.invalidar(cache_id)
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({
+            'status': 'erro',
+            'mensagem': e.args[0] if e.args else str(e)
+        }), 400
+    
+    print(f"[TRI SERVICE] Cache invalidado ({cache_id or 'tudo'}): {removidas} entradas")
+    return jsonify({
+        'status': 'sucesso',
+        'cache_id': cache_id,
+        'removidas': removidas,
+        'cache': cache_resultados.estatisticas()
+    }), 200
+
+
+@app.route('/api/recorrigir', methods=['POST'])
+def recorrigir():
+    """
+    Recorrige uma turma já calculada após anulação ou troca de gabarito.
+    
+    Entrada JSON:
+    {
+      "matriz_id": "3f2a...",           (retornado por /api/calcular-tri)
+      "alteracoes": [
+        {"questao": 12, "anular": true},
+        {"questao": 30, "gabarito": "C"}
+      ]
+    }
+    
+    Saída JSON: apenas os alunos cuja nota mudou, no mesmo formato de
+    /api/calcular-tri, com "indice", "id" e notas "anterior".
+    O novo "matriz_id" permite encadear outras alterações.
+    """
+    
+    if vetorizado is None or repositorio_matrizes is None:
+        return jsonify({
+            'status': 'erro',
+            'mensagem': 'Recorreção indisponível (tabela ou repositório não carregados)'
+        }), 500
+    
+    try:
+        data = request.get_json()
+        
+        if not data or 'matriz_id' not in data or not data.get('alteracoes'):
+            return jsonify({
+                'status': 'erro',
+                'mensagem': 'Dados inválidos. Necessário: matriz_id, alteracoes'
+            }), 400
+        
+        try:
+            matriz, areas_config, opcoes = repositorio_matrizes.carregar_com_opcoes(data['matriz_id'])
+        except KeyError:
+            return jsonify({
+                'status': 'erro',
+                'mensagem': f"Matriz não encontrada: {data['matriz_id']}. Recalcule via /api/calcular-tri com armazenar_matriz"
+            }), 404
+        if opcoes.get('modo', 'tabela') != 'tabela':
+            # A matriz existe, mas foi calculada por outro motor: conflito de estado, não entrada inválida
+            return jsonify({
+                'status': 'erro',
+                'mensagem': f"Recorreção só no modo 'tabela' (matriz calculada no modo {opcoes['modo']!r})"
+            }), 409
+        
+        nova_matriz, prova_analysis, alterados = vetorizado.recorrigir(
+            matriz, areas_config, data['alteracoes']
+        )
+        novo_id = repositorio_matrizes.salvar(nova_matriz, areas_config)
+        
+        print(f"[TRI SERVICE] Recorreção {data['matriz_id'][:12]} → {novo_id[:12]}: "
+              f"{len(data['alteracoes'])} alterações, {len(alterados)}/{matriz.n_alunos} alunos mudaram")
+        
+        return jsonify({
+            'status': 'sucesso',
+            'matriz_id': novo_id,
+            'total_alunos': matriz.n_alunos,
+            'total_alterados': len(alterados),
+            'gabarito': nova_matriz.gabarito_dict(),
+            'prova_analysis': convert_numpy(prova_analysis),
+            'resultados': convert_numpy(alterados)
+        }), 200
+        
+    except (KeyError, ValueError) as e:
+        return jsonify({
+            'status': 'erro',
+            'mensagem': e.args[0] if e.args else str(e)
+        }), 400
+        
+    except Exception as e:
+        import traceback
+        error_trace = traceback.format_exc()
+        print(f"❌ [TRI SERVICE] ERRO: {error_trace}")
+        
+        return jsonify({
+            'status': 'erro',
+            'mensagem': str(e),
+            'trace': error_trace
+        }), 500
+
+
+@app.route('/api/item-analysis', methods=['POST'])
+def item_analysis():
+    """
+    Análise clássica de itens da turma.
+    
+    Entrada JSON: {"matriz_id": "3f2a..."} ou o mesmo corpo de
+    /api/calcular-tri ({"alunos", "gabarito", "areas_config"}).
+    
+    Saída JSON: por questão p_valor, ponto_bisserial, discriminação 27%
+    (p_superior - p_inferior) e distribuição A-E/branco/dupla; por área KR-20.
+    """
+    
+    try:
+        data = request.get_json()
+        
+        if data and data.get('matriz_id'):
+            if repositorio_matrizes is None:
+                return jsonify({
+                    'status': 'erro',
+                    'mensagem': 'Repositório de matrizes indisponível'
+                }), 500
+            try:
+                matriz, areas_config = repositorio_matrizes.carregar(data['matriz_id'])
+            except KeyError:
+                return jsonify({
+                    'status': 'erro',
+                    'mensagem': f"Matriz não encontrada: {data['matriz_id']}. Recalcule via /api/calcular-tri com armazenar_matriz"
+                }), 404
+        elif data and 'alunos' in data and 'gabarito' in data:
+            gabarito = converter_gabarito(data['gabarito'])
+            alunos = [converter_aluno(aluno) for aluno in data['alunos']]
+            areas_config = {k: tuple(v) for k, v in data.get('areas_config', AREAS_CONFIG_PADRAO).items()}
+            matriz = MatrizRespostas.de_alunos(alunos, gabarito)
+        else:
+            return jsonify({
+                'status': 'erro',
+                'mensagem': 'Dados inválidos. Necessário: matriz_id ou alunos + gabarito'
+            }), 400
+        
+        analise = analisar_itens(matriz, areas_config)
+        
+        return jsonify(dict(status='sucesso', **analise)), 200
+        
+    except (KeyError, ValueError) as e:
+        return jsonify({
+            'status': 'erro',
+            'mensagem': e.args[0] if e.args else str(e)
         }), 400
         
     except Exception as e:
@@ -244,6 +779,476 @@ def calcular_tri():
         }), 500
 
 
+def _obter_ranking(matriz_id: str) -> IndiceRanking:
+    """Índice de ranking da matriz (KeyError se a matriz não existir ou tiver expirado)."""
+    if not repositorio_matrizes.existe(matriz_id):
+        repositorio_rankings.descartar(matriz_id)
+        raise KeyError(f'Matriz não encontrada: {matriz_id}')
+    
+    def construir():
+        matriz, areas_config, opcoes = repositorio_matrizes.carregar_com_opcoes(matriz_id)
+        return IndiceRanking.de_matriz(vetorizado, matriz, areas_config, opcoes)
+    return repositorio_rankings.obter(matriz_id, construir)
+
+
+def _ranking_indisponivel():
+    if vetorizado is None or repositorio_matrizes is None or repositorio_rankings is None:
+        return jsonify({
+            'status': 'erro',
+            'mensagem': 'Ranking indisponível (tabela ou repositórios não carregados)'
+        }), 500
+    return None
+
+
+def _matriz_nao_encontrada(matriz_id):
+    return jsonify({
+        'status': 'erro',
+        'mensagem': f"Matriz não encontrada: {matriz_id}. Recalcule via /api/calcular-tri com armazenar_matriz"
+    }), 404
+
+
+@app.route('/api/ranking', methods=['POST'])
+def ranking():
+    """
+    Posição e percentil de cada aluno por turma, escola e rede.
+    
+    Entrada JSON:
+    {
+      "matriz_id": "3f2a...",     (retornado por /api/calcular-tri)
+      "turma": "3A",              (opcional: só alunos desta turma)
+      "escola": "E01"             (opcional: só alunos desta escola)
+    }
+    
+    Áreas: "geral" (tri_geral) e as áreas de areas_config. Turma e escola
+    vêm dos campos "turma" / "escola" dos alunos em /api/calcular-tri.
+    """
+    
+    erro = _ranking_indisponivel()
+    if erro:
+        return erro
+    
+    try:
+        data = request.get_json()
+        
+        if not data or 'matriz_id' not in data:
+            return jsonify({
+                'status': 'erro',
+                'mensagem': 'Dados inválidos. Necessário: matriz_id'
+            }), 400
+        
+        try:
+            indice = _obter_ranking(data['matriz_id'])
+        except KeyError:
+            return _matriz_nao_encontrada(data['matriz_id'])
+        
+        selecionados = np.ones(indice.n_alunos, dtype=bool)
+        if data.get('turma') is not None:
+            selecionados &= np.array(indice.turmas, dtype=object) == str(data['turma'])
+        if data.get('escola') is not None:
+            selecionados &= np.array(indice.escolas, dtype=object) == str(data['escola'])
+        
+        return jsonify({
+            'status': 'sucesso',
+            'total_alunos': indice.n_alunos,
+            'areas': indice.areas,
+            'grupos': indice.grupos(),
+            'alunos': indice.classificar(np.flatnonzero(selecionados))
+        }), 200
+        
+    except Exception as e:
+        import traceback
+        error_trace = traceback.format_exc()
+        print(f"❌ [TRI SERVICE] ERRO: {error_trace}")
+        
+        return jsonify({
+            'status': 'erro',
+            'mensagem': str(e),
+            'trace': error_trace
+        }), 500
+
+
+@app.route('/api/ranking/consultar', methods=['POST'])
+def ranking_consultar():
+    """
+    Posição/percentil que uma nota teria num grupo.
+    
+    Entrada JSON:
+    {"matriz_id": "3f2a...", "area": "MT", "nota": 640.5, "nivel": "escola", "grupo": "E01"}
+    """
+    
+    erro = _ranking_indisponivel()
+    if erro:
+        return erro
+    
+    try:
+        data = request.get_json()
+        
+        if not data or 'matriz_id' not in data or 'nota' not in data:
+            return jsonify({
+                'status': 'erro',
+                'mensagem': 'Dados inválidos. Necessário: matriz_id, nota'
+            }), 400
+        
+        try:
+            indice = _obter_ranking(data['matriz_id'])
+        except KeyError:
+            return _matriz_nao_encontrada(data['matriz_id'])
+        
+        consulta = indice.consultar(
+            area=data.get('area', 'geral'),
+            nota=float(data['nota']),
+            nivel=data.get('nivel', 'rede'),
+            grupo=data.get('grupo', '')
+        )
+        return jsonify(dict(status='sucesso', **consulta)), 200
+        
+    except (TypeError, ValueError) as e:
+        return jsonify({
+            'status': 'erro',
+            'mensagem': str(e)
+        }), 400
+        
+    except Exception as e:
+        import traceback
+        error_trace = traceback.format_exc()
+        print(f"❌ [TRI SERVICE] ERRO: {error_trace}")
+        
+        return jsonify({
+            'status': 'erro',
+            'mensagem': str(e),
+            'trace': error_trace
+        }), 500
+
+
+@app.route('/api/ranking/inserir', methods=['POST'])
+def ranking_inserir():
+    """
+    Inclui no ranking alunos corrigidos depois (sem reordenar a coorte).
+    
+    Entrada JSON:
+    {
+      "matriz_id": "3f2a...",
+      "alunos": [
+        {"id": "123", "nome": "...", "turma": "3A", "escola": "E01",
+         "tri_geral": 612.4, "tri_lc": 590.1, ...}      (formato de /api/calcular-tri)
+      ]
+    }
+    
+    Saída: posição e percentil dos alunos inseridos.
+    """
+    
+    erro = _ranking_indisponivel()
+    if erro:
+        return erro
+    
+    try:
+        data = request.get_json()
+        
+        if not data or 'matriz_id' not in data or not data.get('alunos'):
+            return jsonify({
+                'status': 'erro',
+                'mensagem': 'Dados inválidos. Necessário: matriz_id, alunos'
+            }), 400
+        
+        try:
+            indice = _obter_ranking(data['matriz_id'])
+        except KeyError:
+            return _matriz_nao_encontrada(data['matriz_id'])
+        
+        alunos = [
+            {
+                'id': aluno.get('id', ''),
+                'nome': aluno.get('nome', ''),
+                'turma': aluno.get('turma', ''),
+                'escola': aluno.get('escola', ''),
+                'notas': aluno.get('notas') or notas_de_resultado(aluno),
+            }
+            for aluno in data['alunos']
+        ]
+        indice.validar(alunos)
+        
+        # Registro compartilhado: os outros workers aplicam na próxima consulta.
+        # As linhas vêm do registro (sob lock), não do fim do índice: outra
+        # inserção concorrente pode ter entrado depois desta
+        anteriores = repositorio_rankings.registrar_insercao(data['matriz_id'], alunos)
+        indice = _obter_ranking(data['matriz_id'])
+        inseridos = indice.n_coorte + anteriores + np.arange(len(alunos))
+        
+        return jsonify({
+            'status': 'sucesso',
+            'total_alunos': indice.n_alunos,
+            'alunos': indice.classificar(inseridos)
+        }), 200
+        
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({
+            'status': 'erro',
+            'mensagem': e.args[0] if e.args else str(e)
+        }), 400
+        
+    except Exception as e:
+        import traceback
+        error_trace = traceback.format_exc()
+        print(f"❌ [TRI SERVICE] ERRO: {error_trace}")
+        
+        return jsonify({
+            'status': 'erro',
+            'mensagem': str(e),
+            'trace': error_trace
+        }), 500
+
+
+@app.route('/api/exportar/<matriz_id>', methods=['GET'])
+def exportar(matriz_id):
+    """
+    Exporta uma turma já calculada em formato colunar.
+    
+    Query string:
+      tabela=alunos   respostas, acertos e TRI por área, tri_geral, tct (padrão)
+      tabela=itens    estatísticas por questão (como /api/item-analysis)
+      formato=parquet (padrão) ou arrow (Arrow IPC, para leitura por memory map)
+    
+    Saída: o arquivo (application/octet-stream). Gerado uma vez por matriz_id
+    e servido enquanto a matriz existir (mesma retenção de TRI_MATRIZ_TTL).
+    """
+    
+    if vetorizado is None or repositorio_matrizes is None or repositorio_exportacoes is None:
+        return jsonify({
+            'status': 'erro',
+            'mensagem': 'Exportação indisponível (tabela ou repositórios não carregados)'
+        }), 500
+    
+    try:
+        tabela = request.args.get('tabela', 'alunos')
+        formato = request.args.get('formato', 'parquet')
+        caminho = repositorio_exportacoes.caminho(matriz_id, tabela, formato)
+        
+        # Matriz expirada ou apagada: a exportação (nomes, ids) também não é servida
+        try:
+            matriz, areas_config, opcoes = repositorio_matrizes.carregar_com_opcoes(matriz_id)
+        except KeyError:
+            return _matriz_nao_encontrada(matriz_id)
+        
+        if not os.path.exists(caminho):
+            caminho = repositorio_exportacoes.exportar(vetorizado, matriz_id, matriz, areas_config, tabela, formato,
+                                                       opcoes)
+            print(f"[TRI SERVICE] Exportação {matriz_id[:12]}: {tabela} ({formato}, "
+                  f"{os.path.getsize(caminho) / 1024:.0f} KB)")
+        
+        return send_file(
+            caminho,
+            mimetype='application/octet-stream',
+            as_attachment=True,
+            download_name=os.path.basename(caminho)
+        )
+        
+    except ExportacaoIndisponivel as e:
+        return jsonify({
+            'status': 'erro',
+            'mensagem': str(e)
+        }), 501
+        
+    except (KeyError, ValueError) as e:
+        return jsonify({
+            'status': 'erro',
+            'mensagem': e.args[0] if e.args else str(e)
+        }), 400
+        
+    except Exception as e:
+        import traceback
+        error_trace = traceback.format_exc()
+        print(f"❌ [TRI SERVICE] ERRO: {error_trace}")
+        
+        return jsonify({
+            'status': 'erro',
+            'mensagem': str(e),
+            'trace': error_trace
+        }), 500
+
+
+@app.route('/api/calibrar', methods=['POST'])
+def calibrar():
+    """
+    Calibra parâmetros 2PL/3PL das questões de uma turma já calculada (MML/EM).
+    
+    Entrada JSON:
+    {
+      "matriz_id": "3f2a...",       (retornado por /api/calcular-tri)
+      "modelo": "3pl",              (opcional: "2pl" ou "3pl")
+      "prova_id": "simulado-03",    (opcional: parte da última calibração da prova)
+      "recalibrar": false           (opcional: ignora o cache)
+    }
+    
+    Saída JSON: calibracao_id (usar em /api/calcular-tri com "modo": "irt"),
+    parametros por questão, iterações EM e convergência por área.
+    """
+    
+    if repositorio_matrizes is None or repositorio_calibracoes is None:
+        return jsonify({
+            'status': 'erro',
+            'mensagem': 'Calibração indisponível (repositórios não carregados)'
+        }), 500
+    
+    try:
+        data = request.get_json()
+        
+        if not data or 'matriz_id' not in data:
+            return jsonify({
+                'status': 'erro',
+                'mensagem': 'Dados inválidos. Necessário: matriz_id'
+            }), 400
+        
+        modelo = data.get('modelo', '3pl')
+        if modelo not in MODELOS:
+            raise ValueError(f'Modelo inválido: {modelo}. Use: {MODELOS}')
+        prova_id = data.get('prova_id')
+        
+        try:
+            matriz, areas_config = repositorio_matrizes.carregar(data['matriz_id'])
+        except KeyError:
+            return jsonify({
+                'status': 'erro',
+                'mensagem': f"Matriz não encontrada: {data['matriz_id']}. Recalcule via /api/calcular-tri com armazenar_matriz"
+            }), 404
+        
+        # Cache: mesma matriz + mesmo modelo → mesmos parâmetros
+        calibracao_id = RepositorioCalibracoes.gerar_id(data['matriz_id'], modelo)
+        if not data.get('recalibrar'):
+            try:
+                registro = repositorio_calibracoes.carregar(calibracao_id)
+                return jsonify(dict(registro, status='sucesso', cache=True)), 200
+            except KeyError:
+                pass
+        
+        # Partida a quente: última calibração da mesma prova (mesmo modelo)
+        inicial = None
+        if prova_id:
+            anterior = repositorio_calibracoes.ultima_da_prova(prova_id)
+            if anterior and anterior.get('modelo') == modelo:
+                inicial = ParametrosItens.de_dict(anterior['parametros'])
+        
+        resultado = CalibradorMML(modelo).calibrar(matriz, areas_config, inicial=inicial)
+        calibracao_id = repositorio_calibracoes.salvar(data['matriz_id'], resultado, prova_id)
+        registro = repositorio_calibracoes.carregar(calibracao_id)
+        
+        print(f"[TRI SERVICE] Calibração {modelo.upper()} {data['matriz_id'][:12]}: "
+              f"{matriz.n_alunos} alunos, {len(resultado.parametros.questoes)} questões em {resultado.tempo:.2f}s"
+              f"{' (partida a quente)' if inicial is not None else ''}")
+        
+        return jsonify(dict(registro, status='sucesso', cache=False,
+                            partida_quente=inicial is not None)), 200
+        
+    except (KeyError, ValueError) as e:
+        return jsonify({
+            'status': 'erro',
+            'mensagem': e.args[0] if e.args else str(e)
+        }), 400
+        
+    except Exception as e:
+        import traceback
+        error_trace = traceback.format_exc()
+        print(f"❌ [TRI SERVICE] ERRO: {error_trace}")
+        
+        return jsonify({
+            'status': 'erro',
+            'mensagem': str(e),
+            'trace': error_trace
+        }), 500
+
+
+@app.route('/api/calcular-tri-stream', methods=['POST'])
+def calcular_tri_stream():
+    """
+    Calcula TRI V2 para coortes grandes a partir de um arquivo, em streaming.
+    
+    Entrada multipart/form-data:
+      arquivo        CSV (nome;id;turma;q1;q2;...) ou NDJSON (um aluno por linha)
+      gabarito       JSON: {"1": "A", ...} ou ["A", "B", ...]
+      areas_config   JSON (opcional, padrão LC/CH/CN/MT do ENEM)
+      formato_saida  ndjson (padrão) ou csv
+      tamanho_bloco  alunos por bloco (opcional)
+    
+    Saída: um resultado por linha, na ordem do arquivo. Em NDJSON a última
+    linha é {"prova_analysis": {...}}. A dificuldade das questões usa a
+    coorte inteira (idêntico a /api/calcular-tri).
+    """
+    
+    if processador is None:
+        return jsonify({
+            'status': 'erro',
+            'mensagem': 'Processador TRI não inicializado'
+        }), 500
+    
+    arquivo = request.files.get('arquivo')
+    if arquivo is None or 'gabarito' not in request.form:
+        return jsonify({
+            'status': 'erro',
+            'mensagem': 'Dados inválidos. Necessário: arquivo, gabarito'
+        }), 400
+    
+    caminho = None
+    try:
+        gabarito = json.loads(request.form['gabarito'])
+        areas_config = json.loads(request.form['areas_config']) if request.form.get('areas_config') else None
+        formato_entrada = request.form.get('formato_entrada') or detectar_formato(arquivo.filename)
+        formato_saida = request.form.get('formato_saida', 'ndjson')
+        if formato_saida not in FORMATOS_SAIDA:
+            raise ValueError(f'formato_saida inválido: {formato_saida}. Use: {FORMATOS_SAIDA}')
+        
+        stream = ProcessadorStreaming(
+            tabela_referencia, gabarito, areas_config,
+            tamanho_bloco=int(request.form.get('tamanho_bloco', TAMANHO_BLOCO_PADRAO))
+        )
+        
+        # Cópia própria em disco: o upload do werkzeug é fechado quando a view
+        # retorna, mas o PASSO 2 roda durante o streaming da resposta
+        fd, caminho = tempfile.mkstemp(prefix='tri_stream_', suffix=os.path.splitext(arquivo.filename or '')[1])
+        with os.fdopen(fd, 'wb') as destino:
+            arquivo.save(destino)
+        
+        def abrir_entrada():
+            return open(caminho, 'r', encoding='utf-8-sig', newline='')
+        
+        # PASSO 1 antes de responder: erros de formato ainda viram 400
+        with abrir_entrada() as entrada:
+            stream.acumular(ler_blocos(entrada, formato_entrada, stream.tamanho_bloco))
+        
+    except (KeyError, ValueError, UnicodeDecodeError) as e:
+        if caminho:
+            os.remove(caminho)
+        return jsonify({
+            'status': 'erro',
+            'mensagem': e.args[0] if e.args else str(e)
+        }), 400
+        
+    except Exception as e:
+        import traceback
+        error_trace = traceback.format_exc()
+        print(f"❌ [TRI SERVICE] ERRO: {error_trace}")
+        if caminho:
+            os.remove(caminho)
+        
+        return jsonify({
+            'status': 'erro',
+            'mensagem': str(e),
+            'trace': error_trace
+        }), 500
+    
+    print(f"[TRI SERVICE] Streaming: {stream.total} alunos, blocos de {stream.tamanho_bloco}")
+    
+    def gerar():
+        try:
+            with abrir_entrada() as entrada:
+                resultados = stream.pontuar(ler_blocos(entrada, formato_entrada, stream.tamanho_bloco))
+                yield from formatar_saida(resultados, formato_saida, resumo=lambda: convert_numpy(stream.resumo))
+        finally:
+            os.remove(caminho)
+    
+    mimetype = 'application/x-ndjson' if formato_saida == 'ndjson' else 'text/csv'
+    
+    return Response(gerar(), mimetype=mimetype)
+
+
 @app.route('/api/debug', methods=['GET'])
 def debug():
     """Endpoint de debug para verificar configuração"""
@@ -255,6 +1260,8 @@ def debug():
         'tabela_linhas': len(processador.tabela.df) if processador else 0,
         'python_version': sys.version,
         'flask_version': '3.0.0',
+        'cache': cache_resultados.estatisticas() if cache_resultados else None,
+        'exportacao_colunar': PYARROW_DISPONIVEL,
     }), 200
 
 
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Testes da análise clássica de itens (tri_analise_itens, /api/item-analysis)
+
+Cada estatística vetorizada é conferida contra um cálculo direto, questão a
+questão; a dificuldade, contra a distribuição de processar_turma.
+
+Rodar: python -m pytest python_tri_service/test_tri_analise_itens.py
+"""
+
+from collections import Counter
+
+import numpy as np
+import pytest
+
+import app as tri_app
+from tri_analise_itens import analisar_itens, kr20
+from tri_benchmark import Coorte
+from tri_matriz import MatrizRespostas, RepositorioMatrizes
+
+
+@pytest.fixture(scope='module')
+def coorte():
+    return Coorte(300, 90, semente=30)
+
+
+@pytest.fixture(scope='module')
+def analise(coorte):
+    return analisar_itens(MatrizRespostas.de_alunos(coorte.alunos(), coorte.gabarito), coorte.areas_config)
+
+
+def _acertos(coorte):
+    return np.array([[aluno.get(f'q{q}') == coorte.gabarito[str(q)] for q in range(1, coorte.n_questoes + 1)]
+                     for aluno in coorte.alunos()], dtype=np.float64)
+
+
+def test_p_valor_bisserial_e_distribuicao_como_calculo_direto(coorte, analise):
+    acertos = _acertos(coorte)
+    total = acertos.sum(axis=1)
+
+    for j, item in enumerate(analise['itens']):
+        respostas = Counter(aluno.get(f'q{j + 1}') for aluno in coorte.alunos())
+        assert item['questao'] == j + 1
+        assert item['p_valor'] == pytest.approx(acertos[:, j].mean(), abs=1e-4)
+        assert item['ponto_bisserial'] == pytest.approx(np.corrcoef(acertos[:, j], total)[0, 1], abs=1e-4)
+        assert item['distribuicao'] == {**{letra: respostas[letra] for letra in 'ABCDE'},
+                                        'branco': respostas[''], 'dupla': respostas['X']}
+
+
+def test_discriminacao_27_por_cento(coorte, analise):
+    acertos = _acertos(coorte)
+    ordem = np.argsort(acertos.sum(axis=1), kind='stable')
+    grupo = round(0.27 * coorte.n_alunos)
+
+    assert analise['tamanho_grupos_27'] == grupo
+    for j, item in enumerate(analise['itens']):
+        superior, inferior = acertos[ordem[-grupo:], j].mean(), acertos[ordem[:grupo], j].mean()
+        assert item['discriminacao'] == pytest.approx(superior - inferior, abs=1e-4)
+
+
+def test_dificuldade_igual_a_de_processar_turma(coorte, analise):
+    prova_analysis, _ = tri_app.processador.processar_turma(coorte.alunos(), coorte.gabarito, coorte.areas_config)
+
+    contagem = Counter(item['dificuldade'] for item in analise['itens'])
+
+    assert {dif: contagem[dif] for dif in prova_analysis['questoes_stats']} == prova_analysis['questoes_stats']
+
+
+def test_kr20_como_formula_direta(coorte, analise):
+    acertos = _acertos(coorte)
+    for area, (inicio, fim) in coorte.areas_config.items():
+        sub = acertos[:, inicio - 1:fim]
+        k = sub.shape[1]
+        p = sub.mean(axis=0)
+        esperado = k / (k - 1) * (1 - np.sum(p * (1 - p)) / np.var(sub.sum(axis=1)))
+        assert analise['areas'][area]['kr20'] == pytest.approx(esperado, abs=1e-4)
+        assert analise['areas'][area]['n_itens'] == k
+    assert kr20(np.ones((10, 5))) == 0.0
+
+
+def test_questao_anulada_sai_da_analise(coorte):
+    matriz = MatrizRespostas.de_alunos(coorte.alunos(), coorte.gabarito)
+    anulada, _, _ = tri_app.vetorizado.recorrigir(matriz, coorte.areas_config, [{'questao': 7, 'anular': True}])
+
+    analise = analisar_itens(anulada, coorte.areas_config)
+
+    item = analise['itens'][6]
+    assert item['anulada'] and item['gabarito'] is None and item['p_valor'] == 0
+    assert item['areas'] == []
+    assert analise['areas']['LC']['n_itens'] == 44
+
+
+def test_turma_vazia():
+    analise = analisar_itens(MatrizRespostas.de_alunos([], {'1': 'A', '2': 'B'}), {'LC': (1, 2)})
+
+    assert analise['total_alunos'] == 0
+    assert [item['p_valor'] for item in analise['itens']] == [0, 0]
+
+
+def test_endpoint_por_matriz_id_ou_pelo_corpo(coorte, analise, tmp_path, monkeypatch):
+    monkeypatch.setattr(tri_app, 'repositorio_matrizes', RepositorioMatrizes(str(tmp_path), ttl=3600))
+    cliente = tri_app.app.test_client()
+    corpo = {'alunos': coorte.alunos(), 'gabarito': coorte.gabarito, 'areas_config': coorte.areas_config}
+    matriz_id = cliente.post('/api/calcular-tri', json=dict(
+        corpo, armazenar_matriz=True, execucao='sincrona')).get_json()['matriz_id']
+
+    pelo_corpo = cliente.post('/api/item-analysis', json=corpo)
+    por_id = cliente.post('/api/item-analysis', json={'matriz_id': matriz_id})
+
+    assert pelo_corpo.status_code == por_id.status_code == 200
+    # O JSON do cliente de teste chega com as chaves do gabarito em ordem de texto
+    def por_questao(itens):
+        return sorted(itens, key=lambda item: item['questao'])
+    assert por_questao(pelo_corpo.get_json()['itens']) == por_questao(por_id.get_json()['itens']) == analise['itens']
+    assert cliente.post('/api/item-analysis', json={'matriz_id': 'c' * 64}).status_code == 404
+    assert cliente.post('/api/item-analysis', json={'alunos': []}).status_code == 400
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Testes do cache de respostas (tri_cache, /api/cache/invalidar)
+
+Rodar: python -m pytest python_tri_service/test_tri_cache.py
+"""
+
+import random
+
+import pytest
+
+import app as tri_app
+from tri_cache import CacheResultados
+
+
+def _turma(n=10, seed=9):
+    rng = random.Random(seed)
+    gabarito = {str(q): rng.choice('ABCDE') for q in range(1, 91)}
+    alunos = [{
+        'nome': f'Aluno {i}', 'id': f'M{i:04d}',
+        'respostas': [gabarito[str(q)] if rng.random() < 0.5 else rng.choice('ABCDE') for q in range(1, 91)],
+    } for i in range(n)]
+    return alunos, gabarito
+
+
+@pytest.fixture
+def cliente(tmp_path, monkeypatch):
+    monkeypatch.setattr(tri_app, 'cache_resultados', CacheResultados(max_memoria=8, diretorio=str(tmp_path)))
+    return tri_app.app.test_client()
+
+
+def _calcular(cliente, alunos, gabarito):
+    resposta = cliente.post('/api/calcular-tri', json={'alunos': alunos, 'gabarito': gabarito, 'execucao': 'sincrona'})
+    assert resposta.status_code == 200
+    return resposta.get_json()
+
+
+def test_resposta_traz_cache_id_sem_armazenar_matriz(cliente):
+    alunos, gabarito = _turma()
+
+    primeira = _calcular(cliente, alunos, gabarito)
+    segunda = _calcular(cliente, alunos, gabarito)
+
+    assert primeira['matriz_id'] is None
+    assert primeira['cache_id'] == segunda['cache_id']
+    assert segunda['resultados'] == primeira['resultados']
+    assert tri_app.cache_resultados.acertos == 1
+
+
+@pytest.mark.parametrize('por_calculo', [False, True], ids=['cache_id', 'entrada'])
+def test_invalidar_pela_chave_retornada_ou_pela_entrada(cliente, por_calculo):
+    alunos, gabarito = _turma()
+    cache_id = _calcular(cliente, alunos, gabarito)['cache_id']
+    outra = _calcular(cliente, *_turma(seed=10))['cache_id']
+
+    corpo = {'alunos': alunos, 'gabarito': gabarito} if por_calculo else {'cache_id': cache_id}
+    resposta = cliente.post('/api/cache/invalidar', json=corpo)
+
+    assert resposta.status_code == 200
+    assert resposta.get_json()['cache_id'] == cache_id
+    assert resposta.get_json()['removidas'] == 1
+    # Só a turma invalidada é recalculada
+    _calcular(cliente, alunos, gabarito)
+    _calcular(cliente, *_turma(seed=10))
+    assert tri_app.cache_resultados.acertos == 1
+    assert outra != cache_id
+
+
+def test_invalidar_sem_chave_nem_entrada(cliente):
+    assert cliente.post('/api/cache/invalidar', json={}).status_code == 400
+    assert cliente.post('/api/cache/invalidar', json={'cache_id': 'nao-hex'}).status_code == 400
+
+
+def test_memoria_limitada_por_bytes_e_disco_compartilhado(tmp_path):
+    resposta = {'resultados': ['x' * 1000]}
+    cache = CacheResultados(max_memoria=100, diretorio=str(tmp_path), disco=True,
+                            max_bytes=3500, max_entrada_bytes=2000)
+
+    for k in range(5):
+        cache.guardar(f'{k:064x}_0', resposta)
+    cache.guardar(f'{9:064x}_0', {'resultados': ['x' * 3000]})
+
+    # Só as 3 mais recentes cabem; a grande demais vai só para o disco
+    assert cache.estatisticas()['entradas_memoria'] == 3
+    assert cache.estatisticas()['bytes_memoria'] <= 3500
+    outro_worker = CacheResultados(diretorio=str(tmp_path), disco=True)
+    assert outro_worker.obter(f'{0:064x}_0') == resposta
+    assert outro_worker.obter(f'{9:064x}_0') == {'resultados': ['x' * 3000]}
+    # Memória deste worker + arquivo em disco; o outro worker vê a marca
+    assert outro_worker.invalidar(f'{0:064x}') == 2
+    assert cache.obter(f'{0:064x}_0') is None
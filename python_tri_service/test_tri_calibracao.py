@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Testes da calibração de itens (tri_calibracao, /api/calibrar)
+
+Respostas simuladas com parâmetros conhecidos (métrica logística, D = 1):
+a calibração precisa recuperá-los.
+
+Rodar: python -m pytest python_tri_service/test_tri_calibracao.py
+"""
+
+import numpy as np
+import pytest
+
+import app as tri_app
+from tri_benchmark import Coorte
+from tri_calibracao import CalibradorMML, RepositorioCalibracoes, LIMITES_C
+from tri_irt import ParametrosItens, probabilidade
+from tri_matriz import RepositorioMatrizes
+
+
+def _simular(n_alunos, a, b, c, seed=29):
+    rng = np.random.default_rng(seed)
+    theta = rng.normal(size=n_alunos)
+    acertos = (rng.random((n_alunos, len(a))) < probabilidade(theta, a, b, c)).astype(np.float64)
+    return acertos, np.ones_like(acertos)
+
+
+def _itens(n=30, seed=29, c=0.0):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(0.8, 2.0, n), rng.uniform(-1.8, 1.8, n), np.full(n, c)
+
+
+def test_2pl_recupera_os_parametros():
+    a, b, c = _itens()
+    acertos, observadas = _simular(4000, a, b, c)
+
+    ajuste = CalibradorMML('2pl').calibrar_area(acertos, observadas)
+
+    assert ajuste['convergiu']
+    assert np.all(ajuste['c'] == 0.0)
+    assert np.abs(ajuste['b'] - b).mean() < 0.1
+    assert np.abs(ajuste['a'] - a).mean() < 0.15
+    assert np.corrcoef(ajuste['a'], a)[0, 1] > 0.9
+
+
+def test_3pl_recupera_dificuldade_e_mantem_c_nos_limites():
+    a, b, c = _itens(c=0.2)
+    acertos, observadas = _simular(4000, a, b, c, seed=30)
+
+    ajuste = CalibradorMML('3pl').calibrar_area(acertos, observadas)
+
+    assert np.corrcoef(ajuste['b'], b)[0, 1] > 0.95
+    assert np.all((ajuste['c'] >= LIMITES_C[0]) & (ajuste['c'] <= LIMITES_C[1]))
+    assert abs(ajuste['c'].mean() - 0.2) < 0.07
+
+
+def test_item_que_todos_acertam_fica_finito():
+    a, b, c = _itens(10)
+    acertos, observadas = _simular(500, a, b, c)
+    acertos[:, 0] = 1.0
+
+    ajuste = CalibradorMML('2pl').calibrar_area(acertos, observadas)
+
+    assert np.all(np.isfinite(ajuste['a'])) and np.all(np.isfinite(ajuste['b']))
+    assert ajuste['b'][0] == ajuste['b'].min()
+
+
+def test_partida_a_quente_converge_em_menos_iteracoes():
+    a, b, c = _itens()
+    acertos, observadas = _simular(3000, a, b, c)
+    frio = CalibradorMML('2pl').calibrar_area(acertos, observadas)
+
+    # Turma nova da mesma prova, partindo da calibração anterior
+    outra, observadas_outra = _simular(3000, a, b, c, seed=31)
+    quente = CalibradorMML('2pl').calibrar_area(outra, observadas_outra, (frio['a'], frio['b'], frio['c']))
+    do_zero = CalibradorMML('2pl').calibrar_area(outra, observadas_outra)
+
+    assert quente['iteracoes'] < do_zero['iteracoes']
+    np.testing.assert_allclose(quente['b'], do_zero['b'], atol=0.01)
+
+
+def test_modelo_invalido():
+    with pytest.raises(ValueError):
+        CalibradorMML('1pl')
+
+
+@pytest.fixture
+def cliente(tmp_path, monkeypatch):
+    monkeypatch.setattr(tri_app, 'repositorio_matrizes', RepositorioMatrizes(str(tmp_path / 'matrizes'), ttl=3600))
+    monkeypatch.setattr(tri_app, 'repositorio_calibracoes', RepositorioCalibracoes(str(tmp_path / 'calibracoes')))
+    return tri_app.app.test_client()
+
+
+def _calcular(cliente, coorte, **opcoes):
+    resposta = cliente.post('/api/calcular-tri', json=dict({
+        'alunos': coorte.alunos(), 'gabarito': coorte.gabarito, 'areas_config': coorte.areas_config,
+        'execucao': 'sincrona'}, **opcoes))
+    assert resposta.status_code == 200
+    return resposta.get_json()
+
+
+def test_endpoint_calibra_guarda_e_pontua_pela_calibracao(cliente):
+    coorte = Coorte(600, 90, semente=32)
+    matriz_id = _calcular(cliente, coorte, armazenar_matriz=True)['matriz_id']
+
+    primeira = cliente.post('/api/calibrar', json={'matriz_id': matriz_id, 'modelo': '2pl', 'prova_id': 'sim-1'})
+    segunda = cliente.post('/api/calibrar', json={'matriz_id': matriz_id, 'modelo': '2pl'})
+
+    assert primeira.status_code == segunda.status_code == 200
+    calibracao = primeira.get_json()
+    assert calibracao['cache'] is False and segunda.get_json()['cache'] is True
+    assert len(calibracao['parametros']) == 90
+    assert set(calibracao['convergiu']) == set(coorte.areas_config)
+
+    por_id = _calcular(cliente, coorte, modo='irt', calibracao_id=calibracao['calibracao_id'])
+    por_parametros = _calcular(cliente, coorte, modo='irt', parametros_itens=calibracao['parametros'])
+    assert por_id['resultados'] == por_parametros['resultados']
+
+    # Mesma prova, outra turma: parte da calibração anterior
+    outra = Coorte(600, 90, semente=33)
+    outra_id = _calcular(cliente, outra, armazenar_matriz=True)['matriz_id']
+    quente = cliente.post('/api/calibrar', json={'matriz_id': outra_id, 'modelo': '2pl', 'prova_id': 'sim-1'})
+    assert quente.get_json()['partida_quente'] is True
+    ParametrosItens.de_dict(quente.get_json()['parametros'])
+
+
+def test_endpoint_erros(cliente):
+    coorte = Coorte(50, 90, semente=34)
+    matriz_id = _calcular(cliente, coorte, armazenar_matriz=True)['matriz_id']
+
+    assert cliente.post('/api/calibrar', json={}).status_code == 400
+    assert cliente.post('/api/calibrar', json={'matriz_id': 'a' * 64}).status_code == 404
+    assert cliente.post('/api/calibrar', json={'matriz_id': matriz_id, 'modelo': '4pl'}).status_code == 400
+    resposta = cliente.post('/api/calcular-tri', json={
+        'alunos': coorte.alunos(), 'gabarito': coorte.gabarito, 'modo': 'irt', 'calibracao_id': 'b' * 64})
+    assert resposta.status_code == 404
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Testes da exportação colunar (tri_exportacao, /api/exportar)
+
+Rodar: python -m pytest python_tri_service/test_tri_exportacao.py
+"""
+
+import os
+import random
+import time
+
+import numpy as np
+import pytest
+
+pytest.importorskip('pyarrow')
+
+import app as tri_app
+from tri_exportacao import RepositorioExportacoes, escrever, ler, matriz_de_tabela, tabela_alunos
+from tri_matriz import RepositorioMatrizes
+
+
+def _turma(n=12, seed=3):
+    rng = random.Random(seed)
+    gabarito = {str(q): rng.choice('ABCDE') for q in range(1, 91)}
+    alunos = [{
+        'nome': f'Aluno {i}', 'id': f'M{i:04d}', 'turma': '3A' if i % 2 else '3B', 'escola': 'E1',
+        'respostas': [gabarito[str(q)] if rng.random() < 0.45 else rng.choice('ABCDE') for q in range(1, 91)],
+    } for i in range(n)]
+    return alunos, gabarito
+
+
+@pytest.fixture
+def cliente(tmp_path, monkeypatch):
+    matrizes = RepositorioMatrizes(str(tmp_path / 'matrizes'), ttl=3600)
+    exportacoes = RepositorioExportacoes(str(tmp_path / 'exportacoes'))
+    matrizes.registrar_derivados(exportacoes.diretorio)
+    monkeypatch.setattr(tri_app, 'repositorio_matrizes', matrizes)
+    monkeypatch.setattr(tri_app, 'repositorio_exportacoes', exportacoes)
+    return tri_app.app.test_client()
+
+
+def _calcular(cliente, alunos, gabarito):
+    resposta = cliente.post('/api/calcular-tri', json={
+        'alunos': alunos, 'gabarito': gabarito, 'armazenar_matriz': True, 'execucao': 'sincrona'})
+    assert resposta.status_code == 200
+    return resposta.get_json()
+
+
+@pytest.mark.parametrize('formato', ['parquet', 'arrow'])
+def test_escrever_e_ler_mantem_notas_do_calculo(cliente, tmp_path, formato):
+    alunos, gabarito = _turma()
+    calculado = _calcular(cliente, alunos, gabarito)
+    matriz, areas_config, opcoes = tri_app.repositorio_matrizes.carregar_com_opcoes(calculado['matriz_id'])
+
+    caminho = str(tmp_path / f'alunos.{formato}')
+    escrever(tabela_alunos(tri_app.vetorizado, matriz, areas_config, calculado['matriz_id'], opcoes),
+             caminho, formato)
+    tabela = ler(caminho)
+
+    assert tabela.column('nome').to_pylist() == [a['nome'] for a in alunos]
+    assert tabela.column('tri_geral').to_pylist() == pytest.approx(
+        [r['tri_geral'] for r in calculado['resultados']], abs=0.05)
+    assert tabela.column('tri_lc').to_pylist() == pytest.approx(
+        [r['tri_lc'] for r in calculado['resultados']], abs=0.05)
+
+
+def test_releitura_arrow_por_memory_map_sem_copia(cliente, tmp_path):
+    alunos, gabarito = _turma()
+    calculado = _calcular(cliente, alunos, gabarito)
+    matriz, areas_config, opcoes = tri_app.repositorio_matrizes.carregar_com_opcoes(calculado['matriz_id'])
+    caminho = str(tmp_path / 'alunos.arrow')
+    escrever(tabela_alunos(tri_app.vetorizado, matriz, areas_config, calculado['matriz_id'], opcoes),
+             caminho, 'arrow')
+
+    relida, areas_relidas = matriz_de_tabela(ler(caminho))
+
+    assert np.array_equal(relida.respostas, matriz.respostas)
+    assert not relida.respostas.flags.writeable
+    assert not relida.respostas.flags.owndata
+    assert {k: tuple(v) for k, v in areas_relidas.items()} == areas_config
+
+
+def test_exportar_serve_so_enquanto_a_matriz_existe(cliente):
+    alunos, gabarito = _turma()
+    matriz_id = _calcular(cliente, alunos, gabarito)['matriz_id']
+
+    resposta = cliente.get(f'/api/exportar/{matriz_id}?formato=arrow')
+    assert resposta.status_code == 200
+    caminho = tri_app.repositorio_exportacoes.caminho(matriz_id, 'alunos', 'arrow')
+    assert os.path.exists(caminho)
+
+    # Matriz expirada: a exportação já gerada não é mais servida e sai na limpeza
+    vencida = time.time() - 2 * tri_app.repositorio_matrizes.ttl
+    os.utime(tri_app.repositorio_matrizes._caminho(matriz_id), (vencida, vencida))
+    tri_app.repositorio_matrizes._ultima_limpeza = 0.0
+
+    assert cliente.get(f'/api/exportar/{matriz_id}?formato=arrow').status_code == 404
+    assert not os.path.exists(caminho)
+
+
+def test_limpar_apaga_exportacoes_orfas_e_conta_no_tamanho(tmp_path):
+    matrizes = RepositorioMatrizes(str(tmp_path / 'matrizes'), ttl=3600, max_bytes=10_000)
+    exportacoes = RepositorioExportacoes(str(tmp_path / 'exportacoes'))
+    matrizes.registrar_derivados(exportacoes.diretorio)
+    agora = time.time()
+
+    antiga, nova = 'a' * 64, 'b' * 64
+    for matriz_id, idade in ((antiga, 200), (nova, 100)):
+        caminho = os.path.join(matrizes.diretorio, f'{matriz_id}.npz')
+        with open(caminho, 'wb') as f:
+            f.write(b'x' * 1000)
+        os.utime(caminho, (agora - idade, agora - idade))
+    # Exportação grande da matriz antiga estoura o limite do diretório
+    with open(exportacoes.caminho(antiga, 'alunos', 'parquet'), 'wb') as f:
+        f.write(b'x' * 9500)
+    orfa = exportacoes.caminho('c' * 64, 'alunos', 'arrow')
+    with open(orfa, 'wb') as f:
+        f.write(b'x')
+
+    assert matrizes.limpar(agora=agora, intervalo=0) == 1
+
+    assert sorted(os.listdir(matrizes.diretorio)) == [f'{nova}.npz']
+    assert os.listdir(exportacoes.diretorio) == []
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Testes do modo 3PL (tri_irt: EAP / MAP)
+
+EAP e MAP são conferidos contra integração e busca numa grade fina, aluno a
+aluno; a turma, contra processar_turma(modo='irt').
+
+Rodar: python -m pytest python_tri_service/test_tri_irt.py
+"""
+
+import numpy as np
+import pytest
+
+import app as tri_app
+from tri_benchmark import Coorte
+from tri_irt import EstimadorIRT, ParametrosItens, probabilidade, matrizes_area, processar_matriz_irt
+from tri_matriz import MatrizRespostas
+
+GRADE_FINA = np.linspace(-6.0, 6.0, 4001)
+
+
+def _itens(n=45, seed=28):
+    rng = np.random.default_rng(seed)
+    return np.exp(rng.normal(0.0, 0.3, n)), rng.normal(0.0, 1.0, n), rng.uniform(0.1, 0.25, n)
+
+
+def _respostas(a, b, c, theta, seed=1, ausentes=0.0):
+    rng = np.random.default_rng(seed)
+    acertos = (rng.random((len(theta), len(a))) < probabilidade(theta, a, b, c)).astype(np.float64)
+    observadas = (rng.random(acertos.shape) >= ausentes).astype(np.float64)
+    return acertos * observadas, observadas
+
+
+def _log_posterior_fina(u, obs, a, b, c):
+    p = probabilidade(GRADE_FINA, a, b, c)
+    return (obs * (u * np.log(p) + (1 - u) * np.log1p(-p))).sum(axis=1) - 0.5 * GRADE_FINA ** 2
+
+
+def test_eap_igual_a_integracao_numa_grade_fina():
+    a, b, c = _itens()
+    u, obs = _respostas(a, b, c, np.linspace(-2.5, 2.5, 25), ausentes=0.1)
+
+    theta, erro = EstimadorIRT().estimar(u, obs, a, b, c, 'eap')
+
+    for k in range(len(theta)):
+        log_post = _log_posterior_fina(u[k], obs[k], a, b, c)
+        peso = np.exp(log_post - log_post.max())
+        peso /= peso.sum()
+        media = peso @ GRADE_FINA
+        assert theta[k] == pytest.approx(media, abs=0.01)
+        assert erro[k] == pytest.approx(np.sqrt(peso @ (GRADE_FINA - media) ** 2), abs=0.01)
+
+
+def test_map_igual_ao_maximo_numa_grade_fina():
+    a, b, c = _itens()
+    u, obs = _respostas(a, b, c, np.linspace(-2.5, 2.5, 25), seed=2)
+
+    theta, erro = EstimadorIRT().estimar(u, obs, a, b, c, 'map')
+
+    for k in range(len(theta)):
+        assert theta[k] == pytest.approx(GRADE_FINA[np.argmax(_log_posterior_fina(u[k], obs[k], a, b, c))], abs=0.01)
+    assert np.all((erro > 0) & (erro < 1))
+
+
+@pytest.mark.parametrize('estimador', ['eap', 'map'])
+def test_blocos_nao_mudam_o_resultado(estimador):
+    a, b, c = _itens()
+    u, obs = _respostas(a, b, c, np.random.default_rng(3).normal(size=200))
+
+    inteiro = EstimadorIRT().estimar(u, obs, a, b, c, estimador)
+    em_blocos = EstimadorIRT(bloco=7).estimar(u, obs, a, b, c, estimador)
+
+    np.testing.assert_allclose(em_blocos, inteiro, atol=1e-9)
+
+
+@pytest.mark.parametrize('estimador', ['eap', 'map'])
+def test_recupera_a_proficiencia_simulada(estimador):
+    a, b, c = _itens(90)
+    verdadeiro = np.random.default_rng(4).normal(size=2000)
+    u, obs = _respostas(a, b, c, verdadeiro, seed=5)
+
+    theta, erro = EstimadorIRT().estimar(u, obs, a, b, c, estimador)
+
+    assert np.corrcoef(theta, verdadeiro)[0, 1] > 0.9
+    # Erro padrão compatível com o erro observado
+    assert np.sqrt(np.mean((theta - verdadeiro) ** 2)) == pytest.approx(np.sqrt(np.mean(erro ** 2)), rel=0.25)
+
+
+def test_acertar_mais_uma_questao_nunca_baixa_o_eap():
+    a, b, c = _itens()
+    u, obs = _respostas(a, b, c, np.zeros(1), seed=6)
+    erradas = np.flatnonzero(u[0] == 0)
+    padroes = np.repeat(u, len(erradas) + 1, axis=0)
+    for k, j in enumerate(erradas, 1):
+        padroes[k, j] = 1.0
+
+    theta, _ = EstimadorIRT().estimar(padroes, np.ones_like(padroes), a, b, c, 'eap')
+
+    assert np.all(theta[1:] > theta[0])
+
+
+def test_sem_questoes_observadas_fica_a_priori():
+    a, b, c = _itens()
+    vazio = np.zeros((1, len(a)))
+
+    theta, erro = EstimadorIRT().estimar(vazio, vazio, a, b, c, 'eap')
+
+    assert theta[0] == pytest.approx(0.0, abs=1e-9)
+    assert erro[0] == pytest.approx(1.0, abs=0.01)
+
+
+def test_questao_ausente_fica_fora_da_verossimilhanca():
+    coorte = Coorte(2, 90, semente=7)
+    alunos = coorte.alunos()
+    alunos[0]['q3'] = ''        # branco: erro observado
+    alunos[1].pop('q3', None)   # ausente: fora
+    matriz = MatrizRespostas.de_alunos(alunos, coorte.gabarito)
+
+    questoes, acertos, observadas = matrizes_area(matriz, 1, 45)
+    coluna = list(questoes).index(3)
+
+    assert observadas[:, coluna].tolist() == [True, False]
+    assert not acertos[:, coluna].any()
+
+
+def test_parametros_invalidos_ou_ausentes():
+    with pytest.raises(ValueError):
+        ParametrosItens.de_dict({'1': {'a': 1.0}})
+    parametros = ParametrosItens.de_dict({'1': {'a': 1.0, 'b': 0.0}})
+    assert parametros.c[0] == 0.0
+    with pytest.raises(ValueError, match='ausentes'):
+        parametros.selecionar(np.array([1, 2]))
+    with pytest.raises(ValueError):
+        EstimadorIRT().estimar(np.zeros((1, 1)), np.ones((1, 1)), parametros.a, parametros.b, parametros.c, 'mle')
+
+
+@pytest.mark.parametrize('estimador', ['eap', 'map'])
+def test_endpoint_modo_irt_igual_a_processar_turma(estimador):
+    coorte = Coorte(40, 90, semente=8)
+    parametros = coorte.parametros.para_dict()
+
+    resposta = tri_app.app.test_client().post('/api/calcular-tri', json={
+        'alunos': coorte.alunos(), 'gabarito': coorte.gabarito, 'areas_config': coorte.areas_config,
+        'modo': 'irt', 'parametros_itens': parametros, 'estimador': estimador, 'execucao': 'sincrona'})
+
+    assert resposta.status_code == 200
+    corpo = resposta.get_json()
+    prova, esperados = tri_app.processador.processar_turma(
+        coorte.alunos(), coorte.gabarito, coorte.areas_config, modo='irt',
+        parametros_itens=parametros, estimador=estimador)
+    _, direto = processar_matriz_irt(MatrizRespostas.de_alunos(coorte.alunos(), coorte.gabarito),
+                                     coorte.areas_config, coorte.parametros, estimador)
+    for campo in ('tri_geral', 'tri_lc', 'tri_ch'):
+        assert [r[campo] for r in corpo['resultados']] == [r[campo] for r in esperados] == [r[campo] for r in direto]
+    assert corpo['prova_analysis']['estimador'] == prova['estimador'] == estimador
+    assert all(r['detalhes']['LC']['erro_padrao'] > 0 for r in corpo['resultados'])
+
+
+def test_endpoint_modo_irt_sem_parametros():
+    coorte = Coorte(3, 90, semente=9)
+    resposta = tri_app.app.test_client().post('/api/calcular-tri', json={
+        'alunos': coorte.alunos(), 'gabarito': coorte.gabarito, 'modo': 'irt', 'execucao': 'sincrona'})
+    assert resposta.status_code == 400
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Testes dos jobs assíncronos (tri_jobs, execucao em /api/calcular-tri, /api/jobs)
+
+O resultado de um job concluído é conferido contra a resposta síncrona.
+
+Rodar: python -m pytest python_tri_service/test_tri_jobs.py
+"""
+
+import time
+
+import pytest
+
+import app as tri_app
+from tri_benchmark import Coorte, comparar
+from tri_cache import CacheResultados
+from tri_jobs import GerenciadorJobs, CONCLUIDO, ERRO
+
+
+def _dormir(dados):
+    """Job lento (função de módulo: vai para o pool de processos)."""
+    time.sleep(float(dados.get('segundos', 3)))
+    return {'status': 'sucesso'}
+
+
+def _falhar(dados):
+    raise ValueError('turma inválida')
+
+
+@pytest.fixture
+def jobs(tmp_path, monkeypatch):
+    monkeypatch.setattr(tri_app, 'cache_resultados', CacheResultados(diretorio=str(tmp_path / 'cache')))
+    criados = []
+
+    def criar(executar=tri_app._executar_job_calculo, **opcoes):
+        gerenciador = GerenciadorJobs(executar, diretorio=str(tmp_path / 'jobs'), max_workers=1, **opcoes)
+        monkeypatch.setattr(tri_app, 'gerenciador_jobs', gerenciador)
+        criados.append(gerenciador)
+        return gerenciador
+
+    yield criar
+    for gerenciador in criados:
+        if gerenciador._pool is not None:
+            gerenciador._pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _corpo(coorte, **opcoes):
+    return dict({'alunos': coorte.alunos(), 'gabarito': coorte.gabarito,
+                 'areas_config': coorte.areas_config}, **opcoes)
+
+
+def _aguardar(cliente, job_id, limite=60.0):
+    fim = time.monotonic() + limite
+    while time.monotonic() < fim:
+        estado = cliente.get(f'/api/jobs/{job_id}').get_json()
+        if estado['status'] in (CONCLUIDO, ERRO):
+            return estado
+        time.sleep(0.05)
+    raise AssertionError(f'job {job_id} não terminou em {limite}s')
+
+
+def test_job_concluido_igual_a_resposta_sincrona(jobs):
+    jobs()
+    cliente = tri_app.app.test_client()
+    coorte = Coorte(80, 90, semente=32)
+
+    aceito = cliente.post('/api/calcular-tri', json=_corpo(coorte, execucao='assincrona'))
+
+    assert aceito.status_code == 202
+    corpo = aceito.get_json()
+    estado = _aguardar(cliente, corpo['job_id'])
+    assert estado['status'] == CONCLUIDO
+    _, esperados = tri_app.processador.processar_turma(coorte.alunos(), coorte.gabarito, coorte.areas_config)
+    assert comparar(estado['resultado']['resultados'], esperados)['ok']
+    assert estado['resultado']['cache_id'] == corpo['cache_id']
+
+    # Outro worker (mesmo diretório) vê o mesmo estado
+    outro = GerenciadorJobs(tri_app._executar_job_calculo, diretorio=tri_app.gerenciador_jobs.diretorio)
+    assert outro.consultar(corpo['job_id']) == estado
+
+
+def test_auto_com_turma_em_cache_responde_200(jobs, monkeypatch):
+    jobs()
+    monkeypatch.setattr(tri_app, 'JOB_LIMIAR_ALUNOS', 10)
+    cliente = tri_app.app.test_client()
+    coorte = Coorte(30, 90, semente=33)
+    sincrona = cliente.post('/api/calcular-tri', json=_corpo(coorte, execucao='sincrona')).get_json()
+
+    resposta = cliente.post('/api/calcular-tri', json=_corpo(coorte, execucao='auto'))
+
+    assert resposta.status_code == 200
+    assert resposta.get_json()['resultados'] == sincrona['resultados']
+    # Turma nova acima do limiar vira job
+    nova = cliente.post('/api/calcular-tri', json=_corpo(Coorte(30, 90, semente=34), execucao='auto'))
+    assert nova.status_code == 202
+
+
+def test_limite_por_tenant_responde_429(jobs):
+    jobs(_dormir, limite_por_tenant=2)
+    cliente = tri_app.app.test_client()
+
+    def enviar(semente, tenant):
+        return cliente.post('/api/calcular-tri', headers={'X-Tenant-Id': tenant},
+                            json=_corpo(Coorte(3, 90, semente=semente), execucao='assincrona', segundos=1))
+
+    assert [enviar(s, 'escola-1').status_code for s in (1, 2, 3)] == [202, 202, 429]
+    assert enviar(4, 'escola-2').status_code == 202
+    assert tri_app.gerenciador_jobs.ativos('escola-1') == 2
+
+
+def test_job_com_erro_e_job_inexistente(jobs):
+    gerenciador = jobs(_falhar)
+    cliente = tri_app.app.test_client()
+
+    estado = _aguardar(cliente, gerenciador.submeter('padrao', {}))
+
+    assert estado['status'] == ERRO and estado['mensagem'] == 'turma inválida'
+    assert gerenciador.ativos('padrao') == 0
+    assert cliente.get(f"/api/jobs/{'0' * 32}").status_code == 404
+    assert cliente.get('/api/jobs/nao-hex').status_code == 404
+
+
+def test_job_travado_expira(jobs):
+    gerenciador = jobs(_dormir, ttl=0.5)
+    job_id = gerenciador.submeter('padrao', {'segundos': 1})
+
+    time.sleep(0.6)
+
+    assert gerenciador.consultar(job_id)['status'] == ERRO
+    assert gerenciador.ativos('padrao') == 0
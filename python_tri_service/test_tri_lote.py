@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Testes do cálculo em lote (/api/calcular-tri-lote)
+
+"por_grupo" é conferido contra /api/calcular-tri grupo a grupo;
+"compartilhada", contra processar_turma de todos os alunos, fatiada por grupo.
+
+Rodar: python -m pytest python_tri_service/test_tri_lote.py
+"""
+
+import pytest
+
+import app as tri_app
+from tri_benchmark import Coorte, comparar
+from tri_matriz import RepositorioMatrizes
+
+
+@pytest.fixture(scope='module')
+def coorte():
+    return Coorte(150, 90, semente=34)
+
+
+@pytest.fixture
+def cliente(tmp_path, monkeypatch):
+    monkeypatch.setattr(tri_app, 'repositorio_matrizes', RepositorioMatrizes(str(tmp_path), ttl=3600))
+    return tri_app.app.test_client()
+
+
+# Grupos de tamanhos diferentes, incluindo um de um aluno só
+LIMITES = [0, 70, 71, 150]
+
+
+def _grupos(coorte):
+    # Sem turma: o lote usa o nome do grupo
+    alunos = [{k: v for k, v in aluno.items() if k != 'turma'} for aluno in coorte.alunos()]
+    return [{'grupo': f'G{g}', 'alunos': alunos[inicio:fim]}
+            for g, (inicio, fim) in enumerate(zip(LIMITES[:-1], LIMITES[1:]))]
+
+
+def _lote(cliente, coorte, dificuldade, **opcoes):
+    return cliente.post('/api/calcular-tri-lote', json=dict({
+        'gabarito': coorte.gabarito, 'areas_config': coorte.areas_config,
+        'dificuldade': dificuldade, 'grupos': _grupos(coorte)}, **opcoes))
+
+
+def test_por_grupo_igual_a_calcular_tri_de_cada_turma(cliente, coorte):
+    resposta = _lote(cliente, coorte, 'por_grupo')
+
+    assert resposta.status_code == 200
+    corpo = resposta.get_json()
+    assert corpo['prova_analysis'] is None
+    assert [g['grupo'] for g in corpo['grupos']] == ['G0', 'G1', 'G2']
+    for grupo, entrada in zip(corpo['grupos'], _grupos(coorte)):
+        isolada = cliente.post('/api/calcular-tri', json={
+            'alunos': entrada['alunos'], 'gabarito': coorte.gabarito, 'areas_config': coorte.areas_config,
+            'execucao': 'sincrona'}).get_json()
+        assert grupo['total_alunos'] == len(entrada['alunos'])
+        assert comparar(grupo['resultados'], isolada['resultados'])['ok']
+        assert grupo['prova_analysis']['questoes_stats'] == isolada['prova_analysis']['questoes_stats']
+
+
+def test_compartilhada_igual_a_uma_turma_fatiada(cliente, coorte):
+    resposta = _lote(cliente, coorte, 'compartilhada')
+
+    assert resposta.status_code == 200
+    corpo = resposta.get_json()
+    prova_analysis, esperados = tri_app.processador.processar_turma(
+        coorte.alunos(), coorte.gabarito, coorte.areas_config)
+    assert corpo['total_alunos'] == coorte.n_alunos
+    assert corpo['prova_analysis']['questoes_stats'] == prova_analysis['questoes_stats']
+    assert corpo['prova_analysis']['tri_medio'] == pytest.approx(prova_analysis['tri_medio'], abs=0.01)
+    for grupo, inicio, fim in zip(corpo['grupos'], LIMITES[:-1], LIMITES[1:]):
+        assert comparar(grupo['resultados'], esperados[inicio:fim])['ok']
+        # Dificuldade de todos os alunos, não só do grupo
+        assert grupo['prova_analysis']['questoes_stats'] == prova_analysis['questoes_stats']
+
+
+def test_matrizes_armazenadas_por_modo(cliente, coorte):
+    compartilhada = _lote(cliente, coorte, 'compartilhada', armazenar_matriz=True).get_json()
+    por_grupo = _lote(cliente, coorte, 'por_grupo', armazenar_matriz=True).get_json()
+
+    matriz, _ = tri_app.repositorio_matrizes.carregar(compartilhada['matriz_id'])
+    assert matriz.n_alunos == coorte.n_alunos
+    assert [tri_app.repositorio_matrizes.carregar(g['matriz_id'])[0].n_alunos
+            for g in por_grupo['grupos']] == [70, 1, 79]
+    assert matriz.turmas == ['G0'] * 70 + ['G1'] + ['G2'] * 79
+
+
+def test_entrada_invalida(cliente, coorte):
+    assert _lote(cliente, coorte, 'por_escola').status_code == 400
+    assert cliente.post('/api/calcular-tri-lote', json={'gabarito': coorte.gabarito}).status_code == 400
+    assert cliente.post('/api/calcular-tri-lote', json={'grupos': _grupos(coorte)}).status_code == 400
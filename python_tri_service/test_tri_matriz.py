@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Testes da matriz de respostas e da recorreção (tri_matriz, /api/recorrigir)
+
+A referência é TRIProcessadorV2.processar_turma com o gabarito já alterado
+(questão anulada = fora do gabarito).
+
+Rodar: python -m pytest python_tri_service/test_tri_matriz.py
+"""
+
+import pytest
+
+import app as tri_app
+from tri_benchmark import Coorte, comparar
+from tri_matriz import MatrizRespostas, RepositorioMatrizes
+
+
+@pytest.fixture
+def cliente(tmp_path, monkeypatch):
+    monkeypatch.setattr(tri_app, 'repositorio_matrizes', RepositorioMatrizes(str(tmp_path), ttl=3600))
+    return tri_app.app.test_client()
+
+
+def _referencia(coorte, gabarito):
+    return tri_app.processador.processar_turma(coorte.alunos(), gabarito, coorte.areas_config)[1]
+
+
+def _armazenar(cliente, coorte, **opcoes):
+    resposta = cliente.post('/api/calcular-tri', json=dict({
+        'alunos': coorte.alunos(), 'gabarito': coorte.gabarito, 'areas_config': coorte.areas_config,
+        'armazenar_matriz': True, 'execucao': 'sincrona'}, **opcoes))
+    assert resposta.status_code == 200
+    return resposta.get_json()
+
+
+@pytest.mark.parametrize('n_alunos, n_questoes', [(1, 90), (40, 45), (120, 90), (60, 180)])
+def test_processar_matriz_igual_a_processar_turma(n_alunos, n_questoes):
+    coorte = Coorte(n_alunos, n_questoes, semente=n_alunos)
+
+    _, resultados = tri_app.vetorizado.processar_matriz(
+        MatrizRespostas.de_alunos(coorte.alunos(), coorte.gabarito), coorte.areas_config)
+
+    assert comparar(resultados, _referencia(coorte, coorte.gabarito))['ok']
+
+
+def test_recorrigir_igual_a_recalcular_com_gabarito_novo(cliente):
+    coorte = Coorte(120, 90, semente=3)
+    matriz_id = _armazenar(cliente, coorte)['matriz_id']
+    troca = 'A' if coorte.gabarito['30'] != 'A' else 'B'
+
+    resposta = cliente.post('/api/recorrigir', json={'matriz_id': matriz_id, 'alteracoes': [
+        {'questao': 12, 'anular': True}, {'questao': 30, 'gabarito': troca}]})
+
+    assert resposta.status_code == 200
+    corpo = resposta.get_json()
+    gabarito = {q: letra for q, letra in coorte.gabarito.items() if q != '12'}
+    gabarito['30'] = troca
+    assert corpo['gabarito'] == gabarito
+
+    antes = _referencia(coorte, coorte.gabarito)
+    depois = _referencia(coorte, gabarito)
+    mudaram = [i for i, (a, d) in enumerate(zip(antes, depois))
+               if any(a[campo] != d[campo] for campo in ('tri_geral', 'tri_lc', 'tri_ch', 'tri_cn', 'tri_mt'))]
+    # Só os alunos cuja nota mudou, com a nota nova e a anterior
+    assert [r['indice'] for r in corpo['resultados']] == mudaram
+    assert corpo['total_alterados'] == len(mudaram) > 0
+    assert comparar(corpo['resultados'], [depois[i] for i in mudaram])['ok']
+    for resultado in corpo['resultados']:
+        assert resultado['anterior']['tri_geral'] == pytest.approx(antes[resultado['indice']]['tri_geral'], abs=0.1)
+
+
+def test_recorrecoes_encadeadas_pelo_novo_matriz_id(cliente):
+    coorte = Coorte(60, 90, semente=4)
+    matriz_id = _armazenar(cliente, coorte)['matriz_id']
+
+    primeiro = cliente.post('/api/recorrigir', json={
+        'matriz_id': matriz_id, 'alteracoes': [{'questao': 5, 'anular': True}]}).get_json()
+    segundo = cliente.post('/api/recorrigir', json={
+        'matriz_id': primeiro['matriz_id'], 'alteracoes': [{'questao': 50, 'anular': True}]}).get_json()
+    direto = cliente.post('/api/recorrigir', json={
+        'matriz_id': matriz_id, 'alteracoes': [{'questao': 5, 'anular': True}, {'questao': 50, 'anular': True}]
+    }).get_json()
+
+    assert primeiro['matriz_id'] != matriz_id
+    assert segundo['matriz_id'] == direto['matriz_id']
+    assert '5' not in segundo['gabarito'] and '50' not in segundo['gabarito']
+
+
+def test_recorrigir_erros(cliente):
+    coorte = Coorte(20, 90, semente=5)
+    matriz_id = _armazenar(cliente, coorte)['matriz_id']
+
+    def recorrigir(matriz_id, alteracoes):
+        return cliente.post('/api/recorrigir', json={'matriz_id': matriz_id, 'alteracoes': alteracoes})
+
+    assert recorrigir('f' * 64, [{'questao': 1, 'anular': True}]).status_code == 404
+    assert recorrigir(matriz_id, []).status_code == 400
+    assert recorrigir(matriz_id, [{'questao': 1, 'gabarito': 'Z'}]).status_code == 400
+    assert recorrigir(matriz_id, [{'questao': 999, 'anular': True}]).status_code == 400
+
+    # Matriz do modo IRT existe, mas não é recorrigível pela tabela
+    irt = _armazenar(cliente, coorte, modo='irt', parametros_itens=coorte.parametros.para_dict())
+    assert recorrigir(irt['matriz_id'], [{'questao': 1, 'anular': True}]).status_code == 409
+
+
+def test_repositorio_salva_e_carrega_com_opcoes(tmp_path):
+    coorte = Coorte(30, 90, semente=6)
+    matriz = MatrizRespostas.de_alunos(coorte.alunos(), coorte.gabarito)
+    repositorio = RepositorioMatrizes(str(tmp_path), ttl=3600)
+    opcoes = {'modo': 'irt', 'estimador': 'map', 'parametros_itens': coorte.parametros.para_dict()}
+
+    matriz_id = repositorio.salvar(matriz, coorte.areas_config, opcoes)
+    # Outro worker: sem a cópia em memória
+    relida, areas_config, opcoes_relidas = RepositorioMatrizes(str(tmp_path), ttl=3600).carregar_com_opcoes(matriz_id)
+
+    assert matriz_id != repositorio.salvar(matriz, coorte.areas_config)
+    assert (relida.respostas == matriz.respostas).all()
+    assert (relida.gabarito == matriz.gabarito).all()
+    assert relida.nomes == matriz.nomes and relida.turmas == matriz.turmas
+    assert areas_config == coorte.areas_config
+    assert opcoes_relidas['estimador'] == 'map'
+    with pytest.raises(KeyError):
+        repositorio.carregar('0' * 64)
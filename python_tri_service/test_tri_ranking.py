@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Testes do ranking por turma / escola / rede (tri_ranking, /api/ranking*)
+
+Rodar: python -m pytest python_tri_service/test_tri_ranking.py
+"""
+
+import os
+import random
+import threading
+import time
+
+import pytest
+
+import app as tri_app
+from tri_matriz import RepositorioMatrizes
+from tri_benchmark import Coorte
+from tri_ranking import NIVEIS, IndiceRanking, RepositorioRankings
+
+
+def _turma(n=12, seed=5):
+    rng = random.Random(seed)
+    gabarito = {str(q): rng.choice('ABCDE') for q in range(1, 91)}
+    alunos = [{
+        'nome': f'Aluno {i}', 'id': f'M{i:04d}', 'turma': '3A' if i % 2 else '3B', 'escola': f'E{i % 3}',
+        'respostas': [gabarito[str(q)] if rng.random() < 0.45 else rng.choice('ABCDE') for q in range(1, 91)],
+    } for i in range(n)]
+    return alunos, gabarito
+
+
+@pytest.fixture
+def cliente(tmp_path, monkeypatch):
+    matrizes = RepositorioMatrizes(str(tmp_path / 'matrizes'), ttl=3600)
+    rankings = RepositorioRankings(str(tmp_path / 'rankings'))
+    matrizes.registrar_derivados(rankings.diretorio)
+    monkeypatch.setattr(tri_app, 'repositorio_matrizes', matrizes)
+    monkeypatch.setattr(tri_app, 'repositorio_rankings', rankings)
+    return tri_app.app.test_client()
+
+
+def _calcular(cliente, alunos, gabarito):
+    resposta = cliente.post('/api/calcular-tri', json={
+        'alunos': alunos, 'gabarito': gabarito, 'armazenar_matriz': True, 'execucao': 'sincrona'})
+    assert resposta.status_code == 200
+    return resposta.get_json()
+
+
+def _inserir(cliente, matriz_id, alunos):
+    return cliente.post('/api/ranking/inserir', json={'matriz_id': matriz_id, 'alunos': alunos})
+
+
+def _expirar(matriz_id):
+    vencida = time.time() - 2 * tri_app.repositorio_matrizes.ttl
+    os.utime(tri_app.repositorio_matrizes._caminho(matriz_id), (vencida, vencida))
+    tri_app.repositorio_matrizes._ultima_limpeza = 0.0
+
+
+def test_registro_de_insercoes_sai_com_a_matriz(cliente):
+    alunos, gabarito = _turma()
+    calculado = _calcular(cliente, alunos, gabarito)
+    matriz_id = calculado['matriz_id']
+    novo = dict(calculado['resultados'][0], id='NOVO', nome='Aluno Novo')
+
+    assert _inserir(cliente, matriz_id, [novo]).status_code == 200
+    registro = tri_app.repositorio_rankings._caminho(matriz_id)
+    assert os.path.exists(registro)
+
+    # Matriz expirada: nem o índice em memória nem o registro (nomes, ids) sobrevivem
+    _expirar(matriz_id)
+
+    assert cliente.post('/api/ranking', json={'matriz_id': matriz_id}).status_code == 404
+    assert _inserir(cliente, matriz_id, [novo]).status_code == 404
+    assert not os.path.exists(registro)
+    assert matriz_id not in tri_app.repositorio_rankings._memoria
+
+
+def _ingenuo(notas, nota):
+    """Posição e percentil por contagem direta (docstring de tri_ranking)."""
+    acima = sum(n > nota for n in notas)
+    abaixo = sum(n < nota for n in notas)
+    return 1 + acima, round(100.0 * (abaixo + 0.5 * (len(notas) - acima - abaixo)) / len(notas), 2)
+
+
+def _conferir(alunos):
+    for aluno in alunos:
+        for nivel in NIVEIS:
+            grupo = [outro for outro in alunos if nivel == 'rede' or outro[nivel] == aluno[nivel]]
+            for area, nota in aluno['notas'].items():
+                posicao, percentil = _ingenuo([outro['notas'][area] for outro in grupo], nota)
+                assert aluno['posicao'][nivel][area] == posicao
+                assert aluno['percentil'][nivel][area] == pytest.approx(percentil, abs=0.01)
+
+
+def test_posicao_e_percentil_como_contagem_direta(cliente):
+    alunos, gabarito = _turma(150)
+    calculado = _calcular(cliente, alunos, gabarito)
+
+    resposta = cliente.post('/api/ranking', json={'matriz_id': calculado['matriz_id']})
+
+    assert resposta.status_code == 200
+    ranking = resposta.get_json()['alunos']
+    assert [a['notas']['geral'] for a in ranking] == [r['tri_geral'] for r in calculado['resultados']]
+    assert [a['notas']['MT'] for a in ranking] == [r['tri_mt'] for r in calculado['resultados']]
+    # Notas por área arredondadas: há empates para dividir a posição
+    assert len({a['notas']['LC'] for a in ranking}) < len(ranking)
+    _conferir(ranking)
+
+    so_3a = cliente.post('/api/ranking', json={'matriz_id': calculado['matriz_id'], 'turma': '3A'}).get_json()
+    assert so_3a['alunos'] == [a for a in ranking if a['turma'] == '3A']
+
+
+def test_consultar_como_contagem_direta(cliente):
+    alunos, gabarito = _turma(60)
+    calculado = _calcular(cliente, alunos, gabarito)
+    notas = [r['tri_geral'] for r in calculado['resultados']]
+    escola = [r for a, r in zip(alunos, calculado['resultados']) if a['escola'] == 'E1']
+
+    for nota in (min(notas) - 1, notas[7], sorted(notas)[30] + 0.05, max(notas) + 1):
+        rede = cliente.post('/api/ranking/consultar', json={
+            'matriz_id': calculado['matriz_id'], 'nota': nota}).get_json()
+        por_escola = cliente.post('/api/ranking/consultar', json={
+            'matriz_id': calculado['matriz_id'], 'nota': nota, 'nivel': 'escola', 'grupo': 'E1'}).get_json()
+        assert (rede['posicao'], rede['percentil']) == _ingenuo(notas, nota)
+        assert (por_escola['posicao'], por_escola['percentil']) == _ingenuo([r['tri_geral'] for r in escola], nota)
+        assert por_escola['total'] == len(escola)
+
+    assert cliente.post('/api/ranking/consultar', json={
+        'matriz_id': calculado['matriz_id'], 'nota': 500, 'area': 'XX'}).status_code == 400
+    assert cliente.post('/api/ranking/consultar', json={'matriz_id': 'd' * 64, 'nota': 500}).status_code == 404
+
+
+def test_inseridos_entram_no_ranking_de_todos(cliente):
+    alunos, gabarito = _turma(40)
+    calculado = _calcular(cliente, alunos, gabarito)
+    matriz_id = calculado['matriz_id']
+    novos = [dict(r, id=f'N{k}', nome=f'Novo {k}', turma='3A', escola='E1')
+             for k, r in enumerate(calculado['resultados'][:3])]
+
+    inserido = _inserir(cliente, matriz_id, novos).get_json()
+    ranking = cliente.post('/api/ranking', json={'matriz_id': matriz_id}).get_json()
+
+    assert inserido['total_alunos'] == ranking['total_alunos'] == 43
+    assert [a['indice'] for a in inserido['alunos']] == [40, 41, 42]
+    assert inserido['alunos'] == ranking['alunos'][40:]
+    _conferir(ranking['alunos'])
+    assert _inserir(cliente, matriz_id, [{'id': 'X', 'tri_geral': 500}]).status_code == 400
+
+
+def test_insercoes_concorrentes_de_dois_workers(tmp_path):
+    def construir():
+        return IndiceRanking({'geral': [500.0, 600.0]}, ['a', 'b'], ['A', 'B'], ['T', 'T'], ['E', 'E'])
+
+    matriz_id = 'e' * 64
+    workers = [RepositorioRankings(str(tmp_path)) for _ in range(2)]
+    lotes = [[{'id': f'W{w}-{k}-{i}', 'nome': '', 'turma': 'T', 'escola': 'E', 'notas': {'geral': 550.0 + i}}
+              for i in range(k % 3 + 1)] for w in range(2) for k in range(25)]
+    deslocamentos = [None] * len(lotes)
+    barreira = threading.Barrier(8)
+
+    def inserir(t):
+        barreira.wait()
+        for k in range(t, len(lotes), 8):
+            deslocamentos[k] = workers[k // 25].registrar_insercao(matriz_id, lotes[k])
+
+    threads = [threading.Thread(target=inserir, args=(t,)) for t in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Cada lote está exatamente nas linhas que registrar_insercao devolveu
+    for worker in workers:
+        atual = worker.obter(matriz_id, construir)
+        for lote, deslocamento in zip(lotes, deslocamentos):
+            inicio = atual.n_coorte + deslocamento
+            assert atual.ids[inicio:inicio + len(lote)] == [aluno['id'] for aluno in lote]
+        assert atual.n_alunos == 2 + sum(len(lote) for lote in lotes)
+
+
+def test_ranking_do_modo_irt_usa_as_notas_irt(cliente):
+    coorte = Coorte(50, 90, semente=31)
+    alunos = [dict(aluno, turma=f'T{i % 2}') for i, aluno in enumerate(coorte.alunos())]
+    resposta = cliente.post('/api/calcular-tri', json={
+        'alunos': alunos, 'gabarito': coorte.gabarito, 'areas_config': coorte.areas_config,
+        'modo': 'irt', 'parametros_itens': coorte.parametros.para_dict(),
+        'armazenar_matriz': True, 'execucao': 'sincrona'}).get_json()
+
+    ranking = cliente.post('/api/ranking', json={'matriz_id': resposta['matriz_id']}).get_json()['alunos']
+
+    assert [a['notas']['geral'] for a in ranking] == [r['tri_geral'] for r in resposta['resultados']]
+    assert [a['notas']['LC'] for a in ranking] == [r['tri_lc'] for r in resposta['resultados']]
+    _conferir(ranking)
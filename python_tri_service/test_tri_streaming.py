@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Testes do processamento em streaming (tri_streaming, /api/calcular-tri-stream)
+
+A referência é TRIProcessadorV2.processar_turma sobre a coorte inteira.
+
+Rodar: python -m pytest python_tri_service/test_tri_streaming.py
+"""
+
+import csv
+import io
+import json
+
+import pytest
+
+import app as tri_app
+from tri_benchmark import Coorte, comparar
+from tri_streaming import ProcessadorStreaming, ler_blocos
+
+
+def _ndjson(coorte):
+    return ''.join(json.dumps(aluno, ensure_ascii=False) + '\n' for aluno in coorte.alunos())
+
+
+def _csv(coorte):
+    buffer = io.StringIO()
+    campos = ['nome', 'id', 'turma'] + [f'q{q}' for q in range(1, coorte.n_questoes + 1)]
+    writer = csv.DictWriter(buffer, fieldnames=campos, delimiter=';')
+    writer.writeheader()
+    writer.writerows(coorte.alunos())
+    return buffer.getvalue()
+
+
+def _arquivo(tmp_path, coorte, formato):
+    caminho = tmp_path / f'alunos.{formato}'
+    caminho.write_text(_csv(coorte) if formato == 'csv' else _ndjson(coorte), encoding='utf-8')
+    return caminho
+
+
+@pytest.fixture(scope='module')
+def coorte():
+    return Coorte(230, 90, semente=27)
+
+
+@pytest.fixture(scope='module')
+def referencia(coorte):
+    return tri_app.processador.processar_turma(coorte.alunos(), coorte.gabarito, coorte.areas_config)
+
+
+@pytest.mark.parametrize('formato', ['csv', 'ndjson'])
+@pytest.mark.parametrize('tamanho_bloco', [1, 37, 1000])
+def test_dois_passos_igual_a_processar_turma(tmp_path, coorte, referencia, formato, tamanho_bloco):
+    caminho = _arquivo(tmp_path, coorte, formato)
+    motor = ProcessadorStreaming(tri_app.tabela_referencia, coorte.gabarito, coorte.areas_config,
+                                 tamanho_bloco=tamanho_bloco)
+
+    resultados = list(motor.processar(lambda: open(caminho, encoding='utf-8', newline=''), formato))
+
+    prova_analysis, esperados = referencia
+    assert comparar(resultados, esperados)['ok']
+    assert [r['id'] for r in resultados] == [str(i) for i in range(coorte.n_alunos)]
+    assert motor.total == coorte.n_alunos
+    assert motor.resumo['tri_medio'] == pytest.approx(prova_analysis['tri_medio'], abs=0.01)
+    assert motor.resumo['questoes_stats'] == prova_analysis['questoes_stats']
+
+
+def test_pool_de_processos_mantem_a_ordem(tmp_path, coorte, referencia):
+    caminho = _arquivo(tmp_path, coorte, 'ndjson')
+    motor = ProcessadorStreaming(tri_app.tabela_referencia, coorte.gabarito, coorte.areas_config,
+                                 tamanho_bloco=20, workers=2)
+
+    resultados = list(motor.processar(lambda: open(caminho, encoding='utf-8'), 'ndjson'))
+
+    assert comparar(resultados, referencia[1])['ok']
+
+
+def test_pontuar_antes_de_acumular():
+    motor = ProcessadorStreaming(tri_app.tabela_referencia, {'1': 'A'})
+    with pytest.raises(RuntimeError):
+        list(motor.pontuar([]))
+
+
+def test_ndjson_invalido_indica_a_linha():
+    with pytest.raises(ValueError, match='linha 2'):
+        list(ler_blocos(io.StringIO('{"nome": "a"}\n{nome\n'), 'ndjson'))
+
+
+def _stream(cliente, conteudo, nome, gabarito, **campos):
+    return cliente.post('/api/calcular-tri-stream', content_type='multipart/form-data', data=dict({
+        'arquivo': (io.BytesIO(conteudo.encode('utf-8')), nome),
+        'gabarito': json.dumps(gabarito),
+    }, **campos))
+
+
+@pytest.mark.parametrize('formato', ['csv', 'ndjson'])
+def test_endpoint_ndjson_termina_com_prova_analysis(coorte, referencia, formato):
+    cliente = tri_app.app.test_client()
+    conteudo = _csv(coorte) if formato == 'csv' else _ndjson(coorte)
+
+    resposta = _stream(cliente, conteudo, f'alunos.{formato}', coorte.gabarito,
+                       areas_config=json.dumps(coorte.areas_config), tamanho_bloco='50')
+
+    assert resposta.status_code == 200
+    linhas = [json.loads(linha) for linha in resposta.get_data(as_text=True).splitlines()]
+    assert comparar(linhas[:-1], referencia[1])['ok']
+    assert linhas[-1]['prova_analysis']['total_alunos'] == coorte.n_alunos
+
+
+def test_endpoint_saida_csv(coorte, referencia):
+    cliente = tri_app.app.test_client()
+
+    resposta = _stream(cliente, _ndjson(coorte), 'alunos.ndjson', coorte.gabarito,
+                       areas_config=json.dumps(coorte.areas_config), formato_saida='csv')
+
+    linhas = list(csv.DictReader(io.StringIO(resposta.get_data(as_text=True)), delimiter=';'))
+    assert len(linhas) == coorte.n_alunos
+    assert [float(linha['tri_geral']) for linha in linhas] == pytest.approx(
+        [r['tri_geral'] for r in referencia[1]], abs=0.1)
+
+
+def test_endpoint_erros_de_entrada():
+    cliente = tri_app.app.test_client()
+
+    assert _stream(cliente, '{"nome": "a"}\n{nome\n', 'alunos.ndjson', {'1': 'A'}).status_code == 400
+    assert _stream(cliente, '', 'alunos.ndjson', {'1': 'A'}, formato_saida='xml').status_code == 400
+    assert cliente.post('/api/calcular-tri-stream', data={'gabarito': '{}'}).status_code == 400
@@ -0,0 +1,133 @@
+"""
+╔════════════════════════════════════════════════════════════════════════════════╗
+║                                                                                ║
+║              TRI V2 - ANÁLISE CLÁSSICA DE ITENS (TCT)                          ║
+║                                                                                ║
+║  • p-valor (% de acerto, mesma regra do PASSO 1 de processar_turma)           ║
+║  • Ponto-bisserial contra o escore total                                      ║
+║  • Discriminação pelos grupos superior e inferior de 27%                      ║
+║  • Distribuição de respostas A-E / branco / dupla marcação                    ║
+║  • Fidedignidade KR-20 por área                                               ║
+║                                                                                ║
+╚════════════════════════════════════════════════════════════════════════════════╝
+
+Tudo é calculado com reduções sobre a matriz alunos × questões (sem laços
+por aluno), para coortes de dezenas de milhares de alunos.
+"""
+
+import numpy as np
+from typing import Dict, List
+
+from tri_v2_producao import DIFICULDADES, normalizar_areas_config
+from tri_matriz import (
+    MatrizRespostas, OPCOES, COD_BRANCO, COD_DUPLA,
+    classificar_dificuldades, decodificar
+)
+
+FRACAO_GRUPOS = 0.27
+
+
+def _correlacao_colunas(x: np.ndarray, total: np.ndarray) -> np.ndarray:
+    """Correlação de Pearson de cada coluna de x com total (0 se variância nula)."""
+    n = x.shape[0]
+    media_x = x.mean(axis=0)
+    media_t = total.mean()
+    cov = (x.T @ total) / n - media_x * media_t
+    desvio = np.sqrt(np.maximum(media_x * (1.0 - media_x), 0.0)) * total.std()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(desvio > 0, cov / desvio, 0.0)
+
+
+def kr20(acertos: np.ndarray) -> float:
+    """KR-20 de um conjunto de itens dicotômicos (alunos × itens)."""
+    n, k = acertos.shape
+    if k < 2 or n < 2:
+        return 0.0
+    p = acertos.mean(axis=0)
+    variancia_total = acertos.sum(axis=1).var()
+    if variancia_total == 0:
+        return 0.0
+    return float(k / (k - 1) * (1.0 - (p * (1.0 - p)).sum() / variancia_total))
+
+
+def analisar_itens(matriz: MatrizRespostas, areas_config: dict) -> Dict:
+    """
+    Estatísticas por questão e fidedignidade por área.
+
+    Args:
+        matriz: Matriz de respostas da turma
+        areas_config: Mesmo formato de processar_turma
+
+    Returns:
+        {'total_alunos', 'itens': [...], 'areas': {area: {...}}}
+    """
+    areas = normalizar_areas_config(areas_config)
+    n = matriz.n_alunos
+    ativas = matriz.ativas()
+    # Acerto válido (PASSO 1): resposta igual ao gabarito, ignorando branco e 'X'
+    acertos = (matriz.acertos() & (matriz.gabarito < COD_BRANCO) & ativas).astype(np.float64)
+    total = acertos.sum(axis=1)
+
+    p_valor = acertos.mean(axis=0) if n else np.zeros(matriz.n_questoes)
+    bisserial = _correlacao_colunas(acertos, total) if n else np.zeros(matriz.n_questoes)
+
+    # Grupos superior / inferior de 27% pelo escore total
+    tamanho_grupo = max(1, int(round(FRACAO_GRUPOS * n))) if n else 0
+    if tamanho_grupo:
+        ordem = np.argsort(total, kind='stable')
+        p_inferior = acertos[ordem[:tamanho_grupo]].mean(axis=0)
+        p_superior = acertos[ordem[-tamanho_grupo:]].mean(axis=0)
+    else:
+        p_inferior = p_superior = np.zeros(matriz.n_questoes)
+
+    # Distribuição de respostas: uma redução por código (A-E, branco, dupla)
+    rotulos = list(OPCOES) + ['branco', 'dupla']
+    contagens = {
+        rotulo: (matriz.respostas == codigo).sum(axis=0)
+        for rotulo, codigo in zip(rotulos, list(range(len(OPCOES))) + [COD_BRANCO, COD_DUPLA])
+    }
+    contagens = {rotulo: valores.tolist() for rotulo, valores in contagens.items()}
+
+    classes = classificar_dificuldades(p_valor)
+    area_da_questao: Dict[int, List[str]] = {}
+    resumo_areas = {}
+    for area, (start, end) in areas.items():
+        colunas = (matriz.questoes >= start) & (matriz.questoes <= end) & ativas
+        for q in matriz.questoes[colunas].tolist():
+            area_da_questao.setdefault(q, []).append(area)
+        sub = acertos[:, colunas]
+        escore = sub.sum(axis=1)
+        resumo_areas[area] = {
+            'n_itens': int(colunas.sum()),
+            'kr20': round(kr20(sub), 4),
+            'media': float(escore.mean()) if n else 0.0,
+            'desvio': float(escore.std()) if n else 0.0,
+            'p_valor_medio': float(p_valor[colunas].mean()) if colunas.any() else 0.0,
+        }
+
+    questoes = matriz.questoes.tolist()
+    p_l, bis_l = p_valor.tolist(), bisserial.tolist()
+    sup_l, inf_l = p_superior.tolist(), p_inferior.tolist()
+    itens = []
+    for j, q in enumerate(questoes):
+        anulada = not ativas[j]
+        itens.append({
+            'questao': q,
+            'areas': area_da_questao.get(q, []),
+            'gabarito': None if anulada else decodificar(matriz.gabarito[j]),
+            'anulada': anulada,
+            'p_valor': round(p_l[j], 4),
+            'dificuldade': DIFICULDADES[classes[j]],
+            'ponto_bisserial': round(bis_l[j], 4),
+            'discriminacao': round(sup_l[j] - inf_l[j], 4),
+            'p_superior': round(sup_l[j], 4),
+            'p_inferior': round(inf_l[j], 4),
+            'distribuicao': {rotulo: contagens[rotulo][j] for rotulo in rotulos},
+        })
+
+    return {
+        'total_alunos': n,
+        'tamanho_grupos_27': tamanho_grupo,
+        'itens': itens,
+        'areas': resumo_areas,
+    }
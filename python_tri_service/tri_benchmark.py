@@ -0,0 +1,283 @@
+"""
+╔════════════════════════════════════════════════════════════════════════════════╗
+║                                                                                ║
+║              TRI V2 - BENCHMARK E EQUIVALÊNCIA (GOLDEN)                        ║
+║                                                                                ║
+║  • Coortes sintéticas: 1k / 10k / 100k alunos × 45 / 90 / 180 questões        ║
+║  • Motores: escalar, vetorizado, streaming, IRT (EAP) e serialização JSON     ║
+║  • Mede alunos/s e pico de memória (tracemalloc) de cada motor                ║
+║  • Confere cada caminho rápido contra processar_turma (tolerância 0.1)        ║
+║                                                                                ║
+╚════════════════════════════════════════════════════════════════════════════════╝
+
+Uso:
+    python tri_benchmark.py
+    python tri_benchmark.py --alunos 1000,10000 --questoes 90 --json bench.json
+
+Sai com código 1 se algum caminho rápido divergir da referência.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+import contextlib
+import numpy as np
+from typing import Callable, Dict, List, Optional, Tuple
+
+from tri_v2_producao import AREAS_TRI, TabelaReferenciaTRI, TRIProcessadorV2, localizar_tabela
+from tri_matriz import MatrizRespostas, TRIVetorizado, OPCOES
+from tri_streaming import ProcessadorStreaming
+from tri_irt import ParametrosItens, EstimadorIRT, processar_matriz_irt
+
+TAMANHOS_PADRAO = (1000, 10000, 100000)
+QUESTOES_PADRAO = (45, 90, 180)
+MOTORES = ('escalar', 'vetorizado', 'streaming', 'irt', 'json')
+TOLERANCIA = 0.1
+MAX_ESCALAR_PADRAO = 10000
+CAMPOS_NOTA = ('tri_geral', 'tri_lc', 'tri_ch', 'tri_cn', 'tri_mt', 'tct')
+
+
+# ════════════════════════════════════════════════════════════════════════════════
+# 1. COORTE SINTÉTICA
+# ════════════════════════════════════════════════════════════════════════════════
+
+class Coorte:
+    """
+    Turma sintética gerada por um 3PL (habilidade ~ N(0, 1), dificuldade ~ N(0.3, 1)).
+
+    As respostas ficam numa matriz de índices (0-4 = A-E, 5 = branco, 6 = 'X',
+    7 = ausente); os alunos no formato qN são montados sob demanda.
+    """
+
+    def __init__(self, n_alunos: int, n_questoes: int, semente: int = 0):
+        rng = np.random.default_rng(semente)
+        self.n_alunos = n_alunos
+        self.n_questoes = n_questoes
+
+        gabarito = rng.integers(0, len(OPCOES), n_questoes)
+        self.gabarito = {str(q + 1): OPCOES[gabarito[q]] for q in range(n_questoes)}
+
+        a = np.exp(rng.normal(0.0, 0.3, n_questoes))
+        b = rng.normal(0.3, 1.0, n_questoes)
+        c = rng.uniform(0.15, 0.25, n_questoes)
+        self.parametros = ParametrosItens(questoes=np.arange(1, n_questoes + 1), a=a, b=b, c=c)
+
+        # Áreas de 45 questões (LC, CH, CN, MT), como no ENEM
+        blocos = np.array_split(np.arange(1, n_questoes + 1), max(1, min(len(AREAS_TRI), n_questoes // 45)))
+        self.areas_config = {area: (int(bloco[0]), int(bloco[-1])) for area, bloco in zip(AREAS_TRI, blocos)}
+
+        theta = rng.normal(0.0, 1.0, n_alunos)
+        p = c + (1.0 - c) / (1.0 + np.exp(-1.7 * a * (theta[:, None] - b)))
+        acerto = rng.random((n_alunos, n_questoes)) < p
+        # Erro: qualquer outra alternativa (deslocamento 1-4 sobre o gabarito)
+        erradas = (gabarito + rng.integers(1, len(OPCOES), (n_alunos, n_questoes))) % len(OPCOES)
+        self.codigos = np.where(acerto, gabarito, erradas).astype(np.uint8)
+        sorteio = rng.random((n_alunos, n_questoes))
+        self.codigos[sorteio < 0.03] = 5
+        self.codigos[(sorteio >= 0.03) & (sorteio < 0.04)] = 6
+        self.codigos[(sorteio >= 0.04) & (sorteio < 0.045)] = 7
+
+    def alunos(self, inicio: int = 0, fim: Optional[int] = None) -> List[dict]:
+        """Alunos [inicio, fim) no formato qN de processar_turma."""
+        valores = list(OPCOES) + ['', 'X']
+        chaves = [f'q{q + 1}' for q in range(self.n_questoes)]
+        resultado = []
+        for i, linha in enumerate(self.codigos[inicio:fim].tolist(), start=inicio):
+            aluno = {'id': str(i), 'nome': f'Aluno_{i}', 'turma': f'T{i % 40}'}
+            aluno.update((chave, valores[v]) for chave, v in zip(chaves, linha) if v < 7)
+            resultado.append(aluno)
+        return resultado
+
+    def blocos(self, tamanho: int):
+        for inicio in range(0, self.n_alunos, tamanho):
+            yield self.alunos(inicio, inicio + tamanho)
+
+
+# ════════════════════════════════════════════════════════════════════════════════
+# 2. MEDIÇÃO
+# ════════════════════════════════════════════════════════════════════════════════
+
+@contextlib.contextmanager
+def _silencioso():
+    with open(os.devnull, 'w') as nulo, contextlib.redirect_stdout(nulo):
+        yield
+
+
+def medir(funcao: Callable[[], object], memoria: bool = True) -> Tuple[object, float, Optional[int]]:
+    """
+    (retorno, segundos, pico de bytes alocados).
+
+    O tempo é medido sem tracemalloc (que deixa código Python bem mais lento);
+    com memoria=True a função roda uma segunda vez só para o pico.
+    """
+    with _silencioso():
+        inicio = time.perf_counter()
+        retorno = funcao()
+        segundos = time.perf_counter() - inicio
+
+    pico = None
+    if memoria:
+        retorno_memoria = None
+        tracemalloc.start()
+        try:
+            base = tracemalloc.get_traced_memory()[0]
+            with _silencioso():
+                retorno_memoria = funcao()
+            pico = tracemalloc.get_traced_memory()[1] - base
+        finally:
+            tracemalloc.stop()
+            del retorno_memoria
+    return retorno, segundos, pico
+
+
+def comparar(resultados: List[Dict], referencia: List[Dict], tolerancia: float = TOLERANCIA) -> Dict:
+    """Maior diferença por campo de nota entre dois conjuntos de resultados."""
+    if len(resultados) != len(referencia):
+        return {'ok': False, 'max_diferenca': None, 'divergentes': abs(len(resultados) - len(referencia))}
+    max_dif, divergentes = 0.0, 0
+    for campo in CAMPOS_NOTA:
+        a = np.array([r[campo] for r in resultados], dtype=np.float64)
+        b = np.array([r[campo] for r in referencia], dtype=np.float64)
+        dif = np.abs(a - b)
+        if dif.size:
+            max_dif = max(max_dif, float(dif.max()))
+            divergentes += int((dif > tolerancia).sum())
+    return {'ok': divergentes == 0, 'max_diferenca': round(max_dif, 6), 'divergentes': divergentes}
+
+
+# ════════════════════════════════════════════════════════════════════════════════
+# 3. MOTORES
+# ════════════════════════════════════════════════════════════════════════════════
+
+def executar_cenario(tabela: TabelaReferenciaTRI, coorte: Coorte, motores: List[str],
+                     max_escalar: int = MAX_ESCALAR_PADRAO, memoria: bool = True,
+                     tamanho_bloco: int = 5000) -> List[Dict]:
+    """
+    Roda os motores pedidos numa coorte.
+
+    A referência golden é processar_turma (escalar); acima de max_escalar alunos
+    ela é pulada e os caminhos rápidos são comparados ao vetorizado.
+    """
+    processador = TRIProcessadorV2(tabela)
+    vetorizado = TRIVetorizado(tabela)
+    alunos = coorte.alunos()
+    gabarito, areas_config = coorte.gabarito, coorte.areas_config
+    linhas = []
+    referencia, nome_referencia = None, None
+    resultados_vetorizado = None
+
+    def registrar(motor, segundos, pico, equivalencia=None):
+        linhas.append({
+            'alunos': coorte.n_alunos,
+            'questoes': coorte.n_questoes,
+            'motor': motor,
+            'segundos': round(segundos, 4),
+            'alunos_por_s': round(coorte.n_alunos / segundos, 1) if segundos > 0 else None,
+            'pico_mb': round(pico / 2 ** 20, 1) if pico is not None else None,
+            'referencia': nome_referencia if equivalencia else None,
+            **(equivalencia or {}),
+        })
+
+    if 'escalar' in motores and coorte.n_alunos <= max_escalar:
+        (_, referencia), segundos, pico = medir(
+            lambda: processador.processar_turma(alunos, gabarito, areas_config), memoria
+        )
+        nome_referencia = 'escalar'
+        registrar('escalar', segundos, pico)
+
+    if 'vetorizado' in motores or 'json' in motores or (referencia is None and 'streaming' in motores):
+        (_, resultados_vetorizado), segundos, pico = medir(
+            lambda: vetorizado.processar_matriz(MatrizRespostas.de_alunos(alunos, gabarito), areas_config),
+            memoria
+        )
+        if 'vetorizado' in motores:
+            registrar('vetorizado', segundos, pico,
+                      comparar(resultados_vetorizado, referencia) if referencia is not None else None)
+        if referencia is None:
+            referencia, nome_referencia = resultados_vetorizado, 'vetorizado'
+
+    if 'streaming' in motores:
+        def streaming():
+            motor = ProcessadorStreaming(tabela, gabarito, areas_config, tamanho_bloco=tamanho_bloco)
+            motor.acumular(coorte.blocos(tamanho_bloco))
+            return list(motor.pontuar(coorte.blocos(tamanho_bloco)))
+        resultados, segundos, pico = medir(streaming, memoria)
+        registrar('streaming', segundos, pico, comparar(resultados, referencia))
+
+    if 'irt' in motores:
+        # Modelo diferente (3PL): só desempenho, sem equivalência com a tabela
+        motor_irt = EstimadorIRT()
+        _, segundos, pico = medir(
+            lambda: processar_matriz_irt(MatrizRespostas.de_alunos(alunos, gabarito), areas_config,
+                                         coorte.parametros, 'eap', motor_irt),
+            memoria
+        )
+        registrar('irt', segundos, pico)
+
+    if 'json' in motores:
+        _, segundos, pico = medir(lambda: json.dumps(resultados_vetorizado, ensure_ascii=False), memoria)
+        registrar('json', segundos, pico)
+
+    return linhas
+
+
+def imprimir_tabela(linhas: List[Dict]):
+    print(f"{'alunos':>8} {'questões':>8}  {'motor':<11} {'segundos':>9} {'alunos/s':>11} "
+          f"{'pico MB':>8}  equivalência")
+    for linha in linhas:
+        if linha.get('referencia'):
+            status = '✓' if linha['ok'] else f"✗ {linha['divergentes']} divergentes"
+            equivalencia = f"{status} (máx {linha['max_diferenca']} vs {linha['referencia']})"
+        else:
+            equivalencia = '-'
+        pico = f"{linha['pico_mb']:.1f}" if linha['pico_mb'] is not None else '-'
+        print(f"{linha['alunos']:>8} {linha['questoes']:>8}  {linha['motor']:<11} {linha['segundos']:>9.3f} "
+              f"{linha['alunos_por_s'] or 0:>11.0f} {pico:>8}  {equivalencia}")
+
+
+def _lista_int(texto: str) -> List[int]:
+    return [int(parte.replace('k', '000')) for parte in texto.split(',') if parte.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark e equivalência dos motores TRI V2')
+    parser.add_argument('--alunos', default=','.join(map(str, TAMANHOS_PADRAO)), help='Ex: 1k,10k,100k')
+    parser.add_argument('--questoes', default=','.join(map(str, QUESTOES_PADRAO)), help='Ex: 45,90,180')
+    parser.add_argument('--motores', default=','.join(MOTORES), help=f'Subconjunto de {",".join(MOTORES)}')
+    parser.add_argument('--max-escalar', type=int, default=MAX_ESCALAR_PADRAO,
+                        help='Maior coorte rodada no motor escalar (referência golden)')
+    parser.add_argument('--tabela', default=localizar_tabela(), help='Tabela TRI de referência (.csv ou .json)')
+    parser.add_argument('--semente', type=int, default=0)
+    parser.add_argument('--sem-memoria', action='store_true', help='Não mede pico de memória (roda cada motor uma vez)')
+    parser.add_argument('--json', help='Grava as medições neste arquivo')
+
+    args = parser.parse_args()
+    motores = [m.strip() for m in args.motores.split(',') if m.strip()]
+    invalidos = set(motores) - set(MOTORES)
+    if invalidos:
+        parser.error(f'Motores inválidos: {sorted(invalidos)}')
+
+    tabela = TabelaReferenciaTRI(args.tabela)
+    linhas = []
+    for n_alunos in _lista_int(args.alunos):
+        for n_questoes in _lista_int(args.questoes):
+            print(f'▶ {n_alunos} alunos × {n_questoes} questões', file=sys.stderr)
+            coorte = Coorte(n_alunos, n_questoes, args.semente)
+            linhas.extend(executar_cenario(tabela, coorte, motores, args.max_escalar, not args.sem_memoria))
+
+    imprimir_tabela(linhas)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(linhas, f, ensure_ascii=False, indent=2)
+
+    divergentes = [linha for linha in linhas if linha.get('referencia') and not linha['ok']]
+    if divergentes:
+        print(f'❌ {len(divergentes)} medições fora da tolerância de {TOLERANCIA} pontos', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
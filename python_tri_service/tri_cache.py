@@ -0,0 +1,186 @@
+"""
+╔════════════════════════════════════════════════════════════════════════════════╗
+║                                                                                ║
+║              TRI V2 - CACHE DE RESULTADOS (MEMÓRIA + DISCO OPCIONAL)           ║
+║                                                                                ║
+║  • Chave: matriz_id (hash de gabarito, areas_config e respostas) + opções     ║
+║  • LRU em memória por worker, limitado em bytes; disco opcional (.json.gz)    ║
+║  • Invalidação explícita por matriz ou total, vista por todos os workers      ║
+║                                                                                ║
+╚════════════════════════════════════════════════════════════════════════════════╝
+
+A mesma turma (mesmas respostas, mesmo gabarito, mesma configuração) sempre
+produz o mesmo resultado; o painel pede a mesma turma a cada abertura de
+relatório, então a resposta é servida sem recalcular.
+
+O LRU é limitado pelo tamanho aproximado das respostas (JSON serializado),
+não pelo número de entradas: a resposta de uma coorte grande tem dezenas de
+MB. Respostas acima de max_entrada_bytes não entram na memória.
+"""
+
+import os
+import gzip
+import json
+import time
+import hashlib
+import tempfile
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+_MARCA_TUDO = 'invalidado_tudo'
+
+
+class CacheResultados:
+    """
+    Cache de respostas de /api/calcular-tri.
+
+    Invalidações gravam uma marca (arquivo) no diretório compartilhado; uma
+    entrada em memória mais antiga que a marca da sua matriz (ou que a marca
+    geral) é descartada, de modo que todos os workers do gunicorn respeitam
+    a invalidação feita em qualquer um deles.
+    """
+
+    def __init__(self, max_memoria: Optional[int] = None, diretorio: Optional[str] = None,
+                 disco: Optional[bool] = None, max_bytes: Optional[int] = None,
+                 max_entrada_bytes: Optional[int] = None):
+        """
+        Args:
+            max_memoria: Entradas no LRU (padrão: TRI_CACHE_MAX ou 64; 0 desliga o cache)
+            diretorio: Marcas de invalidação e camada em disco (padrão: TRI_CACHE_DIR)
+            disco: Ativa a camada em disco (padrão: TRI_CACHE_DISCO=1)
+            max_bytes: Soma dos tamanhos no LRU (padrão: TRI_CACHE_MAX_MB ou 128 MB)
+            max_entrada_bytes: Maior resposta guardada em memória (padrão:
+                TRI_CACHE_MAX_ENTRADA_MB ou 16 MB); maiores só vão para o disco
+        """
+        self.max_memoria = max_memoria if max_memoria is not None else int(os.getenv('TRI_CACHE_MAX', '64'))
+        self.max_bytes = max_bytes if max_bytes is not None else \
+            int(float(os.getenv('TRI_CACHE_MAX_MB', '128')) * 1024 * 1024)
+        self.max_entrada_bytes = max_entrada_bytes if max_entrada_bytes is not None else \
+            int(float(os.getenv('TRI_CACHE_MAX_ENTRADA_MB', '16')) * 1024 * 1024)
+        self.diretorio = diretorio or os.getenv(
+            'TRI_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'tri_cache')
+        )
+        os.makedirs(self.diretorio, exist_ok=True)
+        self.disco = disco if disco is not None else os.getenv('TRI_CACHE_DISCO', '0') == '1'
+        # chave -> (criado_em, resposta, bytes do JSON)
+        self._memoria: 'OrderedDict[str, Tuple[float, Dict, int]]' = OrderedDict()
+        self._bytes = 0
+        self.acertos = 0
+        self.faltas = 0
+
+    @property
+    def ativo(self) -> bool:
+        return self.max_memoria > 0 or self.disco
+
+    @staticmethod
+    def chave(matriz_id: str, opcoes: Dict) -> str:
+        """matriz_id + hash das opções de cálculo (modo, estimador, parâmetros)."""
+        resumo = hashlib.sha256(json.dumps(opcoes, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        return f'{matriz_id}_{resumo[:16]}'
+
+    def _caminho(self, chave: str) -> str:
+        if not all(c in '0123456789abcdef_' for c in chave):
+            raise KeyError(f'Chave de cache inválida: {chave}')
+        return os.path.join(self.diretorio, f'{chave}.json.gz')
+
+    def _marca(self, nome: str) -> float:
+        try:
+            return os.path.getmtime(os.path.join(self.diretorio, nome))
+        except FileNotFoundError:
+            return 0.0
+
+    def _valida(self, chave: str, criado_em: float) -> bool:
+        matriz_id = chave.split('_', 1)[0]
+        return criado_em > max(self._marca(_MARCA_TUDO), self._marca(f'invalidado_{matriz_id}'))
+
+    def _remover(self, chave: str):
+        _, _, tamanho = self._memoria.pop(chave)
+        self._bytes -= tamanho
+
+    def _lembrar(self, chave: str, criado_em: float, resposta: Dict, tamanho: int):
+        if self.max_memoria <= 0 or tamanho > min(self.max_entrada_bytes, self.max_bytes):
+            return
+        if chave in self._memoria:
+            self._remover(chave)
+        self._memoria[chave] = (criado_em, resposta, tamanho)
+        self._bytes += tamanho
+        while len(self._memoria) > self.max_memoria or self._bytes > self.max_bytes:
+            self._remover(next(iter(self._memoria)))
+
+    def obter(self, chave: str) -> Optional[Dict]:
+        """Resposta em cache (None se ausente ou invalidada)."""
+        if chave in self._memoria:
+            criado_em, resposta, _ = self._memoria[chave]
+            if self._valida(chave, criado_em):
+                self._memoria.move_to_end(chave)
+                self.acertos += 1
+                return resposta
+            self._remover(chave)
+
+        if self.disco:
+            caminho = self._caminho(chave)
+            try:
+                criado_em = os.path.getmtime(caminho)
+                if self._valida(chave, criado_em):
+                    with gzip.open(caminho, 'rt', encoding='utf-8') as f:
+                        texto = f.read()
+                    resposta = json.loads(texto)
+                    self._lembrar(chave, criado_em, resposta, len(texto))
+                    self.acertos += 1
+                    return resposta
+            except (FileNotFoundError, OSError, json.JSONDecodeError):
+                pass
+
+        self.faltas += 1
+        return None
+
+    def guardar(self, chave: str, resposta: Dict):
+        agora = time.time()
+        # Tamanho aproximado da resposta em memória: o JSON serializado
+        texto = json.dumps(resposta, ensure_ascii=False)
+        self._lembrar(chave, agora, resposta, len(texto))
+        if self.disco:
+            caminho = self._caminho(chave)
+            tmp = f'{caminho}.{os.getpid()}.tmp'
+            with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+                f.write(texto)
+            os.replace(tmp, caminho)
+
+    def invalidar(self, matriz_id: Optional[str] = None) -> int:
+        """
+        Invalida as entradas de uma matriz (ou todas, se matriz_id for None).
+
+        Returns:
+            Entradas removidas deste worker e do disco
+        """
+        if matriz_id is not None and not all(c in '0123456789abcdef' for c in matriz_id):
+            raise KeyError(f'matriz_id inválido: {matriz_id}')
+        nome_marca = _MARCA_TUDO if matriz_id is None else f'invalidado_{matriz_id}'
+        with open(os.path.join(self.diretorio, nome_marca), 'w') as f:
+            f.write(str(time.time()))
+
+        prefixo = '' if matriz_id is None else f'{matriz_id}_'
+        removidas = [chave for chave in self._memoria if chave.startswith(prefixo)]
+        for chave in removidas:
+            self._remover(chave)
+        total = len(removidas)
+        if self.disco:
+            for nome in os.listdir(self.diretorio):
+                if nome.endswith('.json.gz') and nome.startswith(prefixo):
+                    try:
+                        os.remove(os.path.join(self.diretorio, nome))
+                        total += 1
+                    except FileNotFoundError:
+                        pass
+        return total
+
+    def estatisticas(self) -> Dict:
+        return {
+            'entradas_memoria': len(self._memoria),
+            'max_memoria': self.max_memoria,
+            'bytes_memoria': self._bytes,
+            'max_bytes': self.max_bytes,
+            'disco': self.disco,
+            'acertos': self.acertos,
+            'faltas': self.faltas,
+        }
@@ -0,0 +1,342 @@
+"""
+╔════════════════════════════════════════════════════════════════════════════════╗
+║                                                                                ║
+║              TRI V2 - CALIBRAÇÃO DE ITENS (MML / EM, 2PL e 3PL)                ║
+║                                                                                ║
+║  • Ajusta a, b (e c) a partir de uma matriz de respostas armazenada           ║
+║  • Máxima verossimilhança marginal via EM (Bock-Aitkin), θ ~ N(0, 1)          ║
+║  • Passo E vetorizado (alunos × nós), passo M por Fisher scoring em lote      ║
+║  • Partida a quente a partir de calibração anterior; cache por prova          ║
+║                                                                                ║
+╚════════════════════════════════════════════════════════════════════════════════╝
+
+Provas de escola não têm parâmetros publicados: a calibração fornece os
+parâmetros usados pelo modo 'irt' (tri_irt.py). Cada área é calibrada
+separadamente, com a proficiência da turma na métrica N(0, 1).
+"""
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+import numpy as np
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from tri_v2_producao import normalizar_areas_config
+from tri_matriz import MatrizRespostas
+from tri_irt import EstimadorIRT, ParametrosItens, matrizes_area
+
+MODELOS = ('2pl', '3pl')
+
+# Prioris fracas: mantêm itens degenerados (todos acertam / ninguém acerta)
+# dentro de valores plausíveis sem puxar itens bem determinados
+PRIORI_LOG_A_DESVIO = 0.5          # log a ~ N(0, 0.5²)
+PRIORI_B_DESVIO = 2.0              # b ~ N(0, 2²)
+PRIORI_C_BETA = (5.0, 17.0)        # c ~ Beta(5, 17), média ≈ 0.23 (5 alternativas)
+
+LIMITES_A = (0.05, 5.0)
+LIMITES_B = (-6.0, 6.0)
+LIMITES_C = (1e-3, 0.5)
+_EPS = 1e-10
+
+
+# ════════════════════════════════════════════════════════════════════════════════
+# 1. EM POR ÁREA
+# ════════════════════════════════════════════════════════════════════════════════
+
+@dataclass
+class ResultadoCalibracao:
+    parametros: ParametrosItens
+    modelo: str
+    iteracoes: Dict[str, int]
+    convergiu: Dict[str, bool]
+    log_verossimilhanca: Dict[str, float]
+    tempo: float
+
+    def para_dict(self) -> Dict:
+        return {
+            'modelo': self.modelo,
+            'parametros': self.parametros.para_dict(),
+            'iteracoes': self.iteracoes,
+            'convergiu': self.convergiu,
+            'log_verossimilhanca': self.log_verossimilhanca,
+            'tempo': round(self.tempo, 3),
+        }
+
+
+class CalibradorMML:
+    """Calibração 2PL/3PL por máxima verossimilhança marginal (EM)."""
+
+    def __init__(self, modelo: str = '3pl', max_iter: int = 500, tol: float = 1e-4,
+                 n_nos: int = 41, limite: float = 4.0, passos_m: int = 3):
+        """
+        Args:
+            modelo: '2pl' ou '3pl'
+            max_iter: Máximo de ciclos EM
+            tol: Convergência (maior mudança absoluta em a, b, c)
+            n_nos: Pontos de quadratura
+            limite: Grade em [-limite, limite]
+            passos_m: Iterações de Fisher scoring por passo M
+        """
+        if modelo not in MODELOS:
+            raise ValueError(f'Modelo inválido: {modelo}. Use: {MODELOS}')
+        self.modelo = modelo
+        self.max_iter = max_iter
+        self.tol = tol
+        self.passos_m = passos_m
+        self.motor = EstimadorIRT(n_nos=n_nos, limite=limite)
+
+    def _passo_e(self, acertos, observadas, a, b, c) -> Tuple[np.ndarray, np.ndarray, float]:
+        """
+        Contagens esperadas por questão × nó.
+
+        Returns:
+            (r, n, log L) - r = acertos esperados, n = respondentes esperados
+        """
+        motor = self.motor
+        r = np.zeros((a.shape[0], motor.nos.shape[0]))
+        n = np.zeros_like(r)
+        log_marginal = 0.0
+        for inicio in range(0, acertos.shape[0], motor.bloco):
+            u = acertos[inicio:inicio + motor.bloco]
+            obs = observadas[inicio:inicio + motor.bloco]
+            log_post = motor.log_verossimilhanca(u, obs, a, b, c) + motor.log_prior
+            maximo = log_post.max(axis=1, keepdims=True)
+            post = np.exp(log_post - maximo)
+            soma = post.sum(axis=1, keepdims=True)
+            post /= soma
+            log_marginal += float((np.log(soma) + maximo).sum())
+            r += u.T @ post
+            n += obs.T @ post
+        return r, n, log_marginal
+
+    def _passo_m(self, r, n, a, b, c) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Fisher scoring simultâneo em todas as questões (sistemas 2×2 ou 3×3)."""
+        nos = self.motor.nos[None, :]
+        d = self.motor.fator_d
+        tres = self.modelo == '3pl'
+        alfa_c, beta_c = PRIORI_C_BETA
+
+        for _ in range(self.passos_m):
+            logistica = 1.0 / (1.0 + np.exp(-d * a[:, None] * (nos - b[:, None])))
+            p = np.clip(c[:, None] + (1.0 - c[:, None]) * logistica, _EPS, 1.0 - _EPS)
+            pq = p * (1.0 - p)
+            residuo = (r - n * p) / pq
+            peso = n / pq
+
+            inclinacao = (1.0 - c[:, None]) * logistica * (1.0 - logistica) * d
+            derivadas = [inclinacao * (nos - b[:, None]), -inclinacao * a[:, None]]
+            if tres:
+                derivadas.append(1.0 - logistica)
+            derivadas = np.stack(derivadas)                              # (m, q, nós)
+
+            gradiente = np.einsum('qk,mqk->qm', residuo, derivadas)
+            informacao = np.einsum('qk,iqk,jqk->qij', peso, derivadas, derivadas)
+
+            # Prioris
+            log_a = np.log(a)
+            gradiente[:, 0] += -(1.0 + log_a / PRIORI_LOG_A_DESVIO ** 2) / a
+            informacao[:, 0, 0] += 1.0 / (PRIORI_LOG_A_DESVIO * a) ** 2
+            gradiente[:, 1] += -b / PRIORI_B_DESVIO ** 2
+            informacao[:, 1, 1] += 1.0 / PRIORI_B_DESVIO ** 2
+            if tres:
+                gradiente[:, 2] += (alfa_c - 1.0) / c - (beta_c - 1.0) / (1.0 - c)
+                informacao[:, 2, 2] += (alfa_c - 1.0) / c ** 2 + (beta_c - 1.0) / (1.0 - c) ** 2
+
+            informacao += 1e-8 * np.eye(informacao.shape[1])
+            passo = np.clip(np.linalg.solve(informacao, gradiente[:, :, None])[:, :, 0], -1.0, 1.0)
+
+            a = np.clip(a + passo[:, 0], *LIMITES_A)
+            b = np.clip(b + passo[:, 1], *LIMITES_B)
+            if tres:
+                c = np.clip(c + passo[:, 2], *LIMITES_C)
+        return a, b, c
+
+    def _iniciais(self, acertos, observadas) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """a = 1, c = 0.2 (3PL) e b pela proporção de acerto da questão."""
+        q = acertos.shape[1]
+        c = np.full(q, 0.2 if self.modelo == '3pl' else 0.0)
+        pct = (acertos.sum(axis=0) + 0.5) / (observadas.sum(axis=0) + 1.0)
+        pct = np.clip((pct - c) / (1.0 - c), 0.02, 0.98)
+        b = np.clip(-np.log(pct / (1.0 - pct)), *LIMITES_B)
+        return np.ones(q), b, c
+
+    def calibrar_area(self, acertos: np.ndarray, observadas: np.ndarray,
+                      inicial: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None) -> Dict:
+        """
+        EM para uma área.
+
+        Args:
+            acertos, observadas: Matrizes 0/1 alunos × questões
+            inicial: (a, b, c) para partida a quente (NaN = usar padrão)
+        """
+        acertos = acertos.astype(np.float64)
+        observadas = observadas.astype(np.float64)
+        a, b, c = self._iniciais(acertos, observadas)
+        if inicial is not None:
+            for atual, anterior in zip((a, b, c), inicial):
+                conhecido = ~np.isnan(anterior)
+                atual[conhecido] = anterior[conhecido]
+            if self.modelo == '2pl':
+                c[:] = 0.0
+            else:
+                c = np.clip(c, *LIMITES_C)
+
+        log_l = -np.inf
+        convergiu = False
+        iteracao = 0
+        for iteracao in range(1, self.max_iter + 1):
+            r, n, log_l = self._passo_e(acertos, observadas, a, b, c)
+            novo_a, novo_b, novo_c = self._passo_m(r, n, a, b, c)
+            mudanca = max(np.max(np.abs(novo_a - a), initial=0.0),
+                          np.max(np.abs(novo_b - b), initial=0.0),
+                          np.max(np.abs(novo_c - c), initial=0.0))
+            a, b, c = novo_a, novo_b, novo_c
+            if mudanca < self.tol:
+                convergiu = True
+                break
+
+        return {'a': a, 'b': b, 'c': c, 'iteracoes': iteracao,
+                'convergiu': convergiu, 'log_verossimilhanca': log_l}
+
+    def calibrar(self, matriz: MatrizRespostas, areas_config: dict,
+                 inicial: Optional[ParametrosItens] = None) -> ResultadoCalibracao:
+        """
+        Calibra todas as questões ativas, área por área.
+
+        Args:
+            matriz: Matriz de respostas (ex.: do RepositorioMatrizes)
+            areas_config: Mesmo formato de processar_turma
+            inicial: Calibração anterior da prova (partida a quente)
+        """
+        inicio = time.time()
+        areas = normalizar_areas_config(areas_config)
+        parametros: Dict[int, Tuple[float, float, float]] = {}
+        iteracoes, convergiu, log_l = {}, {}, {}
+
+        for area, (start, end) in areas.items():
+            questoes, acertos, observadas = matrizes_area(matriz, start, end)
+            if questoes.size == 0:
+                continue
+            chute = None
+            if inicial is not None:
+                posicao = {int(q): i for i, q in enumerate(inicial.questoes)}
+                idx = [posicao.get(int(q)) for q in questoes]
+                chute = tuple(
+                    np.array([valores[i] if i is not None else np.nan for i in idx])
+                    for valores in (inicial.a, inicial.b, inicial.c)
+                )
+            ajuste = self.calibrar_area(acertos, observadas, chute)
+            for j, q in enumerate(questoes.tolist()):
+                parametros[q] = (ajuste['a'][j], ajuste['b'][j], ajuste['c'][j])
+            iteracoes[area] = ajuste['iteracoes']
+            convergiu[area] = ajuste['convergiu']
+            log_l[area] = ajuste['log_verossimilhanca']
+            print(f"📊 [TRI CALIB] {area}: {len(questoes)} questões, {ajuste['iteracoes']} iterações EM "
+                  f"({'convergiu' if ajuste['convergiu'] else 'NÃO convergiu'})")
+
+        questoes = sorted(parametros)
+        return ResultadoCalibracao(
+            parametros=ParametrosItens(
+                questoes=np.array(questoes, dtype=np.int32),
+                a=np.array([parametros[q][0] for q in questoes]),
+                b=np.array([parametros[q][1] for q in questoes]),
+                c=np.array([parametros[q][2] for q in questoes]),
+            ),
+            modelo=self.modelo,
+            iteracoes=iteracoes,
+            convergiu=convergiu,
+            log_verossimilhanca=log_l,
+            tempo=time.time() - inicio,
+        )
+
+
+# ════════════════════════════════════════════════════════════════════════════════
+# 2. CACHE DE CALIBRAÇÕES
+# ════════════════════════════════════════════════════════════════════════════════
+
+class RepositorioCalibracoes:
+    """
+    Calibrações por (matriz, modelo), em disco (.json) e em memória.
+
+    Cada prova (prova_id escolhido pelo cliente) aponta para sua calibração
+    mais recente, usada como partida a quente quando a turma muda.
+    """
+
+    def __init__(self, diretorio: Optional[str] = None, max_memoria: int = 64):
+        self.diretorio = diretorio or os.getenv(
+            'TRI_CALIBRACAO_DIR', os.path.join(tempfile.gettempdir(), 'tri_calibracoes')
+        )
+        os.makedirs(self.diretorio, exist_ok=True)
+        self.max_memoria = max_memoria
+        self._memoria: 'OrderedDict[str, Dict]' = OrderedDict()
+
+    @staticmethod
+    def gerar_id(matriz_id: str, modelo: str) -> str:
+        return hashlib.sha256(f'{matriz_id}:{modelo}'.encode('utf-8')).hexdigest()
+
+    def _caminho(self, calibracao_id: str) -> str:
+        if not calibracao_id or not all(c in '0123456789abcdef' for c in calibracao_id):
+            raise KeyError(f'calibracao_id inválido: {calibracao_id}')
+        return os.path.join(self.diretorio, f'{calibracao_id}.json')
+
+    def _caminho_prova(self, prova_id: str) -> str:
+        chave = hashlib.sha256(str(prova_id).encode('utf-8')).hexdigest()
+        return os.path.join(self.diretorio, f'prova_{chave}.json')
+
+    @staticmethod
+    def _gravar(caminho: str, conteudo: Dict):
+        tmp = f'{caminho}.{os.getpid()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(conteudo, f, ensure_ascii=False)
+        os.replace(tmp, caminho)
+
+    def _lembrar(self, calibracao_id: str, registro: Dict):
+        self._memoria[calibracao_id] = registro
+        self._memoria.move_to_end(calibracao_id)
+        while len(self._memoria) > self.max_memoria:
+            self._memoria.popitem(last=False)
+
+    def salvar(self, matriz_id: str, resultado: ResultadoCalibracao, prova_id: Optional[str] = None) -> str:
+        calibracao_id = self.gerar_id(matriz_id, resultado.modelo)
+        registro = dict(resultado.para_dict(), matriz_id=matriz_id, prova_id=prova_id,
+                        calibracao_id=calibracao_id)
+        self._gravar(self._caminho(calibracao_id), registro)
+        if prova_id:
+            self._gravar(self._caminho_prova(prova_id), {'calibracao_id': calibracao_id})
+        self._lembrar(calibracao_id, registro)
+        return calibracao_id
+
+    def carregar(self, calibracao_id: str) -> Dict:
+        """
+        Returns:
+            Registro com 'parametros' ({"1": {"a", "b", "c"}, ...}) e metadados
+
+        Raises:
+            KeyError: se a calibração não existir
+        """
+        if calibracao_id in self._memoria:
+            self._memoria.move_to_end(calibracao_id)
+            return self._memoria[calibracao_id]
+        caminho = self._caminho(calibracao_id)
+        if not os.path.exists(caminho):
+            raise KeyError(f'Calibração não encontrada: {calibracao_id}')
+        with open(caminho, 'r', encoding='utf-8') as f:
+            registro = json.load(f)
+        self._lembrar(calibracao_id, registro)
+        return registro
+
+    def ultima_da_prova(self, prova_id: str) -> Optional[Dict]:
+        """Calibração mais recente da prova (None se não houver)."""
+        caminho = self._caminho_prova(prova_id)
+        if not os.path.exists(caminho):
+            return None
+        with open(caminho, 'r', encoding='utf-8') as f:
+            calibracao_id = json.load(f)['calibracao_id']
+        try:
+            return self.carregar(calibracao_id)
+        except KeyError:
+            return None
@@ -0,0 +1,263 @@
+"""
+╔════════════════════════════════════════════════════════════════════════════════╗
+║                                                                                ║
+║              TRI V2 - EXPORTAÇÃO COLUNAR (PARQUET / ARROW IPC)                 ║
+║                                                                                ║
+║  • Alunos: respostas, acertos e TRI por área, tri_geral e TCT                 ║
+║  • Itens: estatísticas de tri_analise_itens (p-valor, bisserial, ...)         ║
+║  • Arrow IPC sem compressão: releitura por memory map (sem cópia)             ║
+║  • pyarrow é opcional: sem ele só a exportação fica indisponível              ║
+║                                                                                ║
+╚════════════════════════════════════════════════════════════════════════════════╝
+
+As respostas vão numa única coluna fixed_size_list<uint8>[questões] com os
+códigos de tri_matriz (A-E = 0-4, branco, dupla, ...): o buffer de valores é
+a própria matriz alunos × questões, reconstruída com um reshape.
+Gabarito, questões, areas_config e prova_analysis ficam nos metadados do schema.
+"""
+
+import os
+import json
+import tempfile
+import numpy as np
+from typing import Dict, Optional, Tuple
+
+from tri_v2_producao import AREAS_TRI, normalizar_areas_config
+from tri_matriz import MatrizRespostas, EstadoTurma, TRIVetorizado, OPCOES
+from tri_analise_itens import analisar_itens
+from tri_irt import ParametrosItens, pontuar_matriz_irt, analisar_prova_irt
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.parquet as pq
+    PYARROW_DISPONIVEL = True
+except ImportError:
+    pa = pa_ipc = pq = None
+    PYARROW_DISPONIVEL = False
+
+FORMATOS = ('parquet', 'arrow')
+TABELAS = ('alunos', 'itens')
+EXTENSOES = {'parquet': 'parquet', 'arrow': 'arrow'}
+_PREFIXO_META = 'tri.'
+
+
+class ExportacaoIndisponivel(RuntimeError):
+    """pyarrow não instalado."""
+
+
+def _exigir_pyarrow():
+    if not PYARROW_DISPONIVEL:
+        raise ExportacaoIndisponivel('Exportação colunar requer pyarrow (pip install pyarrow)')
+
+
+def _metadados(**campos) -> Dict[bytes, bytes]:
+    return {
+        f'{_PREFIXO_META}{nome}'.encode('utf-8'): json.dumps(valor, ensure_ascii=False, default=str).encode('utf-8')
+        for nome, valor in campos.items()
+    }
+
+
+def ler_metadados(tabela) -> Dict:
+    """Metadados tri.* do schema, já decodificados."""
+    meta = tabela.schema.metadata or {}
+    return {
+        chave.decode('utf-8')[len(_PREFIXO_META):]: json.loads(valor)
+        for chave, valor in meta.items() if chave.startswith(_PREFIXO_META.encode('utf-8'))
+    }
+
+
+# ════════════════════════════════════════════════════════════════════════════════
+# 1. TABELAS
+# ════════════════════════════════════════════════════════════════════════════════
+
+def tabela_alunos(vetorizado: TRIVetorizado, matriz: MatrizRespostas, areas_config: dict,
+                  matriz_id: Optional[str] = None, opcoes: Optional[Dict] = None):
+    """
+    Uma linha por aluno, com as notas do mesmo motor do cálculo original.
+
+    opcoes (de RepositorioMatrizes): modo 'tabela' usa o caminho vetorizado
+    (tabela oficial); modo 'irt', as notas 3PL (áreas fora de areas_config
+    ficam nulas).
+    """
+    _exigir_pyarrow()
+    areas = normalizar_areas_config(areas_config)
+    opcoes = opcoes or {'modo': 'tabela'}
+    n, q = matriz.respostas.shape
+
+    if opcoes.get('modo', 'tabela') == 'irt':
+        estimador = opcoes.get('estimador', 'eap')
+        irt = pontuar_matriz_irt(matriz, areas_config, ParametrosItens.de_dict(opcoes['parametros_itens']), estimador)
+        acertos = irt['acertos']
+        notas = {area: pa.array(irt['notas'][area]) if area in irt['notas'] else pa.nulls(n, pa.float64())
+                 for area in AREAS_TRI}
+        tri_geral, tct = irt['tri_geral'], irt['tct']
+        prova_analysis = analisar_prova_irt(matriz, tri_geral, tct, estimador)
+    else:
+        estado = EstadoTurma(matriz, areas)
+        pontuacao = vetorizado.pontuar(estado)
+        acertos = pontuacao.acertos
+        notas = {area: pa.array(np.round(pontuacao.tri[area], 1)) for area in AREAS_TRI}
+        tri_geral, tct = pontuacao.tri_geral, pontuacao.tct
+        prova_analysis = TRIVetorizado.analisar_prova(pontuacao, estado)
+
+    valores = pa.array(np.ascontiguousarray(matriz.respostas).reshape(-1), type=pa.uint8())
+    colunas = {
+        'id': pa.array(matriz.ids, type=pa.string()),
+        'nome': pa.array(matriz.nomes, type=pa.string()),
+        'turma': pa.array(matriz.turmas, type=pa.string()),
+        'escola': pa.array(matriz.escolas, type=pa.string()),
+        'respostas': pa.FixedSizeListArray.from_arrays(valores, q),
+    }
+    for area in AREAS_TRI:
+        colunas[f'acertos_{area.lower()}'] = pa.array(np.asarray(acertos[area]).astype(np.int16))
+    for area in AREAS_TRI:
+        colunas[f'tri_{area.lower()}'] = notas[area]
+    colunas['tri_geral'] = pa.array(tri_geral)
+    colunas['tct'] = pa.array(tct)
+
+    tabela = pa.table(colunas)
+    return tabela.replace_schema_metadata(_metadados(
+        matriz_id=matriz_id,
+        questoes=matriz.questoes.tolist(),
+        gabarito=matriz.gabarito.tolist(),
+        opcoes=list(OPCOES),
+        areas_config={area: list(limites) for area, limites in areas.items()},
+        prova_analysis=prova_analysis,
+        calculo=opcoes,
+    ))
+
+
+def tabela_itens(matriz: MatrizRespostas, areas_config: dict, matriz_id: Optional[str] = None):
+    """Uma linha por questão (analisar_itens), com a distribuição de respostas em colunas."""
+    _exigir_pyarrow()
+    analise = analisar_itens(matriz, areas_config)
+    itens = analise['itens']
+    rotulos = list(itens[0]['distribuicao'].keys()) if itens else list(OPCOES) + ['branco', 'dupla']
+
+    colunas = {
+        'questao': pa.array([item['questao'] for item in itens], type=pa.int32()),
+        'areas': pa.array([item['areas'] for item in itens], type=pa.list_(pa.string())),
+        'gabarito': pa.array([item['gabarito'] for item in itens], type=pa.string()),
+        'anulada': pa.array([item['anulada'] for item in itens], type=pa.bool_()),
+        'dificuldade': pa.array([item['dificuldade'] for item in itens], type=pa.string()),
+    }
+    for campo in ('p_valor', 'ponto_bisserial', 'discriminacao', 'p_superior', 'p_inferior'):
+        colunas[campo] = pa.array([item[campo] for item in itens], type=pa.float64())
+    for rotulo in rotulos:
+        colunas[f'resp_{rotulo.lower()}'] = pa.array([item['distribuicao'][rotulo] for item in itens], type=pa.int64())
+
+    tabela = pa.table(colunas)
+    return tabela.replace_schema_metadata(_metadados(
+        matriz_id=matriz_id,
+        total_alunos=analise['total_alunos'],
+        tamanho_grupos_27=analise['tamanho_grupos_27'],
+        areas=analise['areas'],
+    ))
+
+
+# ════════════════════════════════════════════════════════════════════════════════
+# 2. ESCRITA / LEITURA
+# ════════════════════════════════════════════════════════════════════════════════
+
+def escrever(tabela, caminho: str, formato: str):
+    """
+    Grava de forma atômica (arquivo temporário + rename).
+
+    Arrow IPC sai sem compressão e num único lote, para que ler() possa mapear
+    as colunas direto do arquivo.
+    """
+    _exigir_pyarrow()
+    if formato not in FORMATOS:
+        raise ValueError(f'Formato inválido: {formato}. Use: {FORMATOS}')
+    tmp = f'{caminho}.{os.getpid()}.tmp'
+    if formato == 'parquet':
+        pq.write_table(tabela, tmp, compression='zstd')
+    else:
+        tabela = tabela.combine_chunks()
+        with pa.OSFile(tmp, 'wb') as sink, pa_ipc.new_file(sink, tabela.schema) as escritor:
+            escritor.write_table(tabela)
+    os.replace(tmp, caminho)
+
+
+def ler(caminho: str):
+    """
+    Lê uma tabela exportada.
+
+    .arrow: memory map (as colunas apontam para as páginas do arquivo);
+    .parquet: decodificado em memória.
+    """
+    _exigir_pyarrow()
+    if caminho.endswith('.parquet'):
+        return pq.read_table(caminho, memory_map=True)
+    return pa_ipc.open_file(pa.memory_map(caminho, 'r')).read_all()
+
+
+def matriz_de_tabela(tabela) -> Tuple[MatrizRespostas, dict]:
+    """
+    Reconstrói (matriz, areas_config) a partir da tabela de alunos.
+
+    Com tabela lida de um .arrow, respostas é uma view somente-leitura sobre
+    o arquivo mapeado (nenhuma cópia da matriz).
+    """
+    meta = ler_metadados(tabela)
+    questoes = np.array(meta['questoes'], dtype=np.int32)
+    coluna = tabela.column('respostas')
+    lista = coluna.chunk(0) if coluna.num_chunks == 1 else coluna.combine_chunks()
+    valores = lista.values.slice(lista.offset * len(questoes), len(lista) * len(questoes))
+    respostas = valores.to_numpy(zero_copy_only=True).reshape(len(lista), len(questoes))
+
+    matriz = MatrizRespostas(
+        questoes=questoes,
+        respostas=respostas,
+        gabarito=np.array(meta['gabarito'], dtype=np.uint8),
+        nomes=tabela.column('nome').to_pylist(),
+        ids=tabela.column('id').to_pylist(),
+        turmas=tabela.column('turma').to_pylist(),
+        escolas=tabela.column('escola').to_pylist(),
+    )
+    return matriz, {k: tuple(v) for k, v in meta['areas_config'].items()}
+
+
+# ════════════════════════════════════════════════════════════════════════════════
+# 3. ARQUIVOS POR MATRIZ
+# ════════════════════════════════════════════════════════════════════════════════
+
+class RepositorioExportacoes:
+    """
+    Exportações por (matriz_id, tabela, formato) em disco.
+
+    O conteúdo de um matriz_id nunca muda (hash das respostas, gabarito,
+    áreas e opções de cálculo), então cada arquivo é gerado uma única vez e servido depois.
+    Os arquivos têm nomes e ids dos alunos: o diretório é registrado em
+    RepositorioMatrizes.registrar_derivados e cada exportação sai com a matriz.
+    """
+
+    def __init__(self, diretorio: Optional[str] = None):
+        self.diretorio = diretorio or os.getenv(
+            'TRI_EXPORT_DIR', os.path.join(tempfile.gettempdir(), 'tri_exportacoes')
+        )
+        os.makedirs(self.diretorio, exist_ok=True)
+
+    def caminho(self, matriz_id: str, tabela: str, formato: str) -> str:
+        if not matriz_id or not all(c in '0123456789abcdef' for c in matriz_id):
+            raise KeyError(f'matriz_id inválido: {matriz_id}')
+        if tabela not in TABELAS:
+            raise ValueError(f'Tabela inválida: {tabela}. Use: {TABELAS}')
+        if formato not in FORMATOS:
+            raise ValueError(f'Formato inválido: {formato}. Use: {FORMATOS}')
+        return os.path.join(self.diretorio, f'{matriz_id}.{tabela}.{EXTENSOES[formato]}')
+
+    def exportar(self, vetorizado: TRIVetorizado, matriz_id: str, matriz: MatrizRespostas,
+                 areas_config: dict, tabela: str = 'alunos', formato: str = 'parquet',
+                 opcoes: Optional[Dict] = None) -> str:
+        """Caminho do arquivo, gerando-o se ainda não existir."""
+        _exigir_pyarrow()
+        caminho = self.caminho(matriz_id, tabela, formato)
+        if not os.path.exists(caminho):
+            if tabela == 'alunos':
+                conteudo = tabela_alunos(vetorizado, matriz, areas_config, matriz_id, opcoes)
+            else:
+                conteudo = tabela_itens(matriz, areas_config, matriz_id)
+            escrever(conteudo, caminho, formato)
+        return caminho
@@ -0,0 +1,290 @@
+"""
+╔════════════════════════════════════════════════════════════════════════════════╗
+║                                                                                ║
+║              TRI V2 - MODELO LOGÍSTICO DE 3 PARÂMETROS (EAP / MAP)             ║
+║                                                                                ║
+║  • Parâmetros a, b, c por questão (publicados ou calibrados)                  ║
+║  • Proficiência por EAP ou MAP sobre grade fixa de quadratura                 ║
+║  • Verossimilhança em log: alunos × questões × nós, contraída por matmul      ║
+║  • Resultado na escala do ENEM (média 500, desvio 100)                        ║
+║                                                                                ║
+╚════════════════════════════════════════════════════════════════════════════════╝
+"""
+
+import numpy as np
+from dataclasses import dataclass
+from typing import Dict, List, Tuple, Optional
+
+from tri_v2_producao import AREAS_TRI, DIFICULDADES, normalizar_areas_config
+from tri_matriz import MatrizRespostas, COD_AUSENTE, classificar_dificuldades
+
+ESCALA_MEDIA = 500.0
+ESCALA_DESVIO = 100.0
+ESTIMADORES = ('eap', 'map')
+
+# Evita log(0) quando c = 0 e a·(θ-b) é extremo
+_EPS = 1e-10
+
+
+# ════════════════════════════════════════════════════════════════════════════════
+# 1. PARÂMETROS DOS ITENS
+# ════════════════════════════════════════════════════════════════════════════════
+
+@dataclass
+class ParametrosItens:
+    """Parâmetros 3PL por questão (c = 0 para 2PL)."""
+    questoes: np.ndarray   # (q,) número da questão
+    a: np.ndarray          # (q,) discriminação
+    b: np.ndarray          # (q,) dificuldade (métrica θ, média 0 / desvio 1)
+    c: np.ndarray          # (q,) acerto ao acaso
+
+    @classmethod
+    def de_dict(cls, parametros: dict) -> 'ParametrosItens':
+        """
+        Args:
+            parametros: {"1": {"a": 1.2, "b": 0.4, "c": 0.18}, ...}
+        """
+        chaves = sorted(parametros.keys(), key=int)
+        try:
+            return cls(
+                questoes=np.array([int(k) for k in chaves], dtype=np.int32),
+                a=np.array([float(parametros[k]['a']) for k in chaves]),
+                b=np.array([float(parametros[k]['b']) for k in chaves]),
+                c=np.array([float(parametros[k].get('c', 0.0)) for k in chaves]),
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f'parametros_itens inválido: {e}')
+
+    def para_dict(self) -> Dict[str, Dict[str, float]]:
+        return {
+            str(int(q)): {'a': float(a), 'b': float(b), 'c': float(c)}
+            for q, a, b, c in zip(self.questoes, self.a, self.b, self.c)
+        }
+
+    def selecionar(self, questoes: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """a, b, c na ordem de `questoes` (ValueError se faltar alguma)."""
+        posicao = {int(q): i for i, q in enumerate(self.questoes)}
+        faltando = [int(q) for q in questoes if int(q) not in posicao]
+        if faltando:
+            raise ValueError(f'Parâmetros ausentes para as questões: {faltando}')
+        idx = np.array([posicao[int(q)] for q in questoes], dtype=np.int64)
+        return self.a[idx], self.b[idx], self.c[idx]
+
+
+def probabilidade(theta: np.ndarray, a: np.ndarray, b: np.ndarray, c: np.ndarray,
+                  fator_d: float = 1.0) -> np.ndarray:
+    """P(acerto) 3PL para cada θ × questão → (len(theta), q)."""
+    z = fator_d * a[None, :] * (theta[:, None] - b[None, :])
+    return c[None, :] + (1.0 - c[None, :]) / (1.0 + np.exp(-z))
+
+
+def para_escala_enem(theta: np.ndarray) -> np.ndarray:
+    return ESCALA_MEDIA + ESCALA_DESVIO * theta
+
+
+# ════════════════════════════════════════════════════════════════════════════════
+# 2. ESTIMAÇÃO DA PROFICIÊNCIA
+# ════════════════════════════════════════════════════════════════════════════════
+
+class EstimadorIRT:
+    """
+    EAP / MAP vetorizados para uma área.
+
+    log L(aluno, nó) = Σ_q [u·log P + (1-u)·log Q] sobre as questões
+    observadas. O tensor alunos × questões × nós nunca é materializado:
+    a soma em q é um produto de matrizes (n × q) @ (q × nós), feito em
+    blocos de alunos para limitar a memória.
+    """
+
+    def __init__(self, n_nos: int = 61, limite: float = 6.0, fator_d: float = 1.0,
+                 bloco: int = 20000, iteracoes_map: int = 20):
+        """
+        Args:
+            n_nos: Pontos da grade de quadratura
+            limite: Grade em [-limite, limite] (métrica θ)
+            fator_d: 1.0 para métrica logística, 1.7 para métrica normal
+            bloco: Alunos por bloco
+            iteracoes_map: Máximo de iterações de Fisher scoring no MAP
+        """
+        self.nos = np.linspace(-limite, limite, n_nos)
+        self.log_prior = -0.5 * self.nos ** 2
+        self.log_prior -= np.logaddexp.reduce(self.log_prior)
+        self.limite = limite
+        self.fator_d = fator_d
+        self.bloco = max(1, int(bloco))
+        self.iteracoes_map = iteracoes_map
+
+    def log_verossimilhanca(self, acertos: np.ndarray, observadas: np.ndarray,
+                            a: np.ndarray, b: np.ndarray, c: np.ndarray) -> np.ndarray:
+        """(n, nós) - acertos/observadas são matrizes 0/1 alunos × questões."""
+        p = np.clip(probabilidade(self.nos, a, b, c, self.fator_d), _EPS, 1.0 - _EPS)
+        log_p, log_q = np.log(p), np.log1p(-p)
+        return acertos @ log_p.T + (observadas - acertos) @ log_q.T
+
+    def posterior(self, acertos, observadas, a, b, c) -> np.ndarray:
+        """Pesos normalizados da posteriori por nó → (n, nós)."""
+        log_post = self.log_verossimilhanca(acertos, observadas, a, b, c) + self.log_prior
+        log_post -= log_post.max(axis=1, keepdims=True)
+        post = np.exp(log_post)
+        post /= post.sum(axis=1, keepdims=True)
+        return post
+
+    def eap(self, acertos, observadas, a, b, c) -> Tuple[np.ndarray, np.ndarray]:
+        """Média e desvio da posteriori (θ, erro padrão)."""
+        n = acertos.shape[0]
+        theta = np.empty(n)
+        erro = np.empty(n)
+        for inicio in range(0, n, self.bloco):
+            fim = inicio + self.bloco
+            post = self.posterior(acertos[inicio:fim], observadas[inicio:fim], a, b, c)
+            media = post @ self.nos
+            theta[inicio:fim] = media
+            erro[inicio:fim] = np.sqrt(np.maximum(post @ self.nos ** 2 - media ** 2, 0.0))
+        return theta, erro
+
+    def _informacao(self, theta, observadas, a, b, c):
+        """Informação de Fisher do 3PL somada nas questões observadas (+1 da priori)."""
+        p = np.clip(probabilidade(theta, a, b, c, self.fator_d), _EPS, 1.0 - _EPS)
+        w = (p - c) / (1.0 - c)
+        da = self.fator_d * a
+        informacao = (observadas * (da ** 2 * w ** 2 * (1.0 - p) / p)).sum(axis=1) + 1.0
+        return p, w, informacao
+
+    def map(self, acertos, observadas, a, b, c) -> Tuple[np.ndarray, np.ndarray]:
+        """Moda da posteriori por Fisher scoring (priori N(0,1)), a partir do EAP."""
+        theta, _ = self.eap(acertos, observadas, a, b, c)
+        da = self.fator_d * a
+        for inicio in range(0, theta.shape[0], self.bloco):
+            # Só os alunos que ainda não convergiram seguem iterando
+            ativos = np.arange(inicio, min(inicio + self.bloco, theta.shape[0]))
+            for _ in range(self.iteracoes_map):
+                if ativos.size == 0:
+                    break
+                u, obs, t = acertos[ativos], observadas[ativos], theta[ativos]
+                p, w, informacao = self._informacao(t, obs, a, b, c)
+                gradiente = (obs * (u - p) * (da * w / p)).sum(axis=1) - t
+                passo = gradiente / informacao
+                theta[ativos] = np.clip(t + passo, -self.limite, self.limite)
+                ativos = ativos[np.abs(passo) >= 1e-6]
+
+        erro = np.empty_like(theta)
+        for inicio in range(0, theta.shape[0], self.bloco):
+            fim = inicio + self.bloco
+            _, _, informacao = self._informacao(theta[inicio:fim], observadas[inicio:fim], a, b, c)
+            erro[inicio:fim] = 1.0 / np.sqrt(informacao)
+        return theta, erro
+
+    def estimar(self, acertos, observadas, a, b, c, estimador: str = 'eap') -> Tuple[np.ndarray, np.ndarray]:
+        if estimador not in ESTIMADORES:
+            raise ValueError(f'Estimador inválido: {estimador}. Use: {ESTIMADORES}')
+        metodo = self.eap if estimador == 'eap' else self.map
+        return metodo(acertos.astype(np.float64), observadas.astype(np.float64), a, b, c)
+
+
+# ════════════════════════════════════════════════════════════════════════════════
+# 3. TURMA (MESMO FORMATO DE processar_turma)
+# ════════════════════════════════════════════════════════════════════════════════
+
+def matrizes_area(matriz: MatrizRespostas, start: int, end: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Acertos e questões observadas de uma área.
+
+    Branco e dupla marcação contam como erro; questão ausente no aluno
+    (chave qN inexistente) e questão anulada ficam fora da verossimilhança.
+    """
+    colunas = (matriz.questoes >= start) & (matriz.questoes <= end) & matriz.ativas()
+    acertos = matriz.acertos()[:, colunas]
+    observadas = matriz.respostas[:, colunas] != COD_AUSENTE
+    return matriz.questoes[colunas], acertos, observadas
+
+
+def pontuar_matriz_irt(matriz: MatrizRespostas, areas_config: dict, parametros: ParametrosItens,
+                       estimador: str = 'eap', motor: Optional[EstimadorIRT] = None) -> Dict:
+    """
+    Notas 3PL da turma em arrays (sem montar os resultados por aluno).
+
+    Returns:
+        {'notas': {área: (n,)}, 'erros': {área: (n,)}, 'acertos': {área: (n,)},
+         'tri_geral': (n,), 'tct': (n,)} — notas/erros só das áreas de areas_config
+    """
+    motor = motor or EstimadorIRT()
+    areas = normalizar_areas_config(areas_config)
+    n = matriz.n_alunos
+
+    acertos_area = {area: np.zeros(n, dtype=np.int64) for area in AREAS_TRI}
+    notas, erros = {}, {}
+    for area, (start, end) in areas.items():
+        questoes, acertos, observadas = matrizes_area(matriz, start, end)
+        a, b, c = parametros.selecionar(questoes)
+        theta, erro = motor.estimar(acertos, observadas, a, b, c, estimador)
+        acertos_area[area] = acertos.sum(axis=1)
+        notas[area] = np.round(para_escala_enem(theta), 1)
+        erros[area] = np.round(erro * ESCALA_DESVIO, 1)
+        print(f"📊 [TRI IRT] {area}: {len(questoes)} questões, {estimador.upper()} "
+              f"média {notas[area].mean() if n else 0:.1f}")
+
+    tri_geral = np.round(np.mean([notas[area] for area in notas], axis=0), 1) if notas else np.zeros(n)
+    total = sum(acertos_area.values())
+    tct = np.round(total / 90.0 * 4.0, 2)
+    return {'notas': notas, 'erros': erros, 'acertos': acertos_area, 'tri_geral': tri_geral, 'tct': tct}
+
+
+def analisar_prova_irt(matriz: MatrizRespostas, tri_geral: np.ndarray, tct: np.ndarray, estimador: str) -> Dict:
+    """prova_analysis do modo 'irt' (mesmos campos de processar_turma + modo/estimador)."""
+    n = matriz.n_alunos
+    if n == 0:
+        return {'total_alunos': 0, 'tri_medio': 0, 'tri_min': 0, 'tri_max': 0, 'tct_medio': 0,
+                'modo': 'irt', 'estimador': estimador}
+
+    classes = classificar_dificuldades(matriz.contagem_acertos() / n)
+    contagens = np.bincount(classes[matriz.ativas()], minlength=len(DIFICULDADES))
+    return {
+        'total_alunos': n,
+        'tri_medio': float(tri_geral.mean()),
+        'tri_min': float(tri_geral.min()),
+        'tri_max': float(tri_geral.max()),
+        'tct_medio': float(tct.mean()),
+        'questoes_stats': {dif: int(cnt) for dif, cnt in zip(DIFICULDADES, contagens)},
+        'modo': 'irt',
+        'estimador': estimador,
+    }
+
+
+def processar_matriz_irt(matriz: MatrizRespostas, areas_config: dict, parametros: ParametrosItens,
+                         estimador: str = 'eap', motor: Optional[EstimadorIRT] = None) -> Tuple[Dict, List[Dict]]:
+    """
+    Proficiência 3PL por área no formato de saída de processar_turma.
+
+    Áreas fora de areas_config ficam com tri None e não entram no tri_geral.
+    """
+    pontuacao = pontuar_matriz_irt(matriz, areas_config, parametros, estimador, motor)
+    notas, erros, acertos_area = pontuacao['notas'], pontuacao['erros'], pontuacao['acertos']
+    tri_geral, tct = pontuacao['tri_geral'], pontuacao['tct']
+    n = matriz.n_alunos
+
+    col_notas = {area: notas[area].tolist() for area in notas}
+    col_erros = {area: erros[area].tolist() for area in erros}
+    col_acertos = {area: acertos_area[area].tolist() for area in AREAS_TRI}
+    tri_geral_l, tct_l = tri_geral.tolist(), tct.tolist()
+
+    resultados = []
+    for k in range(n):
+        detalhes = {
+            area: {
+                'acertos': col_acertos[area][k],
+                'tri': col_notas[area][k],
+                'erro_padrao': col_erros[area][k],
+                'estimador': estimador,
+            }
+            for area in notas
+        }
+        resultado = {'tct': tct_l[k], 'tri_geral': tri_geral_l[k]}
+        for area in AREAS_TRI:
+            resultado[f'tri_{area.lower()}'] = col_notas[area][k] if area in col_notas else None
+        resultado['detalhes'] = detalhes
+        resultado['nome'] = matriz.nomes[k]
+        for area in AREAS_TRI:
+            resultado[f'{area.lower()}_acertos'] = col_acertos[area][k]
+        resultados.append(resultado)
+
+    return analisar_prova_irt(matriz, tri_geral, tct, estimador), resultados
@@ -0,0 +1,207 @@
+"""
+╔════════════════════════════════════════════════════════════════════════════════╗
+║                                                                                ║
+║              TRI V2 - JOBS ASSÍNCRONOS (SUBMETER / CONSULTAR)                  ║
+║                                                                                ║
+║  • Turmas grandes rodam num pool de processos fora do worker HTTP             ║
+║  • Estado e resultado em disco: qualquer worker do gunicorn responde          ║
+║  • Limite de jobs ativos por tenant (escola / rede)                           ║
+║                                                                                ║
+╚════════════════════════════════════════════════════════════════════════════════╝
+
+Fluxo: POST /api/calcular-tri (turma acima do limiar) → 202 + job_id;
+GET /api/jobs/<job_id> até status 'concluido' (ou 'erro').
+"""
+
+import os
+import json
+import time
+import uuid
+import fcntl
+import tempfile
+import traceback
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Optional
+
+PENDENTE = 'pendente'
+PROCESSANDO = 'processando'
+CONCLUIDO = 'concluido'
+ERRO = 'erro'
+ATIVOS = (PENDENTE, PROCESSANDO)
+
+
+class LimiteTenantExcedido(Exception):
+    """Tenant já tem o máximo de jobs ativos."""
+
+
+# ════════════════════════════════════════════════════════════════════════════════
+# 1. ARMAZENAMENTO (um .json de estado + um .resultado.json por job)
+# ════════════════════════════════════════════════════════════════════════════════
+
+def _gravar(caminho: str, conteudo: Dict):
+    tmp = f'{caminho}.{os.getpid()}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(conteudo, f, ensure_ascii=False)
+    os.replace(tmp, caminho)
+
+
+def _ler(caminho: str) -> Optional[Dict]:
+    try:
+        with open(caminho, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _caminho_estado(diretorio: str, job_id: str) -> str:
+    if not job_id or not all(c in '0123456789abcdef' for c in job_id):
+        raise KeyError(f'job_id inválido: {job_id}')
+    return os.path.join(diretorio, f'{job_id}.json')
+
+
+def _caminho_resultado(diretorio: str, job_id: str) -> str:
+    return os.path.join(diretorio, f'{job_id}.resultado.json')
+
+
+def _atualizar(diretorio: str, job_id: str, **campos):
+    caminho = _caminho_estado(diretorio, job_id)
+    estado = _ler(caminho) or {'job_id': job_id}
+    estado.update(campos)
+    _gravar(caminho, estado)
+
+
+def _executar_job(executar: Callable[[Dict], Dict], diretorio: str, job_id: str, dados: Dict):
+    """Roda no processo do pool: grava o resultado direto no disco."""
+    _atualizar(diretorio, job_id, status=PROCESSANDO, iniciado_em=time.time())
+    try:
+        resultado = executar(dados)
+        _gravar(_caminho_resultado(diretorio, job_id), resultado)
+        _atualizar(diretorio, job_id, status=CONCLUIDO, concluido_em=time.time())
+    except Exception as e:
+        _atualizar(diretorio, job_id, status=ERRO, concluido_em=time.time(),
+                   mensagem=str(e), trace=traceback.format_exc())
+
+
+# ════════════════════════════════════════════════════════════════════════════════
+# 2. GERENCIADOR
+# ════════════════════════════════════════════════════════════════════════════════
+
+class GerenciadorJobs:
+    """
+    Pool local de processos + estado em disco.
+
+    Cada worker do gunicorn tem seu pool (criado sob demanda); o limite por
+    tenant é verificado com lock de arquivo sobre todos os jobs do diretório.
+    """
+
+    def __init__(self, executar: Callable[[Dict], Dict], diretorio: Optional[str] = None,
+                 max_workers: Optional[int] = None, limite_por_tenant: Optional[int] = None,
+                 ttl: Optional[float] = None):
+        """
+        Args:
+            executar: Função de módulo (picklável) que recebe o corpo e retorna o resultado
+            diretorio: Estado dos jobs (padrão: TRI_JOBS_DIR ou /tmp/tri_jobs)
+            max_workers: Processos por worker HTTP (padrão: TRI_JOB_WORKERS ou 1)
+            limite_por_tenant: Jobs ativos por tenant (padrão: TRI_JOB_LIMITE_TENANT ou 2)
+            ttl: Segundos até um job terminado (ou travado) ser descartado
+        """
+        self.executar = executar
+        self.diretorio = diretorio or os.getenv(
+            'TRI_JOBS_DIR', os.path.join(tempfile.gettempdir(), 'tri_jobs')
+        )
+        os.makedirs(self.diretorio, exist_ok=True)
+        self.max_workers = max_workers or int(os.getenv('TRI_JOB_WORKERS', '1'))
+        self.limite_por_tenant = limite_por_tenant or int(os.getenv('TRI_JOB_LIMITE_TENANT', '2'))
+        self.ttl = ttl or float(os.getenv('TRI_JOB_TTL', '1800'))
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_pid: Optional[int] = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        # Pool criado no próprio worker (não herdado do master via fork)
+        if self._pool is None or self._pool_pid != os.getpid():
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            self._pool_pid = os.getpid()
+        return self._pool
+
+    @contextmanager
+    def _lock(self):
+        with open(os.path.join(self.diretorio, '.lock'), 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _estados(self):
+        for nome in os.listdir(self.diretorio):
+            if nome.endswith('.json') and not nome.endswith('.resultado.json'):
+                estado = _ler(os.path.join(self.diretorio, nome))
+                if estado:
+                    yield estado
+
+    def _expirado(self, estado: Dict, agora: float) -> bool:
+        referencia = estado.get('concluido_em') or estado.get('criado_em') or 0
+        return agora - referencia > self.ttl
+
+    def _limpar(self, agora: float):
+        """Remove jobs terminados (ou travados) há mais de ttl segundos."""
+        for estado in list(self._estados()):
+            if self._expirado(estado, agora):
+                for caminho in (_caminho_estado(self.diretorio, estado['job_id']),
+                                _caminho_resultado(self.diretorio, estado['job_id'])):
+                    try:
+                        os.remove(caminho)
+                    except FileNotFoundError:
+                        pass
+
+    def ativos(self, tenant: str) -> int:
+        agora = time.time()
+        return sum(
+            1 for estado in self._estados()
+            if estado.get('tenant') == tenant and estado.get('status') in ATIVOS
+            and not self._expirado(estado, agora)
+        )
+
+    def submeter(self, tenant: str, dados: Dict, tamanho: int = 0) -> str:
+        """
+        Enfileira um job.
+
+        Raises:
+            LimiteTenantExcedido: se o tenant já tiver limite_por_tenant jobs ativos
+        """
+        agora = time.time()
+        with self._lock():
+            self._limpar(agora)
+            if self.ativos(tenant) >= self.limite_por_tenant:
+                raise LimiteTenantExcedido(
+                    f'Tenant {tenant} já tem {self.limite_por_tenant} jobs em andamento. '
+                    'Aguarde a conclusão antes de enviar outro.'
+                )
+            job_id = uuid.uuid4().hex
+            _gravar(_caminho_estado(self.diretorio, job_id), {
+                'job_id': job_id,
+                'tenant': tenant,
+                'status': PENDENTE,
+                'tamanho': tamanho,
+                'criado_em': agora,
+            })
+        self._executor().submit(_executar_job, self.executar, self.diretorio, job_id, dados)
+        return job_id
+
+    def consultar(self, job_id: str) -> Dict:
+        """
+        Estado do job; com status 'concluido' inclui 'resultado'.
+
+        Raises:
+            KeyError: se o job não existir (ou já tiver expirado)
+        """
+        estado = _ler(_caminho_estado(self.diretorio, job_id))
+        if estado is None:
+            raise KeyError(f'Job não encontrado: {job_id}')
+        estado = dict(estado)
+        if estado['status'] in ATIVOS and self._expirado(estado, time.time()):
+            estado.update(status=ERRO, mensagem='Job expirou sem concluir (worker reiniciado?)')
+        if estado['status'] == CONCLUIDO:
+            estado['resultado'] = _ler(_caminho_resultado(self.diretorio, job_id))
+        return estado
@@ -0,0 +1,898 @@
+"""
+╔════════════════════════════════════════════════════════════════════════════════╗
+║                                                                                ║
+║              TRI V2 - MATRIZ DE RESPOSTAS (CAMINHO VETORIZADO)                 ║
+║                                                                                ║
+║  • Codifica a turma como matriz alunos × questões (uint8)                     ║
+║  • Reproduz processar_turma com operações de matriz (mesmas regras)           ║
+║  • Recorreção: anulação / troca de gabarito atualizando só a coluna afetada   ║
+║  • Repositório de matrizes em disco (.npz) para recorreções posteriores       ║
+║                                                                                ║
+╚════════════════════════════════════════════════════════════════════════════════╝
+"""
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+import numpy as np
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple, Optional
+
+from tri_v2_producao import (
+    TabelaReferenciaTRI,
+    TRI_MAXIMA_OFICIAL,
+    AREAS_TRI,
+    DIFICULDADES,
+    normalizar_areas_config,
+)
+
+# ════════════════════════════════════════════════════════════════════════════════
+# 1. CODIFICAÇÃO DAS RESPOSTAS
+# ════════════════════════════════════════════════════════════════════════════════
+# A-E = 0-4. Brancos e dupla marcação mantêm código próprio para que a
+# comparação com o gabarito siga exatamente a regra do processar_turma.
+
+OPCOES = ('A', 'B', 'C', 'D', 'E')
+COD_BRANCO = 5     # '' ou None
+COD_DUPLA = 6      # 'X' (dupla marcação)
+COD_AUSENTE = 7    # chave qN ausente no aluno (nunca conta como acerto)
+COD_OUTRO = 8      # qualquer outro valor (nunca conta como acerto)
+COD_ANULADA = 9    # apenas no gabarito: questão anulada (fora da correção)
+
+_AUSENTE = object()
+
+_CODIGOS = {letra: i for i, letra in enumerate(OPCOES)}
+_CODIGOS.update({'': COD_BRANCO, None: COD_BRANCO, 'X': COD_DUPLA, _AUSENTE: COD_AUSENTE})
+
+_LETRAS = {i: letra for i, letra in enumerate(OPCOES)}
+_LETRAS.update({COD_BRANCO: '', COD_DUPLA: 'X', COD_AUSENTE: None, COD_OUTRO: None, COD_ANULADA: None})
+
+# Limites inferiores de % de acerto das classes (muito_dificil → muito_facil)
+_LIMITES_DIFICULDADE = np.array([0.20, 0.40, 0.60, 0.80])
+
+
+def codificar(valor) -> int:
+    """Converte uma resposta/gabarito ('A'..'E', '', 'X') para código uint8."""
+    try:
+        return _CODIGOS.get(valor, COD_OUTRO)
+    except TypeError:
+        return COD_OUTRO
+
+
+def decodificar(codigo: int) -> Optional[str]:
+    """Converte código uint8 de volta para a letra."""
+    return _LETRAS.get(int(codigo))
+
+
+AREAS_CONFIG_PADRAO = {
+    'LC': [1, 45],
+    'CH': [46, 90],
+    'CN': [1, 45],
+    'MT': [46, 90]
+}
+
+
+def converter_gabarito(gabarito_raw) -> Dict[str, str]:
+    """
+    Converte o gabarito garantindo chaves string (qN usa string).
+    Aceita tanto lista quanto dicionário.
+    """
+    if isinstance(gabarito_raw, list):
+        # Se é lista, converter para dicionário {1: 'A', 2: 'B', ...}
+        return {str(i+1): v for i, v in enumerate(gabarito_raw)}
+    return {str(k): v for k, v in gabarito_raw.items()}
+
+
+def converter_aluno(aluno: dict) -> dict:
+    """
+    Normaliza um aluno para o formato qN usado por processar_turma.
+
+    Aceita: {'respostas': ['A', 'B', ...]} ou {'q1': 'A', 'q2': 'B', ...}
+    """
+    aluno_conv = {'id': aluno.get('id', ''), 'nome': aluno.get('nome', '')}
+    for key in ('turma', 'escola'):
+        if key in aluno:
+            aluno_conv[key] = aluno[key]
+
+    # Se tem 'respostas' como lista, converter para q1, q2, ...
+    if 'respostas' in aluno and isinstance(aluno['respostas'], list):
+        for i, resp in enumerate(aluno['respostas']):
+            aluno_conv[f'q{i+1}'] = resp if resp else ''
+    else:
+        # Já está no formato qN, copiar
+        for key, val in aluno.items():
+            if key.startswith('q') or key in ['id', 'nome', 'studentNumber', 'studentName', 'turma', 'escola']:
+                aluno_conv[key] = val
+
+    return aluno_conv
+
+
+def classificar_dificuldades(pct: np.ndarray) -> np.ndarray:
+    """
+    Versão vetorizada de classificar_dificuldade.
+
+    Returns:
+        Índices em DIFICULDADES (0 = muito_facil ... 4 = muito_dificil)
+    """
+    return (len(_LIMITES_DIFICULDADE) - np.searchsorted(_LIMITES_DIFICULDADE, pct, side='right')).astype(np.int8)
+
+
+# ════════════════════════════════════════════════════════════════════════════════
+# 2. MATRIZ DE RESPOSTAS
+# ════════════════════════════════════════════════════════════════════════════════
+
+@dataclass
+class MatrizRespostas:
+    """Respostas da turma codificadas (alunos × questões do gabarito)."""
+    questoes: np.ndarray          # (q,) número de cada questão, na ordem do gabarito
+    respostas: np.ndarray         # (n, q) uint8
+    gabarito: np.ndarray          # (q,) uint8
+    nomes: List[str] = field(default_factory=list)
+    ids: List[str] = field(default_factory=list)
+    turmas: List[str] = field(default_factory=list)
+    escolas: List[str] = field(default_factory=list)
+
+    @classmethod
+    def de_alunos(cls, alunos: list, gabarito: dict) -> 'MatrizRespostas':
+        """
+        Monta a matriz a partir do formato aceito por processar_turma.
+
+        Args:
+            alunos: Lista de dicts no formato qN ({'nome': ..., 'q1': 'A', ...})
+            gabarito: {'1': 'A', '2': 'B', ...}
+        """
+        chaves = list(gabarito.keys())
+        questoes = np.array([int(k) for k in chaves], dtype=np.int32)
+        gab = np.array([codificar(gabarito[k]) for k in chaves], dtype=np.uint8)
+
+        respostas = np.empty((len(alunos), len(chaves)), dtype=np.uint8)
+        for j, q_num in enumerate(questoes):
+            q_key = f'q{q_num}'
+            respostas[:, j] = [codificar(aluno.get(q_key, _AUSENTE)) for aluno in alunos]
+
+        return cls(
+            questoes=questoes,
+            respostas=respostas,
+            gabarito=gab,
+            nomes=[aluno.get('nome', f'Aluno_{idx}') for idx, aluno in enumerate(alunos)],
+            ids=[str(aluno.get('id', '') or '') for aluno in alunos],
+            turmas=[str(aluno.get('turma', '') or '') for aluno in alunos],
+            escolas=[str(aluno.get('escola', '') or '') for aluno in alunos],
+        )
+
+    @property
+    def n_alunos(self) -> int:
+        return self.respostas.shape[0]
+
+    @property
+    def n_questoes(self) -> int:
+        return self.respostas.shape[1]
+
+    def ativas(self) -> np.ndarray:
+        """Questões que participam da correção (não anuladas)."""
+        return self.gabarito != COD_ANULADA
+
+    def acertos(self) -> np.ndarray:
+        """Matriz bool de acertos (mesma regra do PASSO 2 de processar_turma)."""
+        return (self.respostas == self.gabarito) & (self.respostas <= COD_DUPLA)
+
+    def contagem_acertos(self) -> np.ndarray:
+        """Acertos por questão usados na dificuldade (PASSO 1: ignora branco e 'X')."""
+        return (self.acertos() & (self.gabarito < COD_BRANCO)).sum(axis=0).astype(np.int64)
+
+    def gabarito_dict(self) -> Dict[str, str]:
+        """Gabarito no formato {'1': 'A', ...} (questões anuladas omitidas)."""
+        return {
+            str(int(q)): decodificar(cod)
+            for q, cod in zip(self.questoes, self.gabarito)
+            if cod != COD_ANULADA
+        }
+
+    def indice_questao(self, q_num: int) -> int:
+        """Posição da questão na matriz."""
+        idx = np.flatnonzero(self.questoes == int(q_num))
+        if idx.size == 0:
+            raise KeyError(f'Questão {q_num} não está no gabarito')
+        return int(idx[0])
+
+    def fatia(self, inicio: int, fim: int) -> 'MatrizRespostas':
+        """Alunos [inicio, fim) (a matriz de respostas é uma view)."""
+        return MatrizRespostas(
+            questoes=self.questoes,
+            respostas=self.respostas[inicio:fim],
+            gabarito=self.gabarito,
+            nomes=self.nomes[inicio:fim],
+            ids=self.ids[inicio:fim],
+            turmas=self.turmas[inicio:fim],
+            escolas=self.escolas[inicio:fim],
+        )
+
+    def com_gabarito(self, gabarito: np.ndarray) -> 'MatrizRespostas':
+        """Cópia rasa com outro gabarito (a matriz de respostas é compartilhada)."""
+        return MatrizRespostas(
+            questoes=self.questoes,
+            respostas=self.respostas,
+            gabarito=gabarito,
+            nomes=self.nomes,
+            ids=self.ids,
+            turmas=self.turmas,
+            escolas=self.escolas,
+        )
+
+    def hash_conteudo(self, areas_config: Optional[dict] = None) -> str:
+        """SHA-256 das respostas, gabarito, identificação dos alunos e (opcional) areas_config."""
+        h = hashlib.sha256()
+        h.update(np.ascontiguousarray(self.questoes, dtype=np.int32).tobytes())
+        h.update(np.ascontiguousarray(self.gabarito).tobytes())
+        h.update(np.int64(self.n_alunos).tobytes())
+        h.update(np.ascontiguousarray(self.respostas).tobytes())
+        h.update(json.dumps([self.nomes, self.ids, self.turmas, self.escolas], ensure_ascii=False).encode('utf-8'))
+        if areas_config is not None:
+            h.update(json.dumps(areas_config, sort_keys=True).encode('utf-8'))
+        return h.hexdigest()
+
+
+# ════════════════════════════════════════════════════════════════════════════════
+# 3. ESTADO DA TURMA (estatísticas por questão + contagens por aluno/área)
+# ════════════════════════════════════════════════════════════════════════════════
+
+@dataclass
+class EstadoArea:
+    """Contagens de um aluno em uma área (uma linha por aluno)."""
+    colunas: np.ndarray           # (q,) bool - questões da área
+    acertos: np.ndarray           # (n,) int64
+    por_classe: np.ndarray        # (n, 5) int64 - acertos por classe de dificuldade
+    soma_dificuldade: np.ndarray  # (n,) float64 - Σ(1 - pct) das questões acertadas
+
+
+class EstadoTurma:
+    """
+    Tudo o que processar_turma deriva da matriz, mantido em arrays.
+
+    Permite atualizar uma única coluna (anulação / troca de gabarito) sem
+    recalcular as demais. Quando a matriz é só um pedaço da coorte, a
+    dificuldade pode vir de fora (contagem/total acumulados da coorte).
+    """
+
+    def __init__(self, matriz: MatrizRespostas, areas: Dict[str, Tuple[int, int]],
+                 contagem: Optional[np.ndarray] = None, total: Optional[int] = None):
+        self.matriz = matriz
+        self.areas = areas
+        self.gabarito = matriz.gabarito.copy()
+        self.acertos = matriz.acertos()
+
+        if contagem is None:
+            validos = self.acertos & (self.gabarito < COD_BRANCO)
+            contagem = validos.sum(axis=0)
+            total = matriz.n_alunos
+        self.contagem = np.array(contagem, dtype=np.int64)
+        self.total = int(total)
+        self.pct = self.contagem / self.total if self.total > 0 else np.zeros(matriz.n_questoes)
+        self.classes = classificar_dificuldades(self.pct)
+
+        self.por_area: Dict[str, EstadoArea] = {}
+        ativas = matriz.ativas()
+        for area, (start, end) in areas.items():
+            colunas = (matriz.questoes >= start) & (matriz.questoes <= end) & ativas
+            sub = self.acertos[:, colunas].astype(np.float64)
+            onehot = np.zeros((int(colunas.sum()), len(DIFICULDADES)))
+            onehot[np.arange(onehot.shape[0]), self.classes[colunas]] = 1.0
+            self.por_area[area] = EstadoArea(
+                colunas=colunas,
+                acertos=sub.sum(axis=1).astype(np.int64),
+                por_classe=(sub @ onehot).astype(np.int64),
+                soma_dificuldade=sub @ (1.0 - self.pct[colunas]),
+            )
+
+    def distribuicao_dificuldade(self) -> Dict[str, int]:
+        """Quantidade de questões (não anuladas) em cada classe."""
+        contagens = np.bincount(self.classes[self.gabarito != COD_ANULADA], minlength=len(DIFICULDADES))
+        return {dif: int(c) for dif, c in zip(DIFICULDADES, contagens)}
+
+    def atualizar_coluna(self, j: int, codigo: int):
+        """
+        Troca o gabarito da coluna j e propaga a mudança só por essa coluna.
+
+        Args:
+            j: Índice da coluna na matriz
+            codigo: Novo código de gabarito (COD_ANULADA para anular)
+        """
+        resp = self.matriz.respostas[:, j]
+        n = self.matriz.n_alunos
+
+        col_antiga = self.acertos[:, j]
+        pct_antigo = self.pct[j]
+        classe_antiga = int(self.classes[j])
+        ativa_antiga = self.gabarito[j] != COD_ANULADA
+
+        if codigo == COD_ANULADA:
+            col_nova = np.zeros(n, dtype=bool)
+        else:
+            col_nova = (resp == codigo) & (resp <= COD_DUPLA)
+        validos = col_nova & (codigo < COD_BRANCO)
+        self.contagem[j] = int(validos.sum())
+        pct_novo = self.contagem[j] / self.total if self.total > 0 else 0.0
+        classe_nova = int(classificar_dificuldades(np.array([pct_novo]))[0])
+        ativa_nova = codigo != COD_ANULADA
+
+        q_num = self.matriz.questoes[j]
+        for area, (start, end) in self.areas.items():
+            if not (start <= q_num <= end):
+                continue
+            estado = self.por_area[area]
+            antiga = col_antiga.astype(np.int64) if ativa_antiga else np.zeros(n, dtype=np.int64)
+            nova = col_nova.astype(np.int64)
+            estado.acertos += nova - antiga
+            estado.por_classe[:, classe_antiga] -= antiga
+            estado.por_classe[:, classe_nova] += nova
+            estado.soma_dificuldade += nova * (1.0 - pct_novo) - antiga * (1.0 - pct_antigo)
+            estado.colunas[j] = ativa_nova
+
+        self.acertos[:, j] = col_nova
+        self.pct[j] = pct_novo
+        self.classes[j] = classe_nova
+        self.gabarito[j] = codigo
+
+
+# ════════════════════════════════════════════════════════════════════════════════
+# 4. CÁLCULO VETORIZADO DA TRI (mesmas regras de TRICalculator/processar_aluno)
+# ════════════════════════════════════════════════════════════════════════════════
+
+@dataclass
+class PontuacaoTurma:
+    """Resultados por aluno em arrays (uma entrada por aluno)."""
+    acertos: Dict[str, np.ndarray]
+    baseline: Dict[str, np.ndarray]
+    ajuste_coerencia: Dict[str, np.ndarray]
+    ajuste_relacao: Dict[str, np.ndarray]
+    penalidade: Dict[str, np.ndarray]
+    tri_ajustado: Dict[str, np.ndarray]
+    coerencia: Dict[str, np.ndarray]
+    bonus_dificil: Dict[str, np.ndarray]
+    limitado: Dict[str, np.ndarray]
+    tri: Dict[str, np.ndarray]
+    tri_geral: np.ndarray
+    tct: np.ndarray
+
+    @property
+    def n_alunos(self) -> int:
+        return self.tri_geral.shape[0]
+
+    def fatia(self, inicio: int, fim: int) -> 'PontuacaoTurma':
+        """Alunos [inicio, fim) de todos os arrays."""
+        campos = {}
+        for nome_campo, valor in self.__dict__.items():
+            if isinstance(valor, dict):
+                campos[nome_campo] = {area: arr[inicio:fim] for area, arr in valor.items()}
+            else:
+                campos[nome_campo] = valor[inicio:fim]
+        return PontuacaoTurma(**campos)
+
+    def notas_arredondadas(self) -> np.ndarray:
+        """(n, 5) com tri_geral e TRI das 4 áreas, arredondadas como na saída."""
+        colunas = [self.tri_geral] + [np.round(self.tri[a], 1) for a in AREAS_TRI]
+        return np.column_stack(colunas)
+
+
+class TRIVetorizado:
+    """
+    Reimplementação vetorizada de processar_turma.
+
+    Produz exatamente o mesmo formato de saída; os cálculos por aluno são
+    feitos em arrays NumPy (um elemento por aluno) em vez de laços.
+    """
+
+    def __init__(self, tabela_referencia: TabelaReferenciaTRI):
+        self.tabela = tabela_referencia
+        self._tabelas = {}
+        for area, valores in tabela_referencia.lookup.items():
+            max_acertos = max(valores.keys())
+            arr = np.zeros((3, max_acertos + 1))
+            for acertos, linha in valores.items():
+                arr[:, acertos] = (linha['tri_min'], linha['tri_med'], linha['tri_max'])
+            self._tabelas[area] = arr
+
+    def _obter(self, area: str, acertos: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Versão vetorizada de TabelaReferenciaTRI.obter (limita ao máximo)."""
+        if area not in self._tabelas:
+            raise ValueError(f"Área inválida: {area}")
+        arr = self._tabelas[area]
+        idx = np.minimum(acertos, arr.shape[1] - 1)
+        return arr[0, idx], arr[1, idx], arr[2, idx]
+
+    def pontuar(self, estado: EstadoTurma) -> PontuacaoTurma:
+        """Calcula TRI de todos os alunos a partir do estado da turma."""
+        n = estado.matriz.n_alunos
+        zeros_int = np.zeros(n, dtype=np.int64)
+        acertos = {area: (estado.por_area[area].acertos if area in estado.por_area else zeros_int)
+                   for area in AREAS_TRI}
+        tabelas = {area: self._obter(area, acertos[area]) for area in AREAS_TRI}
+
+        campos = {nome: {} for nome in ('baseline', 'ajuste_coerencia', 'ajuste_relacao', 'penalidade',
+                                          'tri_ajustado', 'coerencia', 'bonus_dificil', 'limitado', 'tri')}
+
+        for area in AREAS_TRI:
+            tri_min, tri_med, tri_max = tabelas[area]
+            ac = acertos[area]
+            zero_ajuste = np.zeros(n)
+            ajuste = zero_ajuste
+            penalidade = zero_ajuste
+            bonus = zero_ajuste
+            coer = zero_ajuste
+
+            # [AJUSTE 1] Coerência pedagógica (só para áreas configuradas)
+            if area in estado.por_area:
+                est = estado.por_area[area]
+                com_acerto = ac > 0
+                peso_dificuldade = np.where(com_acerto, est.soma_dificuldade / np.maximum(ac, 1), 0.5)
+                # AlunoCoherenceAnalyzer soma todos os valores, inclusive _peso_dificuldade
+                total = ac + peso_dificuldade
+                total_seguro = np.where(total > 0, total, 1.0)
+                c = est.por_classe
+                taxas = c / total_seguro[:, None]
+                coerencia_base = ((taxas[:, 0] >= taxas[:, 1]).astype(np.float64) +
+                                  (taxas[:, 1] >= taxas[:, 2]) +
+                                  (taxas[:, 2] >= taxas[:, 3]) +
+                                  (taxas[:, 3] >= taxas[:, 4])) / 4
+                peso_acertos = (c[:, 0] * 1.0 + c[:, 1] * 0.8 + c[:, 2] * 0.5 +
+                                c[:, 3] * 0.3 + c[:, 4] * 0.1)
+                peso_normalizado = peso_acertos / total_seguro
+                coer = coerencia_base * 0.3 + peso_normalizado * 0.3 + peso_dificuldade * 0.4
+                coer = np.where(total > 0, coer, 0.0)
+                taxas = np.where((total > 0)[:, None], taxas, 0.0)
+
+                range_disponivel = tri_max - tri_min
+                ajuste = np.where(coer >= 0.5, (coer - 0.5) * 2 * (range_disponivel * 0.5), 0.0)
+                penalidade = np.where(coer < 0.5, (0.5 - coer) * 2 * (range_disponivel * 0.5), 0.0)
+                bonus = np.where(taxas[:, 4] > 0.3, taxas[:, 4] * 20.0,
+                                 np.where(taxas[:, 3] > 0.3, taxas[:, 3] * 10.0, 0.0))
+
+            # [AJUSTE 2] Relação com outras áreas
+            outras = [tabelas[a][1] for a in AREAS_TRI if a != area]
+            media_outras = (outras[0] + outras[1] + outras[2]) / 3
+            diferenca = tri_med - media_outras
+            relacao = np.where(diferenca > 50, -5.0, np.where(diferenca < -50, 5.0, 0.0))
+
+            ajuste_total = ajuste + bonus
+            tri_ajustado = tri_med + ajuste_total + relacao - penalidade
+            tri_ajustado = np.maximum(tri_min, np.minimum(tri_max, tri_ajustado))
+            limitado = tri_ajustado > TRI_MAXIMA_OFICIAL.get(area, 1000.0)
+            tri_ajustado = np.minimum(tri_ajustado, TRI_MAXIMA_OFICIAL.get(area, 1000.0))
+
+            # [CRÍTICO] Zero acertos → tri_med oficial sem ajustes
+            zero = ac == 0
+            campos['baseline'][area] = tri_med
+            campos['ajuste_coerencia'][area] = np.where(zero, 0.0, ajuste_total)
+            campos['ajuste_relacao'][area] = np.where(zero, 0.0, relacao)
+            campos['penalidade'][area] = np.where(zero, 0.0, penalidade)
+            campos['tri_ajustado'][area] = np.where(zero, tri_med, tri_ajustado)
+            campos['coerencia'][area] = coer
+            campos['bonus_dificil'][area] = np.where(zero, 0.0, bonus)
+            campos['limitado'][area] = ~zero & limitado
+            campos['tri'][area] = np.minimum(campos['tri_ajustado'][area], TRI_MAXIMA_OFICIAL.get(area, 1000.0))
+
+        tris = campos['tri']
+        tri_geral = np.round((((tris['LC'] + tris['CH']) + tris['CN']) + tris['MT']) / 4, 1)
+        total_acertos = acertos['LC'] + acertos['CH'] + acertos['CN'] + acertos['MT']
+        tct = np.round((total_acertos / 90.0) * 4.0, 2)
+
+        return PontuacaoTurma(acertos=acertos, tri_geral=tri_geral, tct=tct, **campos)
+
+    # ────────────────────────────────────────────────────────────────────────────
+    # Montagem da saída (mesmo formato de processar_aluno + metadados)
+    # ────────────────────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _motivo(area: str, acertos: int, baseline: float, coer: float, ajuste: float,
+                bonus: float, penalidade: float, tri_limitado: bool) -> str:
+        if acertos == 0:
+            return f'Zero acertos: TRI oficial ({baseline:.1f}) sem ajustes'
+        motivo = f'{area}: {acertos} acertos'
+        if coer >= 0.5:
+            if ajuste - bonus > 0.5:
+                motivo += f' | Coerência {coer:.2f}: +{ajuste - bonus:.1f}'
+        elif penalidade > 0.5:
+            motivo += f' | Incoerência {coer:.2f}: -{penalidade:.1f}'
+        if bonus > 0:
+            motivo += f' | Bônus difíceis: +{bonus:.1f}'
+        if tri_limitado:
+            motivo += f' | LIMITADO ao máximo oficial {area}: {TRI_MAXIMA_OFICIAL[area]}'
+        return motivo
+
+    def montar_resultados(self, pontuacao: PontuacaoTurma, nomes: List[str],
+                          indices: Optional[np.ndarray] = None) -> List[Dict]:
+        """
+        Converte os arrays em dicts no formato de processar_turma.
+
+        Args:
+            pontuacao: Resultado de pontuar()
+            nomes: Nome de cada aluno (mesma ordem da matriz)
+            indices: Subconjunto de alunos a montar (padrão: todos)
+        """
+        if indices is None:
+            indices = np.arange(pontuacao.n_alunos)
+
+        # .tolist() uma vez por coluna: evita milhões de escalares numpy
+        col = {}
+        for nome_campo in ('acertos', 'baseline', 'ajuste_coerencia', 'ajuste_relacao', 'penalidade',
+                           'tri_ajustado', 'coerencia', 'bonus_dificil', 'limitado', 'tri'):
+            valores = getattr(pontuacao, nome_campo)
+            col[nome_campo] = {area: valores[area][indices].tolist() for area in AREAS_TRI}
+        tri_geral = pontuacao.tri_geral[indices].tolist()
+        tct = pontuacao.tct[indices].tolist()
+        tri_round = {area: np.round(pontuacao.tri[area][indices], 1).tolist() for area in AREAS_TRI}
+
+        resultados = []
+        for k, idx in enumerate(indices.tolist()):
+            detalhes = {}
+            for area in AREAS_TRI:
+                acertos = col['acertos'][area][k]
+                tri_ajustado = col['tri_ajustado'][area][k]
+                ajuste = col['ajuste_coerencia'][area][k]
+                penalidade = col['penalidade'][area][k]
+                detalhes[area] = {
+                    'acertos': acertos,
+                    'baseline': col['baseline'][area][k],
+                    'ajustes': {
+                        'coerencia': ajuste,
+                        'relacao': col['ajuste_relacao'][area][k],
+                        'penalidade': penalidade
+                    },
+                    'tri_ajustado': tri_ajustado,
+                    'motivo': self._motivo(area, acertos, col['baseline'][area][k], col['coerencia'][area][k],
+                                           ajuste, col['bonus_dificil'][area][k], penalidade,
+                                           col['limitado'][area][k])
+                }
+            resultados.append({
+                'tct': tct[k],
+                'tri_geral': tri_geral[k],
+                'tri_lc': tri_round['LC'][k],
+                'tri_ch': tri_round['CH'][k],
+                'tri_cn': tri_round['CN'][k],
+                'tri_mt': tri_round['MT'][k],
+                'detalhes': detalhes,
+                'nome': nomes[idx],
+                'lc_acertos': col['acertos']['LC'][k],
+                'ch_acertos': col['acertos']['CH'][k],
+                'cn_acertos': col['acertos']['CN'][k],
+                'mt_acertos': col['acertos']['MT'][k],
+            })
+        return resultados
+
+    @staticmethod
+    def analisar_prova(pontuacao: PontuacaoTurma, estado: EstadoTurma) -> Dict:
+        """Mesmo prova_analysis de processar_turma."""
+        if pontuacao.n_alunos == 0:
+            return {
+                'total_alunos': 0,
+                'tri_medio': 0,
+                'tri_min': 0,
+                'tri_max': 0,
+                'tct_medio': 0
+            }
+        return {
+            'total_alunos': pontuacao.n_alunos,
+            'tri_medio': float(np.mean(pontuacao.tri_geral)),
+            'tri_min': float(np.min(pontuacao.tri_geral)),
+            'tri_max': float(np.max(pontuacao.tri_geral)),
+            'tct_medio': float(np.mean(pontuacao.tct)),
+            'questoes_stats': estado.distribuicao_dificuldade()
+        }
+
+    def processar_matriz(self, matriz: MatrizRespostas, areas_config: dict) -> Tuple[Dict, List[Dict]]:
+        """Equivalente vetorizado de TRIProcessadorV2.processar_turma."""
+        estado = EstadoTurma(matriz, normalizar_areas_config(areas_config))
+        pontuacao = self.pontuar(estado)
+        return self.analisar_prova(pontuacao, estado), self.montar_resultados(pontuacao, matriz.nomes)
+
+    def processar_lote(self, matriz: MatrizRespostas, limites: List[int], areas_config: dict,
+                       compartilhada: bool = True) -> Tuple[Optional[Dict], List[Tuple[Dict, List[Dict]]]]:
+        """
+        Vários grupos (turmas) numa única matriz combinada.
+
+        Args:
+            matriz: Alunos de todos os grupos, em sequência
+            limites: [0, fim_grupo_1, fim_grupo_2, ..., n_alunos]
+            areas_config: Configuração comum a todos os grupos
+            compartilhada: True = dificuldade calculada sobre todos os alunos
+                (como uma única turma); False = cada grupo com a sua
+
+        Returns:
+            (prova_analysis geral ou None, [(prova_analysis, resultados) por grupo])
+        """
+        areas = normalizar_areas_config(areas_config)
+        grupos = []
+
+        if compartilhada:
+            estado = EstadoTurma(matriz, areas)
+            pontuacao = self.pontuar(estado)
+            for inicio, fim in zip(limites[:-1], limites[1:]):
+                parte = pontuacao.fatia(inicio, fim)
+                grupos.append((self.analisar_prova(parte, estado),
+                               self.montar_resultados(parte, matriz.nomes[inicio:fim])))
+            return self.analisar_prova(pontuacao, estado), grupos
+
+        # Cada grupo é uma view da matriz combinada (sem copiar respostas)
+        for inicio, fim in zip(limites[:-1], limites[1:]):
+            parte = matriz.fatia(inicio, fim)
+            estado = EstadoTurma(parte, areas)
+            pontuacao = self.pontuar(estado)
+            grupos.append((self.analisar_prova(pontuacao, estado),
+                           self.montar_resultados(pontuacao, parte.nomes)))
+        return None, grupos
+
+    # ────────────────────────────────────────────────────────────────────────────
+    # Recorreção (questão anulada / gabarito alterado)
+    # ────────────────────────────────────────────────────────────────────────────
+
+    def recorrigir(self, matriz: MatrizRespostas, areas_config: dict,
+                   alteracoes: List[Dict]) -> Tuple[MatrizRespostas, Dict, List[Dict]]:
+        """
+        Aplica um delta de gabarito e retorna só os alunos cuja nota mudou.
+
+        Args:
+            matriz: Matriz armazenada da turma
+            areas_config: Configuração de áreas usada no cálculo original
+            alteracoes: [{'questao': 12, 'anular': True}, {'questao': 30, 'gabarito': 'C'}]
+
+        Returns:
+            (matriz_atualizada, prova_analysis, resultados_alterados)
+        """
+        estado = EstadoTurma(matriz, normalizar_areas_config(areas_config))
+        antes = self.pontuar(estado)
+
+        for alteracao in alteracoes:
+            j = matriz.indice_questao(alteracao['questao'])
+            if alteracao.get('anular'):
+                codigo = COD_ANULADA
+            else:
+                letra = str(alteracao.get('gabarito', '')).strip().upper()
+                if letra not in OPCOES:
+                    raise ValueError(f"Gabarito inválido para questão {alteracao['questao']}: {letra!r}")
+                codigo = codificar(letra)
+            estado.atualizar_coluna(j, codigo)
+
+        depois = self.pontuar(estado)
+        notas_antes = antes.notas_arredondadas()
+        notas_depois = depois.notas_arredondadas()
+        alterados = np.flatnonzero(np.any(notas_antes != notas_depois, axis=1))
+
+        resultados = self.montar_resultados(depois, matriz.nomes, alterados)
+        for resultado, idx in zip(resultados, alterados.tolist()):
+            resultado['indice'] = idx
+            resultado['id'] = matriz.ids[idx] if idx < len(matriz.ids) else ''
+            resultado['anterior'] = {
+                'tri_geral': float(notas_antes[idx, 0]),
+                **{f'tri_{area.lower()}': float(notas_antes[idx, k + 1]) for k, area in enumerate(AREAS_TRI)}
+            }
+
+        return matriz.com_gabarito(estado.gabarito.copy()), self.analisar_prova(depois, estado), resultados
+
+
+# ════════════════════════════════════════════════════════════════════════════════
+# 5. REPOSITÓRIO DE MATRIZES
+# ════════════════════════════════════════════════════════════════════════════════
+
+def _remover(caminho: str) -> bool:
+    try:
+        os.remove(caminho)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+class RepositorioMatrizes:
+    """
+    Guarda matrizes de turmas já calculadas para recorreções posteriores.
+
+    Disco (.npz) é a fonte de verdade — compartilhado entre workers do
+    gunicorn; as mais recentes ficam também em memória.
+
+    Cada matriz guarda também as opções de cálculo (modo, estimador,
+    parametros_itens): ranking e exportação pontuam com o mesmo motor de
+    /api/calcular-tri. No modo 'tabela' o id é o hash do conteúdo; nos
+    demais, o hash inclui as opções.
+
+    As matrizes têm nomes, ids, turmas e escolas dos alunos: cada uma é
+    apagada ttl segundos depois de salva e, acima de max_bytes no diretório,
+    as mais antigas saem primeiro.
+
+    Arquivos derivados de uma matriz (exportações, inserções de ranking),
+    nomeados <matriz_id>.*, ficam nos diretórios de registrar_derivados:
+    contam no max_bytes e são apagados junto com a matriz.
+    """
+
+    def __init__(self, diretorio: Optional[str] = None, max_memoria: int = 32,
+                 ttl: Optional[float] = None, max_bytes: Optional[int] = None):
+        """
+        Args:
+            diretorio: Padrão: TRI_MATRIZ_DIR ou /tmp/tri_matrizes
+            max_memoria: Matrizes mantidas em memória (LRU)
+            ttl: Segundos de retenção em disco (padrão: TRI_MATRIZ_TTL ou 7 dias)
+            max_bytes: Tamanho máximo do diretório (padrão: TRI_MATRIZ_MAX_MB ou 512 MB)
+        """
+        self.diretorio = diretorio or os.getenv(
+            'TRI_MATRIZ_DIR', os.path.join(tempfile.gettempdir(), 'tri_matrizes')
+        )
+        os.makedirs(self.diretorio, exist_ok=True)
+        self.max_memoria = max_memoria
+        self.ttl = ttl if ttl is not None else float(os.getenv('TRI_MATRIZ_TTL', str(7 * 24 * 3600)))
+        self.max_bytes = max_bytes if max_bytes is not None else \
+            int(float(os.getenv('TRI_MATRIZ_MAX_MB', '512')) * 1024 * 1024)
+        self._memoria: 'OrderedDict[str, Tuple[MatrizRespostas, dict, dict]]' = OrderedDict()
+        self._ultima_limpeza = 0.0
+        self.derivados: List[str] = []
+
+    def registrar_derivados(self, diretorio: str):
+        """Diretório com arquivos <matriz_id>.* que vivem enquanto a matriz existir."""
+        if diretorio not in self.derivados:
+            self.derivados.append(diretorio)
+
+    @staticmethod
+    def identificador(matriz: MatrizRespostas, areas_config: dict, opcoes: Optional[dict] = None) -> str:
+        """matriz_id: hash do conteúdo (+ opções de cálculo fora do modo 'tabela')."""
+        matriz_id = matriz.hash_conteudo(areas_config)
+        if not opcoes or opcoes.get('modo', 'tabela') == 'tabela':
+            return matriz_id
+        resumo = json.dumps(opcoes, sort_keys=True, default=str).encode('utf-8')
+        return hashlib.sha256(matriz_id.encode('ascii') + resumo).hexdigest()
+
+    def _caminho(self, matriz_id: str) -> str:
+        if not matriz_id or not all(c in '0123456789abcdef' for c in matriz_id):
+            raise KeyError(f'matriz_id inválido: {matriz_id}')
+        return os.path.join(self.diretorio, f'{matriz_id}.npz')
+
+    def _lembrar(self, matriz_id: str, matriz: MatrizRespostas, areas_config: dict, opcoes: dict):
+        self._memoria[matriz_id] = (matriz, areas_config, opcoes)
+        self._memoria.move_to_end(matriz_id)
+        while len(self._memoria) > self.max_memoria:
+            self._memoria.popitem(last=False)
+
+    def limpar(self, agora: Optional[float] = None, intervalo: float = 60.0,
+               manter: Optional[str] = None) -> int:
+        """
+        Apaga matrizes expiradas e, acima de max_bytes, as mais antigas,
+        com os arquivos derivados delas. Derivados sem matriz saem sempre.
+
+        Roda no máximo a cada intervalo segundos por worker (0 = sempre);
+        a matriz manter (recém-salva) nunca sai pelo tamanho.
+
+        Returns:
+            Matrizes apagadas
+        """
+        agora = time.time() if agora is None else agora
+        if agora - self._ultima_limpeza < intervalo:
+            return 0
+        self._ultima_limpeza = agora
+
+        # matriz_id -> [mtime da matriz, bytes com derivados, caminhos]
+        grupos: Dict[str, list] = {}
+        for nome in os.listdir(self.diretorio):
+            if not nome.endswith('.npz'):
+                continue
+            caminho = os.path.join(self.diretorio, nome)
+            try:
+                info = os.stat(caminho)
+            except FileNotFoundError:
+                continue
+            grupos[nome[:-len('.npz')]] = [info.st_mtime, info.st_size, [caminho]]
+
+        for diretorio in self.derivados:
+            for nome in os.listdir(diretorio):
+                caminho = os.path.join(diretorio, nome)
+                try:
+                    info = os.stat(caminho)
+                except FileNotFoundError:
+                    continue
+                grupo = grupos.get(nome.split('.', 1)[0])
+                if grupo is not None:
+                    grupo[1] += info.st_size
+                    grupo[2].append(caminho)
+                elif not nome.endswith('.tmp') or agora - info.st_mtime > 3600:
+                    # Matriz já apagada (outro worker, versão anterior): o derivado sai
+                    _remover(caminho)
+
+        arquivos = sorted(grupos.items(), key=lambda item: item[1][0])
+        total = sum(tamanho for _, (_, tamanho, _) in arquivos)
+        removidas = 0
+        for matriz_id, (mtime, tamanho, caminhos) in arquivos:
+            if agora - mtime <= self.ttl and total <= self.max_bytes:
+                break
+            if matriz_id == manter and agora - mtime <= self.ttl:
+                continue
+            # A matriz primeiro: sem ela nenhum derivado é servido
+            removidas += int(_remover(caminhos[0]))
+            for caminho in caminhos[1:]:
+                _remover(caminho)
+            total -= tamanho
+            self._memoria.pop(matriz_id, None)
+        return removidas
+
+    def salvar(self, matriz: MatrizRespostas, areas_config: dict, opcoes: Optional[dict] = None) -> str:
+        """Salva a matriz e retorna seu id (identificador)."""
+        opcoes = dict(opcoes or {'modo': 'tabela'})
+        matriz_id = self.identificador(matriz, areas_config, opcoes)
+        caminho = self._caminho(matriz_id)
+        if os.path.exists(caminho):
+            # Salvar de novo renova a retenção
+            os.utime(caminho)
+        else:
+            tmp = f'{caminho}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as f:
+                np.savez_compressed(
+                    f,
+                    questoes=matriz.questoes,
+                    respostas=matriz.respostas,
+                    gabarito=matriz.gabarito,
+                    metadados=np.array(json.dumps({
+                        'nomes': matriz.nomes,
+                        'ids': matriz.ids,
+                        'turmas': matriz.turmas,
+                        'escolas': matriz.escolas,
+                        'areas_config': areas_config,
+                        'opcoes': opcoes,
+                    }, ensure_ascii=False, default=str))
+                )
+            os.replace(tmp, caminho)
+        self._lembrar(matriz_id, matriz, areas_config, opcoes)
+        self.limpar(manter=matriz_id)
+        return matriz_id
+
+    def existe(self, matriz_id: str) -> bool:
+        """Matriz em disco e dentro do prazo (sem carregá-la)."""
+        caminho = self._caminho(matriz_id)
+        self.limpar()
+        try:
+            expirada = time.time() - os.path.getmtime(caminho) > self.ttl
+        except FileNotFoundError:
+            # Apagada por outro worker (retenção): a cópia em memória também sai
+            expirada = True
+        if expirada:
+            self._memoria.pop(matriz_id, None)
+        return not expirada
+
+    def carregar(self, matriz_id: str) -> Tuple[MatrizRespostas, dict]:
+        """
+        Returns:
+            (matriz, areas_config)
+
+        Raises:
+            KeyError: se a matriz não existir
+        """
+        matriz, areas_config, _ = self.carregar_com_opcoes(matriz_id)
+        return matriz, areas_config
+
+    def carregar_com_opcoes(self, matriz_id: str) -> Tuple[MatrizRespostas, dict, dict]:
+        """
+        Returns:
+            (matriz, areas_config, opções de cálculo)
+
+        Raises:
+            KeyError: se a matriz não existir
+        """
+        if not self.existe(matriz_id):
+            raise KeyError(f'Matriz não encontrada: {matriz_id}')
+        caminho = self._caminho(matriz_id)
+
+        if matriz_id in self._memoria:
+            self._memoria.move_to_end(matriz_id)
+            return self._memoria[matriz_id]
+
+        with np.load(caminho) as dados:
+            meta = json.loads(str(dados['metadados']))
+            matriz = MatrizRespostas(
+                questoes=dados['questoes'],
+                respostas=dados['respostas'],
+                gabarito=dados['gabarito'],
+                nomes=meta['nomes'],
+                ids=meta['ids'],
+                turmas=meta['turmas'],
+                escolas=meta.get('escolas', [''] * len(meta['nomes'])),
+            )
+        areas_config = {k: tuple(v) for k, v in meta['areas_config'].items()}
+        opcoes = meta.get('opcoes') or {'modo': 'tabela'}
+        self._lembrar(matriz_id, matriz, areas_config, opcoes)
+        return matriz, areas_config, opcoes
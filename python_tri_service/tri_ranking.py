@@ -0,0 +1,301 @@
+"""
+╔════════════════════════════════════════════════════════════════════════════════╗
+║                                                                                ║
+║              TRI V2 - RANKING E PERCENTIL (TURMA / ESCOLA / REDE)              ║
+║                                                                                ║
+║  • Notas ordenadas uma vez por grupo e área (arrays NumPy)                    ║
+║  • Posição e percentil por busca binária (np.searchsorted)                    ║
+║  • Inserção incremental de alunos corrigidos depois                           ║
+║  • Cache por matriz (prova) até a coorte mudar                                ║
+║                                                                                ║
+╚════════════════════════════════════════════════════════════════════════════════╝
+
+Posição: 1 + número de notas estritamente maiores (empates dividem a posição).
+Percentil: 100 · (abaixo + ½ · empatados) / total do grupo.
+"""
+
+import os
+import json
+import fcntl
+import tempfile
+import numpy as np
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from tri_v2_producao import AREAS_TRI, normalizar_areas_config
+from tri_matriz import MatrizRespostas, EstadoTurma, TRIVetorizado
+from tri_irt import ParametrosItens, pontuar_matriz_irt
+
+NIVEIS = ('turma', 'escola', 'rede')
+AREA_GERAL = 'geral'
+
+
+def _posicao_percentil(ordenadas: np.ndarray, notas: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Busca binária de várias notas num array crescente."""
+    total = ordenadas.shape[0]
+    if total == 0:
+        return np.ones(notas.shape, dtype=np.int64), np.zeros(notas.shape)
+    abaixo = np.searchsorted(ordenadas, notas, side='left')
+    ate = np.searchsorted(ordenadas, notas, side='right')
+    posicao = total - ate + 1
+    percentil = 100.0 * (abaixo + 0.5 * (ate - abaixo)) / total
+    return posicao, percentil
+
+
+def notas_de_resultado(resultado: Dict) -> Dict[str, float]:
+    """Notas no formato do índice a partir de um resultado de /api/calcular-tri."""
+    notas = {}
+    if resultado.get('tri_geral') is not None:
+        notas[AREA_GERAL] = float(resultado['tri_geral'])
+    for area in AREAS_TRI:
+        valor = resultado.get(f'tri_{area.lower()}')
+        if valor is not None:
+            notas[area] = float(valor)
+    return notas
+
+
+class IndiceRanking:
+    """
+    Notas de uma coorte ordenadas por (nível, grupo, área).
+
+    O nível 'rede' tem um único grupo ('') com todos os alunos.
+    """
+
+    def __init__(self, notas: Dict[str, np.ndarray], ids: List[str], nomes: List[str],
+                 turmas: List[str], escolas: List[str]):
+        self.areas = list(notas.keys())
+        self.notas = {area: np.asarray(valores, dtype=np.float64) for area, valores in notas.items()}
+        self.ids = list(ids)
+        self.nomes = list(nomes)
+        self.turmas = list(turmas)
+        self.escolas = list(escolas)
+        # Alunos da coorte original; os inseridos depois vêm a partir daqui
+        self.n_coorte = len(self.ids)
+        self._ordenadas: Dict[Tuple[str, str, str], np.ndarray] = {}
+        self._ordenar()
+
+    @property
+    def n_alunos(self) -> int:
+        return len(self.ids)
+
+    def _rotulos(self, nivel: str) -> np.ndarray:
+        if nivel == 'turma':
+            return np.array(self.turmas, dtype=object)
+        if nivel == 'escola':
+            return np.array(self.escolas, dtype=object)
+        return np.full(self.n_alunos, '', dtype=object)
+
+    def _ordenar(self):
+        """Uma ordenação (lexsort grupo, nota) por nível e área."""
+        self._ordenadas.clear()
+        for nivel in NIVEIS:
+            grupos, codigos = np.unique(self._rotulos(nivel).astype(str), return_inverse=True)
+            for area in self.areas:
+                ordem = np.lexsort((self.notas[area], codigos))
+                codigos_ordenados = codigos[ordem]
+                notas_ordenadas = self.notas[area][ordem]
+                limites = np.searchsorted(codigos_ordenados, np.arange(len(grupos) + 1))
+                for g, grupo in enumerate(grupos.tolist()):
+                    self._ordenadas[(nivel, grupo, area)] = notas_ordenadas[limites[g]:limites[g + 1]]
+
+    def grupos(self) -> Dict[str, Dict[str, int]]:
+        """Tamanho de cada grupo por nível."""
+        resumo = {nivel: {} for nivel in NIVEIS}
+        area = self.areas[0] if self.areas else None
+        for (nivel, grupo, a), ordenadas in self._ordenadas.items():
+            if a == area:
+                resumo[nivel][grupo] = int(ordenadas.shape[0])
+        return resumo
+
+    def consultar(self, area: str, nota: float, nivel: str = 'rede', grupo: str = '') -> Dict:
+        """Posição/percentil que uma nota teria no grupo."""
+        if area not in self.areas:
+            raise ValueError(f'Área inválida: {area}. Disponíveis: {self.areas}')
+        if nivel not in NIVEIS:
+            raise ValueError(f'Nível inválido: {nivel}. Use: {NIVEIS}')
+        ordenadas = self._ordenadas.get((nivel, '' if nivel == 'rede' else str(grupo), area), np.empty(0))
+        posicao, percentil = _posicao_percentil(ordenadas, np.array([float(nota)]))
+        return {
+            'posicao': int(posicao[0]),
+            'percentil': round(float(percentil[0]), 2),
+            'total': int(ordenadas.shape[0]),
+        }
+
+    def classificar(self, indices: Optional[np.ndarray] = None) -> List[Dict]:
+        """Posição e percentil de cada aluno em todos os níveis e áreas."""
+        if indices is None:
+            indices = np.arange(self.n_alunos)
+        colunas = {}
+        for nivel in NIVEIS:
+            rotulos = self._rotulos(nivel).astype(str)[indices]
+            for area in self.areas:
+                notas = self.notas[area][indices]
+                posicao = np.empty(len(indices), dtype=np.int64)
+                percentil = np.empty(len(indices))
+                for grupo in np.unique(rotulos).tolist():
+                    membros = rotulos == grupo
+                    posicao[membros], percentil[membros] = _posicao_percentil(
+                        self._ordenadas[(nivel, grupo, area)], notas[membros]
+                    )
+                colunas[(nivel, area)] = (posicao.tolist(), np.round(percentil, 2).tolist())
+
+        notas_l = {area: self.notas[area][indices].tolist() for area in self.areas}
+        resultados = []
+        for k, idx in enumerate(indices.tolist()):
+            resultados.append({
+                'indice': idx,
+                'id': self.ids[idx],
+                'nome': self.nomes[idx],
+                'turma': self.turmas[idx],
+                'escola': self.escolas[idx],
+                'notas': {area: notas_l[area][k] for area in self.areas},
+                'posicao': {nivel: {area: colunas[(nivel, area)][0][k] for area in self.areas} for nivel in NIVEIS},
+                'percentil': {nivel: {area: colunas[(nivel, area)][1][k] for area in self.areas} for nivel in NIVEIS},
+            })
+        return resultados
+
+    def validar(self, alunos: List[Dict]):
+        """ValueError se algum aluno não tiver nota em todas as áreas do índice."""
+        for aluno in alunos:
+            faltando = [area for area in self.areas if area not in (aluno.get('notas') or {})]
+            if faltando:
+                raise ValueError(f"Notas ausentes para {aluno.get('id') or aluno.get('nome')}: {faltando}")
+
+    def inserir(self, alunos: List[Dict]) -> np.ndarray:
+        """
+        Insere alunos corrigidos depois, sem reordenar a coorte.
+
+        Args:
+            alunos: [{'id', 'nome', 'turma', 'escola', 'notas': {area: nota}}]
+
+        Returns:
+            Índices dos alunos inseridos
+        """
+        if not alunos:
+            return np.empty(0, dtype=np.int64)
+        self.validar(alunos)
+
+        inicio = self.n_alunos
+        for aluno in alunos:
+            self.ids.append(str(aluno.get('id', '') or ''))
+            self.nomes.append(aluno.get('nome', ''))
+            self.turmas.append(str(aluno.get('turma', '') or ''))
+            self.escolas.append(str(aluno.get('escola', '') or ''))
+        for area in self.areas:
+            novas = np.array([float(aluno['notas'][area]) for aluno in alunos])
+            self.notas[area] = np.concatenate([self.notas[area], novas])
+
+        # np.insert em cada array afetado: O(grupo) em vez de reordenar tudo
+        for nivel in NIVEIS:
+            rotulos = self._rotulos(nivel)[inicio:].astype(str)
+            for grupo in np.unique(rotulos).tolist():
+                membros = np.flatnonzero(rotulos == grupo) + inicio
+                for area in self.areas:
+                    chave = (nivel, grupo, area)
+                    atuais = self._ordenadas.get(chave, np.empty(0))
+                    novas = np.sort(self.notas[area][membros])
+                    self._ordenadas[chave] = np.insert(atuais, np.searchsorted(atuais, novas), novas)
+        return np.arange(inicio, self.n_alunos)
+
+    @classmethod
+    def de_matriz(cls, vetorizado: TRIVetorizado, matriz: MatrizRespostas, areas_config: dict,
+                  opcoes: Optional[Dict] = None) -> 'IndiceRanking':
+        """
+        Pontua a matriz e indexa tri_geral + áreas configuradas.
+
+        Mesmo motor do cálculo original (opcoes de RepositorioMatrizes):
+        caminho vetorizado no modo 'tabela', 3PL no modo 'irt'.
+        """
+        areas = normalizar_areas_config(areas_config)
+        opcoes = opcoes or {'modo': 'tabela'}
+        if opcoes.get('modo', 'tabela') == 'irt':
+            pontuacao = pontuar_matriz_irt(matriz, areas_config, ParametrosItens.de_dict(opcoes['parametros_itens']),
+                                           opcoes.get('estimador', 'eap'))
+            notas = {AREA_GERAL: pontuacao['tri_geral'], **pontuacao['notas']}
+        else:
+            pontuacao = vetorizado.pontuar(EstadoTurma(matriz, areas))
+            notas = {AREA_GERAL: pontuacao.tri_geral}
+            for area in AREAS_TRI:
+                if area in areas:
+                    notas[area] = np.round(pontuacao.tri[area], 1)
+        return cls(notas, matriz.ids, matriz.nomes, matriz.turmas, matriz.escolas)
+
+
+# ════════════════════════════════════════════════════════════════════════════════
+# CACHE POR MATRIZ
+# ════════════════════════════════════════════════════════════════════════════════
+
+class RepositorioRankings:
+    """
+    Índices de ranking por matriz_id, em memória (LRU).
+
+    Alunos inseridos depois ficam num .ndjson por matriz, compartilhado entre
+    workers do gunicorn: cada worker aplica as linhas que ainda não viu.
+    Uma nova coorte gera outro matriz_id (hash do conteúdo) e outro índice.
+
+    O .ndjson tem nomes e ids dos alunos: o diretório é registrado em
+    RepositorioMatrizes.registrar_derivados e o arquivo sai com a matriz;
+    o índice em memória sai com descartar().
+    """
+
+    def __init__(self, diretorio: Optional[str] = None, max_memoria: int = 16):
+        self.diretorio = diretorio or os.getenv(
+            'TRI_RANKING_DIR', os.path.join(tempfile.gettempdir(), 'tri_rankings')
+        )
+        os.makedirs(self.diretorio, exist_ok=True)
+        self.max_memoria = max_memoria
+        # matriz_id -> (índice, bytes do .ndjson já aplicados)
+        self._memoria: 'OrderedDict[str, Tuple[IndiceRanking, int]]' = OrderedDict()
+
+    def _caminho(self, matriz_id: str) -> str:
+        if not matriz_id or not all(c in '0123456789abcdef' for c in matriz_id):
+            raise KeyError(f'matriz_id inválido: {matriz_id}')
+        return os.path.join(self.diretorio, f'{matriz_id}.ndjson')
+
+    def obter(self, matriz_id: str, construir: Callable[[], IndiceRanking]) -> IndiceRanking:
+        """Índice da matriz (construído uma vez) com as inserções pendentes aplicadas."""
+        caminho = self._caminho(matriz_id)
+        if matriz_id in self._memoria:
+            indice, aplicado = self._memoria[matriz_id]
+            self._memoria.move_to_end(matriz_id)
+        else:
+            indice, aplicado = construir(), 0
+
+        if os.path.exists(caminho) and os.path.getsize(caminho) > aplicado:
+            with open(caminho, 'rb') as f:
+                f.seek(aplicado)
+                conteudo = f.read()
+            completo = conteudo[:conteudo.rfind(b'\n') + 1]
+            indice.inserir([json.loads(linha) for linha in completo.splitlines() if linha.strip()])
+            aplicado += len(completo)
+
+        self._memoria[matriz_id] = (indice, aplicado)
+        while len(self._memoria) > self.max_memoria:
+            self._memoria.popitem(last=False)
+        return indice
+
+    def descartar(self, matriz_id: str):
+        """Esquece o índice em memória (matriz expirada ou apagada)."""
+        self._memoria.pop(matriz_id, None)
+
+    def registrar_insercao(self, matriz_id: str, alunos: List[Dict]) -> int:
+        """
+        Acrescenta alunos ao .ndjson da matriz (uma escrita com O_APPEND).
+
+        Returns:
+            Quantos alunos já tinham sido inseridos antes destes, contado sob
+            flock: os alunos ficam nas linhas n_coorte + esse valor em diante
+            do índice, mesmo com inserções concorrentes de outros workers
+        """
+        caminho = self._caminho(matriz_id)
+        linhas = ''.join(json.dumps(aluno, ensure_ascii=False) + '\n' for aluno in alunos)
+        fd = os.open(caminho, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            with open(caminho, 'rb') as f:
+                anteriores = sum(bloco.count(b'\n') for bloco in iter(lambda: f.read(1 << 20), b''))
+            os.write(fd, linhas.encode('utf-8'))
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+        return anteriores
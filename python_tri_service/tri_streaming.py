@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+╔════════════════════════════════════════════════════════════════════════════════╗
+║                                                                                ║
+║              TRI V2 - PROCESSAMENTO EM STREAMING (COORTES GRANDES)             ║
+║                                                                                ║
+║  • Lê alunos de CSV ou NDJSON em blocos (memória limitada pelo bloco)         ║
+║  • Passo 1: acumula acertos por questão da coorte inteira                     ║
+║  • Passo 2: pontua bloco a bloco com a dificuldade da coorte                  ║
+║  • Saída em NDJSON ou CSV; blocos opcionalmente em pool de processos          ║
+║                                                                                ║
+╚════════════════════════════════════════════════════════════════════════════════╝
+
+Uso (CLI):
+    python tri_streaming.py alunos.csv --gabarito gabarito.json \\
+        --saida resultados.ndjson --areas LC:1-45,CH:46-90 --workers 4
+
+Os resultados são idênticos a processar_turma sobre a coorte inteira: a
+dificuldade de cada questão usa todos os alunos do arquivo, não só o bloco.
+"""
+
+import io
+import csv
+import sys
+import json
+import argparse
+import itertools
+import numpy as np
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from tri_v2_producao import TabelaReferenciaTRI, normalizar_areas_config, localizar_tabela
+from tri_matriz import (
+    MatrizRespostas, EstadoTurma, TRIVetorizado,
+    AREAS_CONFIG_PADRAO, converter_aluno, converter_gabarito
+)
+
+FORMATOS_ENTRADA = ('csv', 'ndjson')
+FORMATOS_SAIDA = ('ndjson', 'csv')
+TAMANHO_BLOCO_PADRAO = 5000
+
+# Blocos em processamento simultâneo por worker (limita memória do pool)
+BLOCOS_POR_WORKER = 2
+
+COLUNAS_CSV = [
+    'id', 'nome', 'turma', 'tct', 'tri_geral', 'tri_lc', 'tri_ch', 'tri_cn', 'tri_mt',
+    'lc_acertos', 'ch_acertos', 'cn_acertos', 'mt_acertos'
+]
+
+
+# ════════════════════════════════════════════════════════════════════════════════
+# 1. LEITURA EM BLOCOS
+# ════════════════════════════════════════════════════════════════════════════════
+
+def detectar_formato(nome_arquivo: str) -> str:
+    """Formato de entrada pela extensão (.csv → csv, demais → ndjson)."""
+    return 'csv' if (nome_arquivo or '').lower().endswith('.csv') else 'ndjson'
+
+
+def _linhas_csv(arquivo: TextIO) -> Iterator[dict]:
+    cabecalho = arquivo.readline()
+    if not cabecalho:
+        return
+    delimiter = ';' if ';' in cabecalho else ','
+    campos = next(csv.reader([cabecalho], delimiter=delimiter))
+    for row in csv.DictReader(arquivo, fieldnames=[c.strip() for c in campos], delimiter=delimiter):
+        yield {k: (v.strip() if isinstance(v, str) else v) for k, v in row.items() if k}
+
+
+def _linhas_ndjson(arquivo: TextIO) -> Iterator[dict]:
+    for num_linha, linha in enumerate(arquivo, 1):
+        linha = linha.strip()
+        if not linha:
+            continue
+        try:
+            yield json.loads(linha)
+        except json.JSONDecodeError as e:
+            raise ValueError(f'NDJSON inválido na linha {num_linha}: {e}')
+
+
+def ler_blocos(arquivo: TextIO, formato: str, tamanho_bloco: int = TAMANHO_BLOCO_PADRAO) -> Iterator[List[dict]]:
+    """
+    Lê alunos em blocos já no formato qN.
+
+    Args:
+        arquivo: Stream de texto (CSV com cabeçalho nome;id;turma;q1;q2;... ou NDJSON)
+        formato: 'csv' ou 'ndjson'
+        tamanho_bloco: Alunos por bloco
+    """
+    if formato not in FORMATOS_ENTRADA:
+        raise ValueError(f'Formato de entrada inválido: {formato}. Use: {FORMATOS_ENTRADA}')
+    linhas = _linhas_csv(arquivo) if formato == 'csv' else _linhas_ndjson(arquivo)
+    alunos = (converter_aluno(aluno) for aluno in linhas)
+    while True:
+        bloco = list(itertools.islice(alunos, tamanho_bloco))
+        if not bloco:
+            return
+        yield bloco
+
+
+# ════════════════════════════════════════════════════════════════════════════════
+# 2. PONTUAÇÃO DE UM BLOCO (também usada pelos workers do pool)
+# ════════════════════════════════════════════════════════════════════════════════
+
+_vetorizado_worker: Optional[TRIVetorizado] = None
+
+
+def _iniciar_worker(tabela: TabelaReferenciaTRI):
+    global _vetorizado_worker
+    _vetorizado_worker = TRIVetorizado(tabela)
+
+
+def pontuar_bloco(vetorizado: TRIVetorizado, alunos: List[dict], gabarito: Dict[str, str],
+                  areas: Dict[str, Tuple[int, int]], contagem: np.ndarray, total: int) -> Tuple[List[Dict], Dict]:
+    """
+    Pontua um bloco usando a dificuldade da coorte inteira.
+
+    Returns:
+        (resultados, parcial) - parcial tem somas/mín/máx para o resumo
+    """
+    matriz = MatrizRespostas.de_alunos(alunos, gabarito)
+    estado = EstadoTurma(matriz, areas, contagem=contagem, total=total)
+    pontuacao = vetorizado.pontuar(estado)
+    resultados = vetorizado.montar_resultados(pontuacao, matriz.nomes)
+    for resultado, id_aluno, turma in zip(resultados, matriz.ids, matriz.turmas):
+        resultado['id'] = id_aluno
+        resultado['turma'] = turma
+
+    parcial = {
+        'n': matriz.n_alunos,
+        'soma_tri': float(pontuacao.tri_geral.sum()),
+        'soma_tct': float(pontuacao.tct.sum()),
+        'tri_min': float(pontuacao.tri_geral.min()) if matriz.n_alunos else None,
+        'tri_max': float(pontuacao.tri_geral.max()) if matriz.n_alunos else None,
+    }
+    return resultados, parcial
+
+
+def _pontuar_bloco_worker(alunos, gabarito, areas, contagem, total):
+    return pontuar_bloco(_vetorizado_worker, alunos, gabarito, areas, contagem, total)
+
+
+# ════════════════════════════════════════════════════════════════════════════════
+# 3. PROCESSADOR EM DOIS PASSOS
+# ════════════════════════════════════════════════════════════════════════════════
+
+class ProcessadorStreaming:
+    """
+    Processa coortes maiores que a memória em dois passos sobre a entrada.
+
+    A entrada é uma função que abre o arquivo do início (chamada uma vez por
+    passo), para que cada passo leia em blocos sem guardar a coorte.
+    """
+
+    def __init__(self, tabela: TabelaReferenciaTRI, gabarito, areas_config: Optional[dict] = None,
+                 tamanho_bloco: int = TAMANHO_BLOCO_PADRAO, workers: int = 0):
+        self.tabela = tabela
+        self.vetorizado = TRIVetorizado(tabela)
+        self.gabarito = converter_gabarito(gabarito)
+        self.areas = normalizar_areas_config(
+            {k: tuple(v) for k, v in (areas_config or AREAS_CONFIG_PADRAO).items()}
+        )
+        self.tamanho_bloco = max(1, int(tamanho_bloco))
+        self.workers = max(0, int(workers))
+        self.contagem: Optional[np.ndarray] = None
+        self.total = 0
+        self.resumo: Optional[Dict] = None
+
+    def acumular(self, blocos: Iterable[List[dict]]):
+        """PASSO 1: acertos por questão da coorte inteira."""
+        vazia = MatrizRespostas.de_alunos([], self.gabarito)
+        self.contagem = np.zeros(vazia.n_questoes, dtype=np.int64)
+        self.total = 0
+        for bloco in blocos:
+            matriz = MatrizRespostas.de_alunos(bloco, self.gabarito)
+            self.contagem += matriz.contagem_acertos()
+            self.total += matriz.n_alunos
+
+    def _resultados_sequencial(self, blocos: Iterable[List[dict]]) -> Iterator[Tuple[List[Dict], Dict]]:
+        for bloco in blocos:
+            yield pontuar_bloco(self.vetorizado, bloco, self.gabarito, self.areas, self.contagem, self.total)
+
+    def _resultados_pool(self, blocos: Iterable[List[dict]]) -> Iterator[Tuple[List[Dict], Dict]]:
+        # Janela limitada de blocos em voo: memória não cresce com a coorte
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_iniciar_worker,
+                                 initargs=(self.tabela,)) as pool:
+            pendentes = deque()
+            for bloco in blocos:
+                pendentes.append(pool.submit(_pontuar_bloco_worker, bloco, self.gabarito,
+                                             self.areas, self.contagem, self.total))
+                if len(pendentes) >= self.workers * BLOCOS_POR_WORKER:
+                    yield pendentes.popleft().result()
+            while pendentes:
+                yield pendentes.popleft().result()
+
+    def pontuar(self, blocos: Iterable[List[dict]]) -> Iterator[Dict]:
+        """PASSO 2: resultados por aluno, na ordem da entrada."""
+        if self.contagem is None:
+            raise RuntimeError('Execute acumular() antes de pontuar()')
+
+        fonte = self._resultados_pool(blocos) if self.workers > 1 else self._resultados_sequencial(blocos)
+        n, soma_tri, soma_tct = 0, 0.0, 0.0
+        tri_min, tri_max = None, None
+        for resultados, parcial in fonte:
+            if parcial['n']:
+                n += parcial['n']
+                soma_tri += parcial['soma_tri']
+                soma_tct += parcial['soma_tct']
+                tri_min = parcial['tri_min'] if tri_min is None else min(tri_min, parcial['tri_min'])
+                tri_max = parcial['tri_max'] if tri_max is None else max(tri_max, parcial['tri_max'])
+            yield from resultados
+
+        self.resumo = self._resumo(n, soma_tri, soma_tct, tri_min, tri_max)
+
+    def _resumo(self, n, soma_tri, soma_tct, tri_min, tri_max) -> Dict:
+        """Mesmo prova_analysis de processar_turma, acumulado por bloco."""
+        if n == 0:
+            return {'total_alunos': 0, 'tri_medio': 0, 'tri_min': 0, 'tri_max': 0, 'tct_medio': 0}
+        estado = EstadoTurma(MatrizRespostas.de_alunos([], self.gabarito), self.areas,
+                             contagem=self.contagem, total=self.total)
+        return {
+            'total_alunos': n,
+            'tri_medio': soma_tri / n,
+            'tri_min': tri_min,
+            'tri_max': tri_max,
+            'tct_medio': soma_tct / n,
+            'questoes_stats': estado.distribuicao_dificuldade()
+        }
+
+    def processar(self, abrir_entrada: Callable[[], TextIO], formato: str) -> Iterator[Dict]:
+        """Executa os dois passos, reabrindo a entrada para o segundo."""
+        with abrir_entrada() as entrada:
+            self.acumular(ler_blocos(entrada, formato, self.tamanho_bloco))
+        with abrir_entrada() as entrada:
+            yield from self.pontuar(ler_blocos(entrada, formato, self.tamanho_bloco))
+
+
+# ════════════════════════════════════════════════════════════════════════════════
+# 4. SAÍDA (NDJSON / CSV)
+# ════════════════════════════════════════════════════════════════════════════════
+
+def formatar_saida(resultados: Iterable[Dict], formato: str,
+                   resumo: Optional[Callable[[], Dict]] = None) -> Iterator[str]:
+    """
+    Serializa resultados linha a linha.
+
+    Em NDJSON, se `resumo` for informado, a última linha é
+    {"prova_analysis": {...}} (avaliado após consumir os resultados).
+    """
+    if formato not in FORMATOS_SAIDA:
+        raise ValueError(f'Formato de saída inválido: {formato}. Use: {FORMATOS_SAIDA}')
+
+    if formato == 'ndjson':
+        for resultado in resultados:
+            yield json.dumps(resultado, ensure_ascii=False) + '\n'
+        if resumo is not None:
+            yield json.dumps({'prova_analysis': resumo()}, ensure_ascii=False) + '\n'
+        return
+
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=COLUNAS_CSV, delimiter=';', extrasaction='ignore')
+    writer.writeheader()
+    for resultado in resultados:
+        writer.writerow(resultado)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+# ════════════════════════════════════════════════════════════════════════════════
+# 5. CLI
+# ════════════════════════════════════════════════════════════════════════════════
+
+def _parse_areas(texto: str) -> Dict[str, List[int]]:
+    """'LC:1-45,CH:46-90' → {'LC': [1, 45], 'CH': [46, 90]}"""
+    areas = {}
+    for parte in texto.split(','):
+        area, faixa = parte.split(':')
+        inicio, fim = faixa.split('-')
+        areas[area.strip()] = [int(inicio), int(fim)]
+    return areas
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Calcula TRI V2 em streaming para coortes grandes')
+    parser.add_argument('entrada', help='Arquivo de alunos (.csv ou .ndjson)')
+    parser.add_argument('--gabarito', required=True, help='Arquivo JSON com gabarito ({"1": "A", ...} ou lista)')
+    parser.add_argument('--saida', default='-', help='Arquivo de saída (padrão: stdout)')
+    parser.add_argument('--formato-entrada', choices=FORMATOS_ENTRADA, help='Padrão: pela extensão')
+    parser.add_argument('--formato-saida', choices=FORMATOS_SAIDA, help='Padrão: pela extensão da saída')
+    parser.add_argument('--areas', help='Ex: LC:1-45,CH:46-90 (padrão: LC/CH/CN/MT do ENEM)')
+    parser.add_argument('--tabela', default=localizar_tabela(), help='Tabela TRI de referência (.csv ou .json)')
+    parser.add_argument('--bloco', type=int, default=TAMANHO_BLOCO_PADRAO, help='Alunos por bloco')
+    parser.add_argument('--workers', type=int, default=0, help='Processos para o passo 2 (0 = sequencial)')
+
+    args = parser.parse_args()
+
+    with open(args.gabarito, 'r', encoding='utf-8') as f:
+        gabarito = json.load(f)
+    formato_entrada = args.formato_entrada or detectar_formato(args.entrada)
+    formato_saida = args.formato_saida or ('csv' if args.saida.lower().endswith('.csv') else 'ndjson')
+
+    processador = ProcessadorStreaming(
+        TabelaReferenciaTRI(args.tabela),
+        gabarito,
+        _parse_areas(args.areas) if args.areas else None,
+        tamanho_bloco=args.bloco,
+        workers=args.workers,
+    )
+
+    def abrir_entrada():
+        return open(args.entrada, 'r', encoding='utf-8-sig', newline='')
+
+    saida = sys.stdout if args.saida == '-' else open(args.saida, 'w', encoding='utf-8', newline='')
+    try:
+        for trecho in formatar_saida(processador.processar(abrir_entrada, formato_entrada), formato_saida):
+            saida.write(trecho)
+    finally:
+        if saida is not sys.stdout:
+            saida.close()
+
+    resumo = processador.resumo or {}
+    print(f"✅ [TRI STREAM] {resumo.get('total_alunos', 0)} alunos | "
+          f"TRI médio {resumo.get('tri_medio', 0):.1f} | dificuldade: {resumo.get('questoes_stats', {})}",
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -30,10 +30,67 @@ TRI_MAXIMA_OFICIAL = {
     'MT': 980.0,   # Matemática - máximo histórico
 }
 
+# Áreas do ENEM na ordem usada em todos os resultados
+AREAS_TRI = ('LC', 'CH', 'CN', 'MT')
+
+# Mapear nomes de áreas para códigos padrão (LC, CH, CN, MT)
+AREA_MAPPING = {
+    'LC': 'LC',
+    'Linguagens e Códigos': 'LC',
+    'Linguagens': 'LC',
+    'CH': 'CH',
+    'Ciências Humanas': 'CH',
+    'CN': 'CN',
+    'Ciências da Natureza': 'CN',
+    'MT': 'MT',
+    'Matemática': 'MT'
+}
+
+# Classes de dificuldade (da mais fácil para a mais difícil)
+DIFICULDADES = ('muito_facil', 'facil', 'media', 'dificil', 'muito_dificil')
+
+
+def normalizar_areas_config(areas_config: dict) -> Dict[str, Tuple[int, int]]:
+    """
+    Converte areas_config para códigos padrão, descartando áreas desconhecidas.
+
+    Raises:
+        ValueError: se nenhuma área válida for encontrada
+    """
+    normalized_areas = {}
+    for area_name, range_config in areas_config.items():
+        area_code = AREA_MAPPING.get(area_name, area_name)
+        if area_code in AREAS_TRI:
+            normalized_areas[area_code] = range_config
+
+    if not normalized_areas:
+        raise ValueError(
+            f"areas_config inválido ou vazio. Recebido: {areas_config}. "
+            "O frontend deve sempre enviar areas_config baseado no template selecionado."
+        )
+    return normalized_areas
+
+
 # ════════════════════════════════════════════════════════════════════════════════
 # 1. CARREGAMENTO DE TABELA DE REFERÊNCIA
 # ════════════════════════════════════════════════════════════════════════════════
 
+TABELA_REFERENCIA_NOMES = ('tri_tabela_referencia_oficial.csv', 'tri_tabela_referencia_oficial.json')
+
+
+def localizar_tabela(diretorio: Optional[str] = None) -> str:
+    """
+    Caminho da tabela de referência ao lado deste módulo (ou em diretorio).
+    
+    Prefere o .csv; sem ele, usa o .json versionado no repositório.
+    """
+    base = Path(diretorio) if diretorio else Path(__file__).resolve().parent
+    for nome in TABELA_REFERENCIA_NOMES:
+        if (base / nome).exists():
+            return str(base / nome)
+    return str(base / TABELA_REFERENCIA_NOMES[0])
+
+
 class TabelaReferenciaTRI:
     """
     Gerenciador de tabela de referência TRI oficial.
@@ -49,9 +106,19 @@ class TabelaReferenciaTRI:
         Carrega tabela de referência agregada.
         
         Args:
-            csv_path: Caminho para 'tri_tabela_referencia_oficial.csv'
+            csv_path: Caminho para 'tri_tabela_referencia_oficial.csv' ou
+                para o .json equivalente ({area: {acertos: {tri_min, tri_med, tri_max}}})
         """
-        self.df = pd.read_csv(csv_path)
+        if str(csv_path).lower().endswith('.json'):
+            with open(csv_path, 'r', encoding='utf-8') as f:
+                dados = json.load(f)
+            self.df = pd.DataFrame([
+                {'area': area, 'acertos': int(acertos), **valores}
+                for area, por_acertos in dados.items()
+                for acertos, valores in por_acertos.items()
+            ])
+        else:
+            self.df = pd.read_csv(csv_path)
         
         # Validar estrutura
         required_cols = ['area', 'acertos', 'tri_min', 'tri_med', 'tri_max']
@@ -475,7 +542,10 @@ class TRIProcessadorV2:
         self,
         alunos: list,
         gabarito: dict,
-        areas_config: dict
+        areas_config: dict,
+        modo: str = 'tabela',
+        parametros_itens: Optional[dict] = None,
+        estimador: str = 'eap'
     ) -> tuple:
         """
         Processa uma turma completa de alunos COM COERÊNCIA PEDAGÓGICA.
@@ -491,42 +561,28 @@ class TRIProcessadorV2:
             alunos: Lista de dicionários com dados dos alunos
             gabarito: Dicionário com gabarito oficial
             areas_config: Configuração de áreas {'LC': [1, 45], 'CH': [46, 90], ...}
+            modo: 'tabela' (padrão, tabela + coerência) ou 'irt' (3PL, ver tri_irt.py)
+            parametros_itens: Modo 'irt': {'1': {'a': 1.2, 'b': 0.4, 'c': 0.18}, ...}
+            estimador: Modo 'irt': 'eap' ou 'map'
         
         Returns:
             Tuple (prova_analysis, resultados)
         """
-        resultados = []
+        if modo == 'irt':
+            return self._processar_turma_irt(alunos, gabarito, areas_config, parametros_itens, estimador)
+        if modo != 'tabela':
+            raise ValueError(f"Modo inválido: {modo}. Use 'tabela' ou 'irt'")
         
-        # Mapear nomes de áreas para códigos padrão (LC, CH, CN, MT)
-        area_mapping = {
-            'LC': 'LC',
-            'Linguagens e Códigos': 'LC',
-            'Linguagens': 'LC',
-            'CH': 'CH',
-            'Ciências Humanas': 'CH',
-            'CN': 'CN',
-            'Ciências da Natureza': 'CN',
-            'MT': 'MT',
-            'Matemática': 'MT'
-        }
+        resultados = []
         
         print("=" * 80)
         print("🔍 [TRI V2] Recebido areas_config:", areas_config)
         print("🔍 [TRI V2] Total alunos:", len(alunos))
         print("🔍 [TRI V2] Total questões no gabarito:", len(gabarito))
         
-        normalized_areas = {}
-        for area_name, range_config in areas_config.items():
-            area_code = area_mapping.get(area_name, area_name)
-            if area_code in ['LC', 'CH', 'CN', 'MT']:
-                normalized_areas[area_code] = range_config
-                print(f"🔍 [TRI V2] Área mapeada: {area_name} -> {area_code} = {range_config}")
-        
-        if not normalized_areas:
-            raise ValueError(
-                f"areas_config inválido ou vazio. Recebido: {areas_config}. "
-                "O frontend deve sempre enviar areas_config baseado no template selecionado."
-            )
+        normalized_areas = normalizar_areas_config(areas_config)
+        for area_code, range_config in normalized_areas.items():
+            print(f"🔍 [TRI V2] Área mapeada: {area_code} = {range_config}")
         
         # ═══════════════════════════════════════════════════════════════════════════
         # PASSO 1: CALCULAR DIFICULDADE DE CADA QUESTÃO (% de acerto da turma)
@@ -716,6 +772,22 @@ class TRIProcessadorV2:
             }
         
         return prova_analysis, resultados
+    
+    def _processar_turma_irt(self, alunos, gabarito, areas_config, parametros_itens, estimador):
+        """Modo 'irt': proficiência 3PL (EAP/MAP) na escala 500/100, sem tabela."""
+        # Import local: tri_irt depende deste módulo
+        from tri_matriz import MatrizRespostas
+        from tri_irt import ParametrosItens, processar_matriz_irt
+        
+        if not parametros_itens:
+            raise ValueError("Modo 'irt' requer parametros_itens")
+        parametros = parametros_itens
+        if not isinstance(parametros, ParametrosItens):
+            parametros = ParametrosItens.de_dict(parametros_itens)
+        
+        print(f"🔍 [TRI IRT] {len(alunos)} alunos, {len(gabarito)} questões, estimador {estimador.upper()}")
+        matriz = MatrizRespostas.de_alunos(alunos, gabarito)
+        return processar_matriz_irt(matriz, areas_config, parametros, estimador)
 
 
 # ════════════════════════════════════════════════════════════════════════════════
@@ -730,7 +802,7 @@ def teste_completo():
     print("="*120)
     
     # Carregar tabela
-    tabela = TabelaReferenciaTRI('/mnt/user-data/outputs/tri_tabela_referencia_oficial.csv')
+    tabela = TabelaReferenciaTRI(localizar_tabela())
     assert tabela.validar(), "Tabela inválida!"
     print("✓ Tabela de referência carregada e validada")
     
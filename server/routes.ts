@@ -129,6 +129,9 @@ const MODAL_OMR_PROCESS_URL = "https://xtribr--omr-api.modal.run/process-image";
 
 const PYTHON_OMR_SERVICE_URL = process.env.PYTHON_OMR_URL || "http://localhost:5002";
 const PYTHON_TRI_SERVICE_URL = process.env.PYTHON_TRI_URL || "http://localhost:5003";
+// Jobs do serviço TRI (turmas grandes): intervalo de consulta e espera máxima
+const TRI_JOB_POLL_MS = 1000;
+const TRI_JOB_TIMEOUT_MS = parseInt(process.env.TRI_JOB_TIMEOUT_MS || "600000", 10);
 const USE_PYTHON_OMR = process.env.USE_PYTHON_OMR !== "false"; // Ativado por padrão
 const USE_PYTHON_TRI = process.env.USE_PYTHON_TRI !== "false"; // Ativado por padrão
 
@@ -376,7 +379,9 @@ async function callPythonTRI(
           'CH': [46, 90],
           'CN': [1, 45],
           'MT': [46, 90]
-        }
+        },
+        // Turmas grandes viram job (202 + job_id), consultado abaixo
+        execucao: 'auto'
       },
       {
         headers: { 'Content-Type': 'application/json' },
@@ -384,7 +389,28 @@ async function callPythonTRI(
       }
     );
 
-    return response.data;
+    if (response.status !== 202) {
+      return response.data;
+    }
+
+    // Job assíncrono: consultar /api/jobs/<job_id> até concluir
+    const jobId = response.data.job_id;
+    console.log(`[TRI SERVICE] ${alunos.length} alunos em job ${jobId}, aguardando...`);
+    const deadline = Date.now() + TRI_JOB_TIMEOUT_MS;
+    while (Date.now() < deadline) {
+      await new Promise(resolve => setTimeout(resolve, TRI_JOB_POLL_MS));
+      const job = await axios.get(`${PYTHON_TRI_SERVICE_URL}/api/jobs/${jobId}`, { timeout: 10000 });
+      if (job.data.status === 'concluido') {
+        return job.data.resultado;
+      }
+      if (job.data.status === 'erro') {
+        return { status: "erro", mensagem: job.data.mensagem || `Job ${jobId} falhou` };
+      }
+    }
+    return {
+      status: "erro",
+      mensagem: `Job ${jobId} não concluiu em ${Math.round(TRI_JOB_TIMEOUT_MS / 1000)}s`
+    };
   } catch (error: any) {
     console.error("[TRI SERVICE] Erro ao chamar serviço Python TRI:", error.message);
     return {